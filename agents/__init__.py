@@ -1,14 +1,19 @@
 # ecommerce_ai_assistant/agents/__init__.py
-from .intent_parser_node import parse_intent_node
-from .retrieval_node import retrieval_node
-from .response_node import response_synthesis_node
-from .sql_node import sql_node
-from .meta_query_node import meta_query_node
+from .intent_parser_node import parse_intent_node, aparse_intent_node
+from .retrieval_node import retrieval_node, aretrieval_node
+from .response_node import response_synthesis_node, aresponse_synthesis_node
+from .sql_node import sql_node, asql_node
+from .meta_query_node import meta_query_node, ameta_query_node
 
 __all__ = [
     "parse_intent_node",
     "retrieval_node",
     "response_synthesis_node",
     "sql_node",
-    "meta_query_node"
+    "meta_query_node",
+    "aparse_intent_node",
+    "aretrieval_node",
+    "aresponse_synthesis_node",
+    "asql_node",
+    "ameta_query_node"
 ]
\ No newline at end of file
@@ -1,59 +1,45 @@
 # agents/intent_parser_node.py
 import json
-from utils import get_llm_response, load_prompt_from_path, get_node_config, logger
+from utils import (get_llm_response, aget_llm_response, load_prompt_from_path, get_node_config, logger,
+                   load_agent_registry,
+                   begin_node_timing, finish_node_timing, llm_options_for_node, new_cache_stats,
+                   get_embeddings, aget_embeddings)
 from graph_state import AgentState
-import time 
+from token_accounting import new_token_usage
+from prompt_store import render_placeholders
+from batch_runner import current_batch_session
+from intent_rules import classifier_for, record_fast_path, record_agreement
+import intent_knn
+import intent_templates
+import speculation
+from schema_introspection import schema_for_sql_prompt
 
 NODE_NAME = "intent_parser"
+DEFAULT_FAST_PATH_MIN_CONFIDENCE = 0.85
+DEFAULT_KNN_MIN_SIMILARITY = 0.5
+DEFAULT_KNN_MIN_MARGIN = 0.6
+DEFAULT_KNN_EMBEDDING_MODEL = "text-embedding-3-small"
+DEFAULT_FUSED_SQL_INTENTS = ("ORDER_STATUS", "PRODUCT_AVAILABILITY")
 
-def parse_intent_node(state: AgentState) -> dict:
-    """
-    Parses the user query to determine intent and extract entities.
-    Updates state with intent, entities.
-    """
-    node_start_time = time.perf_counter() # Start timer for this node
-
-    # Initialize benchmarking fields in state if not present
-    current_latencies = state.get("node_latencies", {})
-    current_order = state.get("node_execution_order", [])
-    if NODE_NAME not in current_order:
-      current_order.append(NODE_NAME)
-
-    logger.info(f"--- NODE: {NODE_NAME} ---")
-    config = get_node_config(NODE_NAME)
-    if not config:
-        error_result = {"error_message": f"Configuration for node '{NODE_NAME}' not found."}
-        node_end_time = time.perf_counter()
-        current_latencies[NODE_NAME] = round(node_end_time - node_start_time, 4)
-        error_result["node_latencies"] = current_latencies
-        error_result["node_execution_order"] = current_order
-        return error_result
-
-
+#3. If the question cannot be answered with a SELECT query, or if it seems malicious, or if it requests personally identifiable information (PII) beyond what's directly asked for an order/customer lookup (e.g. "list all customer emails"), respond EXACTLY with: "I cannot answer this question."
+# Example prompt might expect a list of intents to choose from
+# Make sure your prompt guides the LLM to output structured JSON
+# Example intent prompt (prompts/intent/v1_0_parser.txt):
+"""
+You are an intent classification and entity extraction expert.
+Given the user query, determine the primary intent and extract relevant entities.
+Possible intents are: "SQL_QUERY", "PRODUCT_AVAILABILITY", "ORDER_STATUS", "RETURN_INFO", "SHIPPING_INFO", "META_QUERY", "GREETING", "UNKNOWN".
 
+For "ORDER_STATUS", extract "order_id".
+For "PRODUCT_AVAILABILITY", extract "product_name".
 
+Respond in JSON format with "intent" and "entities" keys.
+If "order_id" is like "#12345", extract "12345".
 
-    user_query = state["original_query"]
-    prompt_template = load_prompt_from_path(config["prompt_path"])
-    #3. If the question cannot be answered with a SELECT query, or if it seems malicious, or if it requests personally identifiable information (PII) beyond what's directly asked for an order/customer lookup (e.g. "list all customer emails"), respond EXACTLY with: "I cannot answer this question."
-    # Example prompt might expect a list of intents to choose from
-    # Make sure your prompt guides the LLM to output structured JSON
-    # Example intent prompt (prompts/intent/v1_0_parser.txt):
-    """
-    You are an intent classification and entity extraction expert.
-    Given the user query, determine the primary intent and extract relevant entities.
-    Possible intents are: "SQL_QUERY", "PRODUCT_AVAILABILITY", "ORDER_STATUS", "RETURN_INFO", "SHIPPING_INFO", "META_QUERY", "GREETING", "UNKNOWN".
-    
-    For "ORDER_STATUS", extract "order_id".
-    For "PRODUCT_AVAILABILITY", extract "product_name".
-    
-    Respond in JSON format with "intent" and "entities" keys.
-    If "order_id" is like "#12345", extract "12345".
-
-    User Query: "{user_query}"
-    JSON Response:
-    """
-    structure_json = """
+User Query: "{user_query}"
+JSON Response:
+"""
+STRUCTURE_JSON = """
 {
   "intent": "ORDER_STATUS",
   "entities": {
@@ -115,43 +101,282 @@ JSON Response:
   "intent": "PROBLEM_REPORT",
   "entities": {}
 }
-""" 
-    formatted_prompt = prompt_template.replace("{user_query}", user_query).replace("{structure_json}", structure_json)
+"""
 
-    # formatted_prompt = prompt_template.format(user_query=user_query,struture_json=structure_json)
 
-    llm_response_str = get_llm_response(
-        prompt=formatted_prompt,
-        model=config.get("llm_model"), # Use model from config
-        json_mode=False # Request JSON output
-    )
+def _build_intent_prompt(config: dict, user_query: str) -> str:
+    prompt_template = load_prompt_from_path(config["prompt_path"])
+    # Fused prompts write SQL for sql_processor's database before the intent is known: tables named in the query
+    db_schema = schema_for_sql_prompt(get_node_config("sql_processor"), user_query) if _is_fused(config) else ""
+    # The template may hold literal JSON braces, so only the placeholders are substituted (no str.format)
+    return render_placeholders(prompt_template, user_query=user_query, structure_json=STRUCTURE_JSON,
+                               db_schema=db_schema)
+
+
+def _is_fused(config: dict) -> bool:
+    """`mode: fused_sql` versions also write the SQL for SQL-bound intents in the same JSON-mode call."""
+    return config.get("mode") == "fused_sql"
 
 
+def _response_text(llm_response) -> str:
+    # json_mode responses come back parsed (or as an {"error": ...} dict when the JSON was invalid)
+    if isinstance(llm_response, dict):
+        return f"Error: {llm_response['error']}" if "error" in llm_response else json.dumps(llm_response)
+    return llm_response
 
+
+def _with_fused_sql(result: dict, config: dict, llm_response) -> dict:
+    """Hands the fused call's SQL to sql_processor, which then only executes it."""
+    sql = llm_response.get("sql") if isinstance(llm_response, dict) else None
+    if sql and result.get("intent") in config.get("fused_sql_intents", DEFAULT_FUSED_SQL_INTENTS):
+        result["sql_query_generated"] = sql.strip()
+        logger.info("%s: Fused SQL: %s", NODE_NAME, result['sql_query_generated'])
+    return result
+
+
+def _intent_result(state: AgentState, config: dict, llm_response_str: str, node_start_time: float,
+                   current_latencies: dict, current_order: list, cache_stats=None, token_usage=None) -> dict:
+    """Turns the raw intent LLM response into the node's partial state update."""
     if "Error:" in llm_response_str: # Check if LLM call failed
-        logger.error(f"{NODE_NAME}: LLM error: {llm_response_str}")
+        logger.error("%s: LLM error: %s", NODE_NAME, llm_response_str)
         return {"intent": "UNKNOWN", "error_message": llm_response_str, "processing_steps_versions": {NODE_NAME: config.get("version")}}
 
     try:
-        partial_result = {}
         parsed_response = json.loads(llm_response_str)
         intent = parsed_response.get("intent", "UNKNOWN")
         entities = parsed_response.get("entities", {})
-        logger.info(f"{NODE_NAME}: Intent='{intent}', Entities='{entities}'")
-        
+        logger.info("%s: Intent='%s', Entities='%s'", NODE_NAME, intent, entities)
+
         # Update processing steps versions
         current_versions = state.get("processing_steps_versions", {})
         current_versions[NODE_NAME] = config.get("version")
 
-        node_end_time = time.perf_counter()
-        current_latencies[NODE_NAME] = round(node_end_time - node_start_time, 4)
-        partial_result["node_latencies"] = current_latencies
-        partial_result["node_execution_order"] = current_order
+        partial_result = finish_node_timing(NODE_NAME, node_start_time, current_latencies, current_order,
+                                            state=state, cache_stats=cache_stats, token_usage=token_usage)
 
-        return {"intent": intent, "entities": entities, "processing_steps_versions": current_versions,**partial_result}
+        return {"intent": intent, "entities": entities, "intent_source": "llm", "processing_steps_versions": current_versions,**partial_result}
     except json.JSONDecodeError:
-        logger.error(f"{NODE_NAME}: Failed to parse LLM JSON response: {llm_response_str}")
+        logger.error("%s: Failed to parse LLM JSON response: %s", NODE_NAME, llm_response_str)
         return {"intent": "UNKNOWN", "error_message": "Failed to parse intent from LLM.", "processing_steps_versions": {NODE_NAME: config.get("version")}}
     except Exception as e:
-        logger.error(f"{NODE_NAME}: Unexpected error: {e}")
-        return {"intent": "UNKNOWN", "error_message": str(e), "processing_steps_versions": {NODE_NAME: config.get("version")}}
\ No newline at end of file
+        logger.error("%s: Unexpected error: %s", NODE_NAME, e)
+        return {"intent": "UNKNOWN", "error_message": str(e), "processing_steps_versions": {NODE_NAME: config.get("version")}}
+
+
+def _fast_path(config: dict, user_query: str):
+    """
+    Runs the rule-based pre-classifier configured under `fast_path` (intent_rules.py).
+    Returns (prediction or None, confident, shadow); in shadow mode the LLM is still asked and its answer used.
+    """
+    fast_path_config = config.get("fast_path") or {}
+    if not fast_path_config.get("enabled"):
+        return None, False, False
+    prediction = classifier_for(fast_path_config).classify(user_query)
+    min_confidence = fast_path_config.get("min_confidence", DEFAULT_FAST_PATH_MIN_CONFIDENCE)
+    confident = prediction is not None and prediction.confidence >= min_confidence
+    shadow = bool(fast_path_config.get("shadow", False))
+    record_fast_path(confident and not shadow)
+    return prediction, confident, shadow
+
+
+def _fast_path_result(state: AgentState, config: dict, prediction, node_start_time: float,
+                      current_latencies: dict, current_order: list) -> dict:
+    logger.info("%s: Fast path (%s, confidence %s): Intent='%s', Entities='%s'",
+                NODE_NAME, prediction.rule, prediction.confidence, prediction.intent, prediction.entities)
+    current_versions = state.get("processing_steps_versions", {})
+    current_versions[NODE_NAME] = config.get("version")
+    partial_result = finish_node_timing(NODE_NAME, node_start_time, current_latencies, current_order)
+    return {"intent": prediction.intent, "entities": prediction.entities, "intent_source": "rules",
+            "intent_fast_path": prediction.as_dict(), "processing_steps_versions": current_versions, **partial_result}
+
+
+def _template_cache(config: dict):
+    template_cache_config = config.get("template_cache") or {}
+    # Batch replays must take the same path every round (the batch session already caches answers)
+    if not template_cache_config.get("enabled") or current_batch_session() is not None:
+        return None
+    return intent_templates.cache_for(template_cache_config)
+
+
+def _template_result(state: AgentState, config: dict, match, node_start_time: float,
+                     current_latencies: dict, current_order: list) -> dict:
+    logger.info("%s: Template cache hit ('%s'): Intent='%s', Entities='%s'",
+                NODE_NAME, match.template, match.intent, match.entities)
+    current_versions = state.get("processing_steps_versions", {})
+    current_versions[NODE_NAME] = config.get("version")
+    partial_result = finish_node_timing(NODE_NAME, node_start_time, current_latencies, current_order)
+    return {"intent": match.intent, "entities": match.entities, "intent_source": "template_cache",
+            "processing_steps_versions": current_versions, **partial_result}
+
+
+def _remember_template(template_cache, config: dict, user_query: str, result: dict) -> dict:
+    """Caches a successful kNN/LLM classification under the query's template."""
+    if (template_cache is not None and not result.get("error_message")
+            and result.get("intent") not in (None, "UNKNOWN")):
+        template_cache.store(config.get("version"), user_query, result["intent"], result.get("entities") or {})
+    return result
+
+
+def _speculation_settings():
+    # Batch replays must take the same path every round, so nothing runs ahead of the intent there
+    if current_batch_session() is not None:
+        return None
+    return (load_agent_registry() or {}).get("speculation")
+
+
+def _knn_classifier(config: dict):
+    """(classifier, knn config) when the `knn` section is enabled and its index has been built."""
+    knn_config = config.get("knn") or {}
+    if not knn_config.get("enabled"):
+        return None, knn_config
+    return intent_knn.classifier_for(knn_config, logger), knn_config
+
+
+def knn_confident(prediction, knn_config: dict) -> bool:
+    """Whether a kNN vote is clear enough to skip the LLM."""
+    return (prediction is not None
+            and prediction.similarity >= knn_config.get("min_similarity", DEFAULT_KNN_MIN_SIMILARITY)
+            and prediction.margin >= knn_config.get("min_margin", DEFAULT_KNN_MIN_MARGIN))
+
+
+def _knn_prediction(classifier, knn_config: dict, user_query: str, embedding):
+    prediction = classifier.classify_vector(embedding, user_query, k=knn_config.get("k", intent_knn.DEFAULT_K))
+    return prediction, knn_confident(prediction, knn_config)
+
+
+def _knn_result(state: AgentState, config: dict, prediction, node_start_time: float,
+                current_latencies: dict, current_order: list) -> dict:
+    logger.info("%s: kNN (similarity %s, margin %s): Intent='%s', Entities='%s'",
+                NODE_NAME, prediction.similarity, prediction.margin, prediction.intent, prediction.entities)
+    current_versions = state.get("processing_steps_versions", {})
+    current_versions[NODE_NAME] = config.get("version")
+    partial_result = finish_node_timing(NODE_NAME, node_start_time, current_latencies, current_order)
+    return {"intent": prediction.intent, "entities": prediction.entities, "intent_source": "knn",
+            "intent_knn": prediction.as_dict(), "processing_steps_versions": current_versions, **partial_result}
+
+
+def _with_rule_prediction(result: dict, prediction, confident: bool) -> dict:
+    """Attaches the rule prediction to an LLM result; confident predictions are scored against the LLM."""
+    if prediction is not None:
+        result["intent_fast_path"] = prediction.as_dict()
+        if confident and result.get("intent_source") == "llm":
+            record_agreement(prediction.intent == result["intent"])
+    return result
+
+
+def _config_error(node_start_time: float, current_latencies: dict, current_order: list) -> dict:
+    error_result = {"error_message": f"Configuration for node '{NODE_NAME}' not found."}
+    error_result.update(finish_node_timing(NODE_NAME, node_start_time, current_latencies, current_order))
+    return error_result
+
+
+def parse_intent_node(state: AgentState) -> dict:
+    """
+    Parses the user query to determine intent and extract entities.
+    Updates state with intent, entities.
+    """
+    node_start_time, current_latencies, current_order = begin_node_timing(state, NODE_NAME)
+
+    logger.info("--- NODE: %s ---", NODE_NAME)
+    config = get_node_config(NODE_NAME)
+    if not config:
+        return _config_error(node_start_time, current_latencies, current_order)
+
+    prediction, confident, shadow = _fast_path(config, state["original_query"])
+    if confident and not shadow:
+        return _fast_path_result(state, config, prediction, node_start_time, current_latencies, current_order)
+
+    template_cache = _template_cache(config)
+    if template_cache is not None and not shadow:
+        match = template_cache.lookup(config.get("version"), state["original_query"])
+        if match is not None:
+            return _template_result(state, config, match, node_start_time, current_latencies, current_order)
+
+    # Branch work that only needs the query runs while the kNN / LLM classification is in flight
+    speculation_record = speculation.start(_speculation_settings(), state["original_query"])
+    knn_prediction = None
+    knn_classifier, knn_config = _knn_classifier(config)
+    if knn_classifier is not None:
+        model = knn_config.get("embedding_model", DEFAULT_KNN_EMBEDDING_MODEL)
+        embedding = get_embeddings([state["original_query"]], model=model)[0]
+        knn_prediction, knn_is_confident = _knn_prediction(knn_classifier, knn_config, state["original_query"], embedding)
+        if knn_is_confident and not shadow:
+            result = _knn_result(state, config, knn_prediction, node_start_time, current_latencies, current_order)
+            _remember_template(template_cache, config, state["original_query"], result)
+            result = _with_rule_prediction(result, prediction, confident)
+            return speculation.settle(speculation_record, result, state["original_query"])
+
+    formatted_prompt = _build_intent_prompt(config, state["original_query"])
+    cache_stats = new_cache_stats(config)
+    token_usage = new_token_usage()
+
+    llm_response = get_llm_response(
+        prompt=formatted_prompt,
+        model=config.get("llm_model"), # Use model from config
+        json_mode=_is_fused(config), # The v1 prompt asks for JSON itself; fused versions use JSON mode
+        **llm_options_for_node(config, cache_stats, token_usage)
+    )
+
+    result = _intent_result(state, config, _response_text(llm_response), node_start_time, current_latencies,
+                            current_order, cache_stats, token_usage)
+    if _is_fused(config):
+        result = _with_fused_sql(result, config, llm_response)
+    if knn_prediction is not None:
+        result["intent_knn"] = knn_prediction.as_dict()
+    _remember_template(template_cache, config, state["original_query"], result)
+    result = _with_rule_prediction(result, prediction, confident)
+    return speculation.settle(speculation_record, result, state["original_query"])
+
+
+async def aparse_intent_node(state: AgentState) -> dict:
+    """Async twin of parse_intent_node used by app.ainvoke."""
+    node_start_time, current_latencies, current_order = begin_node_timing(state, NODE_NAME)
+
+    logger.info("--- NODE: %s (async) ---", NODE_NAME)
+    config = get_node_config(NODE_NAME)
+    if not config:
+        return _config_error(node_start_time, current_latencies, current_order)
+
+    prediction, confident, shadow = _fast_path(config, state["original_query"])
+    if confident and not shadow:
+        return _fast_path_result(state, config, prediction, node_start_time, current_latencies, current_order)
+
+    template_cache = _template_cache(config)
+    if template_cache is not None and not shadow:
+        match = template_cache.lookup(config.get("version"), state["original_query"])
+        if match is not None:
+            return _template_result(state, config, match, node_start_time, current_latencies, current_order)
+
+    speculation_record = speculation.astart(_speculation_settings(), state["original_query"])
+    knn_prediction = None
+    knn_classifier, knn_config = _knn_classifier(config)
+    if knn_classifier is not None:
+        model = knn_config.get("embedding_model", DEFAULT_KNN_EMBEDDING_MODEL)
+        embedding = (await aget_embeddings([state["original_query"]], model=model))[0]
+        knn_prediction, knn_is_confident = _knn_prediction(knn_classifier, knn_config, state["original_query"], embedding)
+        if knn_is_confident and not shadow:
+            result = _knn_result(state, config, knn_prediction, node_start_time, current_latencies, current_order)
+            _remember_template(template_cache, config, state["original_query"], result)
+            result = _with_rule_prediction(result, prediction, confident)
+            return speculation.settle(speculation_record, result, state["original_query"])
+
+    formatted_prompt = _build_intent_prompt(config, state["original_query"])
+    cache_stats = new_cache_stats(config)
+    token_usage = new_token_usage()
+
+    llm_response = await aget_llm_response(
+        prompt=formatted_prompt,
+        model=config.get("llm_model"),
+        json_mode=_is_fused(config),
+        **llm_options_for_node(config, cache_stats, token_usage)
+    )
+
+    result = _intent_result(state, config, _response_text(llm_response), node_start_time, current_latencies,
+                            current_order, cache_stats, token_usage)
+    if _is_fused(config):
+        result = _with_fused_sql(result, config, llm_response)
+    if knn_prediction is not None:
+        result["intent_knn"] = knn_prediction.as_dict()
+    _remember_template(template_cache, config, state["original_query"], result)
+    result = _with_rule_prediction(result, prediction, confident)
+    return speculation.settle(speculation_record, result, state["original_query"])
@@ -1,14 +1,26 @@
 # agents/meta_query_node.py
-from utils import get_node_config, load_agent_registry, logger, get_llm_response, load_prompt_from_path
+from utils import (get_node_config, load_agent_registry, logger, get_llm_response, aget_llm_response,
+                   load_prompt_from_path, begin_node_timing, finish_node_timing, llm_options_for_node, new_cache_stats)
 from graph_state import AgentState
+from token_accounting import new_token_usage
 import json
-import time 
 
 NODE_NAME = "meta_query_handler"
 
-def classify_meta_intent(user_query: str, agent_types: list, model: str = "gpt-4o") -> dict:
+AGENT_TYPES = """
+agent_types:
+- intent_parser
+- sql_processor
+- retrieval_processor
+- response_synthesizer
+- meta_query_handler
+
+"""
+
+
+def _build_classification_prompt(user_query: str, agent_types: list) -> str:
     agent_list_str = agent_types
-    classification_prompt = f"""
+    return f"""
 You are an intelligent AI system that helps route internal meta-queries.
 DO NOT include markdown code formatting (like ```json or ```) in your output. Only return plain.
 
@@ -30,50 +42,30 @@ Respond strictly in JSON format like this:
 
 If unsure about the agent type, set "target_node" to null.
 """
+
+
+def classify_meta_intent(user_query: str, agent_types: list, model: str = "gpt-4o", **llm_options) -> dict:
+    classification_prompt = _build_classification_prompt(user_query, agent_types)
     try:
-        response = get_llm_response(prompt=classification_prompt, model=model)
+        response = get_llm_response(prompt=classification_prompt, model=model, **llm_options)
         return json.loads(response)
     except Exception as e:
-        logger.warning(f"Failed to parse LLM classification: {e}")
+        logger.warning("Failed to parse LLM classification: %s", e)
         return {"is_version_query": False, "target_node": None}
 
-def meta_query_node(state: AgentState) -> dict:
-
-    node_start_time = time.perf_counter() # Start timer for this node
-
-    # Initialize benchmarking fields in state if not present
-    current_latencies = state.get("node_latencies", {})
-    current_order = state.get("node_execution_order", [])
-    if NODE_NAME not in current_order:
-      current_order.append(NODE_NAME)
 
-    logger.info(f"--- NODE: {NODE_NAME} ---")
-    config = get_node_config(NODE_NAME)
-    if not config:
-        error_result = {"error_message": f"Configuration for node '{NODE_NAME}' not found."}
-        node_end_time = time.perf_counter()
-        current_latencies[NODE_NAME] = round(node_end_time - node_start_time, 4)
-        error_result["node_latencies"] = current_latencies
-        error_result["node_execution_order"] = current_order
-        return error_result
-
-
-
-
-    user_query = state["original_query"]
-    agent_types = """
-agent_types:
-- intent_parser
-- sql_processor
-- retrieval_processor
-- response_synthesizer
-- meta_query_handler
-
-"""
-    model = config.get("llm_model", "gpt-4o")
+async def aclassify_meta_intent(user_query: str, agent_types: list, model: str = "gpt-4o", **llm_options) -> dict:
+    """Async twin of classify_meta_intent."""
+    classification_prompt = _build_classification_prompt(user_query, agent_types)
+    try:
+        response = await aget_llm_response(prompt=classification_prompt, model=model, **llm_options)
+        return json.loads(response)
+    except Exception as e:
+        logger.warning("Failed to parse LLM classification: %s", e)
+        return {"is_version_query": False, "target_node": None}
 
-    intent_result = classify_meta_intent(user_query, agent_types, model)
 
+def _answer_from_classification(state: AgentState, intent_result: dict) -> str:
     answer = ""
     if intent_result["is_version_query"]:
         target_node = intent_result.get("target_node")
@@ -96,21 +88,80 @@ agent_types:
                 answer = "Version information is not readily available."
     else:
         answer = "I can answer questions about my system component versions. What would you like to know?"
-    partial_result = {}
+    return answer
+
 
+def _build_meta_prompt(config: dict, answer: str, user_query: str):
+    """Returns the formatting prompt, or None when the raw answer is used as-is."""
     prompt_template = load_prompt_from_path(config["prompt_path"])
     if prompt_template and config.get("llm_model"):
-        formatted_prompt = prompt_template.format(information_found=answer, user_query=user_query)
-        final_meta_answer = get_llm_response(prompt=formatted_prompt, model=model)
-    else:
-        final_meta_answer = answer
-    node_end_time = time.perf_counter()
-    current_latencies[NODE_NAME] = round(node_end_time - node_start_time, 4)
-    partial_result["node_latencies"] = current_latencies
-    partial_result["node_execution_order"] = current_order
-    logger.info(f"{NODE_NAME}: Meta answer: {final_meta_answer}")
+        return prompt_template.format(information_found=answer, user_query=user_query)
+    return None
+
+
+def _meta_result(state: AgentState, config: dict, final_meta_answer: str, node_start_time: float,
+                 current_latencies: dict, current_order: list, cache_stats=None, token_usage=None) -> dict:
+    partial_result = finish_node_timing(NODE_NAME, node_start_time, current_latencies, current_order,
+                                        state=state, cache_stats=cache_stats, token_usage=token_usage)
+    logger.info("%s: Meta answer: %s", NODE_NAME, final_meta_answer)
     current_versions = state.get("processing_steps_versions", {})
     current_versions[NODE_NAME] = config.get("version")
 
+    return {"intermediate_response": final_meta_answer, "processing_steps_versions": current_versions,**partial_result}
+
+
+def _config_error(node_start_time: float, current_latencies: dict, current_order: list) -> dict:
+    error_result = {"error_message": f"Configuration for node '{NODE_NAME}' not found."}
+    error_result.update(finish_node_timing(NODE_NAME, node_start_time, current_latencies, current_order))
+    return error_result
 
-    return {"intermediate_response": final_meta_answer, "processing_steps_versions": current_versions,**partial_result}
\ No newline at end of file
+
+def meta_query_node(state: AgentState) -> dict:
+    node_start_time, current_latencies, current_order = begin_node_timing(state, NODE_NAME)
+
+    logger.info("--- NODE: %s ---", NODE_NAME)
+    config = get_node_config(NODE_NAME)
+    if not config:
+        return _config_error(node_start_time, current_latencies, current_order)
+
+    user_query = state["original_query"]
+    model = config.get("llm_model", "gpt-4o")
+    cache_stats = new_cache_stats(config)
+    token_usage = new_token_usage()
+    llm_options = llm_options_for_node(config, cache_stats, token_usage)
+
+    intent_result = classify_meta_intent(user_query, AGENT_TYPES, model, **llm_options)
+    answer = _answer_from_classification(state, intent_result)
+
+    formatted_prompt = _build_meta_prompt(config, answer, user_query)
+    if formatted_prompt is not None:
+        final_meta_answer = get_llm_response(prompt=formatted_prompt, model=model, **llm_options)
+    else:
+        final_meta_answer = answer
+    return _meta_result(state, config, final_meta_answer, node_start_time, current_latencies, current_order, cache_stats, token_usage)
+
+
+async def ameta_query_node(state: AgentState) -> dict:
+    """Async twin of meta_query_node."""
+    node_start_time, current_latencies, current_order = begin_node_timing(state, NODE_NAME)
+
+    logger.info("--- NODE: %s (async) ---", NODE_NAME)
+    config = get_node_config(NODE_NAME)
+    if not config:
+        return _config_error(node_start_time, current_latencies, current_order)
+
+    user_query = state["original_query"]
+    model = config.get("llm_model", "gpt-4o")
+    cache_stats = new_cache_stats(config)
+    token_usage = new_token_usage()
+    llm_options = llm_options_for_node(config, cache_stats, token_usage)
+
+    intent_result = await aclassify_meta_intent(user_query, AGENT_TYPES, model, **llm_options)
+    answer = _answer_from_classification(state, intent_result)
+
+    formatted_prompt = _build_meta_prompt(config, answer, user_query)
+    if formatted_prompt is not None:
+        final_meta_answer = await aget_llm_response(prompt=formatted_prompt, model=model, **llm_options)
+    else:
+        final_meta_answer = answer
+    return _meta_result(state, config, final_meta_answer, node_start_time, current_latencies, current_order, cache_stats, token_usage)
@@ -1,33 +1,42 @@
 # agents/response_node.py
-from utils import get_llm_response, load_prompt_from_path, get_node_config, logger
+from utils import (get_llm_response, aget_llm_response, load_prompt_from_path, get_node_config, logger,
+                   begin_node_timing, finish_node_timing, llm_options_for_node, new_cache_stats)
 from graph_state import AgentState
-import time 
+from token_accounting import new_token_usage
+from result_encoding import encode_rows
 
 NODE_NAME = "response_synthesizer"
 
-def response_synthesis_node(state: AgentState) -> dict:
-    """
-    Synthesizes a final user-facing response from intermediate results.
-    """
-    node_start_time = time.perf_counter() # Start timer for this node
+GREETING_PROMPT = """You are a friendly e-commerce assistant. Generate a warm, professional greeting response.
+        Examples:
+        - "Hello! How can I assist you with your order today?"
+        - "Hi there! Welcome to our support. How may I help you?"
+        - "Greetings! What can I do for you today?"
 
-    # Initialize benchmarking fields in state if not present
-    current_latencies = state.get("node_latencies", {})
-    current_order = state.get("node_execution_order", [])
-    if NODE_NAME not in current_order:
-      current_order.append(NODE_NAME)
+        Your greeting response:"""
 
-    logger.info(f"--- NODE: {NODE_NAME} ---")
-    config = get_node_config(NODE_NAME)
-    
-    if not config:
-        error_result = {"error_message": f"Configuration for node '{NODE_NAME}' not found."}
-        node_end_time = time.perf_counter()
-        current_latencies[NODE_NAME] = round(node_end_time - node_start_time, 4)
-        error_result["node_latencies"] = current_latencies
-        error_result["node_execution_order"] = current_order
-        return error_result
 
+def _sql_result_text(state: AgentState, config: dict) -> str:
+    """SQL rows for the prompt: compact and within the token budget (result_encoding.py), or their repr if disabled."""
+    sql_result = state.get("sql_query_result")
+    truncated = bool(state.get("sql_result_truncated"))
+    settings = config.get("result_encoding") or {}
+    if not settings.get("enabled", True) or not all(isinstance(row, dict) for row in sql_result):
+        text = f"{sql_result}"
+        if truncated:
+            text += f" (only the first {len(sql_result)} rows; the query matched more)"
+        return text
+    encoded = encode_rows(sql_result, settings, config.get("llm_model") or "gpt-4o", more_at_source=truncated)
+    logger.info("%s: SQL result encoded: %s of %s rows, ~%s tokens",
+                NODE_NAME, encoded.rows_shown, encoded.rows_total, encoded.tokens)
+    return "\n" + encoded.text
+
+
+def _plan_response(state: AgentState, config: dict):
+    """
+    Decides how the final answer is produced.
+    Returns (final_answer, llm_prompt, context_for_llm); when llm_prompt is set the answer still has to be generated.
+    """
     user_query = state["original_query"]
     intent = state.get("intent")  # Get the intent from state
     sql_result = state.get("sql_query_result")
@@ -37,60 +46,109 @@ def response_synthesis_node(state: AgentState) -> dict:
 
     # Handle greeting intent first
     if intent == "OUT_OF_CONTEXT":
-        greeting_prompt = """You are a friendly e-commerce assistant. Generate a warm, professional greeting response.
-        Examples:
-        - "Hello! How can I assist you with your order today?"
-        - "Hi there! Welcome to our support. How may I help you?"
-        - "Greetings! What can I do for you today?"
-        
-        Your greeting response:"""
-        final_answer = get_llm_response(
-            prompt=greeting_prompt,
-            model=config.get("llm_model")
-        )
-        logger.info(f"{NODE_NAME}: Generated greeting response: {final_answer}")
-    elif intermediate_response:
-        logger.info(f"{NODE_NAME}: Using intermediate response: {intermediate_response}")
-        final_answer = intermediate_response
-    elif error_msg and not (sql_result or rag_summary):
-        logger.warning(f"{NODE_NAME}: Error from previous step: {error_msg}")
-        final_answer = f"I encountered an issue trying to process your request: {error_msg}. Please try rephrasing or ask something else."
+        return None, GREETING_PROMPT, None
+    if intermediate_response:
+        logger.info("%s: Using intermediate response: %s", NODE_NAME, intermediate_response)
+        return intermediate_response, None, None
+    if error_msg and not (sql_result or rag_summary):
+        logger.warning("%s: Error from previous step: %s", NODE_NAME, error_msg)
+        return f"I encountered an issue trying to process your request: {error_msg}. Please try rephrasing or ask something else.", None, None
+
+    # Prepare context for non-greeting responses that need LLM formatting
+    context_for_llm = ""
+    if sql_result is not None:
+        context_for_llm = f"The database query for '{user_query}' returned: {_sql_result_text(state, config)}"
+    elif rag_summary:
+        context_for_llm = f"Information found regarding '{user_query}': {rag_summary}"
     else:
-        # Prepare context for non-greeting responses that need LLM formatting
-        context_for_llm = ""
-        if sql_result is not None:
-            context_for_llm = f"The database query for '{user_query}' returned: {sql_result}"
-        elif rag_summary:
-            context_for_llm = f"Information found regarding '{user_query}': {rag_summary}"
-        else:
-            context_for_llm = "I couldn't find a specific answer for your query. Please try rephrasing or asking something else."
-
-        if not intermediate_response and not error_msg:
-            prompt_template = load_prompt_from_path(config["prompt_path"])
-            formatted_prompt = prompt_template.format(user_query=user_query, information=context_for_llm)
-            logger.info(f"formatted prompt of response node {formatted_prompt}")
-
-            try:
-                final_answer = get_llm_response(
-                    prompt=formatted_prompt,
-                    model=config.get("llm_model")
-                )
-                if "Error:" in final_answer:
-                    logger.error(f"{NODE_NAME}: LLM error during final response synthesis: {final_answer}")
-                    final_answer = f"I encountered an issue while processing your request. Here's what I found: {context_for_llm[:200]}..."
-            except Exception as e:
-                logger.error(f"{NODE_NAME}: Error occurred while generating response: {str(e)}")
-                final_answer = "I encountered an issue while processing your request. Please try again later."
-
-    logger.info(f"{NODE_NAME}: Final answer: {final_answer}")
+        context_for_llm = "I couldn't find a specific answer for your query. Please try rephrasing or asking something else."
+
+    prompt_template = load_prompt_from_path(config["prompt_path"])
+    formatted_prompt = prompt_template.format(user_query=user_query, information=context_for_llm)
+    logger.debug("%s: formatted prompt: %s", NODE_NAME, formatted_prompt)
+    return None, formatted_prompt, context_for_llm
+
+
+def _check_llm_answer(final_answer: str, context_for_llm) -> str:
+    if context_for_llm is None:
+        logger.info("%s: Generated greeting response: %s", NODE_NAME, final_answer)
+        return final_answer
+    if "Error:" in final_answer:
+        logger.error("%s: LLM error during final response synthesis: %s", NODE_NAME, final_answer)
+        return f"I encountered an issue while processing your request. Here's what I found: {context_for_llm[:200]}..."
+    return final_answer
+
+
+def _response_result(state: AgentState, config: dict, final_answer: str, node_start_time: float,
+                     current_latencies: dict, current_order: list, cache_stats=None, token_usage=None) -> dict:
+    logger.info("%s: Final answer: %s", NODE_NAME, final_answer)
 
     # Update processing steps versions
     current_versions = state.get("processing_steps_versions", {})
     current_versions[NODE_NAME] = config.get("version")
-    partial_result = {}
-    node_end_time = time.perf_counter()
-    current_latencies[NODE_NAME] = round(node_end_time - node_start_time, 4)
-    partial_result["node_latencies"] = current_latencies
-    partial_result["node_execution_order"] = current_order
+    partial_result = finish_node_timing(NODE_NAME, node_start_time, current_latencies, current_order,
+                                        state=state, cache_stats=cache_stats, token_usage=token_usage)
+
+    return {"final_answer": final_answer, "processing_steps_versions": current_versions,**partial_result}
+
+
+def _config_error(node_start_time: float, current_latencies: dict, current_order: list) -> dict:
+    error_result = {"error_message": f"Configuration for node '{NODE_NAME}' not found."}
+    error_result.update(finish_node_timing(NODE_NAME, node_start_time, current_latencies, current_order))
+    return error_result
+
+
+def response_synthesis_node(state: AgentState) -> dict:
+    """
+    Synthesizes a final user-facing response from intermediate results.
+    """
+    node_start_time, current_latencies, current_order = begin_node_timing(state, NODE_NAME)
+
+    logger.info("--- NODE: %s ---", NODE_NAME)
+    config = get_node_config(NODE_NAME)
+
+    if not config:
+        return _config_error(node_start_time, current_latencies, current_order)
+
+    final_answer, formatted_prompt, context_for_llm = _plan_response(state, config)
+    cache_stats = new_cache_stats(config)
+    token_usage = new_token_usage()
+    if formatted_prompt is not None:
+        try:
+            final_answer = _check_llm_answer(
+                get_llm_response(prompt=formatted_prompt, model=config.get("llm_model"),
+                                 **llm_options_for_node(config, cache_stats, token_usage)),
+                context_for_llm
+            )
+        except Exception as e:
+            logger.error("%s: Error occurred while generating response: %s", NODE_NAME, e)
+            final_answer = "I encountered an issue while processing your request. Please try again later."
+
+    return _response_result(state, config, final_answer, node_start_time, current_latencies, current_order, cache_stats, token_usage)
+
+
+async def aresponse_synthesis_node(state: AgentState) -> dict:
+    """Async twin of response_synthesis_node."""
+    node_start_time, current_latencies, current_order = begin_node_timing(state, NODE_NAME)
+
+    logger.info("--- NODE: %s (async) ---", NODE_NAME)
+    config = get_node_config(NODE_NAME)
+
+    if not config:
+        return _config_error(node_start_time, current_latencies, current_order)
+
+    final_answer, formatted_prompt, context_for_llm = _plan_response(state, config)
+    cache_stats = new_cache_stats(config)
+    token_usage = new_token_usage()
+    if formatted_prompt is not None:
+        try:
+            final_answer = _check_llm_answer(
+                await aget_llm_response(prompt=formatted_prompt, model=config.get("llm_model"),
+                                        **llm_options_for_node(config, cache_stats, token_usage)),
+                context_for_llm
+            )
+        except Exception as e:
+            logger.error("%s: Error occurred while generating response: %s", NODE_NAME, e)
+            final_answer = "I encountered an issue while processing your request. Please try again later."
 
-    return {"final_answer": final_answer, "processing_steps_versions": current_versions,**partial_result}
\ No newline at end of file
+    return _response_result(state, config, final_answer, node_start_time, current_latencies, current_order, cache_stats, token_usage)
@@ -2,9 +2,12 @@
 import faiss
 import json
 import numpy as np
-from utils import get_embeddings, get_llm_response, load_prompt_from_path, get_node_config, logger
+from utils import (get_embeddings, aget_embeddings, get_llm_response, aget_llm_response, load_prompt_from_path,
+                   get_node_config, logger, begin_node_timing, finish_node_timing, llm_options_for_node,
+                   new_cache_stats)
 from graph_state import AgentState
-import time
+from token_accounting import count_text_tokens, estimate_cost_usd, new_token_usage
+import speculation
 NODE_NAME = "retrieval_processor"
 _faiss_index = None
 _metadata = None
@@ -13,70 +16,43 @@ def _load_retrieval_assets(config):
     global _faiss_index, _metadata
     if _faiss_index is None or _metadata is None: # Basic caching
         try:
-            logger.info(f"{NODE_NAME}: Loading FAISS index from {config['vector_store_path']}")
+            logger.info("%s: Loading FAISS index from %s", NODE_NAME, config['vector_store_path'])
             _faiss_index = faiss.read_index(config['vector_store_path'])
-            logger.info(f"{NODE_NAME}: Loading metadata from {config['metadata_store_path']}")
+            logger.info("%s: Loading metadata from %s", NODE_NAME, config['metadata_store_path'])
             with open(config['metadata_store_path'], 'r') as f:
                 _metadata = json.load(f)
-            logger.info(f"{NODE_NAME}: Retrieval assets loaded successfully.")
+            logger.info("%s: Retrieval assets loaded successfully.", NODE_NAME)
         except Exception as e:
-            logger.error(f"{NODE_NAME}: Failed to load retrieval assets: {e}")
+            logger.error("%s: Failed to load retrieval assets: %s", NODE_NAME, e)
             _faiss_index = None # Reset on error
             _metadata = None
             return False
     return True
 
 
-def retrieval_node(state: AgentState) -> dict:
-    """
-    Performs semantic search for relevant documents and synthesizes an answer using RAG.
-    Updates state with retrieved_contexts, rag_summary.
-    """
-    node_start_time = time.perf_counter() # Start timer for this node
-
-    # Initialize benchmarking fields in state if not present
-    current_latencies = state.get("node_latencies", {})
-    current_order = state.get("node_execution_order", [])
-    if NODE_NAME not in current_order:
-      current_order.append(NODE_NAME)
-
-    logger.info(f"--- NODE: {NODE_NAME} ---")
-    config = get_node_config(NODE_NAME)
-    if not config:
-        error_result = {"error_message": f"Configuration for node '{NODE_NAME}' not found."}
-        node_end_time = time.perf_counter()
-        current_latencies[NODE_NAME] = round(node_end_time - node_start_time, 4)
-        error_result["node_latencies"] = current_latencies
-        error_result["node_execution_order"] = current_order
-        return error_result
-
+def _check_assets(config) -> dict:
+    """Returns an error update if the FAISS index/metadata are unavailable, else None."""
     if not _load_retrieval_assets(config):
          return {"error_message": "Failed to load retrieval assets (FAISS index or metadata)."}
-    
+
     if _faiss_index is None or _metadata is None: # Double check after load attempt
         return {"error_message": "Retrieval assets are not available."}
+    return None
 
-    user_query = state["original_query"]
-    embedding_model = config["embedding_model"]
-    top_k = config.get("top_k", 3)
-    # similarity_threshold = config.get("similarity_threshold", 0.5) # FAISS L2 search returns distances
 
-    query_embedding_list = get_embeddings([user_query], model=embedding_model)
-    if not query_embedding_list or not query_embedding_list[0]:
-        logger.error(f"{NODE_NAME}: Failed to generate embedding for query: {user_query}")
-        return {"error_message": "Failed to generate query embedding."}
-    
+def _search_contexts(query_embedding_list, top_k: int) -> list:
+    """Runs the FAISS search for an embedded query and maps hits to context dicts."""
     query_embedding = np.array(query_embedding_list[0]).astype('float32').reshape(1, -1)
 
     # FAISS search: D = distances, I = indices
     distances, indices = _faiss_index.search(query_embedding, top_k)
-    
+
     retrieved_contexts = []
     if indices.size > 0:
         for i in range(indices.shape[1]): # Iterate through top_k results
             doc_index = indices[0][i]
             if 0 <= doc_index < len(_metadata):
-                # L2 distance is lower for more similar items. 
+                # L2 distance is lower for more similar items.
                 # We might want to convert this to a similarity score or filter by a max distance.
                 # For now, just retrieve top_k.
                 # logger.info(f"Retrieved doc index: {doc_index}, distance: {distances[0][i]}")
@@ -87,19 +63,22 @@ def retrieval_node(state: AgentState) -> dict:
                     "distance": float(distances[0][i]) # Add distance for potential filtering
                 })
             else:
-                logger.warning(f"{NODE_NAME}: Retrieved invalid document index {doc_index}.")
-    
-    logger.info(f"{NODE_NAME}: Retrieved {len(retrieved_contexts)} contexts.")
-    logger.info(f" Retrieved Context {retrieved_contexts}")
+                logger.warning("%s: Retrieved invalid document index %s.", NODE_NAME, doc_index)
 
+    logger.info("%s: Retrieved %s contexts.", NODE_NAME, len(retrieved_contexts))
+    logger.debug("%s: retrieved contexts: %s", NODE_NAME, retrieved_contexts)
+    return retrieved_contexts
 
-    if not retrieved_contexts:
-        return {
-            "retrieved_contexts": [], 
-            "rag_summary": "I couldn't find specific information about that in my knowledge base.",
-            "processing_steps_versions": {**state.get("processing_steps_versions", {}), NODE_NAME: config.get("version")}
-        }
 
+def _no_context_result(state: AgentState, config: dict) -> dict:
+    return {
+        "retrieved_contexts": [],
+        "rag_summary": "I couldn't find specific information about that in my knowledge base.",
+        "processing_steps_versions": {**state.get("processing_steps_versions", {}), NODE_NAME: config.get("version")}
+    }
+
+
+def _build_rag_prompt(config: dict, retrieved_contexts: list, user_query: str) -> str:
     # RAG: Synthesize answer from contexts
     rag_prompt_template = load_prompt_from_path(config["rag_prompt_path"])
     # Example RAG prompt (prompts/retrieval/v1_0_rag.txt):
@@ -116,24 +95,141 @@ def retrieval_node(state: AgentState) -> dict:
     """
     context_str = "\n\n---\n\n".join([ctx["text"] for ctx in retrieved_contexts])
     formatted_rag_prompt = rag_prompt_template.format(context_str=context_str, user_query=user_query)
-    logger.info(f"RAG Prompt: {formatted_rag_prompt}")
-    content = get_llm_response(
-        prompt=formatted_rag_prompt,
-        model=config.get("llm_model_for_rag")
-    )
-    partial_result = {}
+    logger.debug("%s: RAG prompt: %s", NODE_NAME, formatted_rag_prompt)
+    return formatted_rag_prompt
+
+
+def _retrieval_result(state: AgentState, config: dict, content, retrieved_contexts: list,
+                      node_start_time: float, current_latencies: dict, current_order: list, cache_stats=None, token_usage=None) -> dict:
     # Update processing steps versions
-    node_end_time = time.perf_counter()
-    current_latencies[NODE_NAME] = round(node_end_time - node_start_time, 4)
-    partial_result["node_latencies"] = current_latencies
-    partial_result["node_execution_order"] = current_order
+    partial_result = finish_node_timing(NODE_NAME, node_start_time, current_latencies, current_order,
+                                        state=state, cache_stats=cache_stats, token_usage=token_usage)
     new_State = {"intermediate_response": content.strip() if content else "",
         "rag_summary": content.strip() if content else "",
         "error_message": None,
         "processing_steps_versions": {NODE_NAME: config.get("version")},
         "retrieved_contexts": retrieved_contexts,**partial_result
         }
-    logger.info(f"{NODE_NAME}: RAG summary: {state['rag_summary']}")
-    logger.info(f"{NODE_NAME}: Intermediate response: {state['intermediate_response']}")
+    logger.debug("%s: RAG summary: %s", NODE_NAME, new_State["rag_summary"])
+
+    return new_State
+
+
+def _speculative_search(user_query: str):
+    """Embedding + FAISS search for speculation.py, run while the intent is still being parsed."""
+    config = get_node_config(NODE_NAME)
+    if not config or _check_assets(config):
+        return None
+    query_embedding_list = get_embeddings([user_query], model=config["embedding_model"])
+    if not query_embedding_list or not query_embedding_list[0]:
+        return None
+    return _search_contexts(query_embedding_list, config.get("top_k", 3))
+
+
+async def _aspeculative_search(user_query: str):
+    config = get_node_config(NODE_NAME)
+    if not config or _check_assets(config):
+        return None
+    query_embedding_list = await aget_embeddings([user_query], model=config["embedding_model"])
+    if not query_embedding_list or not query_embedding_list[0]:
+        return None
+    return _search_contexts(query_embedding_list, config.get("top_k", 3))
+
+
+def _speculative_search_cost(user_query: str) -> float:
+    config = get_node_config(NODE_NAME) or {}
+    model = config.get("embedding_model", "text-embedding-3-small")
+    return estimate_cost_usd(model, count_text_tokens(user_query, model), 0)
+
+
+speculation.register_branch(NODE_NAME, _speculative_search, _aspeculative_search, _speculative_search_cost)
+
 
-    return new_State
\ No newline at end of file
+def _config_error(node_start_time: float, current_latencies: dict, current_order: list) -> dict:
+    error_result = {"error_message": f"Configuration for node '{NODE_NAME}' not found."}
+    error_result.update(finish_node_timing(NODE_NAME, node_start_time, current_latencies, current_order))
+    return error_result
+
+
+def retrieval_node(state: AgentState) -> dict:
+    """
+    Performs semantic search for relevant documents and synthesizes an answer using RAG.
+    Updates state with retrieved_contexts, rag_summary.
+    """
+    node_start_time, current_latencies, current_order = begin_node_timing(state, NODE_NAME)
+
+    logger.info("--- NODE: %s ---", NODE_NAME)
+    config = get_node_config(NODE_NAME)
+    if not config:
+        return _config_error(node_start_time, current_latencies, current_order)
+
+    # Contexts found speculatively while the intent was being parsed (see speculation.py)
+    retrieved_contexts, speculation_update = speculation.claim(state, NODE_NAME)
+
+    asset_error = _check_assets(config)
+    if asset_error:
+        return asset_error
+
+    user_query = state["original_query"]
+    top_k = config.get("top_k", 3)
+    # similarity_threshold = config.get("similarity_threshold", 0.5) # FAISS L2 search returns distances
+
+    if retrieved_contexts is None:
+        query_embedding_list = get_embeddings([user_query], model=config["embedding_model"])
+        if not query_embedding_list or not query_embedding_list[0]:
+            logger.error("%s: Failed to generate embedding for query: %s", NODE_NAME, user_query)
+            return {"error_message": "Failed to generate query embedding.", **speculation_update}
+
+        retrieved_contexts = _search_contexts(query_embedding_list, top_k)
+    if not retrieved_contexts:
+        return {**_no_context_result(state, config), **speculation_update}
+
+    cache_stats = new_cache_stats(config)
+    token_usage = new_token_usage()
+    content = get_llm_response(
+        prompt=_build_rag_prompt(config, retrieved_contexts, user_query),
+        model=config.get("llm_model_for_rag"),
+        **llm_options_for_node(config, cache_stats, token_usage)
+    )
+    return {**_retrieval_result(state, config, content, retrieved_contexts, node_start_time, current_latencies,
+                                current_order, cache_stats, token_usage), **speculation_update}
+
+
+async def aretrieval_node(state: AgentState) -> dict:
+    """Async twin of retrieval_node; embedding and RAG calls are awaited."""
+    node_start_time, current_latencies, current_order = begin_node_timing(state, NODE_NAME)
+
+    logger.info("--- NODE: %s (async) ---", NODE_NAME)
+    config = get_node_config(NODE_NAME)
+    if not config:
+        return _config_error(node_start_time, current_latencies, current_order)
+
+    retrieved_contexts, speculation_update = await speculation.aclaim(state, NODE_NAME)
+
+    asset_error = _check_assets(config)
+    if asset_error:
+        return asset_error
+
+    user_query = state["original_query"]
+    top_k = config.get("top_k", 3)
+
+    if retrieved_contexts is None:
+        query_embedding_list = await aget_embeddings([user_query], model=config["embedding_model"])
+        if not query_embedding_list or not query_embedding_list[0]:
+            logger.error("%s: Failed to generate embedding for query: %s", NODE_NAME, user_query)
+            return {"error_message": "Failed to generate query embedding.", **speculation_update}
+
+        # The FAISS search over the bundled index is sub-millisecond, so it stays on the loop
+        retrieved_contexts = _search_contexts(query_embedding_list, top_k)
+    if not retrieved_contexts:
+        return {**_no_context_result(state, config), **speculation_update}
+
+    cache_stats = new_cache_stats(config)
+    token_usage = new_token_usage()
+    content = await aget_llm_response(
+        prompt=_build_rag_prompt(config, retrieved_contexts, user_query),
+        model=config.get("llm_model_for_rag"),
+        **llm_options_for_node(config, cache_stats, token_usage)
+    )
+    return {**_retrieval_result(state, config, content, retrieved_contexts, node_start_time, current_latencies,
+                                current_order, cache_stats, token_usage), **speculation_update}
@@ -1,114 +1,399 @@
 # agents/sql_node.py
+import asyncio
 import sqlite3
 import time
-import json
-from utils import get_llm_response, load_prompt_from_path, get_node_config, logger, DB_SCHEMA_FOR_PROMPT
+from utils import (get_llm_response, aget_llm_response, load_prompt_from_path, get_node_config, logger,
+                   begin_node_timing, finish_node_timing, llm_options_for_node, new_cache_stats)
 from graph_state import AgentState
-import time
+from token_accounting import count_text_tokens, estimate_cost_usd, new_token_usage
+import speculation
+import sql_templates
+from batch_runner import current_batch_session
+from sql_backends import QueryCancelled, SqlBackendError, backend_for
+from sql_guard import DEFAULT_GUARD_SETTINGS, SqlGuardError, execute_guarded
+from sql_result_cache import result_cache_for
+from product_search import indexed_statement
+from sql_workload import recorder_for
+from schema_introspection import schema_for_sql_prompt
 
 NODE_NAME = "sql_processor"
+DEFAULT_SQL_MAX_OUTPUT_TOKENS = 300
+_TEMPLATE_SOURCES = {"vetted": "template", "learned": "learned_template"} # template.source -> sql_source
+_LLM_SOURCES = ("llm", "speculation") # SQL written by this node's prompt, which templates are learned from
 
-def sql_node(state: AgentState) -> dict:
-    """
-    Generates SQL from user query (if intent is SQL-related), executes it.
-    Updates state with sql_query_generated, sql_query_result.
-    """
-    node_start_time = time.perf_counter() # Start timer for this node
-
-    # Initialize benchmarking fields in state if not present
-    current_latencies = state.get("node_latencies", {})
-    current_order = state.get("node_execution_order", [])
-    if NODE_NAME not in current_order:
-      current_order.append(NODE_NAME)
-      
-    logger.info(f"--- NODE: {NODE_NAME} ---")
-    config = get_node_config(NODE_NAME)
-    if not config:
-        error_result = {"error_message": f"Configuration for node '{NODE_NAME}' not found."}
-        node_end_time = time.perf_counter()
-        current_latencies[NODE_NAME] = round(node_end_time - node_start_time, 4)
-        error_result["node_latencies"] = current_latencies
-        error_result["node_execution_order"] = current_order
-        return error_result
-
-    user_query = state["original_query"]
-    entities = state.get("entities", {})
-    
-    # Construct a more targeted query for the LLM if entities are present
-    # This depends on how the intent parser and this node are designed to interact
-    # For now, we pass the original query and expect the SQL prompt to handle it.
 
+def _build_sql_prompt(config: dict, user_query: str, intent: str = None, entities: dict = None) -> str:
     prompt_template = load_prompt_from_path(config["prompt_path"])
-    # The prompt should include the DB_SCHEMA_FOR_PROMPT placeholder or have it embedded
-    # prompts/sql/v1_0_schema.txt:
+    serach_term = """
+'%{search_term}%'
+"""
+    # Live schema, pruned to the tables the intent, entities and question need (schema_introspection.py)
+    db_schema = schema_for_sql_prompt(config, user_query, intent, entities)
+    return prompt_template.format(serach_term=serach_term, db_schema=db_schema, user_query=user_query)
+
+
+def _fused_sql(state: AgentState):
+    """SQL already written by a fused intent_parser version (see its `mode: fused_sql`), or None."""
+    generated_sql = state.get("sql_query_generated")
+    if generated_sql:
+        logger.info("%s: Using SQL from the fused intent call; skipping SQL generation", NODE_NAME)
+        return generated_sql
+    return None
+
+
+def _refused_result(state: AgentState, config: dict, generated_sql: str, sql_source: str) -> dict:
+    logger.warning("%s: SQL generation failed or refused: %s", NODE_NAME, generated_sql)
+    return {
+        "sql_query_generated": generated_sql,
+        "sql_source": sql_source,
+        "sql_query_result": None,
+        "error_message": "SQL generation failed or request refused.",
+        "processing_steps_versions": {**state.get("processing_steps_versions", {}), NODE_NAME: config.get("version")}
+    }
+
+
+def _is_refusal(generated_sql: str) -> bool:
+    return "Error:" in generated_sql or "I cannot answer this question" in generated_sql
+
+
+def _sqlite_work(config: dict, generated_sql: str, params: dict = None, result_cache_stats: dict = None,
+                 inspect_plan: bool = True, fts_sql: str = None):
     """
-    You are an AI assistant that translates natural language questions into SQL queries for an e-commerce database.
-    {db_schema}
+    The statement on a SQLite connection: returns work(conn) -> (results, truncated).
+    Template statements come with `params` and run as prepared statements. Product-name LIKE filters use
+    the FTS index when the database has one (product_search.py); a template's `fts_sql` replaces the
+    statement in that case. With `result_cache` enabled, rows are served from the SQL result cache while
+    the tables they came from are unchanged. Everything else goes through the guard (sql_guard.py): plan
+    check, time limit and row cap. Executed statements are recorded for the index advisor when `workload`
+    recording is on (sql_workload.py).
+    """
+    guard_settings = {**DEFAULT_GUARD_SETTINGS, **(config.get("guard") or {})}
+    result_cache = result_cache_for(config["db_path"], config.get("result_cache"))
+    workload = recorder_for(config.get("workload"))
+
+    def work(conn):
+        sql, truncated = generated_sql, False
+        if (config.get("product_search") or {}).get("enabled", True):
+            sql, indexed = indexed_statement(conn, sql, params, fts_sql, config["db_path"])
+            if indexed:
+                logger.info("%s: Product name lookup uses the %sFTS index.", NODE_NAME, 'ranked ' if fts_sql else '')
+        results, pending = result_cache.lookup(conn, sql, params) if result_cache else (None, None)
+        cache_hit = results is not None
+        if result_cache_stats is not None:
+            result_cache_stats["hits" if cache_hit else "misses"] += 1
+        started = time.perf_counter()
+        if cache_hit:
+            logger.info("%s: SQL result served from the result cache.", NODE_NAME)
+        elif guard_settings["enabled"]:
+            guarded = execute_guarded(conn, sql, params, guard_settings, inspect_plan=inspect_plan,
+                                      db_key=config["db_path"])
+            results, truncated = guarded.rows, guarded.truncated
+            if guarded.rewritten:
+                logger.warning("%s: Full scan of %s; limited to %s rows",
+                               NODE_NAME, guarded.full_scans[0], guard_settings['max_rows'])
+            if truncated:
+                logger.warning("%s: SQL result truncated at %s rows", NODE_NAME, len(results))
+            elif result_cache is not None: # a truncated result is not the query's answer
+                result_cache.store(pending, results)
+        else:
+            # The pooled connection returns sqlite3.Row objects
+            query_results_raw = conn.execute(sql, params or ()).fetchall()
+            # Convert Row objects to simple dictionaries for JSON serialization if needed later
+            results = [dict(row) for row in query_results_raw]
+            if result_cache is not None:
+                result_cache.store(pending, results)
+        if workload is not None and not cache_hit:
+            workload.record(conn, sql, params, (time.perf_counter() - started) * 1000, len(results))
+        return results, truncated
+    return work
+
 
-    Only generate valid SQLite SELECT queries. Do not generate INSERT, UPDATE, or DELETE queries.
-    If the question cannot be answered with a SELECT query, or seems malicious, respond with "I cannot answer this question."
+def _sql_work(backend, config: dict, generated_sql: str, params: dict = None, result_cache_stats: dict = None,
+              inspect_plan: bool = True, fts_sql: str = None):
+    """work(conn) -> (results, truncated) for the backend's dialect; other databases only get the row cap."""
+    if backend.dialect == "sqlite":
+        return _sqlite_work(config, generated_sql, params, result_cache_stats, inspect_plan, fts_sql)
+    guard_settings = {**DEFAULT_GUARD_SETTINGS, **(config.get("guard") or {})}
+    return lambda conn: backend.fetch(conn, generated_sql, params, guard_settings["max_rows"],
+                                      guard_settings["fetch_batch_size"])
 
-    User Question: {user_query}
-    SQL Query:
+
+def _execution_error(e: Exception, backend, generated_sql: str) -> str:
+    if isinstance(e, SqlGuardError):
+        logger.warning("%s: %s Query: %s", NODE_NAME, e, generated_sql)
+        return str(e)
+    if isinstance(e, backend.errors if backend is not None else sqlite3.Error):
+        logger.error("%s: Database error: %s for query: %s", NODE_NAME, e, generated_sql)
+        return f"Database error: {e}"
+    if isinstance(e, SqlBackendError):
+        logger.error("%s: SQL backend unavailable: %s", NODE_NAME, e)
+        return f"Database unavailable: {e}"
+    logger.error("%s: Unexpected error executing SQL: %s for query: %s", NODE_NAME, e, generated_sql)
+    return f"Unexpected error during SQL execution: {e}"
+
+
+def _execute_sql(config: dict, generated_sql: str, params: dict = None, result_cache_stats: dict = None,
+                 inspect_plan: bool = True, fts_sql: str = None):
     """
-    serach_term = """
-'%{search_term}%'
-"""
-    formatted_prompt = prompt_template.format(serach_term=serach_term,db_schema=DB_SCHEMA_FOR_PROMPT, user_query=user_query)
-    
-    generated_sql = get_llm_response(
-        prompt=formatted_prompt,
-        model=config.get("llm_model")
-    )
-
-    if "Error:" in generated_sql or "I cannot answer this question" in generated_sql:
-        logger.warning(f"{NODE_NAME}: SQL generation failed or refused: {generated_sql}")
-        return {
-            "sql_query_generated": generated_sql, 
-            "sql_query_result": None, 
-            "error_message": "SQL generation failed or request refused.",
-            "processing_steps_versions": {**state.get("processing_steps_versions", {}), NODE_NAME: config.get("version")}
-        }
-    
-    logger.info(f"{NODE_NAME}: Generated SQL: {generated_sql}")
+    Runs the SQL on the configured backend (sql_backends.py) from this thread and returns
+    (results, error_msg, truncated). QueryCancelled propagates, so a cancelled request stops the graph.
+    """
+    backend = None
+    try:
+        backend = backend_for(config)
+        results, truncated = backend.run(_sql_work(backend, config, generated_sql, params, result_cache_stats,
+                                                   inspect_plan, fts_sql))
+    except QueryCancelled:
+        logger.warning("%s: SQL cancelled with its request: %s", NODE_NAME, generated_sql)
+        raise
+    except Exception as e:
+        return None, _execution_error(e, backend, generated_sql), False
+    logger.info("%s: SQL execution successful, %s rows returned.", NODE_NAME, len(results))
+    logger.debug("%s: SQL result rows: %s", NODE_NAME, results)
+    return results, None, truncated
 
-    # Execute SQL
-    db_path = config["db_path"]
-    results = None
-    error_msg = None
+
+async def _aexecute_sql(config: dict, generated_sql: str, params: dict = None, result_cache_stats: dict = None,
+                        inspect_plan: bool = True, fts_sql: str = None):
+    """Async twin of _execute_sql: the statement runs on one of the backend's threads."""
+    backend = None
     try:
-        conn = sqlite3.connect(db_path)
-        # To return results as dictionaries instead of tuples
-        conn.row_factory = sqlite3.Row 
-        cursor = conn.cursor()
-        cursor.execute(generated_sql)
-        query_results_raw = cursor.fetchall()
-        # Convert Row objects to simple dictionaries for JSON serialization if needed later
-        results = [dict(row) for row in query_results_raw]
-        conn.close()
-        logger.info(f"{NODE_NAME}: SQL execution successful, {len(results)} rows returned.")
-        logger.info(f"the result of SQL {results}: ")
-
-    except sqlite3.Error as e:
-        logger.error(f"{NODE_NAME}: Database error: {e} for query: {generated_sql}")
-        error_msg = f"Database error: {e}"
-        results = None # Ensure results is None on error
-    except Exception as e: # Catch other potential errors
-        logger.error(f"{NODE_NAME}: Unexpected error executing SQL: {e} for query: {generated_sql}")
-        error_msg = f"Unexpected error during SQL execution: {e}"
-        results = None
-    partial_result = {}
+        backend = backend_for(config)
+        results, truncated = await backend.arun(_sql_work(backend, config, generated_sql, params,
+                                                          result_cache_stats, inspect_plan, fts_sql))
+    except (QueryCancelled, asyncio.CancelledError):
+        logger.warning("%s: SQL cancelled with its request: %s", NODE_NAME, generated_sql)
+        raise
+    except Exception as e:
+        return None, _execution_error(e, backend, generated_sql), False
+    logger.info("%s: SQL execution successful, %s rows returned.", NODE_NAME, len(results))
+    logger.debug("%s: SQL result rows: %s", NODE_NAME, results)
+    return results, None, truncated
+
+
+def _new_result_cache_stats(config: dict):
+    """Fresh hit/miss counters for this run, or None if the SQL result cache is off."""
+    return {"hits": 0, "misses": 0} if (config.get("result_cache") or {}).get("enabled") else None
+
+
+def _statement(generated_sql: str, template_match):
+    """(SQL to execute, bound parameters, FTS variant): a template runs parameterized, anything else as written."""
+    if template_match is not None:
+        return template_match.template.sql, template_match.params, template_match.template.fts_sql
+    return generated_sql, None, None
+
+
+def _sql_result(state: AgentState, config: dict, generated_sql: str, sql_source: str, results, error_msg,
+                node_start_time: float, current_latencies: dict, current_order: list, cache_stats=None, token_usage=None,
+                result_cache_stats=None, truncated: bool = False) -> dict:
     # Update processing steps versions
     current_versions = state.get("processing_steps_versions", {})
     current_versions[NODE_NAME] = config.get("version")
-    node_end_time = time.perf_counter()
-    current_latencies[NODE_NAME] = round(node_end_time - node_start_time, 4)
-    partial_result["node_latencies"] = current_latencies
-    partial_result["node_execution_order"] = current_order
+    partial_result = finish_node_timing(NODE_NAME, node_start_time, current_latencies, current_order,
+                                        state=state, cache_stats=cache_stats, token_usage=token_usage,
+                                        result_cache_stats=result_cache_stats)
     return {
         "sql_query_generated": generated_sql,
+        "sql_source": sql_source,
         "sql_query_result": results,
+        "sql_result_truncated": truncated,
         "error_message": error_msg,
         "processing_steps_versions": current_versions,
         **partial_result
-    }
\ No newline at end of file
+    }
+
+
+def _sql_templates(config: dict):
+    """(template library or None if disabled, its settings)."""
+    templates_config = config.get("templates") or {}
+    if not templates_config.get("enabled"):
+        return None, templates_config
+    return sql_templates.library_for(templates_config), templates_config
+
+
+def _learning(templates_config: dict) -> bool:
+    # Learned templates change between batch rounds; replays stick to the vetted ones
+    return templates_config.get("learn", True) and current_batch_session() is None
+
+
+def _template_match(state: AgentState, config: dict):
+    """Vetted or learned statement for the parsed intent and entities (see sql_templates.py), or None."""
+    library, templates_config = _sql_templates(config)
+    if library is None:
+        return None
+    match = library.match(config.get("version"), state.get("intent"), state.get("entities"),
+                          state["original_query"], learned=_learning(templates_config))
+    if match is not None:
+        logger.info("%s: Using %s SQL template '%s'; skipping SQL generation",
+                    NODE_NAME, match.template.source, match.template.name)
+    return match
+
+
+def _learn_template(state: AgentState, config: dict, generated_sql: str):
+    """Records SQL the LLM wrote that executed fine, so a repeating shape becomes a learned template."""
+    library, templates_config = _sql_templates(config)
+    if library is None or not _learning(templates_config):
+        return
+    template = library.observe(config.get("version"), state.get("intent"), state.get("entities"),
+                               state["original_query"], generated_sql)
+    if template is not None:
+        logger.info("%s: Learned SQL template '%s': %s", NODE_NAME, template.name, template.sql)
+
+
+def _speculation_redundant(result: dict, query: str) -> bool:
+    """Speculative SQL is wasted when the fused intent call wrote the SQL or a template answers the intent."""
+    if result.get("sql_query_generated"):
+        return True
+    config = get_node_config(NODE_NAME)
+    library, templates_config = _sql_templates(config or {})
+    return library is not None and library.find(config.get("version"), result.get("intent"), result.get("entities"),
+                                                query, learned=_learning(templates_config)) is not None
+
+
+def _speculative_sql(user_query: str):
+    """SQL generation for speculation.py, run while the intent is still being parsed."""
+    config = get_node_config(NODE_NAME)
+    if not config:
+        return None
+    cache_stats, token_usage = new_cache_stats(config), new_token_usage()
+    generated_sql = get_llm_response(prompt=_build_sql_prompt(config, user_query), model=config.get("llm_model"),
+                                     **llm_options_for_node(config, cache_stats, token_usage))
+    return generated_sql, cache_stats, token_usage
+
+
+async def _aspeculative_sql(user_query: str):
+    config = get_node_config(NODE_NAME)
+    if not config:
+        return None
+    cache_stats, token_usage = new_cache_stats(config), new_token_usage()
+    generated_sql = await aget_llm_response(prompt=_build_sql_prompt(config, user_query),
+                                            model=config.get("llm_model"),
+                                            **llm_options_for_node(config, cache_stats, token_usage))
+    return generated_sql, cache_stats, token_usage
+
+
+def _speculative_sql_cost(user_query: str) -> float:
+    """Pre-flight estimate: the full prompt plus a completion of max_output_tokens."""
+    config = get_node_config(NODE_NAME)
+    if not config:
+        return 0.0
+    model = config.get("llm_model", "gpt-4o")
+    return estimate_cost_usd(model, count_text_tokens(_build_sql_prompt(config, user_query), model),
+                             config.get("max_output_tokens", DEFAULT_SQL_MAX_OUTPUT_TOKENS))
+
+
+speculation.register_branch(NODE_NAME, _speculative_sql, _aspeculative_sql, _speculative_sql_cost,
+                            redundant=_speculation_redundant)
+
+
+def _config_error(node_start_time: float, current_latencies: dict, current_order: list) -> dict:
+    error_result = {"error_message": f"Configuration for node '{NODE_NAME}' not found."}
+    error_result.update(finish_node_timing(NODE_NAME, node_start_time, current_latencies, current_order))
+    return error_result
+
+
+def sql_node(state: AgentState) -> dict:
+    """
+    Generates SQL from user query (if intent is SQL-related), executes it.
+    Updates state with sql_query_generated, sql_query_result.
+    """
+    node_start_time, current_latencies, current_order = begin_node_timing(state, NODE_NAME)
+
+    logger.info("--- NODE: %s ---", NODE_NAME)
+    config = get_node_config(NODE_NAME)
+    if not config:
+        return _config_error(node_start_time, current_latencies, current_order)
+
+    # A fused intent_parser version may have written the SQL already; then this node only executes it
+    generated_sql = _fused_sql(state)
+    sql_source = "fused" if generated_sql is not None else None
+    cache_stats = token_usage = None
+    # A vetted or learned parameterized statement for the intent and entities
+    template_match = _template_match(state, config) if generated_sql is None else None
+    if template_match is not None:
+        generated_sql, sql_source = template_match.rendered_sql, _TEMPLATE_SOURCES[template_match.template.source]
+    # SQL generated speculatively while the intent was being parsed (see speculation.py)
+    speculative, speculation_update = speculation.claim(state, NODE_NAME)
+    if generated_sql is None and speculative is not None:
+        (generated_sql, cache_stats, token_usage), sql_source = speculative, "speculation"
+    if generated_sql is None:
+        sql_source = "llm"
+        # Construct a more targeted query for the LLM if entities are present
+        # This depends on how the intent parser and this node are designed to interact
+        # For now, we pass the original query and expect the SQL prompt to handle it.
+        formatted_prompt = _build_sql_prompt(config, state["original_query"], state.get("intent"),
+                                             state.get("entities"))
+        cache_stats = new_cache_stats(config)
+        token_usage = new_token_usage()
+
+        generated_sql = get_llm_response(
+            prompt=formatted_prompt,
+            model=config.get("llm_model"),
+            **llm_options_for_node(config, cache_stats, token_usage)
+        )
+
+    if _is_refusal(generated_sql):
+        return {**_refused_result(state, config, generated_sql, sql_source), **speculation_update}
+
+    logger.info("%s: Generated SQL: %s", NODE_NAME, generated_sql)
+
+    # Execute SQL
+    statement, params, fts_sql = _statement(generated_sql, template_match)
+    result_cache_stats = _new_result_cache_stats(config)
+    # Vetted templates are known to be cheap enough; their plans are not inspected
+    results, error_msg, truncated = _execute_sql(config, statement, params, result_cache_stats,
+                                                 inspect_plan=sql_source != "template", fts_sql=fts_sql)
+    if error_msg is None and sql_source in _LLM_SOURCES:
+        _learn_template(state, config, generated_sql)
+    return {**_sql_result(state, config, generated_sql, sql_source, results, error_msg, node_start_time,
+                          current_latencies, current_order, cache_stats, token_usage, result_cache_stats,
+                          truncated),
+            **speculation_update}
+
+
+async def asql_node(state: AgentState) -> dict:
+    """Async twin of sql_node; the SQL runs on one of the backend's threads, off the event loop."""
+    node_start_time, current_latencies, current_order = begin_node_timing(state, NODE_NAME)
+
+    logger.info("--- NODE: %s (async) ---", NODE_NAME)
+    config = get_node_config(NODE_NAME)
+    if not config:
+        return _config_error(node_start_time, current_latencies, current_order)
+
+    generated_sql = _fused_sql(state)
+    sql_source = "fused" if generated_sql is not None else None
+    cache_stats = token_usage = None
+    template_match = _template_match(state, config) if generated_sql is None else None
+    if template_match is not None:
+        generated_sql, sql_source = template_match.rendered_sql, _TEMPLATE_SOURCES[template_match.template.source]
+    speculative, speculation_update = await speculation.aclaim(state, NODE_NAME)
+    if generated_sql is None and speculative is not None:
+        (generated_sql, cache_stats, token_usage), sql_source = speculative, "speculation"
+    if generated_sql is None:
+        sql_source = "llm"
+        formatted_prompt = _build_sql_prompt(config, state["original_query"], state.get("intent"),
+                                             state.get("entities"))
+        cache_stats = new_cache_stats(config)
+        token_usage = new_token_usage()
+
+        generated_sql = await aget_llm_response(
+            prompt=formatted_prompt,
+            model=config.get("llm_model"),
+            **llm_options_for_node(config, cache_stats, token_usage)
+        )
+
+    if _is_refusal(generated_sql):
+        return {**_refused_result(state, config, generated_sql, sql_source), **speculation_update}
+
+    logger.info("%s: Generated SQL: %s", NODE_NAME, generated_sql)
+
+    statement, params, fts_sql = _statement(generated_sql, template_match)
+    result_cache_stats = _new_result_cache_stats(config)
+    results, error_msg, truncated = await _aexecute_sql(config, statement, params, result_cache_stats,
+                                                        inspect_plan=sql_source != "template", fts_sql=fts_sql)
+    if error_msg is None and sql_source in _LLM_SOURCES:
+        _learn_template(state, config, generated_sql)
+    return {**_sql_result(state, config, generated_sql, sql_source, results, error_msg, node_start_time,
+                          current_latencies, current_order, cache_stats, token_usage, result_cache_stats,
+                          truncated),
+            **speculation_update}
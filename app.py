@@ -1,8 +1,10 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context, g
 from dotenv import load_dotenv
 from app_graph import app as langgraph_app
-from graph_state import AgentState
+from graph_state import AgentState, build_initial_state
 from utils import logger, load_agent_registry
+from chat_stream import cancellable_events, stream_chat_events, final_response_text, to_sse
+from log_pipeline import set_correlation_id, get_correlation_id
 import os
 import time # Import time module
 
@@ -17,6 +19,17 @@ if not os.getenv("OPENAI_API_KEY"):
 # Load registry once
 load_agent_registry()
 
+@app.before_request
+def assign_correlation_id():
+    # Every log line of the request, graph nodes included, carries this id; callers may pass their own
+    set_correlation_id(request.headers.get("X-Request-ID"))
+    g.correlation_id = get_correlation_id()
+
+@app.after_request
+def return_correlation_id(response):
+    response.headers["X-Request-ID"] = g.get("correlation_id", "-")
+    return response
+
 @app.route("/")
 def index():
     return render_template("index.html")  # Optional HTML interface
@@ -29,24 +42,7 @@ def ask():
     if not user_input:
         return jsonify({"error": "Empty message"}), 400
 
-    # Ensure node_latencies and node_execution_order are part of initial_state if AgentState includes them
-    # This is good practice, though they are primarily populated by the nodes themselves.
-    initial_state: AgentState = {
-        "original_query": user_input,
-        "intent": None,
-        "entities": None,
-        "sql_query_generated": None,
-        "sql_query_result": None,
-        "retrieved_contexts": None,
-        "rag_summary": None,
-        "intermediate_response": None,
-        "final_answer": None,
-        "error_message": None,
-        "history": [],
-        "processing_steps_versions": {},
-        "node_latencies": {},  # Initialize for benchmarking data
-        "node_execution_order": [] # Initialize for benchmarking data
-    }
+    initial_state: AgentState = build_initial_state(user_input)
 
     try:
         start_time = time.perf_counter() # Start timer for total processing
@@ -54,25 +50,19 @@ def ask():
         end_time = time.perf_counter() # End timer for total processing
         processing_time = end_time - start_time
         
-        logger.info(f"Total LangGraph processing time for query '{user_input[:50]}...': {processing_time:.4f} seconds")
+        logger.info("Total LangGraph processing time for query '%s...': %.4f seconds", user_input[:50], processing_time)
 
         # Log per-node latencies and execution order if available
         node_latencies = final_state.get("node_latencies")
         node_execution_order = final_state.get("node_execution_order")
 
         if node_latencies:
-            logger.info(f"Per-node latencies: {node_latencies}")
+            logger.info("Per-node latencies: %s", node_latencies)
         if node_execution_order:
-            logger.info(f"Node execution order: {' -> '.join(node_execution_order)}")
+            logger.info("Node execution order: %s", ' -> '.join(node_execution_order))
 
 
-        response_data = {}
-        if final_state.get("final_answer"):
-            response_data = {"response": final_state["final_answer"]}
-        elif final_state.get("error_message"):
-            response_data = {"response": f"I encountered an error: {final_state['error_message']}"}
-        else:
-            response_data = {"response": "I'm not sure how to respond to that."}
+        response_data = {"response": final_response_text(final_state)}
         
         # Optionally add processing time and benchmark data to response for debugging
         # response_data["debug_total_processing_time_seconds"] = round(processing_time, 4)
@@ -87,5 +77,24 @@ def ask():
         logger.error("Error during processing", exc_info=True)
         return jsonify({"response": "A critical error occurred."}), 500
 
+@app.route("/chat/stream", methods=["GET", "POST"])
+def ask_stream():
+    """Same as /chat, but answers as server-sent events: node progress, then tokens, then `done`."""
+    if request.method == "POST":
+        user_input = (request.get_json(silent=True) or {}).get("message", "").strip()
+    else:
+        user_input = request.args.get("message", "").strip() # EventSource can only issue GETs
+
+    if not user_input:
+        return jsonify({"error": "Empty message"}), 400
+
+    def generate():
+        # Heartbeats reveal a disconnected client, which cancels the request's running SQL
+        for event in cancellable_events(lambda: stream_chat_events(langgraph_app, user_input)):
+            yield to_sse(event)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -1,39 +1,37 @@
 # app_graph.py
 from langgraph.graph import StateGraph, END
-from graph_state import AgentState
-from agents.intent_parser_node import parse_intent_node
-from agents.sql_node import sql_node
-from agents.retrieval_node import retrieval_node
-from agents.meta_query_node import meta_query_node
-from agents.response_node import response_synthesis_node
+from langchain_core.runnables import RunnableLambda
+from graph_state import AgentState, INTENT_BRANCHES, branch_for_intent
+from agents.intent_parser_node import parse_intent_node, aparse_intent_node
+from agents.sql_node import sql_node, asql_node
+from agents.retrieval_node import retrieval_node, aretrieval_node
+from agents.meta_query_node import meta_query_node, ameta_query_node
+from agents.response_node import response_synthesis_node, aresponse_synthesis_node
 from utils import logger
 
 # Define nodes
 workflow = StateGraph(AgentState)
 
-workflow.add_node("intent_parser", parse_intent_node)
-workflow.add_node("sql_processor", sql_node)
-workflow.add_node("retrieval_processor", retrieval_node)
-workflow.add_node("meta_query_handler", meta_query_node)
-workflow.add_node("response_synthesizer", response_synthesis_node)
+# Each node carries its sync and async implementation: app.invoke runs the sync one,
+# app.ainvoke / app.astream run the async twin on the AsyncOpenAI client.
+workflow.add_node("intent_parser", RunnableLambda(parse_intent_node, afunc=aparse_intent_node))
+workflow.add_node("sql_processor", RunnableLambda(sql_node, afunc=asql_node))
+workflow.add_node("retrieval_processor", RunnableLambda(retrieval_node, afunc=aretrieval_node))
+workflow.add_node("meta_query_handler", RunnableLambda(meta_query_node, afunc=ameta_query_node))
+workflow.add_node("response_synthesizer", RunnableLambda(response_synthesis_node, afunc=aresponse_synthesis_node))
 
 # Define edges
 workflow.set_entry_point("intent_parser")
 
 def route_after_intent(state: AgentState):
     intent = state.get("intent")
-    logger.info(f"Routing based on intent: {intent}")
-    if intent in ["SQL_QUERY", "SQL_QUERY_GENERAL", "ORDER_STATUS", "PRODUCT_AVAILABILITY"]:
-        return "sql_processor"
-    elif intent in ["RETURN_INFO", "SHIPPING_INFO","PROBLEM_REPORT"]:
-        return "retrieval_processor"
-    elif intent == "META_QUERY":
-        return "meta_query_handler"
-    elif intent == "OUT_OF_CONTEXT":
-        return "response_synthesizer"
+    logger.info("Routing based on intent: %s", intent)
+    # The intent -> branch table is shared with speculation.settle, which keeps the same branch's work
+    if intent in INTENT_BRANCHES or intent == "OUT_OF_CONTEXT":
+        return branch_for_intent(intent)
     else:
         state["intermediate_response"] = "I'm not sure how to help with that. Could you please rephrase?"
-        logger.warning(f"Unknown or unhandled intent: {intent}")
+        logger.warning("Unknown or unhandled intent: %s", intent)
         return "response_synthesizer"
 
 
@@ -0,0 +1,253 @@
+# batch_runner.py
+"""
+Offline batch execution for evaluation and backfill runs.
+
+A whole query set is run through the graph with a BatchSession active. Every chat completion a node
+asks for is queued as one line of OpenAI Batch API JSONL instead of being sent, and the node stops
+with BatchPending. The queued lines are submitted through a backend, the results are loaded, and
+the pending queries are replayed; calls that already have a result return immediately, so each
+replay gets one node further (intent -> SQL/RAG -> response). Queries finish in a few rounds
+without per-request rate-limit stalls, at Batch API pricing.
+
+Backends: OpenAIBatchBackend (files + batches API) and LocalFileBatchBackend, a file-based stand-in
+that answers each line with a responder function (the fake server's canned answers by default).
+"""
+import contextvars
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from graph_state import AgentState, build_initial_state
+
+logger = logging.getLogger(__name__) # utils imports this module, so it cannot use utils.logger
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# The Batch API bills input and output tokens at half the synchronous price
+BATCH_PRICE_FACTOR = 0.5
+TERMINAL_BATCH_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+_active_session: contextvars.ContextVar = contextvars.ContextVar("batch_session", default=None)
+
+
+class BatchPending(BaseException):
+    """
+    Raised from get_llm_response when the request was queued for the next batch.
+    A BaseException so the nodes' `except Exception` fallbacks do not turn it into an error answer.
+    """
+
+
+class BatchResult(NamedTuple):
+    content: Optional[str]
+    usage: Optional[tuple] # (prompt_tokens, completion_tokens) as reported in the batch output
+    error: Optional[str] = None
+
+
+class BatchSession:
+    """Results received so far and the requests still waiting for a batch, keyed by custom_id."""
+
+    def __init__(self):
+        self.results: Dict[str, BatchResult] = {}
+        self.pending: Dict[str, dict] = {}
+
+    def resolve(self, custom_id: str, request_params: dict) -> BatchResult:
+        result = self.results.get(custom_id)
+        if result is None:
+            self.pending.setdefault(custom_id, dict(request_params))
+            raise BatchPending(custom_id)
+        return result
+
+
+def current_batch_session() -> Optional[BatchSession]:
+    return _active_session.get()
+
+
+def batch_request_line(custom_id: str, request_params: dict) -> dict:
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": request_params}
+
+
+def write_batch_file(path: str, requests: Dict[str, dict]) -> str:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for custom_id, request_params in requests.items():
+            f.write(json.dumps(batch_request_line(custom_id, request_params)) + "\n")
+    return path
+
+
+def _result_from_line(line: dict) -> BatchResult:
+    response = line.get("response") or {}
+    body = response.get("body") or {}
+    if line.get("error") or response.get("status_code", 200) != 200:
+        error = line.get("error") or body.get("error") or f"status {response.get('status_code')}"
+        return BatchResult(None, None, json.dumps(error) if not isinstance(error, str) else error)
+    try:
+        content = body["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return BatchResult(None, None, "Malformed batch output line")
+    usage = body.get("usage") or {}
+    counts = (usage.get("prompt_tokens"), usage.get("completion_tokens"))
+    return BatchResult(content, counts if all(isinstance(c, int) for c in counts) else None)
+
+
+def read_batch_results(path: str) -> Dict[str, BatchResult]:
+    """Parses a Batch API output (or error) file into {custom_id: BatchResult}."""
+    results = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for raw in f:
+            if raw.strip():
+                line = json.loads(raw)
+                results[line["custom_id"]] = _result_from_line(line)
+    return results
+
+
+class LocalFileBatchBackend:
+    """Batch API stand-in: answers each input line with `responder(messages)` and writes the output JSONL."""
+
+    def __init__(self, work_dir: str, responder: Optional[Callable[[list], str]] = None):
+        if responder is None:
+            from fake_openai_server import default_chat_responder
+            responder = default_chat_responder
+        self.work_dir = work_dir
+        self.responder = responder
+        self.submitted: List[str] = []
+
+    def submit(self, input_path: str) -> str:
+        from fake_openai_server import fake_usage
+        batch_id = f"batch_local_{len(self.submitted) + 1}"
+        output_path = os.path.join(self.work_dir, f"{batch_id}_output.jsonl")
+        with open(input_path, "r", encoding="utf-8") as f_in, open(output_path, "w", encoding="utf-8") as f_out:
+            for raw in f_in:
+                if not raw.strip():
+                    continue
+                request = json.loads(raw)
+                messages = request["body"]["messages"]
+                content = self.responder(messages)
+                body = {"object": "chat.completion", "model": request["body"]["model"],
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                     "finish_reason": "stop"}],
+                        "usage": fake_usage(messages, content)}
+                f_out.write(json.dumps({"id": f"{batch_id}_{request['custom_id'][:12]}", "custom_id": request["custom_id"],
+                                        "response": {"status_code": 200, "body": body}, "error": None}) + "\n")
+        self.submitted.append(input_path)
+        return batch_id
+
+    def wait(self, batch_id: str) -> List[str]:
+        return [os.path.join(self.work_dir, f"{batch_id}_output.jsonl")]
+
+
+class OpenAIBatchBackend:
+    """Uploads the JSONL, creates a batch and polls it until done; output and error files are downloaded."""
+
+    def __init__(self, openai_client, work_dir: str, completion_window: str = "24h",
+                 poll_interval_seconds: float = 30.0, max_wait_seconds: Optional[float] = None):
+        self.client = openai_client
+        self.work_dir = work_dir
+        self.completion_window = completion_window
+        self.poll_interval_seconds = poll_interval_seconds
+        self.max_wait_seconds = max_wait_seconds
+
+    def submit(self, input_path: str) -> str:
+        with open(input_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT,
+                                           completion_window=self.completion_window)
+        logger.info(f"Submitted batch {batch.id} ({input_path})")
+        return batch.id
+
+    def wait(self, batch_id: str) -> List[str]:
+        started = time.monotonic()
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status in TERMINAL_BATCH_STATUSES:
+                break
+            if self.max_wait_seconds is not None and time.monotonic() - started > self.max_wait_seconds:
+                raise TimeoutError(f"Batch {batch_id} still '{batch.status}' after {self.max_wait_seconds}s")
+            time.sleep(self.poll_interval_seconds)
+
+        logger.info(f"Batch {batch_id} finished with status '{batch.status}'")
+        paths = []
+        # Expired/cancelled batches still return the lines that completed; the rest come back as errors
+        for kind, file_id in (("output", batch.output_file_id), ("errors", batch.error_file_id)):
+            if file_id:
+                path = os.path.join(self.work_dir, f"{batch_id}_{kind}.jsonl")
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(self.client.files.content(file_id).text)
+                paths.append(path)
+        if not paths:
+            raise RuntimeError(f"Batch {batch_id} ended '{batch.status}' without output")
+        return paths
+
+
+class BatchRunner:
+    """Runs a query set through the graph in batch rounds; see the module docstring."""
+
+    def __init__(self, graph, backend, work_dir: str = "batch_runs", max_rounds: int = 8):
+        self.graph = graph
+        self.backend = backend
+        self.work_dir = work_dir
+        self.max_rounds = max_rounds
+        self.stats = {"rounds": 0, "requests": 0, "failed_requests": 0}
+
+    def _replay(self, session: BatchSession, queries: Iterable[str], final_states: Dict[str, AgentState]) -> List[str]:
+        """Runs each query once with the session active; returns those that stopped on a queued request."""
+        waiting = []
+        token = _active_session.set(session)
+        try:
+            for query in queries:
+                start = time.perf_counter()
+                try:
+                    final_state = self.graph.invoke(build_initial_state(query))
+                except BatchPending:
+                    waiting.append(query)
+                    continue
+                # Latency of the final replay only: the graph work, not the time spent waiting on batches
+                final_state["_total_latency_"] = round(time.perf_counter() - start, 4)
+                final_states[query] = final_state
+        finally:
+            _active_session.reset(token)
+        return waiting
+
+    def run(self, queries: Iterable[str]) -> Dict[str, AgentState]:
+        """Returns {query: final_state} for every distinct query."""
+        os.makedirs(self.work_dir, exist_ok=True)
+        session = BatchSession()
+        final_states: Dict[str, AgentState] = {}
+        waiting = self._replay(session, list(dict.fromkeys(queries)), final_states)
+
+        while waiting and self.stats["rounds"] < self.max_rounds:
+            self.stats["rounds"] += 1
+            input_path = write_batch_file(os.path.join(self.work_dir, f"round_{self.stats['rounds']}_input.jsonl"),
+                                          session.pending)
+            logger.info(f"Batch round {self.stats['rounds']}: {len(session.pending)} requests for {len(waiting)} queries")
+            batch_id = self.backend.submit(input_path)
+            for output_path in self.backend.wait(batch_id):
+                session.results.update(read_batch_results(output_path))
+            for custom_id in session.pending:
+                # A line missing from the output must not stall its query forever
+                result = session.results.setdefault(custom_id, BatchResult(None, None, "No result in batch output"))
+                if result.error:
+                    self.stats["failed_requests"] += 1
+            self.stats["requests"] += len(session.pending)
+            session.pending.clear()
+            waiting = self._replay(session, waiting, final_states)
+
+        for query in waiting:
+            logger.error(f"Query still waiting on the batch after {self.max_rounds} rounds: {query[:70]}")
+            final_state = build_initial_state(query)
+            final_state["error_message"] = f"Batch mode: unresolved after {self.max_rounds} rounds"
+            final_states[query] = final_state
+        return final_states
+
+
+def build_batch_backend(name: str, work_dir: str, settings: Optional[Dict[str, Any]] = None):
+    """`openai` or `local`; settings come from the `batch` section of agent_registry.yaml."""
+    settings = settings or {}
+    if name == "local":
+        return LocalFileBatchBackend(work_dir)
+    if name == "openai":
+        from utils import client
+        return OpenAIBatchBackend(client, work_dir, completion_window=settings.get("completion_window", "24h"),
+                                  poll_interval_seconds=settings.get("poll_interval_seconds", 30.0),
+                                  max_wait_seconds=settings.get("max_wait_seconds"))
+    raise ValueError(f"Unknown batch backend '{name}' (expected 'openai' or 'local')")
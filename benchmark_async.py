@@ -0,0 +1,138 @@
+# benchmark_async.py
+"""
+Throughput benchmark: sync app.invoke vs async app.ainvoke against the local fake OpenAI server.
+
+    python benchmark_async.py --queries 200 --latency-ms 300 --threads 8 --concurrency 200
+
+With --intent-versions it instead compares intent_parser versions on a SQL-bound query, e.g. the two-call
+path (v1.0 intent, then SQL generation) against the fused single-call one (v2.0):
+
+    python benchmark_async.py --intent-versions v1.0,v2.0 --queries 100 --latency-ms 300
+
+Nothing leaves the machine; the OpenAI clients in utils are repointed at fake_openai_server.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("OPENAI_API_KEY", "fake-key-for-local-benchmark")
+
+import utils
+from app_graph import app as langgraph_app
+from graph_state import build_initial_state
+from fake_openai_server import start_in_thread
+from llm_transport import build_openai_clients
+
+BENCHMARK_QUERY = "Where is my order #1002?"
+SQL_BENCHMARK_QUERY = "Do you have Nike Air Max in stock?"
+
+
+def _summarize(mode: str, latencies: list, wall_time: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "mode": mode,
+        "queries": len(latencies),
+        "wall_time_s": round(wall_time, 3),
+        "throughput_qps": round(len(latencies) / wall_time, 2) if wall_time else 0.0,
+        "p50_latency_s": round(statistics.median(ordered), 4),
+        "p95_latency_s": round(ordered[int(0.95 * (len(ordered) - 1))], 4),
+    }
+
+
+def _timed_invoke(query: str) -> float:
+    start = time.perf_counter()
+    langgraph_app.invoke(build_initial_state(query))
+    return time.perf_counter() - start
+
+
+def run_sync_threads(num_queries: int, threads: int, query: str = BENCHMARK_QUERY) -> dict:
+    """Flask-style: one blocking graph run per worker thread."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(_timed_invoke, [query] * num_queries))
+    return _summarize(f"sync invoke, {threads} threads", latencies, time.perf_counter() - start)
+
+
+async def run_async(num_queries: int, concurrency: int) -> dict:
+    """Single event loop keeping up to `concurrency` conversations in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed_ainvoke(query: str) -> float:
+        async with semaphore:
+            start = time.perf_counter()
+            await langgraph_app.ainvoke(build_initial_state(query))
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(timed_ainvoke(BENCHMARK_QUERY) for _ in range(num_queries)))
+    return _summarize(f"async ainvoke, concurrency {concurrency}", list(latencies), time.perf_counter() - start)
+
+
+def compare_intent_versions(versions: list, num_queries: int, threads: int, server) -> list:
+    """Runs SQL_BENCHMARK_QUERY once per intent_parser version listed in active_node_versions."""
+    registry = utils.load_agent_registry()
+    intent_config = registry["nodes"]["intent_parser"]
+    # Time the LLM path itself: no rule, kNN, template-cache or SQL-template shortcuts, and no merging of the
+    # identical concurrent requests this benchmark sends
+    for section in ("fast_path", "knn", "template_cache"):
+        intent_config[section] = {**(intent_config.get(section) or {}), "enabled": False}
+    sql_config = registry["nodes"]["sql_processor"]
+    sql_config["templates"] = {**(sql_config.get("templates") or {}), "enabled": False}
+    registry["request_coalescing"] = {"enabled": False}
+
+    results = []
+    for version in versions:
+        registry["active_node_versions"]["intent_parser"] = version
+        final_state = langgraph_app.invoke(build_initial_state(SQL_BENCHMARK_QUERY)) # warm-up and sanity check
+        if final_state.get("sql_query_result") is None:
+            raise RuntimeError(f"intent_parser {version}: no SQL result ({final_state.get('error_message')})")
+        requests_before = server.stats["requests"]
+        result = run_sync_threads(num_queries, threads, SQL_BENCHMARK_QUERY)
+        result["mode"] = f"intent_parser {version}, {threads} threads"
+        result["llm_calls_per_query"] = round((server.stats["requests"] - requests_before) / num_queries, 2)
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync vs async graph throughput against a fake OpenAI server")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Artificial upstream latency per call")
+    parser.add_argument("--threads", type=int, default=8, help="Worker threads for the sync baseline")
+    parser.add_argument("--concurrency", type=int, default=100, help="In-flight conversations for the async run")
+    parser.add_argument("--intent-versions", help="Comma-separated intent_parser versions to compare instead, "
+                                                  "e.g. v1.0,v2.0 (two calls vs fused intent + SQL)")
+    parser.add_argument("--output", help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING) # Per-call INFO logs would dominate the timings
+    server, base_url = start_in_thread(latency_ms=args.latency_ms)
+    registry = utils.load_agent_registry(force_reload=True)
+    utils.client, utils.async_client = build_openai_clients(os.environ["OPENAI_API_KEY"],
+                                                            registry.get("openai_transport"), base_url=base_url)
+
+    if args.intent_versions:
+        results = compare_intent_versions(args.intent_versions.split(","), args.queries, args.threads, server)
+    else:
+        results = [
+            run_sync_threads(args.queries, args.threads),
+            asyncio.run(run_async(args.queries, args.concurrency)),
+        ]
+    server.shutdown()
+
+    for result in results:
+        calls = f"   {result['llm_calls_per_query']} LLM calls/query" if "llm_calls_per_query" in result else ""
+        print(f"{result['mode']:<36} {result['throughput_qps']:>8} q/s   "
+              f"p50 {result['p50_latency_s']}s   p95 {result['p95_latency_s']}s   wall {result['wall_time_s']}s{calls}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
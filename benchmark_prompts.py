@@ -0,0 +1,63 @@
+# benchmark_prompts.py
+"""
+Micro-benchmark: prompt rendering via the prompt store vs. the previous read-the-file-every-call path.
+
+    python benchmark_prompts.py --iterations 20000
+"""
+import argparse
+import timeit
+
+from prompt_store import PromptStore, render_placeholders
+from agents.intent_parser_node import STRUCTURE_JSON
+from utils import DB_SCHEMA_FOR_PROMPT
+
+SEARCH_TERM = "\n'%{search_term}%'\n"
+
+# (template path, render style, values) - mirrors what each node passes
+CASES = [
+    ("prompts/intent/v1_0_parser.txt", "replace", {"user_query": "Where is my order #1002?", "structure_json": STRUCTURE_JSON}),
+    ("prompts/sql/v1_0_schema.txt", "format", {"serach_term": SEARCH_TERM, "db_schema": DB_SCHEMA_FOR_PROMPT,
+                                                "user_query": "Where is my order #1002?"}),
+    ("prompts/retrieval/v1_0_rag.txt", "format", {"context_str": "Returns are accepted within 30 days. " * 20,
+                                                   "user_query": "What is the return policy?"}),
+    ("prompts/response/v1_0_format.txt", "format", {"user_query": "Where is my order #1002?",
+                                                     "information": "The database query returned: [{'status': 'shipped'}]"}),
+    ("prompts/meta/v1_0_responder.txt", "format", {"user_query": "Which version are you?", "information_found": "v1.0"}),
+]
+
+
+def legacy_render(path: str, style: str, values: dict) -> str:
+    """The pre-store path: open + read + strip on every call, then str.format / chained str.replace."""
+    with open(path, "r", encoding="utf-8") as f:
+        template = f.read().strip()
+    if style == "replace":
+        for name, value in values.items():
+            template = template.replace("{" + name + "}", value)
+        return template
+    return template.format(**values)
+
+
+def store_render(store: PromptStore, path: str, style: str, values: dict) -> str:
+    template = store.get(path)
+    return render_placeholders(template, **values) if style == "replace" else template.format(**values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt store vs per-call file read rendering benchmark")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    store = PromptStore("prompts", check_interval_seconds=1.0)
+    store.preload()
+    print(f"{'template':<36} {'legacy us/op':>13} {'store us/op':>12} {'speedup':>8}")
+    for path, style, values in CASES:
+        assert legacy_render(path, style, values) == store_render(store, path, style, values), path
+        legacy = timeit.timeit(lambda: legacy_render(path, style, values), number=args.iterations)
+        compiled = timeit.timeit(lambda: store_render(store, path, style, values), number=args.iterations)
+        print(f"{path:<36} {legacy / args.iterations * 1e6:>13.2f} {compiled / args.iterations * 1e6:>12.2f} "
+              f"{legacy / compiled:>7.1f}x")
+    print(f"store metrics: {store.metrics()['loads']} loads, {store.metrics()['reloads']} reloads")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# benchmark_result_encoding.py
+"""
+Prompt size of SQL results in the response prompt: the raw repr of the rows vs result_encoding.py.
+
+    python benchmark_result_encoding.py --sizes 10,100,1000,10000
+    python benchmark_result_encoding.py --sizes 10,200 --llm --calls 3
+
+Results are real rows (orders joined with their customers) from a copy of data/ecommerce_support.db
+scaled up in a temporary directory. For each result size it reports the prompt tokens and the time to build
+the context. --llm also sends both response prompts to the configured model (this spends real quota, or
+point OPENAI_BASE_URL at fake_openai_server.py, whose latency doesn't depend on prompt size) and reports
+the median latency. A repr prompt over the model's context window is reported as an error.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from benchmark_sqlite import scale_database
+from result_encoding import encode_rows
+from token_accounting import count_text_tokens
+from utils import get_llm_response, get_node_config, load_prompt_from_path
+
+DEFAULT_DB_PATH = "data/ecommerce_support.db"
+RESULT_SQL = ("SELECT o.id, o.order_date, o.status, c.name, c.email, c.location FROM Orders o "
+              "JOIN Customers c ON o.customer_id = c.id ORDER BY o.id LIMIT ?")
+USER_QUERY = "Show me all orders with their customers"
+
+
+def _contexts(rows: list, settings: dict, model: str) -> dict:
+    """Context text and build time (ms) of both encodings."""
+    contexts = {}
+    start = time.perf_counter()
+    contexts["repr"] = (f"The database query for '{USER_QUERY}' returned: {rows}", time.perf_counter() - start)
+    start = time.perf_counter()
+    encoded = encode_rows(rows, settings, model)
+    contexts["encoded"] = (f"The database query for '{USER_QUERY}' returned: \n{encoded.text}",
+                           time.perf_counter() - start)
+    return contexts
+
+
+def _llm_latency_ms(prompt: str, model: str, calls: int):
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        answer = get_llm_response(prompt=prompt, model=model, max_tokens=200)
+        if isinstance(answer, str) and answer.startswith("Error:"):
+            return None, answer[:120]
+        latencies.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(latencies), 1), None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQL result prompt size: repr vs compact encoding")
+    parser.add_argument("--db-path", default=DEFAULT_DB_PATH)
+    parser.add_argument("--sizes", default="10,100,1000,10000", help="Comma-separated result row counts")
+    parser.add_argument("--llm", action="store_true", help="Also time the response LLM call for both prompts")
+    parser.add_argument("--calls", type=int, default=3)
+    parser.add_argument("--output", help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    config = get_node_config("response_synthesizer") or {}
+    model = config.get("llm_model") or "gpt-4o"
+    settings = config.get("result_encoding") or {}
+    template = load_prompt_from_path(config.get("prompt_path", "prompts/response/v1_0_format.txt"))
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "ecommerce_support_scaled.db")
+        scale_database(args.db_path, db_path, max(1, max(sizes) // 10 + 1))
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        for size in sizes:
+            rows = [dict(row) for row in conn.execute(RESULT_SQL, (size,))]
+            for mode, (context, build_seconds) in _contexts(rows, settings, model).items():
+                prompt = template.format(user_query=USER_QUERY, information=context)
+                result = {"rows": len(rows), "mode": mode, "prompt_tokens": count_text_tokens(prompt, model),
+                          "build_ms": round(build_seconds * 1000, 3)}
+                if args.llm:
+                    result["llm_p50_ms"], result["llm_error"] = _llm_latency_ms(prompt, model, args.calls)
+                results.append(result)
+        conn.close()
+
+    for result in results:
+        llm = ""
+        if args.llm:
+            llm = f"   LLM p50 {result['llm_p50_ms']}ms" if result["llm_error"] is None else f"   LLM {result['llm_error']}"
+        print(f"{result['rows']:>6} rows  {result['mode']:<8} {result['prompt_tokens']:>8} prompt tokens   "
+              f"built in {result['build_ms']}ms{llm}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
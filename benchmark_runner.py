@@ -1,7 +1,9 @@
 from langchain.embeddings import OpenAIEmbeddings
 from app_graph import app  # your LangGraph compiled app
-from graph_state import AgentState
+from graph_state import AgentState, build_initial_state
 from openai import OpenAI
+from batch_runner import BatchRunner, build_batch_backend
+import argparse
 import json
 
 # Your benchmark dataset
@@ -55,8 +57,14 @@ def evaluate_with_gpt(expected, actual):
     return response.choices[0].message.content.strip() == "True"
 
 
-def run_benchmark():
+def run_benchmark(batch_backend=None):
     results = []
+    batch_states = {}
+    if batch_backend:
+        # All graph LLM calls go through the Batch API; the GPT judge below still runs per sample
+        runner = BatchRunner(app, build_batch_backend(batch_backend, "batch_runs"), work_dir="batch_runs")
+        batch_states = runner.run(sample["query"] for sample in benchmark_data)
+        print(f"📦 Batch mode: {runner.stats['rounds']} rounds, {runner.stats['requests']} requests")
 
     for sample in benchmark_data:
         query = sample["query"]
@@ -64,26 +72,13 @@ def run_benchmark():
 
         print(f"\n🔍 Running query: {query}")
 
-        # Initialize state
-        state: AgentState = {
-            "original_query": query,
-            "intent": None,
-            "entities": None,
-            "sql_query_generated": None,
-            "sql_query_result": None,
-            "retrieved_contexts": None,
-            "rag_summary": None,
-            "intermediate_response": None,
-            "final_answer": None,
-            "error_message": None,
-            "history": [],
-            "processing_steps_versions": {},
-            "node_latencies": {},
-            "node_execution_order": []
-        }
-
-        # Run through LangGraph
-        final_state = app.invoke(state)
+        if query in batch_states:
+            final_state = batch_states[query]
+        else:
+            state: AgentState = build_initial_state(query)
+
+            # Run through LangGraph
+            final_state = app.invoke(state)
         actual_response = final_state.get("final_answer", "")
 
         # Evaluate with GPT
@@ -100,7 +95,10 @@ def run_benchmark():
 
 # Run benchmark and save to file
 if __name__ == "__main__":
-    benchmark_results = run_benchmark()
+    parser = argparse.ArgumentParser(description="Run the benchmark set through the graph and judge the answers")
+    parser.add_argument("--batch", choices=["openai", "local"], default=None,
+                        help="run the graph's LLM calls through the Batch API (see batch_runner.py)")
+    benchmark_results = run_benchmark(batch_backend=parser.parse_args().batch)
 
     # Save to JSON file
     with open("benchmark_results.json", "w") as f:
@@ -0,0 +1,254 @@
+# benchmark_sqlite.py
+"""
+Per-query SQLite overhead: a fresh connect/close per query (the old sql_node path) vs the pooled read-only
+connections of db_connections.py.
+
+    python benchmark_sqlite.py --scale 2000 --queries 2000 --threads 4
+    python benchmark_sqlite.py --result-cache --write-every 50
+
+With --result-cache a third run adds the SQL result cache (sql_result_cache.py) and reports its hit rate;
+--write-every N updates an order every N queries of that run, like the order system would.
+
+    python benchmark_sqlite.py --fts-products 1000000
+
+--fts-products N instead builds a synthetic catalogue of N products, indexes it with product_search.py
+and compares `name LIKE '%term%'` scans with the FTS5 trigram lookups sql_node runs in their place.
+
+A copy of data/ecommerce_support.db is scaled up in a temporary directory (every table's rows repeated
+`--scale` times with fresh ids), so the original database is never touched.
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db_connections import SQLiteConnectionManager
+from product_search import install_product_index, rewrite_like
+from sql_templates import VETTED_SQL_TEMPLATES
+from sql_result_cache import SqlResultCache
+from utils import get_node_config
+
+DEFAULT_DB_PATH = "data/ecommerce_support.db"
+# The shapes sql_node runs for the golden SQL queries
+BENCHMARK_QUERIES = [
+    "SELECT status FROM Orders WHERE id = 1002;",
+    "SELECT inventory_count FROM Products WHERE name LIKE '%Mouse%';",
+    "SELECT o.id, o.status FROM Orders o JOIN Customers c ON o.customer_id = c.id WHERE c.email = 'alice@example.com';",
+    "SELECT reason FROM Returns WHERE order_id = 1005;",
+]
+
+# Synthetic product names: brand, line, product and a model code
+_BRANDS = ["Acme", "Nimbus", "Vertex", "Orion", "Zephyr", "Atlas", "Quantum", "Helix", "Nova", "Summit",
+           "Pioneer", "Apex", "Lumen", "Kestrel", "Boreal", "Cobalt", "Ember", "Falcon", "Granite", "Harbor"]
+_LINES = ["Pro", "Lite", "Max", "Ultra", "Air", "Sport", "Classic", "Mini", "Plus", "Edge"]
+_PRODUCTS = ["Wireless Mouse", "Mechanical Keyboard", "Running Shoes", "Trail Jacket", "Smartphone", "Tablet",
+             "Headphones", "Monitor", "Laptop", "Charger", "Backpack", "Water Bottle", "Desk Lamp", "Webcam",
+             "Speaker", "Smartwatch", "Camera", "Router", "Hoodie", "T-shirt"]
+# From one product to thousands of matches; the templates run the first kind
+FTS_SEARCH_TERMS = ["Nike Air Max", "M-142424", "Kestrel Ultra Webcam", "Trail Jacket"]
+
+
+def synthetic_catalogue(source_path: str, target_path: str, products: int) -> int:
+    """Copies the database and adds `products` generated products; returns the catalogue size."""
+    shutil.copyfile(source_path, target_path)
+    conn = sqlite3.connect(target_path)
+    start = conn.execute("SELECT MAX(id) FROM Products").fetchone()[0] or 0
+    rows = ((start + i + 1,
+             f"{_BRANDS[i % len(_BRANDS)]} {_LINES[i // len(_BRANDS) % len(_LINES)]} "
+             f"{_PRODUCTS[i // 7 % len(_PRODUCTS)]} M-{i:06d}",
+             round(5 + i % 500 * 1.5, 2), i % 300) for i in range(products))
+    with conn:
+        conn.executemany("INSERT INTO Products (id, name, price, inventory_count) VALUES (?, ?, ?, ?)", rows)
+    size = conn.execute("SELECT COUNT(*) FROM Products").fetchone()[0]
+    conn.close()
+    return size
+
+
+def scale_database(source_path: str, target_path: str, scale: int) -> dict:
+    """Copies the database and repeats its rows `scale` times; returns the row count per table."""
+    shutil.copyfile(source_path, target_path)
+    conn = sqlite3.connect(target_path)
+    with conn:
+        for table, id_column in (("Customers", "id"), ("Orders", "id"), ("Products", "id"), ("Returns", "order_id")):
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+            others = ", ".join(c for c in columns if c != id_column)
+            span = conn.execute(f"SELECT MAX({id_column}) FROM {table}").fetchone()[0] or 0
+            for copy in range(1, scale):
+                conn.execute(f"INSERT INTO {table} ({id_column}, {others}) "
+                             f"SELECT {id_column} + {span * copy}, {others} FROM {table} WHERE {id_column} <= {span}")
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+              for table in ("Customers", "Orders", "Products", "Returns")}
+    conn.close()
+    return counts
+
+
+def _connect_per_query(db_path: str, sql: str) -> list:
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    rows = [dict(row) for row in conn.execute(sql).fetchall()]
+    conn.close()
+    return rows
+
+
+def _pooled(manager: SQLiteConnectionManager, sql: str) -> list:
+    with manager.connection() as conn:
+        return [dict(row) for row in conn.execute(sql).fetchall()]
+
+
+def _cached(manager: SQLiteConnectionManager, cache: SqlResultCache, sql: str) -> list:
+    with manager.connection() as conn:
+        rows, pending = cache.lookup(conn, sql)
+        if rows is None:
+            rows = [dict(row) for row in conn.execute(sql).fetchall()]
+            cache.store(pending, rows)
+        return rows
+
+
+def _order_writer(db_path: str, every: int):
+    """Wraps an execute function so that every `every`-th call first commits an order status update."""
+    lock, calls = threading.Lock(), [0]
+
+    def write_then(execute):
+        def run(sql: str):
+            with lock:
+                calls[0] += 1
+                write = every and calls[0] % every == 0
+            if write:
+                conn = sqlite3.connect(db_path, timeout=5)
+                with conn:
+                    conn.execute("UPDATE Orders SET status = CASE status WHEN 'shipped' THEN 'delivered' "
+                                 "ELSE 'shipped' END WHERE id = 1001")
+                conn.close()
+            return execute(sql)
+        return run
+    return write_then
+
+
+def _run(mode: str, execute, queries: list, num_queries: int, threads: int) -> dict:
+    def timed(i: int) -> float:
+        start = time.perf_counter()
+        execute(queries[i % len(queries)])
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = sorted(pool.map(timed, range(num_queries)))
+    wall_time = time.perf_counter() - start
+    return {
+        "mode": mode,
+        "queries": num_queries,
+        "mean_ms": round(statistics.mean(latencies) * 1000, 4),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 4),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 4),
+        "throughput_qps": round(num_queries / wall_time, 1),
+    }
+
+
+def _pooled_params(manager: SQLiteConnectionManager, statement) -> list:
+    sql, params = statement
+    with manager.connection() as conn:
+        return [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+
+def fts_benchmark(source_path: str, products: int, num_queries: int, threads: int, connection_settings) -> list:
+    """LIKE scan vs FTS lookup for each of FTS_SEARCH_TERMS over a synthetic catalogue of `products` rows."""
+    stock = next(template for template in VETTED_SQL_TEMPLATES if template.name == "product_stock")
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "ecommerce_catalogue.db")
+        size = synthetic_catalogue(source_path, db_path, products)
+        start = time.perf_counter()
+        install_product_index(db_path)
+        print(f"Synthetic catalogue: {size} products; FTS index built in {time.perf_counter() - start:.1f}s")
+
+        manager = SQLiteConnectionManager(db_path, connection_settings)
+        for term in FTS_SEARCH_TERMS:
+            params = {"product_name": term}
+            like = (stock.sql, params)
+            paths = [("LIKE scan", like), ("FTS rewrite", (rewrite_like(*like)[0], params)),
+                     ("FTS ranked template", (stock.fts_sql, params))]
+            matches = {mode: len(_pooled_params(manager, statement)) for mode, statement in paths}
+            if len(set(matches.values())) != 1:
+                raise RuntimeError(f"'{term}': the paths disagree on the matching rows: {matches}")
+            for mode, statement in paths:
+                result = _run(mode, lambda sql: _pooled_params(manager, sql), [statement], num_queries, threads)
+                result.update(query=f"'{term}' ({matches[mode]} rows)", rows=matches[mode])
+                results.append(result)
+            for result in results[-2:]:
+                result["speedup"] = round(results[-3]["p50_ms"] / max(result["p50_ms"], 1e-6), 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Connect-per-query vs pooled read-only SQLite connections")
+    parser.add_argument("--db-path", default=DEFAULT_DB_PATH)
+    parser.add_argument("--scale", type=int, default=2000, help="Times every table's rows are repeated")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--result-cache", action="store_true", help="Also run the pooled path with the result cache")
+    parser.add_argument("--write-every", type=int, default=0, help="Commit an order update every N cached queries")
+    parser.add_argument("--fts-products", type=int, default=0,
+                        help="Run the product name search benchmark on a synthetic catalogue of this many products")
+    parser.add_argument("--output", help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    sql_config = get_node_config("sql_processor") or {}
+    connection_settings = sql_config.get("connection")
+    if args.fts_products:
+        results = fts_benchmark(args.db_path, args.fts_products, args.queries, args.threads, connection_settings)
+        for result in results:
+            speedup = f"   {result['speedup']}x" if "speedup" in result else ""
+            print(f"{result['query'][:40]:<40} {result['mode']:<20} mean {result['mean_ms']}ms   "
+                  f"p50 {result['p50_ms']}ms   p95 {result['p95_ms']}ms   {result['throughput_qps']} q/s{speedup}")
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump({"products": args.fts_products, "results": results}, f, indent=2)
+        return
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "ecommerce_support_scaled.db")
+        counts = scale_database(args.db_path, db_path, args.scale)
+        print(f"Scaled database: {counts}")
+
+        manager = SQLiteConnectionManager(db_path, connection_settings)
+        # Warm both paths once so the OS page cache is equally hot
+        _run("warm-up", lambda sql: _connect_per_query(db_path, sql), BENCHMARK_QUERIES, len(BENCHMARK_QUERIES), 1)
+        # Each shape on its own (the overhead shows on cheap indexed lookups, scans hide it), then the mix
+        results = []
+        for label, queries in [*((sql, [sql]) for sql in BENCHMARK_QUERIES), ("mixed", BENCHMARK_QUERIES)]:
+            baseline = _run("connect per query", lambda sql: _connect_per_query(db_path, sql), queries,
+                            args.queries, args.threads)
+            pooled = _run("pooled read-only", lambda sql: _pooled(manager, sql), queries, args.queries, args.threads)
+            for result in (baseline, pooled):
+                result["query"] = label
+            pooled["overhead_saved_ms"] = round(baseline["p50_ms"] - pooled["p50_ms"], 4) # p50: robust to scheduler noise
+            results += [baseline, pooled]
+            if args.result_cache:
+                cache = SqlResultCache({**(sql_config.get("result_cache") or {}), "enabled": True})
+                execute = _order_writer(db_path, args.write_every)(lambda sql: _cached(manager, cache, sql))
+                cached = _run("pooled + result cache", execute, queries, args.queries, args.threads)
+                lookups = cache.stats["hits"] + cache.stats["misses"]
+                cached.update(query=label, hit_rate=round(cache.stats["hits"] / lookups, 4) if lookups else 0.0,
+                              invalidations=cache.stats["invalidations"] + cache.stats["stale"])
+                cached["overhead_saved_ms"] = round(baseline["p50_ms"] - cached["p50_ms"], 4)
+                results.append(cached)
+        connections_opened = manager.stats["opened"]
+
+    for result in results:
+        saved = f"   p50 saved {result['overhead_saved_ms']}ms/query" if "overhead_saved_ms" in result else ""
+        hit_rate = f"   hit rate {result['hit_rate']}" if "hit_rate" in result else ""
+        print(f"{result['query'][:48]:<48} {result['mode']:<21} mean {result['mean_ms']}ms   "
+              f"p50 {result['p50_ms']}ms   p95 {result['p95_ms']}ms   {result['throughput_qps']} q/s{saved}{hit_rate}")
+    print(f"Pooled connections opened: {connections_opened}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"row_counts": counts, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
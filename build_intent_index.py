@@ -0,0 +1,37 @@
+# build_intent_index.py
+"""
+Embeds the labelled intent examples (the intent prompt's few-shot block plus data/intent_examples.json)
+into the FAISS index used by the intent parser's kNN path (intent_knn.py).
+Re-run after editing the examples or changing the embedding model.
+"""
+import os
+
+from agents.intent_parser_node import STRUCTURE_JSON
+from intent_knn import INTENT_INDEX_PATH, INTENT_LABELS_PATH, KnnIntentClassifier, load_labelled_examples
+from utils import get_embeddings, get_node_config, logger
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+
+def build_index():
+    knn_config = (get_node_config("intent_parser") or {}).get("knn") or {}
+    model = knn_config.get("embedding_model", EMBEDDING_MODEL)
+    examples = load_labelled_examples(STRUCTURE_JSON)
+    logger.info(f"Embedding {len(examples)} labelled intent examples with {model}")
+
+    classifier = KnnIntentClassifier.build(examples, get_embeddings([e["query"] for e in examples], model=model))
+    skipped = len(examples) - classifier.index.ntotal
+    if skipped:
+        logger.warning(f"{skipped} examples had no embedding and were skipped.")
+
+    index_path = knn_config.get("index_path", INTENT_INDEX_PATH)
+    labels_path = knn_config.get("labels_path", INTENT_LABELS_PATH)
+    classifier.save(index_path, labels_path)
+    logger.info(f"Intent index with {classifier.index.ntotal} examples saved to {index_path} ({labels_path})")
+
+
+if __name__ == "__main__":
+    if not os.getenv("OPENAI_API_KEY"):
+        print("OPENAI_API_KEY not set in .env file. Aborting index build.")
+    else:
+        build_index()
@@ -0,0 +1,197 @@
+# caching.py
+"""
+Cache tiers shared by the LLM layer (and anything else that needs a bounded cache).
+
+- TTLCache: thread-safe in-process LRU with optional per-entry TTL.
+- SQLiteCache: on-disk tier in WAL mode so several gunicorn workers share hits.
+- LLMResponseCache: memory tier in front of an optional disk tier, keyed on the chat request.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Bounded LRU cache; entries also expire after `ttl_seconds` (None = never)."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict() # key -> (expires_at or None, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl_seconds: Optional[float] = None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """
+    Shared on-disk key/value tier. Values are stored as JSON text.
+    Each thread gets its own connection; WAL lets readers and one writer proceed concurrently.
+    A hit only reads: its access time is kept in memory and written with the next `set` or `purge`,
+    which already hold the write lock, so eviction still sees recently read keys as recent.
+    """
+    _PURGE_EVERY = 100 # sets between expiry/size sweeps
+
+    def __init__(self, path: str, max_entries: int = 50000, ttl_seconds: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._sets_since_purge = 0
+        self._accessed: Dict[str, float] = {} # key -> last hit, not yet written
+        self._accessed_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_kv_cache_last_access ON kv_cache(last_access)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, default=None):
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute("SELECT value, expires_at FROM kv_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+        value, expires_at = row
+        if expires_at is not None and expires_at <= now: # purge deletes it
+            return default
+        with self._accessed_lock:
+            self._accessed[key] = now
+        return json.loads(value)
+
+    def _write_access_times(self, conn: sqlite3.Connection):
+        """Writes the access times of the hits since the last write (inside the caller's transaction)."""
+        with self._accessed_lock:
+            accessed, self._accessed = self._accessed, {}
+        if accessed:
+            conn.executemany("UPDATE kv_cache SET last_access = MAX(last_access, ?) WHERE key = ?",
+                             [(at, key) for key, at in accessed.items()])
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        now = time.time()
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        conn = self._conn()
+        self._write_access_times(conn)
+        conn.execute(
+            "INSERT OR REPLACE INTO kv_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + ttl if ttl else None, now),
+        )
+        conn.commit()
+        self._sets_since_purge += 1
+        if self._sets_since_purge >= self._PURGE_EVERY:
+            self.purge()
+
+    def purge(self):
+        """Drops expired rows, then the least recently used rows above max_entries."""
+        self._sets_since_purge = 0
+        conn = self._conn()
+        self._write_access_times(conn)
+        conn.execute("DELETE FROM kv_cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+        (count,) = conn.execute("SELECT COUNT(*) FROM kv_cache").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM kv_cache WHERE key IN (SELECT key FROM kv_cache ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+        conn.commit()
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM kv_cache")
+        conn.commit()
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM kv_cache").fetchone()[0]
+
+
+class LLMResponseCache:
+    """Two-tier cache for chat completion contents."""
+
+    def __init__(self, memory: TTLCache, disk: Optional[SQLiteCache] = None):
+        self.memory = memory
+        self.disk = disk
+        self.stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0}
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model: str, messages: list, temperature: float, json_mode: bool, max_tokens: int, **extra) -> str:
+        payload = {"model": model, "messages": messages, "temperature": temperature,
+                   "json_mode": json_mode, "max_tokens": max_tokens, **extra}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _count(self, *names: str):
+        with self._stats_lock:
+            for name in names:
+                self.stats[name] += 1
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            self._count("hits", "memory_hits")
+            return True, value
+        if self.disk is not None:
+            value = self.disk.get(key, _MISSING)
+            if value is not _MISSING:
+                self.memory.set(key, value) # Promote so the next hit skips the disk
+                self._count("hits", "disk_hits")
+                return True, value
+        self._count("misses")
+        return False, None
+
+    def set(self, key: str, value: Any):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
@@ -0,0 +1,134 @@
+# chat_stream.py
+"""
+Server-sent events for /chat/stream.
+
+Runs the graph with app.stream(stream_mode=["updates", "custom"]): "updates" become node-progress
+events, "custom" carries the tokens emitted by get_llm_response for nodes with `stream_tokens: true`.
+
+Event payloads (each sent as `event: <event>` / `data: <json>`):
+    {"event": "progress", "node": "intent_parser", "message": "Intent parsed: ORDER_STATUS", ...}
+    {"event": "token", "node": "response_synthesizer", "text": "Your order"}
+    {"event": "done", "response": "...", "node_latencies": {...}, "node_execution_order": [...]}
+    {"event": "error", "message": "..."}
+
+`cancellable_events` runs the graph on a worker thread and sends a heartbeat (an SSE comment) while
+nothing else is sent. Writing it is how the server notices that the client has gone. The run's SQL
+cancellation token is then cancelled (sql_backends.py), which stops a running statement and the graph.
+"""
+import contextvars
+import json
+import queue
+import threading
+from typing import Callable, Iterator
+
+from graph_state import build_initial_state
+from sql_backends import CancellationToken, QueryCancelled, cancellation_scope
+from utils import logger
+
+STREAM_CONFIG = {"configurable": {"stream_tokens": True}}
+HEARTBEAT_SECONDS = 1.0
+HEARTBEAT = {"event": "heartbeat"}
+
+
+def final_response_text(final_state: dict) -> str:
+    """The user-facing answer for a finished graph run (shared with /chat)."""
+    if final_state.get("final_answer"):
+        return final_state["final_answer"]
+    if final_state.get("error_message"):
+        return f"I encountered an error: {final_state['error_message']}"
+    return "I'm not sure how to respond to that."
+
+
+def progress_event(node_name: str, update: dict) -> dict:
+    """Summarizes one node's state update for the client."""
+    event = {"event": "progress", "node": node_name}
+    if update.get("error_message"):
+        event["message"] = f"{node_name} reported an issue"
+        return event
+
+    if node_name == "intent_parser":
+        event.update(message=f"Intent parsed: {update.get('intent')}", intent=update.get("intent"),
+                     entities=update.get("entities"))
+    elif node_name == "sql_processor":
+        result = update.get("sql_query_result")
+        row_count = len(result) if isinstance(result, list) else None
+        event.update(message="SQL executed" + (f" ({row_count} rows)" if row_count is not None else ""),
+                     sql=update.get("sql_query_generated"), row_count=row_count)
+    elif node_name == "retrieval_processor":
+        contexts = update.get("retrieved_contexts") or []
+        event.update(message=f"Retrieved {len(contexts)} contexts",
+                     sources=[ctx.get("source") for ctx in contexts])
+    elif node_name == "meta_query_handler":
+        event["message"] = "Meta query answered"
+    elif node_name == "response_synthesizer":
+        event["message"] = "Response ready"
+    else:
+        event["message"] = f"{node_name} finished"
+    return event
+
+
+def stream_chat_events(graph, user_query: str) -> Iterator[dict]:
+    """Yields progress/token events while the graph runs, then one done (or error) event."""
+    final_state = build_initial_state(user_query)
+    try:
+        for mode, chunk in graph.stream(final_state, config=STREAM_CONFIG, stream_mode=["updates", "custom"]):
+            if mode == "custom":
+                yield chunk
+                continue
+            for node_name, update in chunk.items():
+                if update:
+                    final_state.update(update)
+                    yield progress_event(node_name, update)
+    except QueryCancelled:
+        logger.info("Streamed request cancelled while its SQL was running")
+        return
+    except Exception:
+        logger.error("Error during streamed processing", exc_info=True)
+        yield {"event": "error", "message": "A critical error occurred."}
+        return
+
+    yield {"event": "done", "response": final_response_text(final_state),
+           "node_latencies": final_state.get("node_latencies"),
+           "node_execution_order": final_state.get("node_execution_order")}
+
+
+def cancellable_events(events: Callable[[], Iterator[dict]],
+                       heartbeat_seconds: float = HEARTBEAT_SECONDS) -> Iterator[dict]:
+    """
+    Relays `events()`, run on a worker thread under a SQL cancellation token, with HEARTBEAT after every
+    `heartbeat_seconds` of silence. Closing this generator (the client disconnected) cancels the token.
+    """
+    token, relay, finished = CancellationToken(), queue.Queue(), object()
+
+    def produce():
+        with cancellation_scope(token):
+            source = events()
+            try:
+                for event in source:
+                    if token.cancelled:
+                        break
+                    relay.put(event)
+            finally:
+                source.close()
+                relay.put(finished)
+
+    # The worker keeps the request's context: correlation id for the logs, the token for the SQL node
+    threading.Thread(target=contextvars.copy_context().run, args=(produce,), name="chat-stream", daemon=True).start()
+    try:
+        while True:
+            try:
+                event = relay.get(timeout=heartbeat_seconds)
+            except queue.Empty:
+                yield HEARTBEAT
+                continue
+            if event is finished:
+                return
+            yield event
+    finally:
+        token.cancel() # nothing left to stop once the run has finished
+
+
+def to_sse(event: dict) -> str:
+    if event.get("event") == HEARTBEAT["event"]:
+        return ": heartbeat\n\n" # a comment; EventSource and the bundled front-end ignore it
+    return f"event: {event.get('event', 'message')}\ndata: {json.dumps(event, default=str)}\n\n"
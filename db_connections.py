@@ -0,0 +1,147 @@
+# db_connections.py
+"""
+Long-lived, read-only SQLite connections for the SQL node.
+
+One manager per database path hands each thread its own connection. Connections are opened once with a
+`mode=ro` URI, `PRAGMA query_only`, a memory map, a larger page cache and statement cache, and
+`temp_store=MEMORY`, so a query no longer pays for connect/close and re-preparing its statement. Before
+reuse, a connection that has been idle longer than `health_check_interval_seconds` runs `SELECT 1` and is
+checked against the database file. It is reopened if the check fails or the file was replaced.
+Configured by the `connection` block of the sql_processor registry entry.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from utils import logger
+
+DEFAULT_CONNECTION_SETTINGS = {
+    "read_only": True,
+    "cached_statements": 256, # sqlite3 default is 128 (Python 3.11)
+    "mmap_size_bytes": 268435456, # 256 MiB
+    "cache_size_kib": 16384, # page cache per connection
+    "busy_timeout_ms": 5000,
+    "health_check_interval_seconds": 30.0,
+}
+
+
+class _PooledConnection:
+    def __init__(self, conn: sqlite3.Connection, file_id):
+        self.conn = conn
+        self.file_id = file_id
+        self.checked_at = time.monotonic()
+
+
+def _file_id(path: str):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+class SQLiteConnectionManager:
+    def __init__(self, db_path: str, settings: Optional[dict] = None):
+        self.db_path = db_path
+        self.settings = {**DEFAULT_CONNECTION_SETTINGS, **(settings or {})}
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.stats = {"opened": 0, "reopened": 0, "health_checks": 0, "failed_checks": 0, "checkouts": 0}
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _open(self) -> _PooledConnection:
+        settings = self.settings
+        if settings["read_only"]:
+            target, uri = f"file:{os.path.abspath(self.db_path)}?mode=ro", True
+        else:
+            target, uri = self.db_path, False
+        conn = sqlite3.connect(target, uri=uri, timeout=settings["busy_timeout_ms"] / 1000.0,
+                               cached_statements=settings["cached_statements"], check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        if settings["read_only"]:
+            conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_size_bytes'])}")
+        conn.execute(f"PRAGMA cache_size = {-int(settings['cache_size_kib'])}") # negative: KiB, not pages
+        conn.execute("PRAGMA temp_store = MEMORY")
+        self._count("opened")
+        return _PooledConnection(conn, _file_id(self.db_path))
+
+    def _healthy(self, pooled: _PooledConnection) -> bool:
+        self._count("health_checks")
+        if _file_id(self.db_path) != pooled.file_id: # database file replaced (e.g. a rebuilt db copied in)
+            return False
+        try:
+            pooled.conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, pooled: Optional[_PooledConnection]):
+        self._local.pooled = None
+        if pooled is not None:
+            try:
+                pooled.conn.close()
+            except sqlite3.Error:
+                pass
+
+    def _checkout(self) -> sqlite3.Connection:
+        pooled = getattr(self._local, "pooled", None)
+        now = time.monotonic()
+        if pooled is not None and now - pooled.checked_at >= self.settings["health_check_interval_seconds"]:
+            if self._healthy(pooled):
+                pooled.checked_at = now
+            else:
+                logger.warning("SQLite connection to %s failed its health check; reopening", self.db_path)
+                self._count("failed_checks")
+                self._count("reopened")
+                self._discard(pooled)
+                pooled = None
+        if pooled is None:
+            pooled = self._local.pooled = self._open()
+        self._count("checkouts")
+        return pooled.conn
+
+    @contextmanager
+    def connection(self):
+        """This thread's connection; dropped (and reopened next time) if the database itself errors."""
+        conn = self._checkout()
+        try:
+            yield conn
+        except sqlite3.OperationalError as e:
+            # Syntax errors and the like leave the connection usable; I/O and file problems don't
+            if "unable to open" in str(e) or "disk I/O" in str(e):
+                self._discard(getattr(self._local, "pooled", None))
+            raise
+        except sqlite3.DatabaseError as e:
+            if not isinstance(e, (sqlite3.ProgrammingError, sqlite3.IntegrityError)):
+                self._discard(getattr(self._local, "pooled", None))
+            raise
+
+    def close(self):
+        """Closes the calling thread's connection (other threads' close when the threads exit)."""
+        self._discard(getattr(self._local, "pooled", None))
+
+
+_managers: Dict[tuple, SQLiteConnectionManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_connection_manager(db_path: str, settings: Optional[dict] = None) -> SQLiteConnectionManager:
+    """One manager per (db_path, settings) pair from the registry."""
+    key = (db_path, repr(sorted((settings or {}).items())))
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = SQLiteConnectionManager(db_path, settings)
+        return manager
+
+
+def get_connection_stats() -> Dict[str, Dict[str, int]]:
+    with _managers_lock:
+        return {manager.db_path: dict(manager.stats) for manager in _managers.values()}
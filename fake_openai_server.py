@@ -0,0 +1,337 @@
+# fake_openai_server.py
+"""
+Local stand-in for the OpenAI API used for offline benchmarking.
+
+Implements POST /v1/chat/completions (including stream=True) and POST /v1/embeddings with an artificial latency
+(fixed, or drawn from a distribution) and deterministic answers shaped for each node's prompt (intent JSON,
+SQL against the bundled database, RAG/response text), so the graph can be driven without spending real quota.
+Errors can be injected (a random error rate, or an explicit queue of statuses) to exercise the
+retry / circuit-breaker path in llm_transport.
+
+    python fake_openai_server.py --port 8089 --latency-ms 300 --error-rate 0.1 --error-status 503
+    python fake_openai_server.py --port 8089 --latency lognormal:300,0.5
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python app.py
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+EMBEDDING_DIMENSION = 1536
+
+
+FALLBACK_ANSWER = "This is a response from the local fake OpenAI server."
+AGENT_TYPES = ("intent_parser", "sql_processor", "retrieval_processor", "response_synthesizer", "meta_query_handler")
+
+# Where each node's prompt embeds the user's question (real prompts and the CI one-liners)
+_USER_QUERY_PATTERNS = [
+    re.compile(r'## User Query: "(.*)"'),
+    re.compile(r'## User Question: "(.*)"'),
+    re.compile(r"User's Original Query: \"(.*)\""),
+    re.compile(r"\*\*User Query\*\*:\s*\n(.*)"),
+    re.compile(r"Given this user query:\n\"(.*)\""),
+    re.compile(r"^User Query: (.*)$", re.MULTILINE),
+    re.compile(r"CI Intent Prompt: (.*?) \{", re.DOTALL),
+    re.compile(r"CI SQL Prompt: .* Query (.*)$", re.DOTALL),
+]
+_ORDER_ID = re.compile(r"#?(\d{3,})")
+# Phrase -> (intent, entities); the first match wins, like a support agent skimming the question
+_INTENT_RULES = [
+    (("version", "which model", "who are you", "what can you do"), "META_QUERY"),
+    (("returned and why", "email", "most recent order", "customer", "total sales"), "SQL_QUERY_GENERAL"),
+    (("return", "refund", "cancel"), "RETURN_INFO"),
+    (("damaged", "broken", "wrong item", "missing"), "PROBLEM_REPORT"),
+    (("shipping", "package", "deliver", "arrive", "late"), "SHIPPING_INFO"),
+    (("in stock", "available", "sizes", "colors"), "PRODUCT_AVAILABILITY"),
+    (("order",), "ORDER_STATUS"),
+]
+_GREETINGS = {"hi", "hello", "hey", "good morning", "good evening", "thanks", "thank you"}
+_CUSTOMER = re.compile(r"placed by ([A-Z][\w-]*(?:\s+[A-Z][\w-]*)*)")
+_PRODUCT = re.compile(r"(?:have|is|are|for|of)\s+(?:the\s+)?([A-Z][\w-]*(?:\s+[A-Z][\w-]*)*)")
+
+
+def extract_user_query(prompt: str) -> str:
+    for pattern in _USER_QUERY_PATTERNS:
+        match = pattern.search(prompt)
+        if match:
+            return match.group(1).strip().strip('"')
+    return ""
+
+
+def fake_intent(query: str) -> dict:
+    """Keyword classification standing in for the intent LLM; the same question always gets the same answer."""
+    lowered = query.lower().strip(" ?!.")
+    if lowered in _GREETINGS:
+        return {"intent": "OUT_OF_CONTEXT", "entities": {}}
+    order_id = _ORDER_ID.search(query)
+    entities = {"order_id": order_id.group(1)} if order_id else {}
+    for phrases, intent in _INTENT_RULES:
+        if any(phrase in lowered for phrase in phrases):
+            if intent == "PRODUCT_AVAILABILITY":
+                product = _PRODUCT.search(query)
+                entities = {"product_name": product.group(1)} if product else {}
+            return {"intent": intent, "entities": entities}
+    return {"intent": "ORDER_STATUS" if order_id else "SQL_QUERY_GENERAL", "entities": entities}
+
+
+def fake_sql(query: str) -> str:
+    """A valid SELECT against data/ecommerce_support.db matching the question's shape."""
+    lowered = query.lower()
+    order_id = _ORDER_ID.search(query)
+    if order_id and "email" in lowered:
+        return f"SELECT email FROM Customers WHERE id = (SELECT customer_id FROM Orders WHERE id = {order_id.group(1)});"
+    if order_id:
+        return f"SELECT status FROM Orders WHERE id = {order_id.group(1)};"
+    customer = _CUSTOMER.search(query)
+    if customer:
+        return (f"SELECT id, order_date FROM Orders WHERE customer_id = (SELECT id FROM Customers WHERE name = "
+                f"'{customer.group(1)}') ORDER BY order_date DESC LIMIT 1;")
+    if "returned" in lowered:
+        return "SELECT Orders.id, Returns.reason FROM Orders JOIN Returns ON Orders.id = Returns.order_id;"
+    product = _PRODUCT.search(query)
+    if product:
+        return f"SELECT inventory_count FROM Products WHERE name LIKE '%{product.group(1)}%';"
+    return "SELECT COUNT(*) AS order_count FROM Orders;"
+
+
+def _first_sentence(text: str, limit: int = 200) -> str:
+    sentence = re.split(r"(?<=[.!?])\s", text.strip(), maxsplit=1)[0]
+    return sentence[:limit]
+
+
+def default_chat_responder(messages: list) -> str:
+    """Returns a deterministic answer in the shape the node that sent the prompt expects."""
+    prompt = messages[-1]["content"] if messages else ""
+    query = extract_user_query(prompt)
+    if "write the SQL for order and product questions" in prompt: # fused intent + SQL (intent_parser v2.0)
+        intent = fake_intent(query)
+        sql = fake_sql(query) if intent["intent"] in ("ORDER_STATUS", "PRODUCT_AVAILABILITY") else None
+        return json.dumps({**intent, "sql": sql})
+    if "classifying user intent" in prompt or "CI Intent Prompt:" in prompt:
+        return json.dumps(fake_intent(query))
+    if "into SQLite SELECT queries" in prompt or "CI SQL Prompt:" in prompt:
+        return fake_sql(query)
+    if "is_version_query" in prompt:
+        target = next((agent for agent in AGENT_TYPES if agent in query.lower()), None)
+        return json.dumps({"is_version_query": "version" in query.lower(), "target_node": target})
+    if "strictly context-based answers" in prompt:
+        context = prompt.split("**Context**:", 1)[-1].split("- **User Query**", 1)[0]
+        return f"{_first_sentence(context)} for more details contact with support team!"
+    if "Information Found by the System:" in prompt:
+        information = prompt.split("Information Found by the System:", 1)[-1].split("---")[1]
+        return f"Here is what I found about \"{query}\": {_first_sentence(information)}"
+    if "Information Found to Answer Query:" in prompt:
+        return f"About your question \"{query}\": " + _first_sentence(prompt.split("Information Found to Answer Query:", 1)[-1])
+    return FALLBACK_ANSWER
+
+
+class LatencyModel:
+    """
+    Per-request upstream latency in ms, parsed from a spec such as:
+    fixed:300 | uniform:200,400 (low, high) | normal:300,50 (mean, stddev) |
+    lognormal:300,0.5 (median, sigma; long right tail like real APIs) | exponential:300 (mean)
+    """
+    KINDS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+
+    def __init__(self, kind: str = "fixed", params=(0.0,), seed: int = 0):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution '{kind}' (expected one of {', '.join(self.KINDS)})")
+        self.kind = kind
+        self.params = tuple(float(p) for p in params)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec: str, seed: int = 0) -> "LatencyModel":
+        kind, _, params = spec.partition(":")
+        return cls(kind.strip(), [p for p in params.split(",") if p.strip()] or [0.0], seed)
+
+    def sample_ms(self) -> float:
+        p = self.params
+        with self._lock: # random.Random is shared by the handler threads
+            if self.kind == "fixed":
+                value = p[0]
+            elif self.kind == "uniform":
+                value = self._random.uniform(p[0], p[1])
+            elif self.kind == "normal":
+                value = self._random.gauss(p[0], p[1])
+            elif self.kind == "lognormal":
+                value = p[0] * math.exp(self._random.gauss(0.0, p[1]))
+            else:
+                value = self._random.expovariate(1.0 / p[0]) if p[0] else 0.0
+        return max(0.0, value)
+
+    def __repr__(self) -> str:
+        return f"{self.kind}:{','.join(f'{p:g}' for p in self.params)}"
+
+
+def fake_usage(messages: list, content: str) -> dict:
+    """Rough token counts (~4 chars/token) so clients exercise their usage accounting."""
+    prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4 + 3 * len(messages) + 3
+    completion_tokens = max(1, len(content) // 4)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def fake_embedding(text: str, dimension: int = EMBEDDING_DIMENSION) -> list:
+    """Deterministic pseudo-embedding derived from the text hash."""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [((digest[i % len(digest)] + i) % 255) / 255.0 for i in range(dimension)]
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    # Keep-alive so pooled clients reuse connections like they would against the real API
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass # Silence per-request access logs
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, model: str, content: str, usage=None):
+        """Answers a stream=True chat request as SSE chunks, one word (plus trailing space) per chunk."""
+        completion_id = f"chatcmpl-fake-{self.server.stats['requests']}"
+
+        def chunk(delta: dict, finish_reason=None) -> str:
+            return "data: " + json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }) + "\n\n"
+
+        def usage_chunk() -> str:
+            return "data: " + json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [], "usage": usage,
+            }) + "\n\n"
+
+        events = [chunk({"role": "assistant", "content": ""})]
+        events += [chunk({"content": piece}) for piece in re.findall(r"\S+\s*", content)]
+        events += [chunk({}, "stop")] + ([usage_chunk()] if usage else []) + ["data: [DONE]\n\n"]
+        body = "".join(events).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.stats["requests"] += 1
+        time.sleep(self.server.latency.sample_ms() / 1000.0)
+
+        error_status = self.server.next_error_status()
+        if error_status is not None:
+            self.server.stats["errors"] += 1
+            self._send_json(error_status, {"error": {"message": f"Injected {error_status} from fake server",
+                                                     "type": "server_error" if error_status >= 500 else "rate_limit_error"}})
+            return
+
+        if self.path.endswith("/chat/completions"):
+            content = self.server.chat_responder(request.get("messages", []))
+            usage = fake_usage(request.get("messages", []), content)
+            if request.get("stream"):
+                include_usage = (request.get("stream_options") or {}).get("include_usage")
+                self._send_stream(request.get("model", "fake-model"), content, usage if include_usage else None)
+                return
+            self._send_json(200, {
+                "id": f"chatcmpl-fake-{self.server.stats['requests']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "fake-model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            })
+        elif self.path.endswith("/embeddings"):
+            inputs = request.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            self._send_json(200, {
+                "object": "list",
+                "model": request.get("model", "fake-embedding"),
+                "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(text)}
+                         for i, text in enumerate(inputs)],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            })
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms: float = 0.0, chat_responder=None,
+                 error_rate: float = 0.0, error_status: int = 503, seed: int = 0, latency: Optional[str] = None):
+        super().__init__(address, FakeOpenAIHandler)
+        # A distribution spec (see LatencyModel) takes precedence over the fixed latency_ms
+        self.latency = LatencyModel.parse(latency, seed) if latency else LatencyModel("fixed", (latency_ms,))
+        self.chat_responder = chat_responder or default_chat_responder
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stats = {"requests": 0, "errors": 0}
+        self._queued_errors = []
+        self._random = random.Random(seed)
+        self._error_lock = threading.Lock()
+
+    def fail_next(self, *statuses: int):
+        """Queues HTTP error statuses returned, in order, by the next requests (e.g. fail_next(503, 429))."""
+        with self._error_lock:
+            self._queued_errors.extend(statuses)
+
+    def next_error_status(self):
+        with self._error_lock:
+            if self._queued_errors:
+                return self._queued_errors.pop(0)
+            if self.error_rate and self._random.random() < self.error_rate:
+                return self.error_status
+        return None
+
+
+def create_server(host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0, chat_responder=None,
+                  error_rate: float = 0.0, error_status: int = 503, seed: int = 0,
+                  latency: Optional[str] = None) -> FakeOpenAIServer:
+    """Builds (but does not start) a fake server; port 0 picks a free port."""
+    return FakeOpenAIServer((host, port), latency_ms, chat_responder, error_rate, error_status, seed, latency)
+
+
+def start_in_thread(**kwargs):
+    """Starts a fake server on a background thread. Returns (server, base_url)."""
+    server = create_server(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake OpenAI-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--latency", help="Latency distribution instead of a fixed --latency-ms, "
+                                          "e.g. lognormal:300,0.5 or uniform:200,400 (see LatencyModel)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+
+    fake_server = create_server(args.host, args.port, args.latency_ms, error_rate=args.error_rate,
+                                error_status=args.error_status, seed=args.seed, latency=args.latency)
+    print(f"Fake OpenAI server listening on http://{args.host}:{args.port}/v1 (latency {fake_server.latency} ms)")
+    try:
+        fake_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,333 @@
+# generate_dataset.py
+"""
+Synthetic, production-sized data for the support database and the retrieval corpus.
+
+    python generate_dataset.py --scale 50 --seed 7
+    python generate_dataset.py --scale 1 --documents 300 --documents-dir data/documents
+
+`generate_database` writes the schema of data/ecommerce_support.db (Customers, Products, Orders,
+Returns). The bundled rows are copied first, so the golden queries still find their orders and
+customers. `--scale 1` adds 20k customers, 2k products and 100k orders, and every table grows linearly
+with the scale. The same seed always writes the same rows. The data has realistic skew:
+- repeat customers: the top 10% of customers place about half of the orders;
+- hot products: a few product types make up most of the catalogue, and the bestsellers are often low
+  on stock or sold out;
+- orders grow over the window and peak before the holidays, and their status follows their age
+  (pending, processing, shipped, then mostly delivered, with some returned or cancelled);
+- every returned order has a Returns row, with skewed reasons.
+The schema has no order-line table, so product popularity shows in the catalogue and its stock levels.
+The file is written with bulk executemany in one transaction per batch (journal and fsync off), then
+moved into place. Connections pooled on the old file notice the replacement and reopen.
+
+`generate_documents` writes a matching corpus:
+- a buying and care guide per product type;
+- a shipping FAQ per customer location;
+- a page per return reason;
+- Q&A pages for the catalogue's bestsellers.
+Index the corpus with build_document_index.py once it is in data/documents.
+Use the database through the sql_processor version "v1.2-synthetic" in active_node_versions.
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from utils import logger
+
+DEFAULT_SOURCE_DB_PATH = "data/ecommerce_support.db"
+DEFAULT_OUTPUT_PATH = "data/synthetic/ecommerce_support.db"
+DEFAULT_DOCUMENTS_DIR = "data/synthetic/documents"
+BASE_ROWS = {"customers": 20000, "products": 2000, "orders": 100000} # at --scale 1
+DEFAULT_BATCH_SIZE = 100000
+DEFAULT_END_DATE = "2024-12-31"
+DEFAULT_DAYS = 730
+CUSTOMER_SKEW = 3.0 # customer = n * u**skew: the top 10% place 0.1**(1/3) ~ 46% of the orders
+PRODUCT_SKEW = 1.1 # Zipf exponent of the product types in the catalogue
+HOLIDAY_SHARE = 0.12 # orders placed in the holiday peak (Nov 15 - Dec 31) on top of the trend
+
+_FIRST_NAMES = ["James", "Mary", "Ahmed", "Fatima", "Wei", "Li", "Carlos", "Sofia", "Olivia", "Liam", "Noah", "Emma",
+                "Mohamed", "Aisha", "Hiroshi", "Yuki", "Ivan", "Anya", "Lucas", "Mia", "Omar", "Layla", "Ethan",
+                "Chloe", "Raj", "Priya", "Daniel", "Sara", "Mateo", "Valentina", "Jonas", "Lea", "Kwame", "Amara",
+                "Pierre", "Camille", "Diego", "Lucia", "Sean", "Nora"]
+_LAST_NAMES = ["Smith", "Johnson", "Hassan", "Ali", "Wang", "Chen", "Garcia", "Martinez", "Brown", "Jones", "Kim",
+               "Nguyen", "Farag", "Ibrahim", "Tanaka", "Sato", "Petrov", "Ivanova", "Silva", "Santos", "Khan",
+               "Patel", "Muller", "Schmidt", "Rossi", "Dubois", "Lopez", "Gonzalez", "Mensah", "Okafor", "Murphy",
+               "Kelly", "Novak", "Horvat", "Cohen", "Levi", "Andersen", "Larsen", "Moreau", "Costa"]
+# Most customers come from a few markets
+_LOCATIONS = ["New York", "Egypt", "London", "Berlin", "Toronto", "Dubai", "Paris", "Madrid", "Sydney", "Tokyo",
+              "Mumbai", "Sao Paulo"]
+_BRANDS = ["Acme", "Nimbus", "Vertex", "Orion", "Zephyr", "Atlas", "Quantum", "Helix", "Nova", "Summit",
+           "Pioneer", "Apex", "Lumen", "Kestrel", "Boreal", "Cobalt", "Ember", "Falcon", "Granite", "Harbor"]
+_LINES = ["Pro", "Lite", "Max", "Ultra", "Air", "Sport", "Classic", "Mini", "Plus", "Edge"]
+# (product type, base price), most popular first
+_PRODUCT_TYPES = [("Wireless Mouse", 25), ("Headphones", 90), ("Smartphone", 650), ("Charger", 30), ("T-shirt", 25),
+                  ("Running Shoes", 110), ("Mechanical Keyboard", 80), ("Laptop", 1100), ("Monitor", 230),
+                  ("Tablet", 350), ("Smartwatch", 250), ("Backpack", 60), ("Speaker", 120), ("Hoodie", 55),
+                  ("Webcam", 70), ("Water Bottle", 20), ("Desk Lamp", 40), ("Router", 130), ("Camera", 700),
+                  ("Trail Jacket", 160), ("Power Bank", 45), ("Phone Case", 18), ("Gaming Chair", 280),
+                  ("Microphone", 95), ("Fitness Tracker", 80), ("Sunglasses", 75), ("Wallet", 35),
+                  ("External SSD", 120), ("Earbuds", 130), ("Printer", 210)]
+_STATUSES = ["pending", "processing", "shipped", "delivered", "returned", "cancelled"]
+# Status probabilities by order age: (max age in days, probabilities in _STATUSES order)
+_STATUS_BY_AGE = [(2, [0.5, 0.5, 0, 0, 0, 0]),
+                  (7, [0, 0.2, 0.75, 0.05, 0, 0]),
+                  (14, [0, 0, 0.35, 0.62, 0.01, 0.02]),
+                  (None, [0, 0, 0.005, 0.905, 0.045, 0.045])]
+_RETURN_REASONS = [("Wrong size", 0.3), ("Item damaged", 0.2), ("Defective", 0.15), ("Changed my mind", 0.15),
+                   ("Wrong item sent", 0.1), ("Arrived late", 0.1)]
+_APPROVERS = [("Agent_v1.0", 0.7), ("support_nora", 0.1), ("support_omar", 0.1), (None, 0.1)] # None: in review
+
+
+def _zipf(n: int, exponent: float) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def _batches(total: int, batch_size: int) -> Iterable[tuple]:
+    for start in range(0, total, batch_size):
+        yield start, min(batch_size, total - start)
+
+
+def _insert(conn: sqlite3.Connection, sql: str, rows: Iterable[tuple]):
+    with conn: # one transaction per batch
+        conn.executemany(sql, rows)
+
+
+def _customers(conn, rng, first_id: int, count: int, batch_size: int):
+    location_p = _zipf(len(_LOCATIONS), 1.0)
+    for start, size in _batches(count, batch_size):
+        first = rng.integers(len(_FIRST_NAMES), size=size).tolist()
+        last = rng.integers(len(_LAST_NAMES), size=size).tolist()
+        location = rng.choice(len(_LOCATIONS), size=size, p=location_p).tolist()
+        ids = range(first_id + start, first_id + start + size)
+        _insert(conn, "INSERT INTO Customers (id, name, email, location) VALUES (?, ?, ?, ?)",
+                ((i, f"{_FIRST_NAMES[f]} {_LAST_NAMES[l]}", f"{_FIRST_NAMES[f]}.{_LAST_NAMES[l]}.{i}@example.com".lower(),
+                  _LOCATIONS[loc]) for i, f, l, loc in zip(ids, first, last, location)))
+
+
+def _products(conn, rng, first_id: int, count: int, batch_size: int):
+    """Products are written bestseller first: the first 1% are the hot products."""
+    type_p = _zipf(len(_PRODUCT_TYPES), PRODUCT_SKEW)
+    hot_count = max(1, count // 100)
+    for start, size in _batches(count, batch_size):
+        kind = rng.choice(len(_PRODUCT_TYPES), size=size, p=type_p)
+        brand = rng.integers(len(_BRANDS), size=size).tolist()
+        line = rng.integers(len(_LINES), size=size).tolist()
+        base = np.array([_PRODUCT_TYPES[k][1] for k in kind], dtype=float)
+        price = np.round(base * rng.lognormal(0.0, 0.35, size=size), 2).tolist()
+        # Bestsellers sell out a quarter of the time and otherwise run low
+        hot = np.arange(start, start + size) < hot_count
+        stock = rng.poisson(120, size=size)
+        stock = np.where(hot, np.where(rng.random(size) < 0.25, 0, rng.poisson(8, size=size)), stock)
+        stock = np.where(rng.random(size) < 0.03, 0, stock).tolist()
+        ids = range(first_id + start, first_id + start + size)
+        _insert(conn, "INSERT INTO Products (id, name, price, inventory_count) VALUES (?, ?, ?, ?)",
+                ((i, f"{_BRANDS[b]} {_PRODUCT_TYPES[k][0]} {_LINES[ln]} M-{i:07d}", p, s)
+                 for i, b, k, ln, p, s in zip(ids, brand, kind.tolist(), line, price, stock)))
+
+
+def _order_days(rng, size: int, days: int, end: datetime.date) -> np.ndarray:
+    """Days since the window start: volume grows linearly, plus a holiday peak each year."""
+    day = np.floor(days * np.sqrt(rng.random(size))).astype(np.int64)
+    holiday = rng.random(size) < HOLIDAY_SHARE
+    peaks = [(datetime.date(year, 11, 15) - end).days + days - 1 for year in range(end.year - days // 365, end.year + 1)]
+    peaks = [peak for peak in peaks if 0 <= peak and peak + 47 <= days]
+    if peaks and holiday.any():
+        chosen = np.array(peaks)[rng.integers(len(peaks), size=int(holiday.sum()))]
+        day[holiday] = chosen + rng.integers(47, size=int(holiday.sum()))
+    return np.minimum(day, days - 1)
+
+
+def _statuses(rng, age: np.ndarray) -> np.ndarray:
+    status = np.empty(len(age), dtype=np.int64)
+    lower = -1
+    for max_age, probabilities in _STATUS_BY_AGE:
+        bucket = (age > lower) if max_age is None else (age > lower) & (age <= max_age)
+        status[bucket] = rng.choice(len(_STATUSES), size=int(bucket.sum()), p=probabilities)
+        lower = max_age if max_age is not None else lower
+    return status
+
+
+def _orders(conn, rng, first_id: int, count: int, customer_ids: tuple, batch_size: int, days: int,
+            end: datetime.date) -> int:
+    """Writes the orders and the Returns rows of the returned ones; returns the number of returns."""
+    first_customer, customers = customer_ids
+    dates = [(end - datetime.timedelta(days=days - 1 - d)).isoformat() for d in range(days)]
+    reasons, reason_p = zip(*_RETURN_REASONS)
+    approvers, approver_p = zip(*_APPROVERS)
+    returns = 0
+    for start, size in _batches(count, batch_size):
+        customer = (first_customer + np.floor(customers * rng.random(size) ** CUSTOMER_SKEW)).astype(np.int64)
+        day = _order_days(rng, size, days, end)
+        status = _statuses(rng, days - 1 - day)
+        ids = np.arange(first_id + start, first_id + start + size)
+        _insert(conn, "INSERT INTO Orders (id, customer_id, order_date, status) VALUES (?, ?, ?, ?)",
+                ((i, c, dates[d], _STATUSES[s]) for i, c, d, s in zip(ids.tolist(), customer.tolist(), day.tolist(),
+                                                                       status.tolist())))
+        returned = ids[status == _STATUSES.index("returned")].tolist()
+        reason = rng.choice(len(reasons), size=len(returned), p=reason_p).tolist()
+        approver = rng.choice(len(approvers), size=len(returned), p=approver_p).tolist()
+        _insert(conn, "INSERT INTO Returns (order_id, reason, approved_by) VALUES (?, ?, ?)",
+                ((i, reasons[r], approvers[a]) for i, r, a in zip(returned, reason, approver)))
+        returns += len(returned)
+    return returns
+
+
+def generate_database(output_path: str = DEFAULT_OUTPUT_PATH, scale: float = 1.0, seed: int = 0,
+                      source_path: str = DEFAULT_SOURCE_DB_PATH, batch_size: int = DEFAULT_BATCH_SIZE,
+                      end_date: str = DEFAULT_END_DATE, days: int = DEFAULT_DAYS) -> Dict[str, int]:
+    """Writes the bundled rows plus `scale` times BASE_ROWS generated ones; returns the row count per table."""
+    rng = np.random.default_rng(seed)
+    counts = {name: int(round(rows * scale)) for name, rows in BASE_ROWS.items()}
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    building = f"{output_path}.building"
+    shutil.copyfile(source_path, building)
+    conn = sqlite3.connect(building)
+    conn.execute("PRAGMA journal_mode = OFF") # a failed build is thrown away, never recovered
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -262144") # 256 MiB
+    try:
+        next_id = {table: (conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0] or 0) + 1
+                   for table in ("Customers", "Products", "Orders")}
+        # Generated orders go to generated customers, so the bundled customers' answers stay the same
+        customer_range = (next_id["Customers"], counts["customers"])
+        if not counts["customers"]:
+            customer_range = (1, next_id["Customers"] - 1)
+        _customers(conn, rng, next_id["Customers"], counts["customers"], batch_size)
+        _products(conn, rng, next_id["Products"], counts["products"], batch_size)
+        end = datetime.date.fromisoformat(end_date)
+        _orders(conn, rng, next_id["Orders"], counts["orders"], customer_range, batch_size, days, end)
+        totals = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                  for table in ("Customers", "Products", "Orders", "Returns")}
+    finally:
+        conn.close()
+    os.replace(building, output_path)
+    return totals
+
+
+def _paragraphs(*paragraphs: str) -> str:
+    return "\n\n".join(paragraphs) + "\n"
+
+
+def _type_guide(rng, name: str, base_price: int) -> str:
+    warranty = int(rng.choice([6, 12, 24, 36]))
+    window = int(rng.choice([14, 30, 30, 45]))
+    return _paragraphs(
+        f"{name} Buying and Care Guide",
+        f"Our {name.lower()} range starts at about ${base_price * 0.6:.0f} and goes up to ${base_price * 2.2:.0f} for "
+        f"the Pro and Ultra lines. Every {name.lower()} comes with a {warranty}-month manufacturer warranty that "
+        f"covers defects in materials and workmanship.",
+        f"Care: keep the {name.lower()} away from moisture and direct heat, and clean it with a dry cloth. Damage "
+        f"from drops, liquids or unauthorised repairs is not covered by the warranty.",
+        f"Returns: an unused {name.lower()} in its original packaging can be returned within {window} days of "
+        f"delivery. A defective {name.lower()} can be exchanged for the same model at no cost while the warranty "
+        f"runs; contact support with your order number.",
+        f"Stock: popular {name.lower()} models sell out quickly. Out-of-stock models can be pre-ordered and ship in "
+        f"the order the pre-orders were placed.")
+
+
+def _shipping_faq(rng, location: str) -> str:
+    standard, express = int(rng.integers(3, 9)), int(rng.integers(1, 4))
+    international = location != "New York"
+    return _paragraphs(
+        f"Shipping to {location}: Frequently Asked Questions",
+        f"How long does delivery take? Standard shipping to {location} takes {standard}-{standard + 3} business days "
+        f"and express shipping {express}-{express + 1} business days after the order is shipped.",
+        f"How much does shipping cost? Standard shipping is free on orders over ${int(rng.choice([35, 50, 75]))}. "
+        f"Express shipping is charged at checkout.",
+        ("Are there customs fees? Orders shipped internationally may be subject to import duties and taxes, which "
+         "are paid by the recipient on delivery." if international else
+         "Are there customs fees? No, domestic orders have no customs fees."),
+        "How do I track my order? Once your order status changes to shipped you receive an email with the tracking "
+        "number. Orders that are pending or processing have not left the warehouse yet.")
+
+
+def _return_reason_page(rng, reason: str) -> str:
+    days = int(rng.choice([14, 30, 30]))
+    return _paragraphs(
+        f"Returns: {reason}",
+        f"If you are returning an order because of '{reason.lower()}', start the return from your account or ask "
+        f"support within {days} days of delivery. Include your order number and, for damaged or defective items, "
+        f"a photo of the problem.",
+        "Returns are reviewed by our support agents. Most are approved within two business days, after which a "
+        "prepaid return label is emailed to you.",
+        "Refunds go to the original payment method within 5-10 business days after the item reaches our warehouse. "
+        + ("Return shipping is free for this reason." if reason in ("Item damaged", "Defective", "Wrong item sent")
+           else "Return shipping is deducted from the refund for this reason."))
+
+
+def _product_qa(rng, name: str, price: float, stock: int) -> str:
+    availability = ("It is currently out of stock; pre-orders ship as soon as new stock arrives." if stock == 0 else
+                    f"It is in stock ({stock} units at the time of writing).")
+    return _paragraphs(
+        f"{name}: Questions and Answers",
+        f"Q: How much is the {name}? A: It is listed at ${price:.2f}. {availability}",
+        f"Q: Is the {name} covered by a warranty? A: Yes, the standard manufacturer warranty applies. Keep your "
+        f"order confirmation as proof of purchase.",
+        f"Q: Can I return the {name} if it does not fit my needs? A: Yes, unused items in their original packaging "
+        f"can be returned within {int(rng.choice([14, 30]))} days of delivery.")
+
+
+def generate_documents(output_dir: str = DEFAULT_DOCUMENTS_DIR, count: int = 200, seed: int = 0,
+                       db_path: Optional[str] = None) -> List[str]:
+    """
+    Writes up to `count` documents and returns their paths. Guides, shipping FAQs and return pages come
+    first. The rest are Q&A pages for the bestsellers of `db_path` (the first generated products).
+    """
+    rng = np.random.default_rng(seed)
+    documents = [(f"guide_{name}", _type_guide(rng, name, price)) for name, price in _PRODUCT_TYPES]
+    documents += [(f"shipping_{location}", _shipping_faq(rng, location)) for location in _LOCATIONS]
+    documents += [(f"returns_{reason}", _return_reason_page(rng, reason)) for reason, _ in _RETURN_REASONS]
+    documents = documents[:count]
+    if db_path and len(documents) < count:
+        conn = sqlite3.connect(db_path)
+        # Generated product names end with their model code; the bundled ones don't
+        products = conn.execute("SELECT name, price, inventory_count FROM Products WHERE name LIKE '% M-%' "
+                                "ORDER BY id LIMIT ?", (count - len(documents),)).fetchall()
+        conn.close()
+        documents += [(f"product_{name}", _product_qa(rng, name, price, stock)) for name, price, stock in products]
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for name, text in documents:
+        slug = "".join(ch if ch.isalnum() else "_" for ch in name.lower())
+        path = os.path.join(output_dir, f"synthetic_{slug}.txt") # easy to tell apart from the curated documents
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        paths.append(path)
+    return paths
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Generate a large synthetic support database and document corpus")
+    parser.add_argument("--scale", type=float, default=1.0, help=f"Multiple of {BASE_ROWS}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--source", default=DEFAULT_SOURCE_DB_PATH, help="Database whose schema and rows are kept")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_PATH)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows per executemany transaction")
+    parser.add_argument("--end-date", default=DEFAULT_END_DATE, help="Last order date (YYYY-MM-DD)")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="Length of the order window")
+    parser.add_argument("--documents", type=int, default=200, help="Documents to write; 0 for none")
+    parser.add_argument("--documents-dir", default=DEFAULT_DOCUMENTS_DIR)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    totals = generate_database(args.output, args.scale, args.seed, args.source, args.batch_size, args.end_date,
+                               args.days)
+    seconds = time.perf_counter() - start
+    rows = sum(totals.values())
+    logger.info(f"Wrote {args.output}: {totals} in {seconds:.1f}s ({rows / seconds:,.0f} rows/s)")
+    print(f"{args.output}: " + ", ".join(f"{table} {count:,}" for table, count in totals.items()) +
+          f" ({seconds:.1f}s, {rows / seconds:,.0f} rows/s, {os.path.getsize(args.output) / 2**20:.0f} MiB)")
+    if args.documents:
+        paths = generate_documents(args.documents_dir, args.documents, args.seed, args.output)
+        print(f"{args.documents_dir}: {len(paths)} documents")
+    return totals
+
+
+if __name__ == "__main__":
+    main()
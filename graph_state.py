@@ -1,13 +1,32 @@
 # graph_state.py
 from typing import TypedDict, Optional, List, Dict, Any
 
+# Branch node the graph runs after intent_parser, per intent (anything else goes to response_synthesizer)
+INTENT_BRANCHES = {
+    "SQL_QUERY": "sql_processor", "SQL_QUERY_GENERAL": "sql_processor",
+    "ORDER_STATUS": "sql_processor", "PRODUCT_AVAILABILITY": "sql_processor",
+    "RETURN_INFO": "retrieval_processor", "SHIPPING_INFO": "retrieval_processor",
+    "PROBLEM_REPORT": "retrieval_processor",
+    "META_QUERY": "meta_query_handler",
+}
+
+
+def branch_for_intent(intent: Optional[str]) -> str:
+    return INTENT_BRANCHES.get(intent, "response_synthesizer")
+
+
 class AgentState(TypedDict):
     original_query: str
     intent: Optional[str]           # e.g., "SQL", "RETRIEVAL", "META", "GREETING", "UNKNOWN"
     entities: Optional[Dict[str, Any]] # e.g., {"order_id": "12345"}
+    intent_source: Optional[str] # "rules" (fast path), "template_cache", "knn" (example index) or "llm"
+    intent_fast_path: Optional[Dict[str, Any]] # Rule prediction: intent, entities, confidence, rule
+    intent_knn: Optional[Dict[str, Any]] # kNN prediction: intent, entities, similarity, margin, neighbours
     
     sql_query_generated: Optional[str]
+    sql_source: Optional[str] # "fused" (intent call), "template" / "learned_template" (sql_templates.py), "speculation" or "llm"
     sql_query_result: Optional[List[Any]] # List of tuples or dicts
+    sql_result_truncated: Optional[bool] # True if the query had more rows than the guard's max_rows (sql_guard.py)
     
     retrieved_contexts: Optional[List[Dict[str, Any]]] # List of {'source': str, 'text': str}
     rag_summary: Optional[str]
@@ -24,4 +43,36 @@ class AgentState(TypedDict):
 
     # For benchmarking
     node_latencies: Optional[Dict[str, float]] # Stores latency for each executed node
-    node_execution_order: Optional[List[str]]  # Stores the order of node execution
\ No newline at end of file
+    node_execution_order: Optional[List[str]]  # Stores the order of node execution
+    llm_cache_stats: Optional[Dict[str, Dict[str, int]]] # Per-node LLM cache hits/misses
+    result_cache_stats: Optional[Dict[str, Dict[str, int]]] # Per-node SQL result cache hits/misses
+    node_token_usage: Optional[Dict[str, Dict[str, Any]]] # Per-node calls, prompt/completion tokens and cost (USD)
+    speculation: Optional[Dict[str, Any]] # Branch work started during intent parsing: launched/kept/discarded, saved_s/wasted_s
+
+def build_initial_state(user_query: str) -> AgentState:
+    """Returns a fresh graph input for one user query, with the benchmarking fields initialised."""
+    return {
+        "original_query": user_query,
+        "intent": None,
+        "entities": None,
+        "intent_source": None,
+        "intent_fast_path": None,
+        "intent_knn": None,
+        "sql_query_generated": None,
+        "sql_source": None,
+        "sql_query_result": None,
+        "sql_result_truncated": None,
+        "retrieved_contexts": None,
+        "rag_summary": None,
+        "intermediate_response": None,
+        "final_answer": None,
+        "error_message": None,
+        "history": [],
+        "processing_steps_versions": {},
+        "node_latencies": {},
+        "node_execution_order": [],
+        "llm_cache_stats": {},
+        "result_cache_stats": {},
+        "node_token_usage": {},
+        "speculation": None
+    }
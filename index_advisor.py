@@ -0,0 +1,216 @@
+# index_advisor.py
+"""
+Index advisor for the SQL workload recorded by sql_workload.py.
+
+Recorded statements are grouped by shape (normalized SQL), weighted by how often they ran, and planned
+against an empty in-memory copy of the schema. `EXPLAIN QUERY PLAN` only needs the schema, so trying an
+index there costs nothing on the real database.
+- Candidates are the single columns that a statement filters or joins on.
+- A plan's scan cost is the sum of the row counts of the tables it fully scans.
+- Candidates are picked greedily by `executions * (scan cost before - scan cost after)` over all shapes,
+  scaled by the column's selectivity (1 - 1/distinct values): an index on a two-valued flag saves half a
+  scan at best. Each pick stays in the copy, so an index that only helps together with another one
+  still scores.
+
+    python index_advisor.py --workload sql_workload.jsonl
+    python index_advisor.py --workload sql_workload.jsonl --apply --repeat 20
+
+--apply creates the advised indexes and replays the recorded workload before and after, with the
+recorded parameters.
+"""
+import argparse
+import json
+import re
+import sqlite3
+import statistics
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from sql_guard import full_scans, table_aliases
+from sql_result_cache import normalize_sql
+from sql_workload import load_workload
+
+DEFAULT_MAX_INDEXES = 5
+_PREDICATE = r"\s*(?:=|==|!=|<>|<|>|\bIN\b|\bIS\b|\bBETWEEN\b|\bLIKE\b)"
+
+
+class IndexCandidate(NamedTuple):
+    table: str
+    column: str
+    saved_rows: int # estimated rows no longer scanned over the whole workload
+    statements: int # statement shapes whose plan improves
+
+    @property
+    def name(self) -> str:
+        return f"idx_{self.table}_{self.column}".lower()
+
+    @property
+    def create_sql(self) -> str:
+        return f'CREATE INDEX IF NOT EXISTS {self.name} ON "{self.table}" ("{self.column}")'
+
+
+def workload_shapes(workload: List[dict]) -> List[dict]:
+    """Recorded statements grouped by normalized SQL: first SQL and params seen, executions and total time."""
+    shapes: Dict[str, dict] = {}
+    for entry in workload:
+        shape = shapes.setdefault(normalize_sql(entry["sql"]), {
+            "sql": entry["sql"], "params": entry.get("params"), "executions": 0, "total_ms": 0.0})
+        shape["executions"] += 1
+        shape["total_ms"] += entry.get("elapsed_ms") or 0.0
+    return list(shapes.values())
+
+
+def _schema_copy(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """An in-memory database with the tables and indexes of `conn`, and no rows."""
+    copy = sqlite3.connect(":memory:")
+    objects = conn.execute("SELECT type, name, sql FROM sqlite_master WHERE sql IS NOT NULL AND type IN ('table', 'index') "
+                           "ORDER BY type = 'index'").fetchall()
+    virtual = [name for kind, name, sql in objects if sql.upper().startswith("CREATE VIRTUAL TABLE")]
+    for kind, name, sql in objects:
+        # Shadow tables of virtual tables are created with them
+        if any(name.startswith(f"{table}_") for table in virtual):
+            continue
+        copy.execute(sql)
+    return copy
+
+
+def _columns(conn: sqlite3.Connection) -> Dict[str, List[str]]:
+    """Lowercased table name -> its column names."""
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+    return {table.lower(): [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')] for table in tables}
+
+
+def _filtered_columns(sql: str, table: str, columns: List[str]) -> List[str]:
+    """Columns of `table` the statement compares with something (WHERE or JOIN ... ON)."""
+    qualifiers = [alias for alias, name in table_aliases(sql).items() if name == table]
+    qualifier = "(?:(?:" + "|".join(re.escape(alias) for alias in qualifiers) + r")\.)?" if qualifiers else ""
+    found = []
+    for column in columns:
+        reference = rf"(?<![\w.]){qualifier}{re.escape(column)}\b"
+        if re.search(reference + _PREDICATE, sql, re.IGNORECASE) or \
+                re.search(r"(?:=|<|>)\s*" + reference, sql, re.IGNORECASE):
+            found.append(column)
+    return found
+
+
+def _scan_cost(copy: sqlite3.Connection, shape: dict, table_rows: Dict[str, int]) -> int:
+    try:
+        return sum(table_rows.get(table, 0) for table in full_scans(copy, shape["sql"], shape["params"]))
+    except sqlite3.Error: # references something the schema no longer has
+        return 0
+
+
+def advise(db_path: str, workload: List[dict], max_indexes: int = DEFAULT_MAX_INDEXES) -> List[IndexCandidate]:
+    """Indexes worth creating for the workload, best first."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        copy = _schema_copy(conn)
+        columns = _columns(conn)
+        shapes = workload_shapes(workload)
+        table_rows = {table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in columns}
+
+        candidates = set()
+        for shape in shapes:
+            # Tables that are not scanned yet count too: indexing one side of a join can move the scan there
+            for table in set(table_aliases(shape["sql"]).values()) & set(columns):
+                candidates.update((table, column) for column in _filtered_columns(shape["sql"], table, columns[table]))
+
+        distinct = {(table, column): conn.execute(f'SELECT COUNT(DISTINCT "{column}") FROM "{table}"').fetchone()[0]
+                    for table, column in candidates}
+        costs = [_scan_cost(copy, shape, table_rows) for shape in shapes]
+        advised = []
+        while candidates and len(advised) < max_indexes:
+            best = None
+            for table, column in sorted(candidates):
+                candidate = IndexCandidate(table, column, 0, 0)
+                copy.execute(candidate.create_sql)
+                after = [_scan_cost(copy, shape, table_rows) for shape in shapes]
+                copy.execute(f"DROP INDEX {candidate.name}")
+                selectivity = 1 - 1 / max(distinct[(table, column)], 1)
+                saved = int(selectivity * sum(shape["executions"] * (before - cost)
+                                              for shape, before, cost in zip(shapes, costs, after)))
+                improved = sum(1 for before, cost in zip(costs, after) if cost < before)
+                if saved > 0 and (best is None or saved > best[0].saved_rows):
+                    best = (candidate._replace(saved_rows=saved, statements=improved), after)
+            if best is None:
+                break
+            candidate, costs = best
+            copy.execute(candidate.create_sql)
+            candidates.discard((candidate.table, candidate.column))
+            advised.append(candidate)
+        copy.close()
+        # Table names as the schema spells them
+        spelled = {row[0].lower(): row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        return [candidate._replace(table=spelled.get(candidate.table, candidate.table)) for candidate in advised]
+    finally:
+        conn.close()
+
+
+def replay(db_path: str, shapes: List[dict], repeat: int) -> Dict[str, float]:
+    """Median execution time in ms of each shape, and the workload total (executions * median)."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    timings = {}
+    try:
+        for shape in shapes:
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                conn.execute(shape["sql"], shape["params"] or ()).fetchall()
+                samples.append((time.perf_counter() - start) * 1000)
+            timings[shape["sql"]] = round(statistics.median(samples), 4)
+    finally:
+        conn.close()
+    timings["workload_total_ms"] = round(sum(shape["executions"] * timings[shape["sql"]] for shape in shapes), 4)
+    return timings
+
+
+def apply_indexes(db_path: str, candidates: List[IndexCandidate]) -> List[str]:
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            for candidate in candidates:
+                conn.execute(candidate.create_sql)
+    finally:
+        conn.close()
+    return [candidate.name for candidate in candidates]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Index advice for the recorded sql_processor workload")
+    parser.add_argument("--workload", required=True, help="JSON lines file written by sql_workload.py")
+    parser.add_argument("--db-path", default="data/ecommerce_support.db")
+    parser.add_argument("--max-indexes", type=int, default=DEFAULT_MAX_INDEXES)
+    parser.add_argument("--apply", action="store_true", help="Create the advised indexes and re-benchmark")
+    parser.add_argument("--repeat", type=int, default=10, help="Replays of each statement shape per benchmark")
+    parser.add_argument("--output", help="Optional JSON file for the advice and timings")
+    args = parser.parse_args(argv)
+
+    workload = load_workload(args.workload)
+    advised = advise(args.db_path, workload, args.max_indexes)
+    print(f"{len(workload)} recorded statements, {len(workload_shapes(workload))} shapes")
+    for candidate in advised:
+        print(f"{candidate.create_sql};   saves ~{candidate.saved_rows} scanned rows "
+              f"over {candidate.statements} statement shape(s)")
+    if not advised:
+        print("No index would remove a full scan from this workload.")
+
+    report = {"advised": [candidate._asdict() for candidate in advised]}
+    if args.apply and advised:
+        shapes = workload_shapes(workload)
+        report["before_ms"] = replay(args.db_path, shapes, args.repeat)
+        report["created"] = apply_indexes(args.db_path, advised)
+        report["after_ms"] = replay(args.db_path, shapes, args.repeat)
+        for shape in shapes:
+            print(f"{shape['sql'][:80]:<80} x{shape['executions']:<5} {report['before_ms'][shape['sql']]}ms -> "
+                  f"{report['after_ms'][shape['sql']]}ms")
+        print(f"Workload total: {report['before_ms']['workload_total_ms']}ms -> "
+              f"{report['after_ms']['workload_total_ms']}ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# intent_knn.py
+"""
+Nearest-neighbour intent classifier over embedded, labelled example queries.
+
+build_intent_index.py embeds the few-shot examples from the intent prompt (STRUCTURE_JSON) plus
+data/intent_examples.json (which labels the golden queries) into a small FAISS inner-product index next to
+data/doc_index. At query time one embedding call and one vector search replace the intent chat completion:
+the k nearest examples vote with their cosine similarity, and the node only trusts the vote when the winner's
+share leads the runner-up by `knn.min_margin` (otherwise it asks the LLM, see agents/intent_parser_node.py).
+"""
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import faiss
+import numpy as np
+
+from intent_rules import entities_for_intent
+
+INDEX_DIR = os.path.join("data", "intent_index")
+INTENT_INDEX_PATH = os.path.join(INDEX_DIR, "intent_index_v1_tes.faiss")
+INTENT_LABELS_PATH = os.path.join(INDEX_DIR, "intent_labels_v1_tes.json")
+EXAMPLES_PATH = os.path.join("data", "intent_examples.json")
+DEFAULT_K = 5
+
+_FEW_SHOT_EXAMPLE = re.compile(r'Query:\s*"(?P<query>[^"]+)"\s*JSON Response:\s*(?P<json>\{.*?\n\})', re.DOTALL)
+
+
+class KnnPrediction(NamedTuple):
+    intent: str
+    entities: Dict[str, str]
+    similarity: float # cosine similarity of the nearest example with the winning intent
+    margin: float # (winner votes - runner-up votes) / all votes, in [0, 1]
+    neighbours: List[str] # intents of the k nearest examples, nearest first
+
+    def as_dict(self) -> dict:
+        return self._asdict()
+
+
+def few_shot_examples(structure_json: str) -> List[dict]:
+    """`Query: "..." / JSON Response: {...}` pairs from the intent prompt's few-shot block."""
+    examples = []
+    for match in _FEW_SHOT_EXAMPLE.finditer(structure_json):
+        try:
+            intent = json.loads(match.group("json")).get("intent")
+        except json.JSONDecodeError:
+            continue
+        if intent:
+            examples.append({"query": match.group("query"), "intent": intent})
+    return examples
+
+
+def load_labelled_examples(structure_json: str = "", examples_path: str = EXAMPLES_PATH) -> List[dict]:
+    """Few-shot examples plus the labelled example file, first occurrence of each query wins."""
+    examples = few_shot_examples(structure_json)
+    if os.path.exists(examples_path):
+        with open(examples_path, "r", encoding="utf-8") as f:
+            examples.extend(json.load(f))
+    seen, unique = set(), []
+    for example in examples:
+        key = example["query"].strip().lower()
+        if key not in seen:
+            seen.add(key)
+            unique.append({"query": example["query"], "intent": example["intent"]})
+    return unique
+
+
+def _normalized(vectors) -> np.ndarray:
+    matrix = np.array(vectors, dtype="float32")
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    faiss.normalize_L2(matrix)
+    return matrix
+
+
+class KnnIntentClassifier:
+    def __init__(self, index, labels: List[dict]):
+        self.index = index
+        self.labels = labels
+
+    @classmethod
+    def build(cls, examples: List[dict], embeddings: Sequence[Sequence[float]]) -> "KnnIntentClassifier":
+        """Index of the examples whose embedding succeeded (get_embeddings returns [] on failure)."""
+        pairs = [(example, emb) for example, emb in zip(examples, embeddings) if emb]
+        if not pairs:
+            raise ValueError("No valid embeddings to build the intent index from.")
+        vectors = _normalized([emb for _, emb in pairs])
+        index = faiss.IndexFlatIP(vectors.shape[1])
+        index.add(vectors)
+        return cls(index, [example for example, _ in pairs])
+
+    @classmethod
+    def load(cls, index_path: str = INTENT_INDEX_PATH, labels_path: str = INTENT_LABELS_PATH) -> "KnnIntentClassifier":
+        with open(labels_path, "r", encoding="utf-8") as f:
+            labels = json.load(f)
+        return cls(faiss.read_index(index_path), labels)
+
+    def save(self, index_path: str = INTENT_INDEX_PATH, labels_path: str = INTENT_LABELS_PATH):
+        os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+        faiss.write_index(self.index, index_path)
+        with open(labels_path, "w", encoding="utf-8") as f:
+            json.dump(self.labels, f, indent=2, ensure_ascii=False)
+
+    def vector(self, position: int) -> np.ndarray:
+        return self.index.reconstruct(position)
+
+    def classify_vector(self, vector, query: str = "", k: int = DEFAULT_K,
+                        exclude: Optional[int] = None) -> Optional[KnnPrediction]:
+        """Similarity-weighted vote of the k nearest examples; `exclude` leaves one example out (evaluation)."""
+        if not len(vector) or self.index.ntotal == 0:
+            return None
+        extra = 1 if exclude is not None else 0
+        similarities, positions = self.index.search(_normalized(vector), min(k + extra, self.index.ntotal))
+        hits = [(float(sim), int(pos)) for sim, pos in zip(similarities[0], positions[0])
+                if pos >= 0 and pos != exclude][:k]
+        if not hits:
+            return None
+
+        votes, best_similarity = defaultdict(float), {}
+        for similarity, position in hits:
+            intent = self.labels[position]["intent"]
+            votes[intent] += max(similarity, 0.0)
+            best_similarity.setdefault(intent, similarity)
+        ranked = sorted(votes.items(), key=lambda item: item[1], reverse=True)
+        total = sum(votes.values())
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        margin = (ranked[0][1] - runner_up) / total if total else 0.0
+        intent = ranked[0][0]
+        return KnnPrediction(intent, entities_for_intent(intent, query), round(best_similarity[intent], 4),
+                             round(margin, 4), [self.labels[position]["intent"] for _, position in hits])
+
+
+_classifiers: Dict[tuple, KnnIntentClassifier] = {}
+_missing_logged = set()
+_load_lock = threading.Lock()
+
+
+def classifier_for(knn_config: dict, logger=None) -> Optional[KnnIntentClassifier]:
+    """Loaded once per index path; None (the node falls back to the LLM) until build_intent_index.py has run."""
+    index_path = knn_config.get("index_path", INTENT_INDEX_PATH)
+    labels_path = knn_config.get("labels_path", INTENT_LABELS_PATH)
+    key = (index_path, labels_path)
+    classifier = _classifiers.get(key)
+    if classifier is not None:
+        return classifier
+    with _load_lock:
+        if key in _classifiers:
+            return _classifiers[key]
+        if not (os.path.exists(index_path) and os.path.exists(labels_path)):
+            if logger is not None and key not in _missing_logged:
+                logger.warning("Intent kNN index not found at %s; run build_intent_index.py. Using the LLM.", index_path)
+                _missing_logged.add(key)
+            return None
+        classifier = _classifiers[key] = KnnIntentClassifier.load(index_path, labels_path)
+        if logger is not None:
+            logger.info("Intent kNN index loaded: %s examples from %s", classifier.index.ntotal, index_path)
+        return classifier
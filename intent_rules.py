@@ -0,0 +1,120 @@
+# intent_rules.py
+"""
+Rule-based fast path for the intent parser.
+
+Obvious queries ("Where is my order #1002?", "hi") are classified with regex rules instead of an LLM call.
+Each rule carries a confidence; a prediction that also matches rules for other intents is treated as
+ambiguous and its confidence is cut. The intent node only uses a prediction at or above
+`fast_path.min_confidence` and asks the LLM otherwise (see agents/intent_parser_node.py).
+"""
+import re
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional
+
+# Used when the registry's `fast_path` section has no `rules` of its own. `requires` lists entities that must
+# be extracted for the rule to apply (an order question without an order id still goes to the LLM).
+DEFAULT_INTENT_RULES = [
+    {"name": "greeting", "intent": "OUT_OF_CONTEXT", "confidence": 0.98,
+     "pattern": r"^\s*(hi|hello|hey|good (morning|afternoon|evening)|thanks|thank you)( there)?[\s!.?]*$"},
+    {"name": "order_status", "intent": "ORDER_STATUS", "confidence": 0.95, "requires": ["order_id"],
+     "pattern": r"\b(where|status|track|tracking|when will)\b.*\border\b|\border\b.*\b(status|shipped|arrive|where)\b"},
+    {"name": "assistant_version", "intent": "META_QUERY", "confidence": 0.9,
+     "pattern": r"\b(which|what) version\b|\bversion of (the|your)\b|\bwhat (model|llm) are you\b"},
+    {"name": "return_or_refund", "intent": "RETURN_INFO", "confidence": 0.8,
+     "pattern": r"\b(return|returns|returning|refund|refunds)\b"},
+    {"name": "damaged_or_wrong_item", "intent": "PROBLEM_REPORT", "confidence": 0.8,
+     "pattern": r"\b(damaged|broken|wrong item|missing item|defective)\b"},
+    {"name": "shipping", "intent": "SHIPPING_INFO", "confidence": 0.75,
+     "pattern": r"\b(shipping|delivery|deliver|package)\b"},
+    {"name": "availability", "intent": "PRODUCT_AVAILABILITY", "confidence": 0.7,
+     "pattern": r"\b(in stock|available|availability|sizes)\b"},
+]
+AMBIGUITY_PENALTY = 0.5 # confidence multiplier when rules for other intents match as well
+
+# "#12345", "order 12345", "order number 12345" -> "12345" (the prompt's order_id rule)
+_ORDER_ID = re.compile(r"#\s*(\d+)|\border\s+(?:number\s+|no\.?\s*|id\s+)?(\d+)", re.IGNORECASE)
+_PRODUCT_NAME = re.compile(r"\b(?:have|for|is|are)\s+(?:the\s+)?((?:[A-Z][\w'-]*\s?)+)")
+
+
+class IntentPrediction(NamedTuple):
+    intent: str
+    entities: Dict[str, Any]
+    confidence: float
+    rule: str
+
+    def as_dict(self) -> dict:
+        return self._asdict()
+
+
+def extract_entities(query: str) -> Dict[str, str]:
+    entities = {}
+    order_id = _ORDER_ID.search(query)
+    if order_id:
+        entities["order_id"] = order_id.group(1) or order_id.group(2)
+    product = _PRODUCT_NAME.search(query)
+    if product:
+        entities["product_name"] = product.group(1).strip()
+    return entities
+
+
+def entities_for_intent(intent: str, query: str) -> Dict[str, str]:
+    """Extracted entities, limited to the ones the intent prompt asks for with this intent."""
+    wanted = ("product_name",) if intent == "PRODUCT_AVAILABILITY" else \
+        ("order_id",) if intent in ("ORDER_STATUS", "RETURN_INFO", "PROBLEM_REPORT", "SQL_QUERY_GENERAL") else ()
+    return {k: v for k, v in extract_entities(query).items() if k in wanted}
+
+
+class RuleBasedIntentClassifier:
+    def __init__(self, rules: Optional[List[dict]] = None):
+        self.rules = [dict(rule, regex=re.compile(rule["pattern"], re.IGNORECASE))
+                      for rule in (rules or DEFAULT_INTENT_RULES)]
+
+    def classify(self, query: str) -> Optional[IntentPrediction]:
+        """Best matching rule's prediction, or None if no rule applies."""
+        entities = extract_entities(query)
+        matches = [rule for rule in self.rules if rule["regex"].search(query)
+                   and all(name in entities for name in rule.get("requires", []))]
+        if not matches:
+            return None
+        best = max(matches, key=lambda rule: rule["confidence"])
+        confidence = best["confidence"]
+        if any(rule["intent"] != best["intent"] for rule in matches):
+            confidence *= AMBIGUITY_PENALTY
+        return IntentPrediction(best["intent"], entities_for_intent(best["intent"], query),
+                                round(confidence, 4), best["name"])
+
+
+_classifiers: Dict[str, RuleBasedIntentClassifier] = {}
+_stats_lock = threading.Lock()
+_stats = {"checked": 0, "fired": 0, "compared": 0, "agreed": 0}
+
+
+def classifier_for(fast_path_config: dict) -> RuleBasedIntentClassifier:
+    """One compiled classifier per distinct rule set (the registry can be reloaded at runtime)."""
+    rules = fast_path_config.get("rules")
+    key = repr(rules)
+    classifier = _classifiers.get(key)
+    if classifier is None:
+        classifier = _classifiers[key] = RuleBasedIntentClassifier(rules)
+    return classifier
+
+
+def record_fast_path(fired: bool):
+    with _stats_lock:
+        _stats["checked"] += 1
+        _stats["fired"] += int(fired)
+
+
+def record_agreement(agreed: bool):
+    """A confident rule prediction was checked against the LLM's intent (shadow mode)."""
+    with _stats_lock:
+        _stats["compared"] += 1
+        _stats["agreed"] += int(agreed)
+
+
+def get_fast_path_stats() -> Dict[str, float]:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["fire_rate"] = round(stats["fired"] / stats["checked"], 4) if stats["checked"] else 0.0
+    stats["agreement_rate"] = round(stats["agreed"] / stats["compared"], 4) if stats["compared"] else 0.0
+    return stats
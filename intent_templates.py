@@ -0,0 +1,141 @@
+# intent_templates.py
+"""
+Query-template cache for the intent parser.
+
+Most traffic comes in a few shapes that differ only in literals ("where is my order #1002?",
+"do you have Nike Air Max in stock?"). A query is normalised into a template with its literals pulled out
+(emails, quoted strings, capitalised names after the first word, numbers), and the intent plus the
+entity -> literal-slot mapping found for it is cached per template. A later query with the same template gets
+the intent straight away and its entities re-read from its own literals. Keys include the intent_parser
+version, so a prompt upgrade (new version in the registry) starts from an empty cache.
+"""
+import re
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from caching import TTLCache
+
+DEFAULT_MAX_ENTRIES = 2048
+DEFAULT_TTL_SECONDS = 3600
+
+# Tried in order; earlier kinds win over overlapping later ones ("#1002" is a number, "a@b.com" an email)
+_LITERALS = [
+    ("email", re.compile(r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b")),
+    ("quoted", re.compile(r"\"([^\"]+)\"|“([^”]+)”")),
+    ("name", re.compile(r"(?<=\s)(?:[A-Z][\w'-]*)(?:\s+[A-Z][\w'-]*)*")), # not the sentence's first word
+    ("number", re.compile(r"\d+(?:\.\d+)?")),
+]
+
+
+class TemplateMatch(NamedTuple):
+    intent: str
+    entities: Dict[str, str]
+    template: str
+
+    def as_dict(self) -> dict:
+        return self._asdict()
+
+
+def to_template(query: str) -> Tuple[str, List[str]]:
+    """("where is my order #{number}?", ["1002"]) for "Where is my order #1002?"."""
+    spans = []
+    for kind, pattern in _LITERALS:
+        for match in pattern.finditer(query):
+            start, end = match.span()
+            if kind == "name" and match.group(0) == "I":
+                continue
+            if any(start < s_end and s_start < end for s_start, s_end, _, _ in spans):
+                continue
+            value = next((g for g in match.groups() if g), None) if match.groups() else match.group(0)
+            spans.append((start, end, kind, value))
+    spans.sort()
+
+    parts, literals, position = [], [], 0
+    for start, end, kind, value in spans:
+        parts.append(query[position:start].lower())
+        parts.append("{%s}" % kind)
+        literals.append(value)
+        position = end
+    parts.append(query[position:].lower())
+    return " ".join("".join(parts).split()), literals
+
+
+def slot_mapping(entities: Dict[str, str], literals: List[str]) -> Optional[Dict[str, int]]:
+    """Entity name -> literal index; None if some entity is not one of the literals (it can't be re-extracted)."""
+    mapping = {}
+    for name, value in (entities or {}).items():
+        if value is None:
+            continue
+        normalized = str(value).strip().lower()
+        slot = next((i for i, literal in enumerate(literals) if literal.strip().lower() == normalized), None)
+        if slot is None:
+            return None
+        mapping[name] = slot
+    return mapping
+
+
+class IntentTemplateCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS):
+        self.entries = TTLCache(max_entries, ttl_seconds)
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "uncacheable": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def lookup(self, version: str, query: str) -> Optional[TemplateMatch]:
+        template, literals = to_template(query)
+        entry = self.entries.get((version, template))
+        if entry is None:
+            self._count("misses")
+            return None
+        intent, slots = entry
+        if any(slot >= len(literals) for slot in slots.values()):
+            self._count("misses")
+            return None
+        self._count("hits")
+        return TemplateMatch(intent, {name: literals[slot] for name, slot in slots.items()}, template)
+
+    def store(self, version: str, query: str, intent: str, entities: Dict[str, str]) -> bool:
+        template, literals = to_template(query)
+        slots = slot_mapping(entities, literals)
+        if slots is None:
+            self._count("uncacheable")
+            return False
+        self.entries.set((version, template), (intent, slots))
+        self._count("stored")
+        return True
+
+    def clear(self):
+        self.entries.clear()
+
+
+_caches: Dict[tuple, IntentTemplateCache] = {}
+_caches_lock = threading.Lock()
+
+
+def cache_for(template_cache_config: dict) -> IntentTemplateCache:
+    """One cache per (max_entries, ttl_seconds) setting, shared by the sync and async node."""
+    key = (template_cache_config.get("max_entries", DEFAULT_MAX_ENTRIES),
+           template_cache_config.get("ttl_seconds", DEFAULT_TTL_SECONDS))
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = IntentTemplateCache(*key)
+        return cache
+
+
+def clear_template_caches():
+    with _caches_lock:
+        for cache in _caches.values():
+            cache.clear()
+
+
+def get_template_cache_stats() -> Dict[str, int]:
+    totals = {"hits": 0, "misses": 0, "stored": 0, "uncacheable": 0, "entries": 0}
+    for cache in list(_caches.values()):
+        for name, value in cache.stats.items():
+            totals[name] += value
+        totals["entries"] += len(cache.entries)
+    return totals
@@ -0,0 +1,229 @@
+# llm_transport.py
+"""
+Resilient transport for the OpenAI clients.
+
+- Pooled HTTP clients (connection limits / keep-alive) built from the registry's `openai_transport` section.
+- Jittered exponential retry on 429 / 5xx / timeouts, bounded by a total deadline per call.
+- A circuit breaker that fails fast while the upstream is degraded instead of piling up blocked workers.
+
+The SDK's own retry loop is disabled (max_retries=0) so this module is the single place that retries.
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+import httpx
+from openai import (OpenAI, AsyncOpenAI, OpenAIError, APIConnectionError, APITimeoutError, APIStatusError,
+                    RateLimitError, DefaultHttpxClient, DefaultAsyncHttpxClient)
+
+DEFAULT_TRANSPORT_SETTINGS = {
+    "max_connections": 100,
+    "max_keepalive_connections": 20,
+    "keepalive_expiry_seconds": 30,
+    "connect_timeout_seconds": 5,
+    "default_timeout_seconds": 30, # per attempt, unless the node sets request_timeout_seconds
+    "retry": {
+        "max_attempts": 4,
+        "base_delay_seconds": 0.25,
+        "max_delay_seconds": 4.0,
+        "total_deadline_seconds": 45,
+    },
+    "circuit_breaker": {
+        "failure_threshold": 5,
+        "reset_timeout_seconds": 30,
+    },
+}
+
+
+class CircuitOpenError(OpenAIError):
+    """Raised without touching the network while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Classic closed -> open -> half-open breaker, shared by every thread and event loop in the process."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_trial = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> bool:
+        """Admits a call or raises CircuitOpenError; True if the call is the half-open trial (see finish_trial)."""
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_timeout_seconds:
+                    raise CircuitOpenError("LLM upstream circuit is open; failing fast.")
+                self.state = "half_open"
+                self._half_open_trial = False
+            if self.state == "half_open":
+                if self._half_open_trial:
+                    raise CircuitOpenError("LLM upstream circuit is half-open; trial request in flight.")
+                self._half_open_trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._half_open_trial = False
+
+    def finish_trial(self, succeeded: bool):
+        """Ends a half-open trial whatever its outcome (429, 4xx, other exceptions, cancellation)."""
+        with self._lock:
+            if not self._half_open_trial: # already settled by record_success / record_failure
+                return
+            self._half_open_trial = False
+            if succeeded:
+                self.state = "closed"
+                self._failures = 0
+            else:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._half_open_trial = False
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (RateLimitError, APITimeoutError, APIConnectionError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+def _counts_against_upstream(error: Exception) -> bool:
+    # 429 means *our* quota is exhausted, not that the upstream is unhealthy
+    return _is_retryable(error) and not isinstance(error, RateLimitError)
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class ResilientTransport:
+    def __init__(self, settings: Optional[dict] = None):
+        settings = _merge_settings(settings)
+        self.settings = settings
+        retry = settings["retry"]
+        self.max_attempts = retry["max_attempts"]
+        self.base_delay = retry["base_delay_seconds"]
+        self.max_delay = retry["max_delay_seconds"]
+        self.total_deadline = retry["total_deadline_seconds"]
+        self.default_timeout = settings["default_timeout_seconds"]
+        breaker = settings["circuit_breaker"]
+        self.breaker = CircuitBreaker(breaker["failure_threshold"], breaker["reset_timeout_seconds"])
+        self._random = random.Random()
+        self.stats = {"attempts": 0, "retries": 0, "failures": 0, "short_circuited": 0}
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        # Full jitter: uniform(0, min(cap, base * 2^attempt)), but never sooner than Retry-After
+        delay = self._random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        retry_after = _retry_after_seconds(error)
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def _next_step(self, attempt: int, error: Exception, deadline: float) -> Optional[float]:
+        """Records the failure; returns the sleep before the next attempt, or None to give up."""
+        if _counts_against_upstream(error):
+            self.breaker.record_failure()
+        if not _is_retryable(error) or attempt + 1 >= self.max_attempts or self.breaker.state == "open":
+            return None
+        delay = self._backoff(attempt, error)
+        if time.monotonic() + delay >= deadline:
+            return None
+        self.stats["retries"] += 1
+        return delay
+
+    def _attempt_timeout(self, timeout: Optional[float], deadline: float) -> float:
+        return max(0.001, min(timeout or self.default_timeout, deadline - time.monotonic()))
+
+    def _start(self):
+        """(deadline, whether this call is the breaker's half-open trial)."""
+        try:
+            trial = self.breaker.before_call()
+        except CircuitOpenError:
+            self.stats["short_circuited"] += 1
+            raise
+        return time.monotonic() + self.total_deadline, trial
+
+    def call(self, fn: Callable[[float], Any], timeout: Optional[float] = None) -> Any:
+        """Runs fn(attempt_timeout) with retries; raises the last OpenAIError when out of attempts or time."""
+        deadline, trial = self._start()
+        attempt, succeeded = 0, False
+        try:
+            while True:
+                self.stats["attempts"] += 1
+                try:
+                    result = fn(self._attempt_timeout(timeout, deadline))
+                    self.breaker.record_success()
+                    succeeded = True
+                    return result
+                except OpenAIError as e:
+                    delay = self._next_step(attempt, e, deadline)
+                    if delay is None:
+                        self.stats["failures"] += 1
+                        raise
+                time.sleep(delay)
+                attempt += 1
+        finally:
+            if trial: # any other outcome of a half-open trial reopens the circuit
+                self.breaker.finish_trial(succeeded)
+
+    async def acall(self, fn: Callable[[float], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        """Async twin of call(); backoff sleeps yield to the event loop."""
+        deadline, trial = self._start()
+        attempt, succeeded = 0, False
+        try:
+            while True:
+                self.stats["attempts"] += 1
+                try:
+                    result = await fn(self._attempt_timeout(timeout, deadline))
+                    self.breaker.record_success()
+                    succeeded = True
+                    return result
+                except OpenAIError as e:
+                    delay = self._next_step(attempt, e, deadline)
+                    if delay is None:
+                        self.stats["failures"] += 1
+                        raise
+                await asyncio.sleep(delay)
+                attempt += 1
+        finally:
+            if trial: # cancellation included: CancelledError passes through here
+                self.breaker.finish_trial(succeeded)
+
+
+def _merge_settings(settings: Optional[dict]) -> dict:
+    merged = {**DEFAULT_TRANSPORT_SETTINGS, **(settings or {})}
+    for section in ("retry", "circuit_breaker"):
+        merged[section] = {**DEFAULT_TRANSPORT_SETTINGS[section], **((settings or {}).get(section) or {})}
+    return merged
+
+
+def build_openai_clients(api_key: Optional[str], settings: Optional[dict] = None, base_url: Optional[str] = None):
+    """Builds pooled sync/async OpenAI clients with SDK retries disabled."""
+    settings = _merge_settings(settings)
+    limits = httpx.Limits(max_connections=settings["max_connections"],
+                          max_keepalive_connections=settings["max_keepalive_connections"],
+                          keepalive_expiry=settings["keepalive_expiry_seconds"])
+    timeout = httpx.Timeout(settings["default_timeout_seconds"], connect=settings["connect_timeout_seconds"])
+    sync_client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0, timeout=timeout,
+                         http_client=DefaultHttpxClient(limits=limits, timeout=timeout))
+    async_client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0, timeout=timeout,
+                               http_client=DefaultAsyncHttpxClient(limits=limits, timeout=timeout))
+    return sync_client, async_client
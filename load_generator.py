@@ -0,0 +1,165 @@
+# load_generator.py
+"""
+Open-loop load generator: drives the graph in-process, or a running app.py over HTTP, at a series of target
+request rates and reports throughput and p50/p95/p99 latency per step (a throughput/latency curve).
+
+    python load_generator.py --mode graph --rps 5,10,20,40 --duration 10 --latency lognormal:300,0.5
+    python load_generator.py --mode http --url http://127.0.0.1:5000/chat --rps 2,4,8 --duration 20
+
+In graph mode the OpenAI clients in utils are repointed at fake_openai_server, so nothing leaves the machine.
+For http mode start the app against the fake server yourself (see fake_openai_server.py).
+Requests are sent on schedule whether or not earlier ones finished; latency is measured from the scheduled
+send time, so queueing inside the system under test is not hidden (no coordinated omission).
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+os.environ.setdefault("OPENAI_API_KEY", "fake-key-for-local-benchmark")
+
+GOLDEN_QUERY_FILES = ("data/golden_queries_sql.json", "data/golden_queries_retrieval.json")
+
+
+def load_query_mix(paths=GOLDEN_QUERY_FILES) -> List[str]:
+    queries = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            queries.extend(item["query"] for item in json.load(f) if item.get("query"))
+    return queries
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def arrival_offsets(rps: float, duration: float, poisson: bool = False, seed: int = 0) -> List[float]:
+    """Send times (seconds from the step start): evenly spaced, or a Poisson process with the same mean rate."""
+    if not poisson:
+        return [i / rps for i in range(int(rps * duration))]
+    rng, offsets, t = random.Random(seed), [], 0.0
+    while True:
+        t += rng.expovariate(rps)
+        if t >= duration:
+            return offsets
+        offsets.append(t)
+
+
+def summarize_step(target_rps: float, latencies: List[float], errors: int, elapsed: float) -> dict:
+    completed = len(latencies) + errors
+    return {
+        "target_rps": target_rps,
+        "sent": completed,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_s": round(percentile(latencies, 0.50), 4),
+        "p95_s": round(percentile(latencies, 0.95), 4),
+        "p99_s": round(percentile(latencies, 0.99), 4),
+        "max_s": round(max(latencies), 4) if latencies else 0.0,
+    }
+
+
+def run_step(send: Callable[[str], bool], queries: List[str], rps: float, duration: float,
+             workers: int, poisson: bool = False, seed: int = 0) -> dict:
+    """Fires requests at `rps` for `duration` seconds and waits for all of them to finish."""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    step_start = time.perf_counter()
+
+    def fire(scheduled_at: float, query: str):
+        try:
+            ok = send(query)
+        except Exception:
+            ok = False
+        latency = time.perf_counter() - scheduled_at
+        with lock:
+            if ok:
+                latencies.append(latency)
+            else:
+                errors[0] += 1
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i, offset in enumerate(arrival_offsets(rps, duration, poisson, seed)):
+            scheduled_at = step_start + offset
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, scheduled_at, queries[i % len(queries)])
+    return summarize_step(rps, latencies, errors[0], time.perf_counter() - step_start)
+
+
+def graph_sender(latency: str, seed: int = 0):
+    """Sends each query through langgraph_app.invoke against an in-process fake OpenAI server."""
+    import utils
+    from app_graph import app as langgraph_app
+    from fake_openai_server import start_in_thread
+    from graph_state import build_initial_state
+    from llm_transport import build_openai_clients
+
+    server, base_url = start_in_thread(latency=latency, seed=seed)
+    registry = utils.load_agent_registry(force_reload=True)
+    utils.client, utils.async_client = build_openai_clients(os.environ["OPENAI_API_KEY"],
+                                                            registry.get("openai_transport"), base_url=base_url)
+
+    def send(query: str) -> bool:
+        final_state = langgraph_app.invoke(build_initial_state(query))
+        return bool(final_state.get("final_answer"))
+    return send, server.shutdown
+
+
+def http_sender(url: str, timeout: float):
+    """POSTs each query to app.py's /chat endpoint over a pooled connection."""
+    import httpx
+    http = httpx.Client(timeout=timeout, limits=httpx.Limits(max_connections=200, max_keepalive_connections=200))
+
+    def send(query: str) -> bool:
+        return http.post(url, json={"message": query}).status_code == 200
+    return send, http.close
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Open-loop load generator with p50/p95/p99 throughput curves")
+    parser.add_argument("--mode", choices=["graph", "http"], default="graph")
+    parser.add_argument("--url", default="http://127.0.0.1:5000/chat", help="Target for --mode http")
+    parser.add_argument("--rps", default="5,10,20", help="Comma-separated target request rates, one step each")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per step")
+    parser.add_argument("--workers", type=int, default=64, help="Max requests in flight")
+    parser.add_argument("--arrival", choices=["uniform", "poisson"], default="uniform")
+    parser.add_argument("--latency", default="lognormal:300,0.5", help="Fake upstream latency for --mode graph")
+    parser.add_argument("--timeout", type=float, default=60.0, help="HTTP timeout for --mode http")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Optional JSON file for the per-step results")
+    args = parser.parse_args(argv)
+
+    queries = load_query_mix()
+    if args.mode == "graph":
+        send, close = graph_sender(args.latency, args.seed)
+    else:
+        send, close = http_sender(args.url, args.timeout)
+    logging.getLogger().setLevel(logging.WARNING) # after utils set up logging; per-call INFO logs would dominate
+
+    results = []
+    print(f"{'target rps':>10} {'sent':>6} {'errors':>6} {'thru rps':>9} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8}")
+    try:
+        for rps in (float(r) for r in args.rps.split(",")):
+            step = run_step(send, queries, rps, args.duration, args.workers, args.arrival == "poisson", args.seed)
+            results.append(step)
+            print(f"{step['target_rps']:>10g} {step['sent']:>6} {step['errors']:>6} {step['throughput_rps']:>9} "
+                  f"{step['p50_s']:>8} {step['p95_s']:>8} {step['p99_s']:>8}")
+    finally:
+        close()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# log_pipeline.py
+"""
+Non-blocking logging for the request path.
+
+Loggers hand records to a QueueHandler; a QueueListener thread does the formatting (text or one JSON
+object per line), the truncation and the stream I/O. On the calling thread a record is only tagged with
+the request's correlation id and sampled, so log with %-style arguments (`logger.info("rows: %s", rows)`)
+rather than f-strings to keep message formatting off the request path. List, dict and set arguments are
+copied (shallowly) before the record is queued. `extra={...}` fields become top-level JSON keys.
+Configured once by utils.configure_logging from the `logging` registry section.
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+DEFAULT_LOGGING_SETTINGS = {
+    "level": "INFO",
+    "format": "text", # text | json
+    "max_field_chars": 2000, # longer messages / extra fields are cut, with a marker
+    "queue_size": 10000, # records beyond this are dropped instead of blocking the caller
+    "sampling": {}, # logger name -> fraction of INFO/DEBUG records kept; WARNING and above are always kept
+}
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(correlation_id)s] %(message)s"
+
+_correlation_id: contextvars.ContextVar = contextvars.ContextVar("correlation_id", default="-")
+# Attributes every LogRecord has; anything else on a record came from `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "correlation_id"}
+_MUTABLE = (list, dict, set) # arguments the caller may change after logging
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.Handler] = None
+
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def set_correlation_id(correlation_id: Optional[str] = None) -> contextvars.Token:
+    """Tags every record logged in this context (including graph nodes it runs) with the id."""
+    return _correlation_id.set(correlation_id or new_correlation_id())
+
+
+def reset_correlation_id(token: contextvars.Token):
+    _correlation_id.reset(token)
+
+
+def get_correlation_id() -> str:
+    return _correlation_id.get()
+
+
+def truncate(value: str, limit: int) -> str:
+    if limit and len(value) > limit:
+        return f"{value[:limit]}... [truncated {len(value) - limit} chars]"
+    return value
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a per-logger fraction of INFO/DEBUG records; the longest matching logger-name prefix wins."""
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self._resolved: Dict[str, float] = {}
+
+    def _rate_for(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            matches = [prefix for prefix in self.rates if name == prefix or name.startswith(prefix + ".")]
+            rate = self.rates[max(matches, key=len)] if matches else 1.0
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class RequestQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records tagged with the correlation id; never blocks when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # msg and args travel as they are and are merged on the listener thread
+        record = copy.copy(record) # other handlers on the root logger still get the original
+        record.correlation_id = _correlation_id.get()
+        if isinstance(record.args, tuple) and any(isinstance(arg, _MUTABLE) for arg in record.args):
+            record.args = tuple(copy.copy(arg) if isinstance(arg, _MUTABLE) else arg for arg in record.args)
+        elif isinstance(record.args, dict):
+            record.args = dict(record.args)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self, max_field_chars: int = 0):
+        super().__init__(TEXT_FORMAT)
+        self.max_field_chars = max_field_chars
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = truncate(record.message, self.max_field_chars)
+        return super().formatMessage(record)
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, max_field_chars: int = 0):
+        super().__init__()
+        self.max_field_chars = max_field_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "correlation_id": getattr(record, "correlation_id", "-"),
+            "msg": truncate(record.getMessage(), self.max_field_chars),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                payload[key] = value if isinstance(value, (int, float, bool, type(None))) else \
+                    truncate(value if isinstance(value, str) else json.dumps(value, default=str), self.max_field_chars)
+        if record.exc_text:
+            payload["exc_info"] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class _StderrHandler(logging.StreamHandler):
+    """Writes to whatever sys.stderr is at emit time (it may be swapped after configuration, e.g. by pytest)."""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+
+def configure_logging(settings: Optional[dict] = None, stream=None) -> logging.Handler:
+    """Installs the queue handler on the root logger (replacing a previous one) and starts the listener."""
+    global _listener, _queue_handler
+    settings = {**DEFAULT_LOGGING_SETTINGS, **(settings or {})}
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream) if stream is not None else _StderrHandler()
+    output.setFormatter(JsonFormatter(settings["max_field_chars"]) if settings["format"] == "json"
+                        else TextFormatter(settings["max_field_chars"]))
+
+    log_queue = queue.Queue(maxsize=settings["queue_size"])
+    _queue_handler = RequestQueueHandler(log_queue)
+    _queue_handler.addFilter(SamplingFilter(settings["sampling"]))
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    root.setLevel(settings["level"])
+    _listener.start()
+    return _queue_handler
+
+
+def shutdown_logging():
+    """Flushes queued records and detaches the handler; safe to call more than once."""
+    global _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+
+
+atexit.register(shutdown_logging)
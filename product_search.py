@@ -0,0 +1,126 @@
+# product_search.py
+"""
+FTS5 trigram index over product names, used instead of `name LIKE '%term%'` full scans.
+
+`install_product_index(db_path)` creates `Products_fts`, an external-content FTS5 table with the
+trigram tokenizer. It holds only the index, because the rows stay in Products, and triggers keep it in
+sync on every INSERT, UPDATE and DELETE. A trigram MATCH on a quoted term finds the same rows as a
+case-insensitive `LIKE '%term%'` (for terms of three or more characters) without reading the table.
+
+sql_processor calls `indexed_statement` before executing, and uses the index when the database has one:
+- The vetted stock template runs its ranked FTS statement (bm25 order, best match first).
+- `rewrite_like` turns `name LIKE '%term%'` on Products in any other statement (LLM-written or learned)
+  into an id lookup through the index.
+Build it with `python product_search.py <db>`; the `product_search` block of the sql_processor registry
+entry turns its use off.
+"""
+import argparse
+import re
+import sqlite3
+from typing import Optional, Tuple
+
+from caching import TTLCache
+from sql_guard import table_aliases
+
+FTS_TABLE = "Products_fts"
+MIN_TERM_LENGTH = 3 # shorter terms have no trigram; they keep the LIKE
+_HAS_INDEX_TTL_SECONDS = 60
+
+# name LIKE '%term%'  |  name LIKE '%' || :param || '%'   (optionally qualified: Products.name, p.name)
+_LIKE = re.compile(
+    r"(?P<prefix>\b\w+\.)?\bname\s+LIKE\s+(?:'%(?P<term>(?:[^'%_]|'')+)%'|'%'\s*\|\|\s*:(?P<param>\w+)\s*\|\|\s*'%')",
+    re.IGNORECASE)
+
+_has_index = TTLCache(max_entries=64, ttl_seconds=_HAS_INDEX_TTL_SECONDS)
+
+
+def match_expression(term: str) -> str:
+    """FTS5 query for a term as one phrase: "nike air max" (embedded quotes doubled)."""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def usable_term(term) -> bool:
+    """A term the index answers exactly like LIKE '%term%': at least one trigram and no LIKE wildcards."""
+    return isinstance(term, str) and len(term) >= MIN_TERM_LENGTH and "%" not in term and "_" not in term
+
+
+def has_product_index(conn: sqlite3.Connection, db_key: str = "") -> bool:
+    found = _has_index.get(db_key)
+    if found is None:
+        found = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE,)).fetchone() is not None
+        _has_index.set(db_key, found)
+    return found
+
+
+def rewrite_like(sql: str, params: Optional[dict] = None) -> Tuple[str, bool]:
+    """
+    (statement, rewritten): product-name LIKE filters on Products answered through the FTS index. A filter is
+    rewritten when its qualifier names Products (or its alias), or when it is unqualified and the statement
+    reads no other table.
+    """
+    aliases = table_aliases(sql)
+    if "products" not in aliases.values():
+        return sql, False
+
+    def replace(match) -> str:
+        prefix = match.group("prefix")
+        if prefix and aliases.get(prefix[:-1].lower()) != "products":
+            return match.group(0)
+        if not prefix and set(aliases.values()) != {"products"}:
+            return match.group(0)
+        if match.group("param"):
+            value = (params or {}).get(match.group("param"))
+            if not usable_term(value):
+                return match.group(0)
+            phrase = f"""'"' || replace(:{match.group("param")}, '"', '""') || '"'"""
+        else:
+            term = match.group("term").replace("''", "'")
+            if not usable_term(term):
+                return match.group(0)
+            phrase = "'" + match_expression(term).replace("'", "''") + "'"
+        return f"{prefix or ''}id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH {phrase})"
+
+    rewritten = _LIKE.sub(replace, sql)
+    return rewritten, rewritten != sql
+
+
+def indexed_statement(conn: sqlite3.Connection, sql: str, params: Optional[dict] = None, fts_sql: Optional[str] = None,
+                      db_key: str = "") -> Tuple[str, bool]:
+    """(statement, uses the index): a template's ranked `fts_sql`, or `sql` with its LIKE filters rewritten."""
+    if not has_product_index(conn, db_key):
+        return sql, False
+    if fts_sql and all(usable_term(value) for value in (params or {}).values()):
+        return fts_sql, True
+    return rewrite_like(sql, params)
+
+
+def clear_product_index_cache():
+    _has_index.clear()
+
+
+def install_product_index(db_path: str) -> int:
+    """Creates (or rebuilds) the index and its sync triggers; returns the number of products indexed."""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                         f"name, content='Products', content_rowid='id', tokenize='trigram')")
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON Products BEGIN "
+                         f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.id, new.name); END")
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON Products BEGIN "
+                         f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name); END")
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF id, name ON Products BEGIN "
+                         f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name); "
+                         f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.id, new.name); END")
+            conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        _has_index.clear()
+        return conn.execute("SELECT COUNT(*) FROM Products").fetchone()[0]
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FTS5 trigram index over Products.name")
+    parser.add_argument("db_path", nargs="?", default="data/ecommerce_support.db")
+    indexed = install_product_index(parser.parse_args().db_path)
+    print(f"{FTS_TABLE} built over {indexed} products; triggers keep it in sync.")
@@ -0,0 +1,158 @@
+# prompt_store.py
+"""
+In-memory store of the prompt templates under prompts/.
+
+Templates are read once, kept as PromptTemplate objects (a str subclass, so existing callers keep
+working) whose static text and placeholders are split ahead of time; rendering is a single join.
+Files are re-read when their mtime changes (checked at most every `check_interval_seconds`),
+so prompt edits go live without a restart. Render counts/timings are kept per template.
+"""
+import os
+import re
+import string
+import threading
+import time
+from typing import Dict, List, Optional
+
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+_UNSUPPORTED = object() # marker: template needs the full str.format machinery
+
+
+class PromptTemplate(str):
+    """A prompt file's text with pre-split segments. `format` keeps str.format semantics."""
+
+    def __new__(cls, text: str, path: Optional[str] = None, mtime_ns: int = 0, store: "PromptStore" = None):
+        template = super().__new__(cls, text)
+        template.path = path
+        template.mtime_ns = mtime_ns
+        template.checked_at = 0.0
+        template._store = store
+        template._format_segments = None # built lazily; not every template is format-style
+        template._substitute_segments = _PLACEHOLDER.split(text)
+        return template
+
+    def _compiled_format(self):
+        if self._format_segments is None:
+            literals, fields = [], []
+            try:
+                for literal, field_name, format_spec, conversion in string.Formatter().parse(self):
+                    if field_name is not None and (format_spec or conversion or not field_name.isidentifier()):
+                        raise ValueError("positional/attribute fields, specs and conversions are not pre-compiled")
+                    literals.append(literal)
+                    fields.append(field_name)
+                self._format_segments = (literals, fields)
+            except ValueError:
+                self._format_segments = _UNSUPPORTED
+        return self._format_segments
+
+    def format(self, *args, **kwargs) -> str:
+        start = time.perf_counter()
+        compiled = self._compiled_format()
+        if args or compiled is _UNSUPPORTED:
+            rendered = str.format(self, *args, **kwargs)
+        else:
+            literals, fields = compiled
+            parts = []
+            for literal, field_name in zip(literals, fields):
+                parts.append(literal)
+                if field_name is not None:
+                    parts.append(str(kwargs[field_name])) # KeyError on a missing value, like str.format
+            rendered = "".join(parts)
+        self._record_render(start)
+        return rendered
+
+    def substitute(self, **values) -> str:
+        """Replaces only `{name}` placeholders present in values; any other braces stay literal (e.g. JSON)."""
+        start = time.perf_counter()
+        segments = self._substitute_segments
+        parts = segments[:] # even indexes: static text, odd indexes: placeholder names
+        for i in range(1, len(segments), 2):
+            name = segments[i]
+            parts[i] = str(values[name]) if name in values else "{" + name + "}"
+        rendered = "".join(parts)
+        self._record_render(start)
+        return rendered
+
+    def _record_render(self, start: float):
+        if self._store is not None:
+            self._store.record_render(self.path, time.perf_counter() - start)
+
+
+def render_placeholders(template: str, **values) -> str:
+    """PromptTemplate.substitute for compiled templates, plain str.replace for anything else."""
+    if isinstance(template, PromptTemplate):
+        return template.substitute(**values)
+    for name, value in values.items():
+        template = template.replace("{" + name + "}", str(value))
+    return template
+
+
+class PromptStore:
+    def __init__(self, root: str = "prompts", check_interval_seconds: float = 1.0):
+        self.root = root
+        self.check_interval_seconds = check_interval_seconds
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self.stats = {"loads": 0, "reloads": 0, "missing": 0}
+        self._render_metrics: Dict[str, Dict[str, float]] = {}
+
+    def preload(self) -> int:
+        """Loads every .txt template under root; returns how many were loaded."""
+        count = 0
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".txt"):
+                    self.get(os.path.join(directory, name))
+                    count += 1
+        return count
+
+    def get(self, path: str) -> PromptTemplate:
+        """Returns the compiled template, re-reading the file if its mtime changed. Raises FileNotFoundError."""
+        key = os.path.normpath(path)
+        template = self._templates.get(key)
+        now = time.monotonic()
+        if template is not None and now - template.checked_at < self.check_interval_seconds:
+            return template
+
+        try:
+            mtime_ns = os.stat(key).st_mtime_ns
+        except FileNotFoundError:
+            with self._lock:
+                self.stats["missing"] += 1
+                self._templates.pop(key, None)
+            raise
+
+        if template is None or template.mtime_ns != mtime_ns:
+            with self._lock:
+                template = self._templates.get(key)
+                if template is None or template.mtime_ns != mtime_ns:
+                    with open(key, "r", encoding="utf-8") as f:
+                        text = f.read().strip()
+                    self.stats["reloads" if template is not None else "loads"] += 1
+                    template = PromptTemplate(text, key, mtime_ns, store=self)
+                    self._templates[key] = template
+        template.checked_at = now
+        return template
+
+    def record_render(self, path: Optional[str], seconds: float):
+        with self._metrics_lock:
+            metrics = self._render_metrics.setdefault(path or "<inline>", {"renders": 0, "total_seconds": 0.0,
+                                                                            "max_seconds": 0.0})
+            metrics["renders"] += 1
+            metrics["total_seconds"] += seconds
+            metrics["max_seconds"] = max(metrics["max_seconds"], seconds)
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        """Per-template render counts and mean/max render time in microseconds, plus load/reload counters."""
+        with self._metrics_lock:
+            per_template = {
+                path: {"renders": m["renders"],
+                       "mean_render_us": round(m["total_seconds"] / m["renders"] * 1e6, 2) if m["renders"] else 0.0,
+                       "max_render_us": round(m["max_seconds"] * 1e6, 2)}
+                for path, m in self._render_metrics.items()
+            }
+        return {"templates": per_template, **self.stats}
+
+    def cached_paths(self) -> List[str]:
+        return sorted(self._templates)
@@ -0,0 +1,116 @@
+# result_encoding.py
+"""
+Compact encoding of SQL result rows for the response prompt, within a token budget.
+
+Rather than the repr of a list of dicts, where every row repeats every column name, the result is written as:
+- a header with the row count and the column names, once;
+- columns that hold one value in every row, stated once and dropped from the rows;
+- one ` | `-separated line per row, with `"` where a value repeats the row above;
+- min / max / avg / sum for numeric columns of results with `summarize_min_rows` rows or more. The summary
+  is computed over all rows, including the ones cut for the budget.
+Rows are added until `max_tokens` is reached, then an explicit "... N more rows not shown" line follows.
+Configured by the `result_encoding` block of the response_synthesizer registry entry.
+"""
+import json
+from numbers import Number
+from typing import List, NamedTuple, Optional
+
+from token_accounting import count_text_tokens
+
+DEFAULT_RESULT_ENCODING_SETTINGS = {
+    "enabled": True,
+    "max_tokens": 1500, # for the whole encoded result
+    "summarize_min_rows": 5,
+    "max_value_chars": 200,
+}
+DITTO = '"'
+
+
+class EncodedResult(NamedTuple):
+    text: str
+    rows_shown: int
+    rows_total: int
+    tokens: int
+
+
+def _value(value, max_chars: int) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    text = str(value)
+    if len(text) > max_chars:
+        text = text[:max_chars] + "..."
+    # Keep one row per line and the separator unambiguous
+    return json.dumps(text) if ("|" in text or "\n" in text or text == DITTO) else text
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, Number) and not isinstance(value, bool)
+
+
+def _summary(rows: List[dict], columns: List[str]) -> List[str]:
+    lines = []
+    for column in columns:
+        values = [row.get(column) for row in rows if row.get(column) is not None]
+        if not values or not all(_is_number(value) for value in values):
+            continue
+        total = sum(values)
+        lines.append(f"{column}: min {_value(min(values), 50)}, max {_value(max(values), 50)}, "
+                     f"avg {round(total / len(values), 2)}, sum {round(total, 2)}")
+    return lines
+
+
+def encode_rows(rows: List[dict], settings: Optional[dict] = None, model: str = "gpt-4o",
+                more_at_source: bool = False) -> EncodedResult:
+    """
+    Encodes result rows within the token budget. `more_at_source` says the rows are already a prefix of
+    a larger result (the SQL guard's row cap), which the text then states.
+    """
+    settings = {**DEFAULT_RESULT_ENCODING_SETTINGS, **(settings or {})}
+    max_chars = settings["max_value_chars"]
+    total = len(rows)
+    if not rows:
+        return EncodedResult("0 rows (no matching records)", 0, 0, 0)
+
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    constant = [column for column in columns if total > 1 and len({row.get(column) for row in rows}) == 1]
+    varying = [column for column in columns if column not in constant]
+
+    header = [f"{total} row{'s' if total != 1 else ''}" + (" (the query matched more)" if more_at_source else "")]
+    if constant:
+        header.append("same in every row: " + ", ".join(f"{column}={_value(rows[0].get(column), max_chars)}"
+                                                       for column in constant))
+    if total >= settings["summarize_min_rows"]:
+        header += _summary(rows, columns)
+    if not varying: # the header already says everything
+        text = "\n".join(header)
+        return EncodedResult(text, total, total, count_text_tokens(text, model))
+    legend = f" ({DITTO} = same as the row above)"
+    header.append("columns: " + " | ".join(varying))
+    tokens = count_text_tokens("\n".join(header) + legend, model) # the legend is dropped again if unused
+
+    lines, previous, ditto_used = [], None, False
+    for row in rows: # only as many rows as fit are encoded
+        cells = [_value(row.get(column), max_chars) for column in varying]
+        shown_cells = [DITTO if previous is not None and cell == previous[i] and len(cell) > 1 else cell
+                       for i, cell in enumerate(cells)]
+        line = " | ".join(shown_cells)
+        line_tokens = count_text_tokens(line, model) + 1
+        # Room is kept for the "more rows" marker unless this is the last row
+        marker_tokens = 12 if len(lines) + 1 < total else 0
+        if tokens + line_tokens + marker_tokens > settings["max_tokens"]:
+            break
+        lines.append(line)
+        tokens += line_tokens
+        ditto_used = ditto_used or DITTO in shown_cells
+        previous = cells
+    if ditto_used:
+        header[-1] += legend
+    else:
+        tokens -= count_text_tokens(legend, model)
+    shown = len(lines)
+    if shown < total:
+        lines.append(f"... {total - shown} more rows not shown")
+        tokens += count_text_tokens(lines[-1], model) + 1
+    return EncodedResult("\n".join(header + lines), shown, total, tokens)
@@ -0,0 +1,223 @@
+# schema_introspection.py
+"""
+Database schema for the SQL prompts, read from the live database instead of a hand-written string.
+
+`load_schema` reads the tables from sqlite_master and their columns from `PRAGMA table_info`. The result
+is cached per database and extracted again only when `PRAGMA schema_version` changes. Relationships come
+from `PRAGMA foreign_key_list`. Where none are declared, they are inferred from `<table>_id` column names.
+Internal tables are left out: the result cache's change counters and FTS indexes with their shadow tables.
+
+`prompt_schema` renders only the part of the schema that a question needs:
+- tables named by the intent, the parsed entities or the words of the question;
+- the tables on the join paths between them;
+- for wide tables, only the key columns and the columns the question mentions.
+The prompt then stays the same size as the database grows. A question that names no table gets the
+whole schema. Configured by the `schema` block of the sql_processor registry entry.
+"""
+import re
+import sqlite3
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sql_backends import SqlBackendError, backend_for
+from sql_result_cache import VERSIONS_TABLE
+from utils import DB_SCHEMA_FOR_PROMPT, logger
+
+DEFAULT_SCHEMA_SETTINGS = {
+    "live": True, # False: the static utils.DB_SCHEMA_FOR_PROMPT
+    "prune": True,
+    "max_columns_per_table": 12, # wider tables keep only key and mentioned columns
+}
+# Tables an intent is about even when the question doesn't name them
+INTENT_TABLES = {
+    "ORDER_STATUS": ("Orders",),
+    "PRODUCT_AVAILABILITY": ("Products",),
+    "RETURN_INFO": ("Returns",),
+}
+_WORD = re.compile(r"[a-z][a-z0-9_]+")
+
+
+class Column(NamedTuple):
+    name: str
+    type: str
+    primary_key: bool
+
+
+class Relationship(NamedTuple):
+    table: str
+    column: str
+    ref_table: str
+    ref_column: str
+
+
+class DatabaseSchema(NamedTuple):
+    version: int # PRAGMA schema_version it was read at
+    tables: Dict[str, Tuple[Column, ...]] # in sqlite_master order
+    relationships: Tuple[Relationship, ...]
+
+
+_schemas: Dict[str, DatabaseSchema] = {}
+_schemas_lock = threading.Lock()
+
+
+def _user_tables(conn: sqlite3.Connection) -> List[str]:
+    rows = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'").fetchall()
+    virtual = [name for name, sql in rows if (sql or "").upper().startswith("CREATE VIRTUAL TABLE")]
+    return [name for name, _ in rows if name != VERSIONS_TABLE and name not in virtual
+            and not any(name.startswith(f"{table}_") for table in virtual)]
+
+
+def _singular(word: str) -> str:
+    word = word.lower()
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    return word[:-1] if word.endswith("s") and not word.endswith("ss") else word
+
+
+def _extract(conn: sqlite3.Connection, version: int) -> DatabaseSchema:
+    tables = {}
+    for table in _user_tables(conn):
+        tables[table] = tuple(Column(row[1], row[2] or "", bool(row[5]))
+                              for row in conn.execute(f'PRAGMA table_info("{table}")'))
+    by_singular = {_singular(table): table for table in tables}
+    relationships = []
+    for table, columns in tables.items():
+        declared = {}
+        for row in conn.execute(f'PRAGMA foreign_key_list("{table}")'):
+            ref_table = next((name for name in tables if name.lower() == row[2].lower()), row[2])
+            ref_column = row[4] or next((c.name for c in tables.get(ref_table, ()) if c.primary_key), "rowid")
+            declared[row[3]] = Relationship(table, row[3], ref_table, ref_column)
+        for column in columns:
+            if column.name in declared:
+                relationships.append(declared[column.name])
+                continue
+            # customer_id -> Customers.id when nothing is declared
+            if column.primary_key or not column.name.lower().endswith("_id"):
+                continue
+            ref_table = by_singular.get(column.name[:-3].lower())
+            ref_key = next((c.name for c in tables.get(ref_table, ()) if c.primary_key), None)
+            if ref_table and ref_table != table and ref_key:
+                relationships.append(Relationship(table, column.name, ref_table, ref_key))
+    return DatabaseSchema(version, tables, tuple(relationships))
+
+
+def load_schema(conn: sqlite3.Connection, db_key: str = "") -> DatabaseSchema:
+    """The cached schema of the database behind `conn`, read again after any schema change."""
+    version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    schema = _schemas.get(db_key)
+    if schema is None or schema.version != version:
+        schema = _extract(conn, version)
+        with _schemas_lock:
+            _schemas[db_key] = schema
+    return schema
+
+
+def clear_schema_cache():
+    with _schemas_lock:
+        _schemas.clear()
+
+
+def _join_path(schema: DatabaseSchema, start: str, goal: str) -> List[str]:
+    """Tables on the shortest relationship path from start to goal (both included), or [] if unconnected."""
+    neighbours: Dict[str, Set[str]] = {table: set() for table in schema.tables}
+    for relationship in schema.relationships:
+        neighbours[relationship.table].add(relationship.ref_table)
+        neighbours.setdefault(relationship.ref_table, set()).add(relationship.table)
+    previous, queue = {start: None}, deque([start])
+    while queue:
+        table = queue.popleft()
+        if table == goal:
+            path = []
+            while table is not None:
+                path.append(table)
+                table = previous[table]
+            return path[::-1]
+        for neighbour in sorted(neighbours.get(table, ())):
+            if neighbour not in previous:
+                previous[neighbour] = table
+                queue.append(neighbour)
+    return []
+
+
+def relevant_tables(schema: DatabaseSchema, intent: Optional[str], entities: Optional[dict], query: str) -> List[str]:
+    """Tables the question needs, in schema order; every table when nothing points anywhere."""
+    words = set(_WORD.findall((query or "").lower()))
+    words |= {str(name).lower() for name, value in (entities or {}).items() if value not in (None, "")}
+    stems = {_singular(word) for word in words}
+    selected = {table for table in INTENT_TABLES.get(intent or "", ()) if table in schema.tables}
+    for table, columns in schema.tables.items():
+        singular = _singular(table)
+        if singular in stems or table.lower() in words or \
+                any(word.startswith(singular) and len(singular) >= 4 for word in words): # "returned" -> Returns
+            selected.add(table)
+        # Entity names: order_id names Orders, product_name Products
+        elif any(f"{singular}_{column.name.lower()}" in words for column in columns):
+            selected.add(table)
+        # A distinctive column ("email", "reason"); join keys and "name" are in too many tables to tell
+        elif any(column.name.lower() in words for column in columns
+                 if not column.primary_key and column.name.lower() != "name" and not column.name.lower().endswith("_id")):
+            selected.add(table)
+    if not selected:
+        return list(schema.tables)
+    ordered = sorted(selected, key=list(schema.tables).index)
+    for start, goal in zip(ordered, ordered[1:]): # connect consecutive tables through their join path
+        selected.update(_join_path(schema, start, goal))
+    return [table for table in schema.tables if table in selected]
+
+
+def _shown_columns(schema: DatabaseSchema, table: str, words: Set[str], max_columns: Optional[int]) -> Tuple[Column, ...]:
+    columns = schema.tables[table]
+    if max_columns is None or len(columns) <= max_columns:
+        return columns
+    keys = {r.column for r in schema.relationships if r.table == table} | \
+           {r.ref_column for r in schema.relationships if r.ref_table == table}
+    return tuple(column for column in columns
+                 if column.primary_key or column.name in keys or column.name.lower() in words)
+
+
+def render_schema(schema: DatabaseSchema, tables: Optional[Iterable[str]] = None, query: str = "",
+                  max_columns: Optional[int] = None) -> str:
+    """The schema block of the SQL prompts, for `tables` (default: all of them, with all their columns)."""
+    tables = list(schema.tables) if tables is None else list(tables)
+    words = set(_WORD.findall((query or "").lower()))
+    lines = ["", "Database Schema:", "Tables:"]
+    for number, table in enumerate(tables, 1):
+        columns = ", ".join(f"{column.name} {column.type}".strip() + (" PRIMARY KEY" if column.primary_key else "")
+                            for column in _shown_columns(schema, table, words, max_columns))
+        lines.append(f"{number}. {table}({columns})")
+    relationships = [r for r in schema.relationships if r.table in tables and r.ref_table in tables]
+    if relationships:
+        lines += ["", "Relationships:"]
+        lines += [f"- {r.table}.{r.column} references {r.ref_table}.{r.ref_column}" for r in relationships]
+    return "\n".join(lines) + "\n"
+
+
+def prompt_schema(conn: sqlite3.Connection, db_key: str = "", intent: Optional[str] = None,
+                  entities: Optional[dict] = None, query: str = "", settings: Optional[dict] = None) -> str:
+    """Schema block for one question: pruned to its tables unless `prune` is off."""
+    settings = {**DEFAULT_SCHEMA_SETTINGS, **(settings or {})}
+    schema = load_schema(conn, db_key)
+    if not settings["prune"]:
+        return render_schema(schema)
+    return render_schema(schema, relevant_tables(schema, intent, entities, query), query,
+                         settings["max_columns_per_table"])
+
+
+def schema_for_sql_prompt(sql_config: dict, query: str, intent: Optional[str] = None,
+                          entities: Optional[dict] = None) -> str:
+    """
+    The {db_schema} of a prompt that writes SQL for sql_processor's database, read through its SQL backend.
+    The static schema when that backend isn't SQLite (introspection uses SQLite pragmas) or can't be read.
+    """
+    settings = sql_config.get("schema") or {}
+    if not settings.get("live", DEFAULT_SCHEMA_SETTINGS["live"]) or not sql_config.get("db_path"):
+        return DB_SCHEMA_FOR_PROMPT
+    try:
+        backend = backend_for(sql_config)
+        if backend.dialect != "sqlite":
+            return DB_SCHEMA_FOR_PROMPT
+        return backend.run(lambda conn: prompt_schema(conn, sql_config["db_path"], intent, entities, query, settings))
+    except (sqlite3.Error, SqlBackendError) as e:
+        logger.warning("Schema introspection failed for %s: %s; using the static schema", sql_config['db_path'], e)
+        return DB_SCHEMA_FOR_PROMPT
@@ -0,0 +1,81 @@
+# single_flight.py
+"""
+Request coalescing: concurrent callers asking for the same key share one upstream call.
+
+Thread callers (Flask workers) use `do`, asyncio callers use `ado`. The two paths keep separate
+in-flight tables because a thread cannot await a task on another loop, but they share the counters.
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Hashable, Tuple
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name: str = "single_flight"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}        # key -> _Call for thread callers
+        self._tasks = {}        # (loop id, key) -> asyncio.Task for async callers
+        self.stats = {"upstream_calls": 0, "coalesced": 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Runs fn once per key among concurrent threads. Returns (result, was_coalesced)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.stats["upstream_calls"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result, False
+
+    async def ado(self, key: Hashable, coro_fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Async variant of do(). The upstream call runs as its own task, so a cancelled caller
+        does not cancel the request the other waiters depend on."""
+        loop = asyncio.get_running_loop()
+        task_key = (id(loop), key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            coalesced = task is not None
+            if coalesced:
+                self.stats["coalesced"] += 1
+            else:
+                task = loop.create_task(coro_fn())
+                self._tasks[task_key] = task
+                self.stats["upstream_calls"] += 1
+                task.add_done_callback(lambda _t: self._forget(task_key))
+        return await asyncio.shield(task), coalesced
+
+    def _forget(self, task_key):
+        with self._lock:
+            self._tasks.pop(task_key, None)
+
+    def saved_calls(self) -> int:
+        return self.stats["coalesced"]
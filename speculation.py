@@ -0,0 +1,221 @@
+# speculation.py
+"""
+Speculative branch work started while the intent parser is still waiting on its LLM call.
+
+Branch nodes register the part of their work that only needs the raw query (retrieval_processor: embed
+the query and search FAISS; sql_processor: generate the SQL). The intent node starts the registered work
+that fits the `speculation.max_cost_usd` budget, and once the intent is known, `settle` keeps the work of
+the branch the graph routes to and cancels or discards the rest. The branch node `claim`s its result
+instead of redoing it. The `speculation` state field records what was launched, kept and discarded, the
+seconds saved and wasted, and the estimated cost of discarded work.
+"""
+import asyncio
+import contextvars
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from caching import TTLCache
+from graph_state import branch_for_intent
+
+DEFAULT_SPECULATION_SETTINGS = {
+    "enabled": False,
+    "branches": ["retrieval_processor"], # launch order; "sql_processor" pre-generates SQL with a chat call
+    "max_cost_usd": 0.001, # estimated spend per request on work that may be thrown away
+    "max_workers": 16,
+}
+# A speculation nobody claimed (e.g. the graph failed in between) is dropped after this long
+_INFLIGHT_TTL_SECONDS = 120
+
+
+class SpeculativeBranch(NamedTuple):
+    run: Callable[[str], Any] # sync work for a query; a None result means "redo it in the node"
+    arun: Callable[[str], Any] # async twin
+    estimate_cost_usd: Callable[[str], float]
+    # (intent result, query) -> True if the node won't need the work, e.g. its answer is already known
+    redundant: Optional[Callable[[dict, str], bool]] = None
+
+
+class _Task:
+    def __init__(self, name: str, handle, cost_usd: float):
+        self.name = name
+        self.handle = handle # concurrent.futures.Future or asyncio.Task
+        self.cost_usd = cost_usd
+        self.started_at = time.perf_counter()
+        self.duration: Optional[float] = None # set when the work finishes
+
+    def _done(self, _):
+        self.duration = time.perf_counter() - self.started_at
+
+    def elapsed(self) -> float:
+        return self.duration if self.duration is not None else time.perf_counter() - self.started_at
+
+    def cancel(self) -> bool:
+        """True if the work never started (only possible for queued thread-pool work)."""
+        cancelled = self.handle.cancel()
+        return cancelled and isinstance(self.handle, Future)
+
+
+_branches: Dict[str, SpeculativeBranch] = {}
+_inflight = TTLCache(max_entries=10000, ttl_seconds=_INFLIGHT_TTL_SECONDS)
+_ids = itertools.count(1)
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"launched": 0, "kept": 0, "discarded": 0, "saved_s": 0.0, "wasted_s": 0.0, "wasted_cost_usd": 0.0}
+
+
+def register_branch(node_name: str, run: Callable[[str], Any], arun: Callable[[str], Any],
+                    estimate_cost_usd: Callable[[str], float], redundant: Optional[Callable[[dict, str], bool]] = None):
+    """Called by a branch node at import time."""
+    _branches[node_name] = SpeculativeBranch(run, arun, estimate_cost_usd, redundant)
+
+
+def _count(**deltas):
+    with _stats_lock:
+        for name, value in deltas.items():
+            _stats[name] += value
+
+
+def get_speculation_stats() -> Dict[str, float]:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["saved_s"], stats["wasted_s"] = round(stats["saved_s"], 4), round(stats["wasted_s"], 4)
+    stats["wasted_cost_usd"] = round(stats["wasted_cost_usd"], 6)
+    return stats
+
+
+def _get_executor(max_workers: int) -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculation")
+        return _executor
+
+
+def _plan(settings: dict, query: str):
+    """(node name, branch, estimated cost) for the configured branches that fit in the budget, in order."""
+    budget, planned = settings["max_cost_usd"], []
+    for name in settings["branches"]:
+        branch = _branches.get(name)
+        if branch is None:
+            continue
+        cost = branch.estimate_cost_usd(query)
+        if cost > budget:
+            continue
+        budget -= cost
+        planned.append((name, branch, cost))
+    return planned
+
+
+def _register(tasks: Dict[str, _Task]) -> Optional[dict]:
+    if not tasks:
+        return None
+    speculation_id = f"spec-{next(_ids)}"
+    _inflight.set(speculation_id, tasks)
+    _count(launched=len(tasks))
+    return {"id": speculation_id, "launched": list(tasks), "kept": None, "discarded": [],
+            "saved_s": 0.0, "wasted_s": 0.0, "wasted_cost_usd": 0.0}
+
+
+def start(settings: Optional[dict], query: str) -> Optional[dict]:
+    """Launches the budgeted branch work on the speculation thread pool; returns the state record or None."""
+    settings = {**DEFAULT_SPECULATION_SETTINGS, **(settings or {})}
+    if not settings["enabled"]:
+        return None
+    executor = _get_executor(settings["max_workers"])
+    tasks = {}
+    for name, branch, cost in _plan(settings, query):
+        # copy_context: the work logs under the request's correlation id
+        task = _Task(name, executor.submit(contextvars.copy_context().run, branch.run, query), cost)
+        task.handle.add_done_callback(task._done)
+        tasks[name] = task
+    return _register(tasks)
+
+
+def astart(settings: Optional[dict], query: str) -> Optional[dict]:
+    """Async twin of start: the work runs as tasks on the running event loop."""
+    settings = {**DEFAULT_SPECULATION_SETTINGS, **(settings or {})}
+    if not settings["enabled"]:
+        return None
+    tasks = {}
+    for name, branch, cost in _plan(settings, query):
+        task = _Task(name, asyncio.ensure_future(branch.arun(query)), cost)
+        task.handle.add_done_callback(task._done)
+        tasks[name] = task
+    return _register(tasks)
+
+
+def settle(record: Optional[dict], result: dict, query: str = "") -> dict:
+    """
+    Keeps the work of the branch `result`'s intent routes to and cancels the rest; adds the record to result.
+    The routed branch's work is discarded too if its `redundant` check says the node won't use it.
+    """
+    if record is None:
+        return result
+    tasks = _inflight.get(record["id"]) or {}
+    keep = branch_for_intent(result.get("intent"))
+    branch = _branches.get(keep)
+    if branch is not None and branch.redundant is not None and branch.redundant(result, query):
+        keep = None
+    for name, task in list(tasks.items()):
+        if name == keep:
+            continue
+        never_started = task.cancel()
+        wasted_s = 0.0 if never_started else task.elapsed()
+        wasted_cost_usd = 0.0 if never_started else task.cost_usd
+        record["discarded"].append(name)
+        record["wasted_s"] = round(record["wasted_s"] + wasted_s, 4)
+        record["wasted_cost_usd"] = round(record["wasted_cost_usd"] + wasted_cost_usd, 6)
+        _count(discarded=1, wasted_s=wasted_s, wasted_cost_usd=wasted_cost_usd)
+        del tasks[name]
+    if keep in tasks:
+        record["kept"] = keep
+    else:
+        _inflight.pop(record["id"])
+    result["speculation"] = record
+    return result
+
+
+def _take(state: dict, node_name: str):
+    record = state.get("speculation")
+    if not record or record.get("kept") != node_name:
+        return None, None
+    tasks = _inflight.pop(record["id"]) or {}
+    return record, tasks.get(node_name)
+
+
+def _claimed(record: dict, task: _Task, wait_s: float, value) -> tuple:
+    # Saved: the part of the work that overlapped the intent call instead of running inside this node
+    saved_s = max(task.elapsed() - wait_s, 0.0) if value is not None else 0.0
+    record = {**record, "saved_s": round(record["saved_s"] + saved_s, 4)}
+    _count(kept=1, saved_s=saved_s)
+    return value, {"speculation": record}
+
+
+def claim(state: dict, node_name: str) -> tuple:
+    """(speculative result or None, partial state update) for a branch node; waits for unfinished work."""
+    record, task = _take(state, node_name)
+    if task is None:
+        return None, {}
+    start_wait = time.perf_counter()
+    try:
+        value = task.handle.result()
+    except Exception:
+        value = None # the node redoes the work and reports the error itself
+    return _claimed(record, task, time.perf_counter() - start_wait, value)
+
+
+async def aclaim(state: dict, node_name: str) -> tuple:
+    """Async twin of claim."""
+    record, task = _take(state, node_name)
+    if task is None:
+        return None, {}
+    start_wait = time.perf_counter()
+    try:
+        value = await task.handle
+    except Exception:
+        value = None
+    return _claimed(record, task, time.perf_counter() - start_wait, value)
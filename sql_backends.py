@@ -0,0 +1,357 @@
+# sql_backends.py
+"""
+Database backends for sql_processor, chosen by the `backend` block of its registry entry. A node version
+switches database by overriding that block.
+
+A backend hands out connections. `run(work)` calls `work(conn)` on the calling thread. `arun(work)` does
+the same on one of the backend's `pool_size` threads, so the event loop never waits on the database.
+Either way the statement runs under a cancellation token:
+- cancelling the task that awaits `arun` cancels it;
+- for synchronous callers, so does the token of `cancellation_scope` (chat_stream.py sets one and cancels
+  it when the /chat/stream client disconnects).
+A cancelled statement is stopped: SQLite connections are interrupted, and DB-API connections are cancelled
+when the driver supports it (psycopg's `cancel()`). The caller gets `QueryCancelled` either way.
+
+- `sqlite` (default): db_connections.py's pooled read-only connections, one per thread.
+- `dbapi`: any DB-API 2.0 driver module (`driver: psycopg`). It connects with `connect_args` and the DSN
+  in the `dsn_env` environment variable, and pools up to `pool_size` connections. Results are capped at
+  the guard's max_rows. The SQLite-only steps (plan check, FTS rewrite, result cache, workload
+  recording) don't apply.
+More backends can be added with `register_backend`.
+"""
+import abc
+import asyncio
+import contextvars
+import importlib
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, List, Optional, Tuple
+
+from db_connections import get_connection_manager
+from utils import logger
+
+DEFAULT_BACKEND_SETTINGS = {
+    "name": "sqlite", # or "dbapi", or a name given to register_backend
+    "pool_size": 8, # threads serving async callers; dbapi: also the most connections open at once
+    "acquire_timeout_seconds": 10.0, # dbapi: wait for a free connection
+    "health_check_interval_seconds": 30.0, # dbapi: an idle connection is pinged before reuse
+}
+_NAMED_PARAM = re.compile(r"(?<![:\w]):(\w+)") # templates bind :name parameters
+
+
+class SqlBackendError(Exception):
+    """The backend is misconfigured, or no connection became free in time."""
+
+
+class QueryCancelled(Exception):
+    """The request behind the statement went away and the statement was stopped."""
+
+
+class CancellationToken:
+    """Cancelled at most once, from any thread; callbacks registered while a statement runs are called then."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.cancelled = False
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e: # the connection may already be closed
+                logger.warning("SQL cancellation callback failed: %s", e)
+
+    @contextmanager
+    def on_cancel(self, callback: Callable[[], None]):
+        with self._lock:
+            cancelled = self.cancelled
+            if not cancelled:
+                self._callbacks.append(callback)
+        if cancelled:
+            callback()
+        try:
+            yield self
+        finally:
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+
+_current_token: contextvars.ContextVar = contextvars.ContextVar("sql_cancellation_token", default=None)
+
+
+@contextmanager
+def cancellation_scope(token: CancellationToken):
+    """Statements run in this context (and in tasks and threads copying it) stop when `token` is cancelled."""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def current_cancellation() -> Optional[CancellationToken]:
+    return _current_token.get()
+
+
+class SqlBackend(abc.ABC):
+    """Connections for sql_processor. Subclasses provide `_connection()` and `_cancel(conn)`."""
+    name = ""
+    dialect = "sqlite" # sql_processor runs its SQLite-only steps only for this dialect
+    errors: tuple = (sqlite3.Error,) # driver errors, reported as database errors
+
+    def __init__(self, settings: dict):
+        self.settings = settings
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _connection(self):
+        """A context manager yielding a connection for the calling thread."""
+
+    @abc.abstractmethod
+    def _cancel(self, conn):
+        """Stops the statement running on `conn`; called from another thread."""
+
+    def _threads(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.settings["pool_size"],
+                                                    thread_name_prefix=f"sql-{self.name}")
+            return self._executor
+
+    def run(self, work: Callable, token: Optional[CancellationToken] = None):
+        """work(conn) on a connection of this thread; raises QueryCancelled if the token is cancelled meanwhile."""
+        token = token or current_cancellation()
+        if token is not None and token.cancelled:
+            raise QueryCancelled("Query not run: the request was cancelled.")
+        with self._connection() as conn:
+            if token is None:
+                return work(conn)
+            with token.on_cancel(lambda: self._cancel(conn)):
+                try:
+                    result = work(conn)
+                except Exception as e:
+                    if token.cancelled:
+                        raise QueryCancelled("Query stopped: the request was cancelled.") from e
+                    raise
+            if token.cancelled: # a driver that can't cancel ran to the end; nobody wants the rows
+                raise QueryCancelled("Query stopped: the request was cancelled.")
+            return result
+
+    async def arun(self, work: Callable):
+        """`run` on one of the backend's threads; cancelling the awaiting task stops the statement."""
+        token, outer = CancellationToken(), current_cancellation()
+        context = contextvars.copy_context()
+        future = asyncio.get_running_loop().run_in_executor(self._threads(), context.run, self.run, work, token)
+        with (outer.on_cancel(token.cancel) if outer is not None else nullcontext()):
+            try:
+                return await future
+            except asyncio.CancelledError: # a queued statement is dropped, a running one interrupted
+                token.cancel()
+                raise
+
+    def close(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+class SQLiteBackend(SqlBackend):
+    """db_connections.py's read-only connections: the calling thread's, or one of the backend threads'."""
+    name = "sqlite"
+
+    def __init__(self, settings: dict, node_config: dict):
+        super().__init__(settings)
+        self.manager = get_connection_manager(node_config["db_path"], node_config.get("connection"))
+
+    def _connection(self):
+        return self.manager.connection()
+
+    def _cancel(self, conn: sqlite3.Connection):
+        conn.interrupt() # safe from any thread; the running statement fails with "interrupted"
+
+
+class DbApiBackend(SqlBackend):
+    """A bounded pool of DB-API 2.0 connections (psycopg, mysqlclient, ...), opened on demand."""
+    name = "dbapi"
+    dialect = "dbapi"
+
+    def __init__(self, settings: dict, node_config: dict):
+        super().__init__(settings)
+        if not settings.get("driver"):
+            raise SqlBackendError("The dbapi backend needs `driver`, the DB-API module to connect with.")
+        try:
+            self.driver = importlib.import_module(settings["driver"])
+        except ImportError as e:
+            raise SqlBackendError(f"Database driver '{settings['driver']}' is not installed: {e}") from e
+        self.errors = (self.driver.Error,)
+        self._idle: queue.LifoQueue = queue.LifoQueue() # (connection, last used); most recent first
+        self._slots = threading.BoundedSemaphore(settings["pool_size"])
+        self._stats_lock = threading.Lock()
+        self.stats = {"opened": 0, "reused": 0, "discarded": 0}
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _open(self):
+        args = []
+        if self.settings.get("dsn_env"):
+            dsn = os.environ.get(self.settings["dsn_env"])
+            if not dsn:
+                raise SqlBackendError(f"Environment variable {self.settings['dsn_env']} (the database DSN) is not set.")
+            args.append(dsn)
+        conn = self.driver.connect(*args, **(self.settings.get("connect_args") or {}))
+        self._count("opened")
+        return conn
+
+    def _discard(self, conn):
+        self._count("discarded")
+        try:
+            conn.close()
+        except self.driver.Error:
+            pass
+
+    def _alive(self, conn) -> bool:
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            conn.rollback()
+            return True
+        except self.driver.Error:
+            return False
+
+    def _checkout(self):
+        while True:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._open()
+            if time.monotonic() - last_used < self.settings["health_check_interval_seconds"] or self._alive(conn):
+                self._count("reused")
+                return conn
+            logger.warning("Pooled %s connection failed its health check; reopening", self.settings['driver'])
+            self._discard(conn)
+
+    @contextmanager
+    def _connection(self):
+        if not self._slots.acquire(timeout=self.settings["acquire_timeout_seconds"]):
+            raise SqlBackendError(f"No database connection became free within "
+                                  f"{self.settings['acquire_timeout_seconds']}s ({self.settings['pool_size']} in use).")
+        conn = None
+        try:
+            conn = self._checkout()
+            try:
+                yield conn
+            finally:
+                try:
+                    conn.rollback() # ends the read transaction the driver opened, or the failed one
+                except self.driver.Error:
+                    self._discard(conn)
+                    conn = None
+        finally:
+            if conn is not None:
+                self._idle.put((conn, time.monotonic()))
+            self._slots.release()
+
+    def _cancel(self, conn):
+        cancel = getattr(conn, "cancel", None) or getattr(conn, "interrupt", None)
+        if cancel is not None:
+            cancel()
+
+    def bind(self, sql: str, params: Optional[dict]) -> Tuple[str, object]:
+        """The statement and parameters in the driver's paramstyle; templates are written with :name."""
+        style = self.driver.paramstyle
+        if not params or style == "named":
+            return sql, params
+        if style == "pyformat":
+            return _NAMED_PARAM.sub(r"%(\1)s", sql.replace("%", "%%")), params
+        names = _NAMED_PARAM.findall(sql)
+        if style == "numeric":
+            counter = iter(range(1, len(names) + 1))
+            return _NAMED_PARAM.sub(lambda m: f":{next(counter)}", sql), [params[name] for name in names]
+        marker = "?" if style == "qmark" else "%s"
+        if style == "format":
+            sql = sql.replace("%", "%%")
+        return _NAMED_PARAM.sub(marker, sql), [params[name] for name in names]
+
+    def fetch(self, conn, sql: str, params: Optional[dict], max_rows: int, batch_size: int) -> Tuple[List[dict], bool]:
+        """(rows as dicts, truncated): reads at most max_rows, plus one row to tell whether there were more."""
+        sql, params = self.bind(sql, params)
+        cursor = conn.cursor()
+        try:
+            if params:
+                cursor.execute(sql, params)
+            else:
+                cursor.execute(sql)
+            columns = [column[0] for column in cursor.description or ()]
+            rows = []
+            while len(rows) < max_rows:
+                batch = cursor.fetchmany(min(batch_size, max_rows - len(rows)))
+                if not batch:
+                    break
+                rows.extend(dict(zip(columns, row)) for row in batch)
+            truncated = len(rows) >= max_rows and cursor.fetchone() is not None
+        finally:
+            cursor.close()
+        return rows, truncated
+
+    def close(self):
+        super().close()
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+
+_backend_types: Dict[str, Callable[[dict, dict], SqlBackend]] = {
+    SQLiteBackend.name: SQLiteBackend,
+    DbApiBackend.name: DbApiBackend,
+}
+_backends: Dict[tuple, SqlBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def register_backend(name: str, factory: Callable[[dict, dict], SqlBackend]):
+    """Makes `backend: {name: <name>}` available; factory(settings, sql_processor config) builds the backend."""
+    _backend_types[name] = factory
+
+
+def backend_for(node_config: dict) -> SqlBackend:
+    """One backend per (backend settings, database) pair from the registry."""
+    settings = {**DEFAULT_BACKEND_SETTINGS, **(node_config.get("backend") or {})}
+    key = (repr(sorted(settings.items())), node_config.get("db_path"),
+           repr(sorted((node_config.get("connection") or {}).items())))
+    with _backends_lock:
+        backend = _backends.get(key)
+        if backend is None:
+            factory = _backend_types.get(settings["name"])
+            if factory is None:
+                raise SqlBackendError(f"Unknown SQL backend '{settings['name']}' (known: {', '.join(_backend_types)}).")
+            backend = _backends[key] = factory(settings, node_config)
+        return backend
+
+
+def close_backends():
+    with _backends_lock:
+        for backend in _backends.values():
+            backend.close()
+        _backends.clear()
@@ -0,0 +1,191 @@
+# sql_guard.py
+"""
+Guarded execution for the SQL that sql_processor runs.
+
+- Plan check: `EXPLAIN QUERY PLAN` runs first. A full scan of a table with more than `large_table_rows`
+  rows is rejected (`on_full_scan: reject`), or the statement is wrapped in a LIMIT (`limit`, the
+  default). The LIMIT lets SQLite stop early and keep a top-N sorter for ORDER BY. Two large scans in
+  one statement are a nested-loop or cartesian join and are always rejected.
+- Time limit: a progress handler aborts the statement once `time_limit_ms` of wall-clock time is spent.
+- Row cap: rows are streamed with fetchmany and reading stops at `max_rows`. `truncated` tells the
+  caller that more rows existed.
+Configured by the `guard` block of the sql_processor registry entry.
+"""
+import re
+import sqlite3
+import time
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from caching import TTLCache
+
+DEFAULT_GUARD_SETTINGS = {
+    "enabled": True,
+    "max_rows": 200,
+    "fetch_batch_size": 50,
+    "time_limit_ms": 2000,
+    "large_table_rows": 10000,
+    "on_full_scan": "limit", # "limit", "reject" or "allow"
+}
+_PROGRESS_INTERVAL = 1000 # SQLite VM instructions between deadline checks
+_TABLE_SIZE_TTL_SECONDS = 300
+
+_SCAN = re.compile(r"^SCAN (\w+)\b(?! VIRTUAL TABLE)") # a virtual table (FTS index) scan is its own index lookup
+_TOKEN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|\[[^\]]*\]|\w+|\S")
+_COMMENT = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|\[[^\]]*\]|--[^\n]*|/\*.*?(?:\*/|$)", re.DOTALL)
+_NOT_AN_ALIAS = {"from", "as", "where", "join", "on", "inner", "left", "right", "cross", "natural", "group", "order",
+                 "limit", "union", "using", "having", "window", "outer", "full", "except", "intersect"}
+_END_OF_FROM = {"where", "group", "order", "limit", "having", "window", "union", "except", "intersect", "select",
+                "values"} # a comma after these no longer separates tables
+
+_table_sizes = TTLCache(max_entries=4096, ttl_seconds=_TABLE_SIZE_TTL_SECONDS)
+
+
+class SqlGuardError(Exception):
+    """The statement was refused by the plan check or stopped by the time limit."""
+
+
+class GuardedResult(NamedTuple):
+    rows: List[dict]
+    truncated: bool
+    rewritten: bool # wrapped in a LIMIT by the plan check
+    full_scans: List[str] # large tables the plan scans
+
+
+def _identifier(token: str) -> Optional[str]:
+    """The lowercased name a token spells, unquoted; None for keywords, literals and punctuation."""
+    if token[0] in "\"`[":
+        return token[1:-1].replace('""', '"').lower()
+    if (token[0].isalpha() or token[0] == "_") and token.lower() not in _NOT_AN_ALIAS:
+        return token.lower()
+    return None
+
+
+def _read_from_clauses(sql: str) -> Tuple[Dict[str, str], bool]:
+    """
+    (alias or table name -> table name, whether every FROM item was read). Follows FROM and JOIN, commas
+    inside a FROM clause, and subqueries at any depth; a FROM item that isn't a plain table name (a
+    table-valued function, say) makes the result incomplete.
+    """
+    tokens = [token for token in _TOKEN.findall(sql) if token[0] != "'"]
+    aliases, complete = {}, True
+    in_from = [False] # per parenthesis depth
+    i = 0
+    while i < len(tokens):
+        token, word = tokens[i], tokens[i].lower()
+        i += 1
+        if token == "(":
+            in_from.append(False)
+        elif token == ")":
+            if len(in_from) > 1:
+                in_from.pop()
+        elif word in _END_OF_FROM:
+            in_from[-1] = False
+        elif word in ("from", "join") or (token == "," and in_from[-1]):
+            in_from[-1] = True
+            if i < len(tokens) and tokens[i] == "(": # a subquery, read at its own depth
+                continue
+            table = _identifier(tokens[i]) if i < len(tokens) else None
+            while table is not None and i + 2 < len(tokens) and tokens[i + 1] == ".": # schema.table
+                i += 2
+                table = _identifier(tokens[i])
+            if table is None or (i + 1 < len(tokens) and tokens[i + 1] == "("):
+                complete = False
+                continue
+            aliases[table] = table
+            i += 1
+            if i < len(tokens) and tokens[i].lower() == "as":
+                i += 1
+            alias = _identifier(tokens[i]) if i < len(tokens) else None
+            if alias is not None:
+                aliases[alias] = table
+                i += 1
+    return aliases, complete
+
+
+def table_aliases(sql: str) -> Dict[str, str]:
+    """Alias (or table name) -> table name, lowercased, for the tables a statement reads."""
+    return _read_from_clauses(sql)[0]
+
+
+def read_tables(sql: str) -> Optional[Set[str]]:
+    """The tables (lowercased) a statement reads, or None when some FROM item couldn't be read."""
+    aliases, complete = _read_from_clauses(sql)
+    return set(aliases.values()) if complete else None
+
+
+def _table_rows(conn: sqlite3.Connection, db_key: str, table: str) -> int:
+    """Cheap size estimate: MAX(rowid) is an index lookup, COUNT(*) would be the full scan we are avoiding."""
+    size = _table_sizes.get((db_key, table))
+    if size is None:
+        try:
+            size = conn.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()[0] or 0
+        except sqlite3.Error: # WITHOUT ROWID table or not a table at all
+            size = 0
+        _table_sizes.set((db_key, table), size)
+    return size
+
+
+def full_scans(conn: sqlite3.Connection, sql: str, params=None) -> List[str]:
+    """Tables (lowercased) that the statement's plan reads with a full scan."""
+    aliases = table_aliases(sql)
+    scans = []
+    for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or ()):
+        match = _SCAN.match(row[3])
+        table = aliases.get(match.group(1).lower()) if match else None
+        if table:
+            scans.append(table)
+    return scans
+
+
+def large_table_scans(conn: sqlite3.Connection, sql: str, params, large_table_rows: int, db_key: str = "") -> List[str]:
+    """Tables with more than `large_table_rows` rows that the statement's plan reads with a full scan."""
+    return [table for table in full_scans(conn, sql, params) if _table_rows(conn, db_key, table) > large_table_rows]
+
+
+def _without_comments(sql: str) -> str:
+    """The statement with its comments removed (string literals and quoted names are kept as they are)."""
+    return _COMMENT.sub(lambda m: m.group(0) if m.group(0)[0] in "'\"`[" else " ", sql)
+
+
+def _with_limit(sql: str, limit: int) -> str:
+    # A trailing "; -- note" would otherwise end up inside the parentheses
+    body = re.sub(r"[\s;]+$", "", _without_comments(sql)).strip()
+    return f"SELECT * FROM ({body}) LIMIT {limit}"
+
+
+def execute_guarded(conn: sqlite3.Connection, sql: str, params=None, settings: Optional[dict] = None,
+                    inspect_plan: bool = True, db_key: str = "") -> GuardedResult:
+    """Runs one statement under the plan check, time limit and row cap; raises SqlGuardError when refused."""
+    settings = {**DEFAULT_GUARD_SETTINGS, **(settings or {})}
+    max_rows = settings["max_rows"]
+    full_scans, rewritten = [], False
+    if inspect_plan and settings["on_full_scan"] != "allow":
+        full_scans = large_table_scans(conn, sql, params, settings["large_table_rows"], db_key)
+        if len(full_scans) > 1:
+            raise SqlGuardError(f"Query rejected: it joins large tables without an index ({', '.join(full_scans)}).")
+        if full_scans and settings["on_full_scan"] == "reject":
+            raise SqlGuardError(f"Query rejected: it scans the whole {full_scans[0]} table.")
+        if full_scans:
+            sql, rewritten = _with_limit(sql, max_rows + 1), True
+
+    deadline = time.perf_counter() + settings["time_limit_ms"] / 1000.0
+    conn.set_progress_handler(lambda: 1 if time.perf_counter() > deadline else 0, _PROGRESS_INTERVAL)
+    try:
+        cursor = conn.execute(sql, params or ())
+        rows, truncated = [], False
+        try:
+            while len(rows) < max_rows:
+                batch = cursor.fetchmany(min(settings["fetch_batch_size"], max_rows - len(rows)))
+                if not batch:
+                    break
+                rows.extend(dict(row) for row in batch)
+            truncated = len(rows) >= max_rows and cursor.fetchone() is not None
+        finally:
+            cursor.close()
+    except sqlite3.OperationalError as e:
+        if "interrupted" in str(e):
+            raise SqlGuardError(f"Query stopped: it ran longer than {settings['time_limit_ms']}ms.") from e
+        raise
+    finally:
+        conn.set_progress_handler(None, 0) # the connection is pooled
+    return GuardedResult(rows, truncated, rewritten, full_scans)
@@ -0,0 +1,215 @@
+# sql_result_cache.py
+"""
+Result cache for sql_processor, keyed on the normalized SQL text plus its bound parameters.
+
+Entries never outlive a write to the tables they read:
+- With change tracking installed (`python sql_result_cache.py --install-triggers <db>`), triggers bump a
+  per-table counter in `_table_versions` on every INSERT/UPDATE/DELETE. An entry remembers the counters
+  of its tables and is stale once any of them moves, so a write to Returns keeps cached Orders rows.
+- Without it, any change to the database file invalidates every entry.
+An external-content FTS index (product_search.py) shares the counter of its content table.
+Either way, a connection re-reads the counters only when its `PRAGMA data_version` says another connection
+committed, so an unchanged database costs one pragma per lookup. Entries also expire after `ttl_seconds`,
+or earlier if a table they read has a `table_ttl_seconds` override, and results over `max_rows` are not kept.
+Configured by the `result_cache` block of the sql_processor registry entry.
+"""
+import argparse
+import re
+import sqlite3
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from caching import TTLCache
+from sql_guard import read_tables
+
+VERSIONS_TABLE = "_table_versions"
+DEFAULT_RESULT_CACHE_SETTINGS = {
+    "enabled": False,
+    "max_entries": 1024,
+    "max_rows": 500, # larger results are not cached
+    "ttl_seconds": 300,
+    "table_ttl_seconds": {}, # e.g. {"Orders": 30}
+}
+
+_STRING_LITERAL = re.compile(r"('(?:[^']|'')*')")
+_CONTENT_TABLE = re.compile(r"\bcontent\s*=\s*['\"]?(\w+)", re.IGNORECASE)
+
+
+def normalize_sql(sql: str) -> str:
+    """Whitespace collapsed, trailing semicolons dropped and everything outside string literals lowercased."""
+    parts = _STRING_LITERAL.split(sql.strip().rstrip(";").strip())
+    return "".join(part if i % 2 else re.sub(r"\s+", " ", part.lower()) for i, part in enumerate(parts)).strip()
+
+
+class _Pending(NamedTuple):
+    """A miss, with what the database looked like before the query ran; handed back to `store`."""
+    key: tuple
+    tables: Tuple[str, ...]
+    versions: object # {table: counter} with change tracking, else the cache generation
+
+
+class _Snapshot:
+    def __init__(self, conn, data_version, versions):
+        self.conn = conn
+        self.data_version = data_version
+        self.versions = versions # {table: counter}, or None without change tracking
+
+
+def _virtual_tables(conn: sqlite3.Connection) -> Dict[str, str]:
+    """Virtual table name -> its CREATE statement."""
+    return {row[0]: row[1] for row in conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND sql LIKE 'CREATE VIRTUAL TABLE%'")}
+
+
+def _index_versions(conn: sqlite3.Connection, versions: Dict[str, int]) -> Dict[str, int]:
+    """External-content FTS tables change exactly when their content table does (product_search.py)."""
+    indexes = {}
+    for name, create_sql in _virtual_tables(conn).items():
+        content = _CONTENT_TABLE.search(create_sql)
+        if content and content.group(1).lower() in versions:
+            indexes[name.lower()] = versions[content.group(1).lower()]
+    return indexes
+
+
+class SqlResultCache:
+    def __init__(self, settings: Optional[dict] = None):
+        self.settings = {**DEFAULT_RESULT_CACHE_SETTINGS, **(settings or {})}
+        self.table_ttls = {table.lower(): ttl for table, ttl in (self.settings["table_ttl_seconds"] or {}).items()}
+        self.entries = TTLCache(self.settings["max_entries"], self.settings["ttl_seconds"])
+        self.generation = 0 # bumped on any change when there is no change tracking
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "stale": 0, "too_large": 0, "untracked": 0,
+                      "invalidations": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _snapshot(self, conn: sqlite3.Connection) -> _Snapshot:
+        """This connection's view of the table counters, refreshed only when another connection has committed."""
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        snapshot = getattr(self._local, "snapshot", None)
+        if snapshot is not None and snapshot.conn is conn and snapshot.data_version == data_version:
+            return snapshot
+        try:
+            versions = {row[0].lower(): row[1] for row in conn.execute(f"SELECT name, version FROM {VERSIONS_TABLE}")}
+            versions.update(_index_versions(conn, versions))
+        except sqlite3.OperationalError: # no change tracking installed
+            # Something changed since this connection last looked (or it is new and can't tell): drop everything
+            versions = None
+            with self._lock:
+                self.generation += 1
+                self.stats["invalidations"] += 1
+        snapshot = self._local.snapshot = _Snapshot(conn, data_version, versions)
+        return snapshot
+
+    def lookup(self, conn: sqlite3.Connection, sql: str, params=None):
+        """
+        (cached rows, None) on a hit, else (None, pending) to pass to `store` with the fresh rows.
+        pending is None when the result can't be cached.
+        """
+        snapshot = self._snapshot(conn)
+        key = (normalize_sql(sql), tuple(sorted(params.items())) if isinstance(params, dict) else tuple(params or ()))
+        tables = read_tables(sql)
+        if tables is None: # a FROM item that isn't a table name: can't tell what the statement reads
+            self._count("untracked")
+            return None, None
+        tables = tuple(sorted(tables))
+        if snapshot.versions is None:
+            versions = self.generation
+        elif all(table in snapshot.versions for table in tables):
+            versions = {table: snapshot.versions[table] for table in tables}
+        else: # reads a table created after the triggers were installed (or a CTE name): can't tell when it changes
+            self._count("untracked")
+            return None, None
+        entry = self.entries.get(key)
+        if entry is not None:
+            entry_versions, rows = entry
+            if entry_versions == versions:
+                self._count("hits")
+                return [dict(row) for row in rows], None
+            self._count("stale")
+        self._count("misses")
+        return None, _Pending(key, tables, versions)
+
+    def store(self, pending: Optional[_Pending], rows: List[dict]) -> bool:
+        if pending is None:
+            return False
+        if len(rows) > self.settings["max_rows"]:
+            self._count("too_large")
+            return False
+        ttls = [self.table_ttls[table] for table in pending.tables if table in self.table_ttls]
+        if ttls and min(ttls) <= 0: # a table that must always be read fresh
+            return False
+        # TTLCache treats ttl_seconds=None as "use the cache default"
+        self.entries.set(pending.key, (pending.versions, [dict(row) for row in rows]), min(ttls) if ttls else None)
+        self._count("stored")
+        return True
+
+    def clear(self):
+        self.entries.clear()
+
+
+_caches: Dict[tuple, SqlResultCache] = {}
+_caches_lock = threading.Lock()
+
+
+def result_cache_for(db_path: str, settings: Optional[dict]) -> Optional[SqlResultCache]:
+    """The shared cache for a database and registry settings, or None if caching is disabled."""
+    if not (settings or {}).get("enabled"):
+        return None
+    key = (db_path, repr(sorted(settings.items())))
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = SqlResultCache(settings)
+        return cache
+
+
+def clear_result_caches():
+    with _caches_lock:
+        for cache in _caches.values():
+            cache.clear()
+
+
+def get_result_cache_stats() -> Dict[str, float]:
+    totals = {"hits": 0, "misses": 0, "stored": 0, "stale": 0, "too_large": 0, "untracked": 0, "invalidations": 0,
+              "entries": 0}
+    for cache in list(_caches.values()):
+        for name, value in cache.stats.items():
+            totals[name] += value
+        totals["entries"] += len(cache.entries)
+    lookups = totals["hits"] + totals["misses"]
+    totals["hit_rate"] = round(totals["hits"] / lookups, 4) if lookups else 0.0
+    return totals
+
+
+def install_change_tracking(db_path: str) -> List[str]:
+    """Creates the per-table change counters and their triggers (idempotent); returns the tracked tables."""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+            # Virtual tables (and their shadow tables) take no triggers; an FTS index follows its content table
+            virtual = tuple(_virtual_tables(conn))
+            shadow_prefixes = tuple(f"{name}_" for name in virtual)
+            tables = [row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND name != ?",
+                (VERSIONS_TABLE,)) if row[0] not in virtual and not row[0].startswith(shadow_prefixes)]
+            for table in tables:
+                conn.execute(f"INSERT OR IGNORE INTO {VERSIONS_TABLE} (name, version) VALUES (?, 0)", (table,))
+                for event in ("INSERT", "UPDATE", "DELETE"):
+                    conn.execute(f"CREATE TRIGGER IF NOT EXISTS {VERSIONS_TABLE}_{table}_{event.lower()} "
+                                 f"AFTER {event} ON {table} BEGIN "
+                                 f"UPDATE {VERSIONS_TABLE} SET version = version + 1 WHERE name = '{table}'; END")
+        return tables
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-table change counters for the SQL result cache")
+    parser.add_argument("--install-triggers", metavar="DB_PATH", required=True)
+    tracked = install_change_tracking(parser.parse_args().install_triggers)
+    print(f"Change tracking installed for: {', '.join(tracked)}")
@@ -0,0 +1,227 @@
+# sql_templates.py
+"""
+Parameterized SQL statements that answer common questions without an LLM call in sql_processor.
+
+Templates are looked up by (intent, entity set), using the `entities` from parse_intent_node, and
+executed as prepared statements with the entity values bound as parameters.
+- Vetted templates (VETTED_SQL_TEMPLATES) are written and reviewed by hand. When several share an
+  (intent, entity set), a `query_pattern` tells them apart.
+- Learned templates come from LLM-generated SQL that executed successfully. The entity values in the
+  SQL are replaced by parameters. When the same query template (intent_templates.to_template) yields the
+  same SQL shape `min_occurrences` times, with at least two different parameter sets, the shape is
+  promoted. Keys include the sql_processor version, so a prompt upgrade starts learning from scratch.
+"""
+import re
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from caching import TTLCache
+from intent_templates import to_template
+
+DEFAULT_MIN_OCCURRENCES = 3
+DEFAULT_MAX_LEARNED = 256
+_MAX_OBSERVED_SHAPES = 4096
+
+# Entities that must be plain integers before they are bound
+_ID_ENTITIES = ("order_id", "customer_id")
+_PARAM = re.compile(r":(\w+)")
+_IN_LIST = re.compile(r"(\bIN\s*\()([^()]*)\)", re.IGNORECASE)
+
+
+class SqlTemplate(NamedTuple):
+    name: str
+    intent: str
+    entities: frozenset
+    sql: str # named parameters, e.g. ":order_id"
+    source: str = "vetted" # or "learned"
+    query_pattern: Optional[re.Pattern] = None
+    fts_sql: Optional[str] = None # ranked lookup through the product name index, used when the database has one
+
+
+def _vetted(name: str, intent: str, entities: Tuple[str, ...], sql: str, query_pattern: str = None,
+            fts_sql: str = None) -> SqlTemplate:
+    pattern = re.compile(query_pattern, re.IGNORECASE) if query_pattern else None
+    return SqlTemplate(name, intent, frozenset(entities), sql, "vetted", pattern, fts_sql)
+
+
+VETTED_SQL_TEMPLATES = [
+    _vetted("order_status", "ORDER_STATUS", ("order_id",), "SELECT status FROM Orders WHERE id = :order_id;"),
+    _vetted("product_stock", "PRODUCT_AVAILABILITY", ("product_name",),
+            "SELECT name, inventory_count FROM Products WHERE name LIKE '%' || :product_name || '%';",
+            fts_sql="SELECT p.name, p.inventory_count FROM Products_fts JOIN Products p ON p.id = Products_fts.rowid "
+                    "WHERE Products_fts MATCH '\"' || replace(:product_name, '\"', '\"\"') || '\"' ORDER BY rank;"),
+    _vetted("customer_email_by_order", "SQL_QUERY_GENERAL", ("order_id",),
+            "SELECT email FROM Customers WHERE id = (SELECT customer_id FROM Orders WHERE id = :order_id);",
+            query_pattern=r"\bemail\b"),
+    _vetted("customer_by_order", "SQL_QUERY_GENERAL", ("order_id",),
+            "SELECT Customers.id, Customers.name, Customers.email FROM Customers "
+            "JOIN Orders ON Orders.customer_id = Customers.id WHERE Orders.id = :order_id;",
+            query_pattern=r"\b(who|customer)\b.*\b(placed|ordered|made)\b"),
+]
+
+
+class SqlMatch(NamedTuple):
+    template: SqlTemplate
+    params: Dict[str, object]
+
+    @property
+    def rendered_sql(self) -> str:
+        """The statement with its parameters inlined, for sql_query_generated and logs (not for execution)."""
+        def literal(value) -> str:
+            return str(value) if isinstance(value, int) else "'" + str(value).replace("'", "''") + "'"
+
+        sql = re.sub(r"'%' \|\| :(\w+) \|\| '%'",
+                     lambda m: literal(f"%{self.params[m.group(1)]}%"), self.template.sql)
+        return _PARAM.sub(lambda m: literal(self.params[m.group(1)]), sql)
+
+
+def _bind(entities: Optional[dict]) -> Optional[Dict[str, object]]:
+    """Parameter values from the parsed entities, or None if an id is not a plain number."""
+    params = {}
+    for name, value in (entities or {}).items():
+        if value is None or str(value).strip() == "":
+            continue
+        value = str(value).strip()
+        if name in _ID_ENTITIES:
+            if not value.isdigit():
+                return None
+            params[name] = int(value)
+        else:
+            params[name] = value
+    return params
+
+
+def _parameterize_number(sql: str, text: str, name: str) -> Tuple[str, int]:
+    """Integer literals replaced only where they are compared: `= 1`, `IN (1, 2)`, `BETWEEN 1 AND 2`."""
+    number = rf"(?<![\w.']){text}(?![\w.'])"
+    found = 0
+    for context in (r"=\s*|\bBETWEEN\s+", r"\bBETWEEN\s+[\w.:']+\s+AND\s+"):
+        sql, count = re.subn(rf"({context}){number}", rf"\g<1>:{name}", sql, flags=re.IGNORECASE)
+        found += count
+
+    def in_list(match) -> str:
+        nonlocal found
+        items = [item.strip() for item in match.group(2).split(",")]
+        if text not in items:
+            return match.group(0)
+        found += items.count(text)
+        return match.group(1) + ", ".join(f":{name}" if item == text else item for item in items) + ")"
+
+    return _IN_LIST.sub(in_list, sql), found
+
+
+def parameterize(sql: str, params: Dict[str, object]) -> Optional[str]:
+    """The SQL with each entity value's literal replaced by its named parameter; None if a value is missing."""
+    shaped = sql
+    for name, value in params.items():
+        text = re.escape(str(value))
+        found = False
+        for pattern, replacement in ((rf"'%{text}%'", f"'%' || :{name} || '%'"), (rf"'{text}'", f":{name}")):
+            shaped, count = re.subn(pattern, replacement, shaped, flags=re.IGNORECASE)
+            found = found or count > 0
+        if isinstance(value, int):
+            shaped, count = _parameterize_number(shaped, str(value), name)
+            found = found or count > 0
+        if not found:
+            return None
+    return " ".join(shaped.split())
+
+
+class SqlTemplateLibrary:
+    def __init__(self, vetted: Optional[List[SqlTemplate]] = None, min_occurrences: int = DEFAULT_MIN_OCCURRENCES,
+                 max_learned: int = DEFAULT_MAX_LEARNED):
+        self.vetted = VETTED_SQL_TEMPLATES if vetted is None else vetted
+        self.min_occurrences = min_occurrences
+        self.learned = TTLCache(max_learned) # (version, intent, entity set, query template) -> SqlTemplate
+        # same key -> {sql shape: recent parameter tuples}; several shapes for one key are never promoted
+        self.observed = TTLCache(_MAX_OBSERVED_SHAPES)
+        self.stats = {"vetted_hits": 0, "learned_hits": 0, "misses": 0, "observed": 0, "learned": 0,
+                      "unparameterizable": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def find(self, version: str, intent: Optional[str], entities: Optional[dict], query: str,
+             learned: bool = True) -> Optional[SqlMatch]:
+        """Like match, without touching the hit/miss stats."""
+        params = _bind(entities)
+        if not intent or not params: # never answer an open question with a fixed statement
+            return None
+        entity_set = frozenset(params)
+        for template in self.vetted:
+            if template.intent == intent and template.entities == entity_set and \
+                    (template.query_pattern is None or template.query_pattern.search(query)):
+                return SqlMatch(template, params)
+        template = self.learned.get((version, intent, entity_set, to_template(query)[0])) if learned else None
+        return SqlMatch(template, params) if template is not None else None
+
+    def match(self, version: str, intent: Optional[str], entities: Optional[dict], query: str,
+              learned: bool = True) -> Optional[SqlMatch]:
+        found = self.find(version, intent, entities, query, learned)
+        self._count("misses" if found is None else f"{found.template.source}_hits")
+        return found
+
+    def observe(self, version: str, intent: Optional[str], entities: Optional[dict], query: str,
+                sql: str) -> Optional[SqlTemplate]:
+        """Records successful LLM-generated SQL; returns the template if this observation promoted it."""
+        params = _bind(entities)
+        if not intent or not params:
+            return None
+        shape = parameterize(sql, params)
+        if shape is None:
+            self._count("unparameterizable")
+            return None
+        self._count("observed")
+        key = (version, intent, frozenset(params), to_template(query)[0])
+        with self._lock:
+            shapes = self.observed.get(key) or {}
+            seen = shapes.setdefault(shape, [])
+            seen.append(tuple(sorted(params.items())))
+            del seen[:-self.min_occurrences]
+            self.observed.set(key, shapes)
+            promote = len(shapes) == 1 and len(seen) >= self.min_occurrences and len(set(seen)) >= 2
+            if len(shapes) > 1:
+                self.learned.pop(key) # the LLM writes different SQL for this question shape: not a template
+        if not promote or self.learned.get(key) is not None:
+            return None
+        template = SqlTemplate(f"learned:{key[3]}", intent, key[2], shape, "learned")
+        self.learned.set(key, template)
+        self._count("learned")
+        return template
+
+    def clear(self):
+        self.learned.clear()
+        self.observed.clear()
+
+
+_libraries: Dict[tuple, SqlTemplateLibrary] = {}
+_libraries_lock = threading.Lock()
+
+
+def library_for(templates_config: dict) -> SqlTemplateLibrary:
+    """One library per (min_occurrences, max_learned) setting, shared by the sync and async node."""
+    key = (templates_config.get("min_occurrences", DEFAULT_MIN_OCCURRENCES),
+           templates_config.get("max_learned", DEFAULT_MAX_LEARNED))
+    with _libraries_lock:
+        library = _libraries.get(key)
+        if library is None:
+            library = _libraries[key] = SqlTemplateLibrary(None, *key)
+        return library
+
+
+def clear_sql_templates():
+    with _libraries_lock:
+        for library in _libraries.values():
+            library.clear()
+
+
+def get_sql_template_stats() -> Dict[str, int]:
+    totals = {"vetted_hits": 0, "learned_hits": 0, "misses": 0, "observed": 0, "learned": 0,
+              "unparameterizable": 0, "learned_templates": 0}
+    for library in list(_libraries.values()):
+        for name, value in library.stats.items():
+            totals[name] += value
+        totals["learned_templates"] += len(library.learned)
+    return totals
@@ -0,0 +1,171 @@
+# sql_workload.py
+"""
+Recorder for the SQL workload that sql_processor executes, as input for index_advisor.py.
+
+Every executed statement is recorded with its bound parameters, execution time, row count and
+`EXPLAIN QUERY PLAN` details. Results served from the SQL result cache are not recorded, because they
+don't run. Each statement shape is explained only once. The last `max_statements` statements are kept in
+memory. With a `path` (relative paths are under WORKLOAD_ROOT) they are also written as JSON lines, in
+batches by a background thread, so the request path never waits on the disk. Once the file holds
+`max_statements` lines it is rotated to `<path>.1` (replacing the previous one), so the two files keep at
+most twice that. Off by default; configured by the `workload` block of the sql_processor registry entry.
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from caching import TTLCache
+from sql_result_cache import normalize_sql
+
+WORKLOAD_ROOT = "."
+DEFAULT_WORKLOAD_SETTINGS = {
+    "enabled": False,
+    "path": None, # JSON lines file, e.g. "sql_workload.jsonl"; None keeps the workload in memory only
+    "max_statements": 10000,
+}
+_MAX_PLANS = 1024
+
+
+class WorkloadRecorder:
+    def __init__(self, path: Optional[str] = None, max_statements: int = DEFAULT_WORKLOAD_SETTINGS["max_statements"]):
+        self.path = os.path.join(WORKLOAD_ROOT, path) if path else None
+        self.statements = deque(maxlen=max_statements)
+        self.plans = TTLCache(_MAX_PLANS) # normalized SQL -> plan details
+        self.max_statements = max_statements
+        self.stats = {"recorded": 0, "explained": 0, "written": 0, "rotations": 0}
+        self._lock = threading.Lock()
+        self._pending: List[dict] = [] # recorded, not yet written to `path`
+        self._write_lock = threading.Lock()
+        self._lines = None # lines in the current file, counted on the first write
+        self._wake = threading.Event()
+        self._writer = None
+
+    def _plan(self, conn: sqlite3.Connection, sql: str, params) -> List[str]:
+        key = normalize_sql(sql)
+        plan = self.plans.get(key)
+        if plan is None:
+            try:
+                plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or ())]
+            except sqlite3.Error:
+                plan = []
+            self.plans.set(key, plan)
+            with self._lock:
+                self.stats["explained"] += 1
+        return plan
+
+    def record(self, conn: sqlite3.Connection, sql: str, params, elapsed_ms: float, rows: int) -> dict:
+        """Records one executed statement; `conn` is the connection it ran on (used for the plan)."""
+        entry = {
+            "sql": sql,
+            "params": dict(params) if isinstance(params, dict) else list(params or ()),
+            "elapsed_ms": round(elapsed_ms, 3),
+            "rows": rows,
+            "plan": self._plan(conn, sql, params),
+            "recorded_at": round(time.time(), 3),
+        }
+        with self._lock:
+            self.statements.append(entry)
+            self.stats["recorded"] += 1
+            if self.path:
+                self._pending.append(entry)
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_forever, name="sql-workload-writer",
+                                                    daemon=True)
+                    self._writer.start()
+        if self.path:
+            self._wake.set()
+        return entry
+
+    def _write_forever(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Writes the statements recorded so far to `path`, rotating it once it holds max_statements lines."""
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            if self._lines is None:
+                self._lines = _count_lines(self.path)
+            while pending:
+                room = max(self.max_statements - self._lines, 0)
+                if room == 0:
+                    os.replace(self.path, f"{self.path}.1")
+                    self._lines = 0
+                    self.stats["rotations"] += 1
+                    continue
+                batch, pending = pending[:room], pending[room:]
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(entry, default=str) + "\n" for entry in batch))
+                self._lines += len(batch)
+                self.stats["written"] += len(batch)
+
+    def clear(self):
+        with self._lock:
+            self.statements.clear()
+        self.plans.clear()
+
+
+def _count_lines(path: str) -> int:
+    if not os.path.exists(path):
+        return 0
+    with open(path, encoding="utf-8") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def load_workload(path: str) -> List[dict]:
+    """Statements recorded to a workload file and its rotated predecessor (`<path>.1`), oldest first."""
+    statements = []
+    for name in (f"{path}.1", path):
+        if name == path or os.path.exists(name):
+            with open(name, encoding="utf-8") as f:
+                statements.extend(json.loads(line) for line in f if line.strip())
+    return statements
+
+
+_recorders: Dict[tuple, WorkloadRecorder] = {}
+_recorders_lock = threading.Lock()
+
+
+def recorder_for(settings: Optional[dict]) -> Optional[WorkloadRecorder]:
+    """The shared recorder for the registry settings, or None if recording is disabled."""
+    settings = {**DEFAULT_WORKLOAD_SETTINGS, **(settings or {})}
+    if not settings["enabled"]:
+        return None
+    key = (WORKLOAD_ROOT, settings["path"], settings["max_statements"])
+    with _recorders_lock:
+        recorder = _recorders.get(key)
+        if recorder is None:
+            recorder = _recorders[key] = WorkloadRecorder(settings["path"], settings["max_statements"])
+        return recorder
+
+
+def flush_recorders():
+    """Writes every recorder's pending statements to its file."""
+    for recorder in list(_recorders.values()):
+        if recorder.path:
+            recorder.flush()
+
+
+def clear_recorders():
+    flush_recorders()
+    with _recorders_lock:
+        _recorders.clear()
+
+
+def recorded_workload() -> List[dict]:
+    """Every statement the in-process recorders still hold."""
+    return [entry for recorder in list(_recorders.values()) for entry in list(recorder.statements)]
+
+
+atexit.register(flush_recorders)
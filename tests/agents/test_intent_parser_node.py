@@ -0,0 +1,154 @@
+import json
+
+import pytest
+
+import intent_rules
+from agents.intent_parser_node import parse_intent_node
+from intent_knn import KnnIntentClassifier
+from intent_rules import RuleBasedIntentClassifier
+from run_evaluation import intent_classifier_report_lines, intent_fast_path_report_lines
+
+
+@pytest.fixture
+def intent_config(mocker):
+    config = {"version": "v-test", "prompt_path": "prompts/intent/v1_0_parser.txt", "llm_model": "gpt-test",
+              "fast_path": {"enabled": True, "min_confidence": 0.85}}
+    mocker.patch("agents.intent_parser_node.get_node_config", return_value=config)
+    return config
+
+
+@pytest.fixture
+def intent_llm(mocker):
+    return mocker.patch("agents.intent_parser_node.get_llm_response",
+                        return_value=json.dumps({"intent": "RETURN_INFO", "entities": {}}))
+
+
+def test_rules_score_obvious_and_ambiguous_queries():
+    classifier = RuleBasedIntentClassifier()
+
+    order = classifier.classify("Where is my order #1002?")
+    assert (order.intent, order.entities, order.confidence) == ("ORDER_STATUS", {"order_id": "1002"}, 0.95)
+    assert classifier.classify("Hi there!").intent == "OUT_OF_CONTEXT"
+    assert classifier.classify("Where is my order?") is None # no order id: the LLM has to ask / decide
+    ambiguous = classifier.classify("Where is order 555? It arrived damaged")
+    assert ambiguous.intent == "ORDER_STATUS" and ambiguous.confidence < 0.85
+
+
+def test_confident_match_skips_the_llm(mock_initial_state, intent_config, intent_llm):
+    mock_initial_state["original_query"] = "Where is my order #1002?"
+
+    result = parse_intent_node(mock_initial_state)
+
+    intent_llm.assert_not_called()
+    assert (result["intent"], result["entities"], result["intent_source"]) == ("ORDER_STATUS", {"order_id": "1002"}, "rules")
+    assert "intent_parser" in result["node_latencies"]
+
+
+def test_low_confidence_falls_back_to_the_llm(mock_initial_state, intent_config, intent_llm):
+    mock_initial_state["original_query"] = "Can I get a refund?"
+
+    result = parse_intent_node(mock_initial_state)
+
+    intent_llm.assert_called_once()
+    assert (result["intent"], result["intent_source"]) == ("RETURN_INFO", "llm")
+    assert result["intent_fast_path"]["rule"] == "return_or_refund"
+
+
+def test_shadow_mode_uses_the_llm_and_scores_agreement(mock_initial_state, intent_config, intent_llm):
+    intent_config["fast_path"]["shadow"] = True
+    mock_initial_state["original_query"] = "Where is my order #1002?"
+    before = intent_rules.get_fast_path_stats()
+
+    result = parse_intent_node(mock_initial_state)
+
+    intent_llm.assert_called_once()
+    assert result["intent_source"] == "llm" and result["intent_fast_path"]["intent"] == "ORDER_STATUS"
+    after = intent_rules.get_fast_path_stats()
+    assert (after["compared"] - before["compared"], after["agreed"] - before["agreed"]) == (1, 0)
+
+    report = "\n".join(intent_fast_path_report_lines([{"original_query": "Where is my order #1002?", **result}]))
+    assert "**Rule/LLM Agreement:** 0/1" in report and "| order_status | ORDER_STATUS (0.95) | RETURN_INFO |" in report
+
+
+def _axis(i, noise=0.0):
+    vector = [noise] * 8
+    vector[i] = 1.0
+    return vector
+
+
+@pytest.fixture
+def knn_config(intent_config, tmp_path):
+    # Two clusters of examples on separate axes; an embedding between them is ambiguous
+    examples = [{"query": f"shipping question {i}", "intent": "SHIPPING_INFO"} for i in range(3)] + \
+               [{"query": f"return question {i}", "intent": "RETURN_INFO"} for i in range(3)]
+    classifier = KnnIntentClassifier.build(examples, [_axis(0, 0.01 * i) for i in range(3)] +
+                                           [_axis(1, 0.01 * i) for i in range(3)])
+    index_path, labels_path = str(tmp_path / "intent.faiss"), str(tmp_path / "labels.json")
+    classifier.save(index_path, labels_path)
+    intent_config["knn"] = {"enabled": True, "index_path": index_path, "labels_path": labels_path, "k": 3}
+    return intent_config
+
+
+def test_knn_votes_and_leaves_one_out():
+    classifier = KnnIntentClassifier.build(
+        [{"query": "a", "intent": "SHIPPING_INFO"}, {"query": "b", "intent": "SHIPPING_INFO"},
+         {"query": "c", "intent": "RETURN_INFO"}], [_axis(0), _axis(0, 0.1), _axis(1)])
+
+    clear = classifier.classify_vector(_axis(0, 0.05), "Where is order 12?", k=2)
+    assert (clear.intent, clear.margin, clear.neighbours) == ("SHIPPING_INFO", 1.0, ["SHIPPING_INFO", "SHIPPING_INFO"])
+    assert clear.entities == {}
+    left_out = classifier.classify_vector(classifier.vector(0), k=1, exclude=0)
+    assert left_out.neighbours == ["SHIPPING_INFO"] and left_out.similarity < 1.0
+
+
+def test_confident_knn_match_skips_the_llm(mock_initial_state, knn_config, intent_llm, mocker):
+    mocker.patch("agents.intent_parser_node.get_embeddings", return_value=[_axis(0, 0.02)])
+    mock_initial_state["original_query"] = "Is shipping free over 50 dollars?"
+
+    result = parse_intent_node(mock_initial_state)
+
+    intent_llm.assert_not_called()
+    assert (result["intent"], result["intent_source"]) == ("SHIPPING_INFO", "knn")
+    assert result["intent_knn"]["margin"] == 1.0
+
+
+def test_low_knn_margin_falls_back_to_the_llm(mock_initial_state, knn_config, intent_llm, mocker):
+    mocker.patch("agents.intent_parser_node.get_embeddings", return_value=[[1.0, 1.0] + [0.0] * 6])
+    mock_initial_state["original_query"] = "Is shipping free over 50 dollars?"
+
+    result = parse_intent_node(mock_initial_state)
+
+    intent_llm.assert_called_once()
+    assert (result["intent"], result["intent_source"]) == ("RETURN_INFO", "llm")
+    assert result["intent_knn"]["margin"] < 0.6
+
+
+def test_intent_classifier_report_scores_answered_and_top_predictions():
+    rows = [{"query": "q1", "label": "SHIPPING_INFO",
+             "rules": {"intent": None, "confident": False, "latency": 0.0},
+             "knn": {"intent": "SHIPPING_INFO", "confident": True, "latency": 0.001}},
+            {"query": "q2", "label": "RETURN_INFO",
+             "rules": {"intent": "RETURN_INFO", "confident": False, "latency": 0.0},
+             "knn": {"intent": "SHIPPING_INFO", "confident": False, "latency": 0.003}}]
+
+    report = "\n".join(intent_classifier_report_lines(rows))
+
+    assert "| Rules | 0/2 | n/a | 50.00% |" in report
+    assert "| kNN (search only) | 1/2 | 100.00% | 50.00% | 2.000 ms |" in report
+    assert "| LLM |" not in report
+
+
+def test_template_cache_answers_repeat_shapes_without_the_llm(mock_initial_state, intent_config, mocker):
+    intent_config["template_cache"] = {"enabled": True}
+    intent_llm = mocker.patch("agents.intent_parser_node.get_llm_response", return_value=json.dumps(
+        {"intent": "PRODUCT_AVAILABILITY", "entities": {"product_name": "Nike Air Max"}}))
+
+    mock_initial_state["original_query"] = "Do you have Nike Air Max in stock?"
+    first = parse_intent_node(dict(mock_initial_state))
+    mock_initial_state["original_query"] = "Do you have Adidas Samba in stock?"
+    second = parse_intent_node(dict(mock_initial_state))
+
+    intent_llm.assert_called_once()
+    assert first["intent_source"] == "llm"
+    assert (second["intent"], second["entities"], second["intent_source"]) == \
+        ("PRODUCT_AVAILABILITY", {"product_name": "Adidas Samba"}, "template_cache")
@@ -130,4 +130,19 @@ def test_response_node_greeting(mocker, state_for_greeting, response_node_config
     args, kwargs = mock_get_llm_greeting.call_args
     assert "friendly e-commerce assistant" in kwargs.get('prompt').lower() # Check greeting prompt
 
-# Add tests for error message handling, no data found scenario, etc.
\ No newline at end of file
+# Add tests for error message handling, no data found scenario, etc.
+
+def test_response_node_reports_llm_cache_stats(mocker, state_for_greeting, response_node_config):
+    response_node_config["cache_llm_responses"] = True
+    mocker.patch('agents.response_node.get_node_config', return_value=response_node_config)
+
+    def fake_cached_llm(prompt, model, use_cache=False, cache_stats=None, **kwargs):
+        assert use_cache is True
+        cache_stats["hits"] += 1
+        return "Hello again!"
+    mocker.patch('agents.response_node.get_llm_response', side_effect=fake_cached_llm)
+
+    result_dict = response_synthesis_node(state_for_greeting)
+
+    assert result_dict["final_answer"] == "Hello again!"
+    assert result_dict["llm_cache_stats"][RESPONSE_NODE_NAME] == {"hits": 1, "misses": 0}
@@ -86,4 +86,43 @@ def mock_openai_client(mocker):
 @pytest.fixture(scope="function", autouse=True)
 def patch_utils_openai_client_globally(monkeypatch, mock_openai_client):
     # This ensures utils.client is always our mock_openai_client
-    monkeypatch.setattr("utils.client", mock_openai_client)
\ No newline at end of file
+    monkeypatch.setattr("utils.client", mock_openai_client)
+
+@pytest.fixture
+def mock_async_openai_client(mocker, mock_openai_client):
+    # Async twin of mock_openai_client: same canned payloads, awaitable create() calls
+    mock_async_client = mocker.MagicMock(name="mock_async_openai_client_instance")
+    mock_async_client.chat.completions.create = mocker.AsyncMock(
+        return_value=mock_openai_client.chat.completions.create.return_value)
+    mock_async_client.embeddings.create = mocker.AsyncMock(
+        return_value=mock_openai_client.embeddings.create.return_value)
+    return mock_async_client
+
+@pytest.fixture(scope="function", autouse=True)
+def patch_utils_async_openai_client_globally(monkeypatch, mock_async_openai_client):
+    monkeypatch.setattr("utils.async_client", mock_async_openai_client)
+
+@pytest.fixture(scope="function", autouse=True)
+def clear_intent_template_cache():
+    # Template hits would otherwise skip the intent LLM mocks of later tests
+    import intent_templates
+    intent_templates.clear_template_caches()
+
+@pytest.fixture(scope="function", autouse=True)
+def clear_learned_sql_templates():
+    # SQL learned in one test would otherwise skip the SQL generation mocks of later tests
+    import sql_templates
+    sql_templates.clear_sql_templates()
+
+@pytest.fixture(scope="function", autouse=True)
+def clear_sql_result_cache():
+    # Rows cached in one test would otherwise outlive the database the next test reads
+    import sql_result_cache
+    sql_result_cache.clear_result_caches()
+
+@pytest.fixture(scope="function", autouse=True)
+def isolate_sql_workload(monkeypatch, tmp_path):
+    # Statements the tests execute must not end up in the recorded workload of the real database
+    import sql_workload
+    monkeypatch.setattr(sql_workload, "WORKLOAD_ROOT", str(tmp_path))
+    sql_workload.clear_recorders()
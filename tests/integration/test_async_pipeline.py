@@ -0,0 +1,57 @@
+import asyncio
+import json
+import time
+
+from graph_state import build_initial_state
+import utils
+
+
+def test_aget_llm_response_uses_async_client(mock_async_openai_client):
+    content = asyncio.run(utils.aget_llm_response(prompt="ping", model="gpt-test"))
+
+    assert content == "Default Content from mock_openai_client in conftest.py"
+    mock_async_openai_client.chat.completions.create.assert_awaited_once()
+    assert mock_async_openai_client.chat.completions.create.call_args.kwargs["model"] == "gpt-test"
+
+
+def test_sql_pipeline_ainvoke_runs_async_nodes(langgraph_app, mocker):
+    async def mock_allm_router(prompt: str, model: str, json_mode: bool = False, **kwargs):
+        if "## User Query:" in prompt or "CI Intent Prompt:" in prompt:
+            return json.dumps({"intent": "ORDER_STATUS", "entities": {"order_id": "1002"}})
+        if "SQL Query:" in prompt or "CI SQL Prompt:" in prompt:
+            return "SELECT status FROM Orders WHERE id = 1002;"
+        return "Your order #1002 has shipped."
+
+    for module in ("intent_parser_node", "sql_node", "response_node"):
+        mocker.patch(f"agents.{module}.aget_llm_response", side_effect=mock_allm_router)
+    sync_llm = mocker.patch("agents.intent_parser_node.get_llm_response")
+
+    final_state = asyncio.run(langgraph_app.ainvoke(build_initial_state("Where is my order #1002?")))
+
+    sync_llm.assert_not_called()
+    assert final_state["intent"] == "ORDER_STATUS"
+    assert final_state["sql_query_result"] == [{"status": "shipped"}]
+    assert final_state["final_answer"] == "Your order #1002 has shipped."
+    assert final_state["node_execution_order"] == ["intent_parser", "sql_processor", "response_synthesizer"]
+
+
+def test_concurrent_ainvoke_calls_overlap(langgraph_app, mocker):
+    async def slow_router(prompt: str, model: str, json_mode: bool = False, **kwargs):
+        await asyncio.sleep(0.2)
+        if "## User Query:" in prompt or "CI Intent Prompt:" in prompt:
+            return json.dumps({"intent": "OUT_OF_CONTEXT", "entities": {}})
+        return "Hello!"
+
+    mocker.patch("agents.intent_parser_node.aget_llm_response", side_effect=slow_router)
+    mocker.patch("agents.response_node.aget_llm_response", side_effect=slow_router)
+
+    async def run_many():
+        return await asyncio.gather(*(langgraph_app.ainvoke(build_initial_state("hi")) for _ in range(20)))
+
+    start = time.perf_counter()
+    results = asyncio.run(run_many())
+    elapsed = time.perf_counter() - start
+
+    assert all(r["final_answer"] == "Hello!" for r in results)
+    # 20 conversations x 2 sequential 0.2s calls would take 8s serially
+    assert elapsed < 2.0
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+import utils
+from batch_runner import (BATCH_PRICE_FACTOR, BatchPending, BatchResult, BatchRunner, BatchSession,
+                          LocalFileBatchBackend, OpenAIBatchBackend, _active_session, read_batch_results)
+from token_accounting import estimate_cost_usd
+
+# Not obvious enough for the intent fast path, so it needs all three LLM steps
+NIKE_QUERY = "Do you have Nike Air Max in stock?"
+
+
+@pytest.fixture(autouse=True)
+def fresh_llm_cache(monkeypatch):
+    monkeypatch.setattr(utils, "_llm_cache", None) # Answers must come from the batch, not an earlier test
+
+
+def test_sql_query_finishes_after_one_round_per_llm_step(langgraph_app, mock_openai_client, tmp_path):
+    runner = BatchRunner(langgraph_app, LocalFileBatchBackend(str(tmp_path)), work_dir=str(tmp_path))
+
+    final_states = runner.run([NIKE_QUERY, NIKE_QUERY])
+
+    state = final_states[NIKE_QUERY]
+    assert state["intent"] == "PRODUCT_AVAILABILITY" and state["intent_source"] == "llm"
+    assert state["sql_query_generated"] == "SELECT name, inventory_count FROM Products WHERE name LIKE '%Nike Air Max%';"
+    assert "inventory_count" in state["final_answer"]
+    assert state["sql_source"] == "template" # the stock lookup needs no SQL generation round
+    assert runner.stats == {"rounds": 2, "requests": 2, "failed_requests": 0}
+    mock_openai_client.chat.completions.create.assert_not_called()
+
+    line = json.loads((tmp_path / "round_1_input.jsonl").read_text().splitlines()[0])
+    assert (line["method"], line["url"]) == ("POST", "/v1/chat/completions")
+    assert "classifying user intent" in line["body"]["messages"][-1]["content"]
+
+
+def test_batch_usage_is_billed_at_the_batch_price(langgraph_app, tmp_path):
+    final_states = BatchRunner(langgraph_app, LocalFileBatchBackend(str(tmp_path)), work_dir=str(tmp_path)).run(
+        [NIKE_QUERY])
+
+    usage = final_states[NIKE_QUERY]["node_token_usage"]["intent_parser"]
+    full_price = estimate_cost_usd("gpt-4o", usage["prompt_tokens"], usage["completion_tokens"])
+    assert usage["cost_usd"] == pytest.approx(full_price * BATCH_PRICE_FACTOR, abs=1e-6)
+
+
+def test_failed_batch_lines_become_error_answers(tmp_path):
+    output = tmp_path / "out.jsonl"
+    output.write_text(json.dumps({"custom_id": "a", "response": {"status_code": 429, "body": {}},
+                                  "error": {"code": "rate_limit", "message": "slow down"}}) + "\n")
+    session = BatchSession()
+    session.results.update(read_batch_results(str(output)))
+
+    token = _active_session.set(session)
+    try:
+        with pytest.raises(BatchPending):
+            utils.get_llm_response("Say hi", model="gpt-4o")
+        assert len(session.pending) == 1
+        session.results[next(iter(session.pending))] = session.results["a"]
+        answer = utils.get_llm_response("Say hi", model="gpt-4o")
+    finally:
+        _active_session.reset(token)
+
+    assert answer.startswith("Error: OpenAI batch request failed.") and "slow down" in answer
+
+
+def test_openai_backend_uploads_creates_and_downloads(mocker, tmp_path):
+    client = mocker.MagicMock()
+    client.files.create.return_value.id = "file-in"
+    client.batches.create.return_value.id = "batch_1"
+    client.batches.retrieve.side_effect = [mocker.MagicMock(status="in_progress"),
+                                           mocker.MagicMock(status="completed", output_file_id="file-out",
+                                                            error_file_id=None)]
+    client.files.content.return_value.text = '{"custom_id": "a", "response": {"status_code": 200, "body": ' \
+                                             '{"choices": [{"message": {"content": "hi"}}]}}}\n'
+    input_path = tmp_path / "in.jsonl"
+    input_path.write_text("{}\n")
+    backend = OpenAIBatchBackend(client, str(tmp_path), poll_interval_seconds=0)
+
+    paths = backend.wait(backend.submit(str(input_path)))
+
+    assert client.batches.create.call_args.kwargs["endpoint"] == "/v1/chat/completions"
+    assert read_batch_results(paths[0]) == {"a": BatchResult("hi", None)}
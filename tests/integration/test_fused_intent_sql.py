@@ -0,0 +1,46 @@
+import pytest
+
+import utils
+
+FUSED_SQL = "SELECT inventory_count FROM Products WHERE name LIKE '%Nike Air Max%';"
+
+
+@pytest.fixture
+def fused_registry(langgraph_app):
+    registry = utils.load_agent_registry()
+    intent_config = registry["nodes"]["intent_parser"]
+    intent_config.pop("fast_path", None)
+    intent_config.pop("template_cache", None)
+    intent_config.setdefault("versions", {})["v2.0"] = {"mode": "fused_sql",
+                                                        "prompt_path": "prompts/intent/v2_0_fused_sql.txt"}
+    registry["active_node_versions"]["intent_parser"] = "v2.0"
+    yield registry
+    utils.load_agent_registry(force_reload=True)
+
+
+def test_versions_map_overrides_the_base_entry(fused_registry):
+    config = utils.get_node_config("intent_parser")
+
+    assert (config["version"], config["mode"], config["prompt_path"]) == \
+        ("v2.0", "fused_sql", "prompts/intent/v2_0_fused_sql.txt")
+    assert config["llm_model"] == fused_registry["nodes"]["intent_parser"]["llm_model"]
+    assert "versions" not in config
+    assert utils.get_node_config("intent_parser", version="v9") == {}
+
+
+def test_fused_version_routes_straight_to_sql_execution(fused_registry, langgraph_app, mock_initial_state, mocker):
+    fused = mocker.patch("agents.intent_parser_node.get_llm_response", return_value={
+        "intent": "PRODUCT_AVAILABILITY", "entities": {"product_name": "Nike Air Max"}, "sql": FUSED_SQL})
+    sql_llm = mocker.patch("agents.sql_node.get_llm_response")
+    mocker.patch("agents.response_node.get_llm_response", return_value="We have 12 pairs in stock.")
+    mock_initial_state["original_query"] = "Do you have Nike Air Max in stock?"
+
+    final_state = langgraph_app.invoke(mock_initial_state)
+
+    assert fused.call_args.kwargs["json_mode"] is True
+    assert "{db_schema}" not in fused.call_args.kwargs["prompt"]
+    sql_llm.assert_not_called()
+    assert final_state["processing_steps_versions"]["intent_parser"] == "v2.0"
+    assert final_state["sql_query_generated"] == FUSED_SQL
+    assert final_state["sql_query_result"] == [{"inventory_count": 12}]
+    assert final_state["node_execution_order"] == ["intent_parser", "sql_processor", "response_synthesizer"]
@@ -1,6 +1,7 @@
 import pytest
 import json
 import os
+import utils
 from graph_state import AgentState
 from run_evaluation import compare_sql_queries, compare_sql_results
 
@@ -25,8 +26,18 @@ def _load_json_for_test_module(relative_path):
 SQL_TEST_DATA = _load_json_for_test_module("data/golden_queries_sql.json")
 # --- End of data loading ---
 
+@pytest.fixture
+def llm_only_registry(langgraph_app):
+    # Every golden query goes through the intent and SQL generation LLM mocks
+    registry = utils.load_agent_registry()
+    for node_name, block in (("intent_parser", "fast_path"), ("intent_parser", "knn"), ("sql_processor", "templates")):
+        registry["nodes"][node_name][block] = {**registry["nodes"][node_name].get(block, {}), "enabled": False}
+    yield registry
+    utils.load_agent_registry(force_reload=True)
+
 @pytest.mark.parametrize("golden_query_data", SQL_TEST_DATA)
-def test_sql_pipeline_from_json_with_latency_check(golden_query_data, langgraph_app, mock_initial_state, mocker):
+def test_sql_pipeline_from_json_with_latency_check(golden_query_data, llm_only_registry, langgraph_app, mock_initial_state,
+                                                   mocker):
     assert isinstance(golden_query_data, dict), \
         f"Test setup error: golden_query_data is not a dict. Got: {golden_query_data} (type: {type(golden_query_data)})"
         
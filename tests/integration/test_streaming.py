@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+import utils
+from chat_stream import stream_chat_events
+from fake_openai_server import start_in_thread
+from graph_state import build_initial_state
+from llm_transport import ResilientTransport, build_openai_clients
+
+
+@pytest.fixture
+def fake_upstream(monkeypatch):
+    server, base_url = start_in_thread()
+    sync_client, async_client = build_openai_clients("test-key", base_url=base_url)
+    monkeypatch.setattr(utils, "client", sync_client)
+    monkeypatch.setattr(utils, "async_client", async_client)
+    monkeypatch.setattr(utils, "_transport", ResilientTransport())
+    monkeypatch.setattr(utils, "_llm_cache", None) # Greeting/format answers must not come from an earlier test
+    yield server
+    server.shutdown()
+
+
+def _parse_sse(body: str) -> list:
+    return [json.loads(frame.split("data: ", 1)[1]) for frame in body.split("\n\n") if "data: " in frame]
+
+
+def test_stream_emits_progress_then_tokens_then_done(langgraph_app, fake_upstream):
+    events = list(stream_chat_events(langgraph_app, "Where is my order #1002?"))
+    kinds = [event["event"] for event in events]
+
+    progress = [event for event in events if event["event"] == "progress"]
+    assert [event["node"] for event in progress] == ["intent_parser", "sql_processor", "response_synthesizer"]
+    assert progress[0]["intent"] == "ORDER_STATUS"
+    assert progress[1]["row_count"] == 1
+
+    tokens = [event for event in events if event["event"] == "token"]
+    assert len(tokens) > 1 and {event["node"] for event in tokens} == {"response_synthesizer"}
+    # Tokens arrive before the synthesizer's own progress event, i.e. while the LLM call is running
+    assert events.index(tokens[0]) < events.index(progress[-1])
+    assert kinds[-1] == "done"
+    assert events[-1]["response"] == "".join(event["text"] for event in tokens)
+
+
+def test_invoke_does_not_stream(langgraph_app, fake_upstream, mocker):
+    spy = mocker.spy(utils, "_stream_chat_content")
+    final_state = langgraph_app.invoke(build_initial_state("Where is my order #1002?"))
+    assert final_state["final_answer"]
+    spy.assert_not_called()
+
+
+def test_chat_stream_endpoint_returns_sse(fake_upstream):
+    from app import app as flask_app
+
+    response = flask_app.test_client().post("/chat/stream", json={"message": "Where is my order #1002?"})
+
+    assert response.mimetype == "text/event-stream"
+    events = _parse_sse(response.get_data(as_text=True))
+    assert events[0]["event"] == "progress" and events[-1]["event"] == "done"
+    assert any(event["event"] == "token" for event in events)
+
+
+def test_chat_endpoint_starts_from_the_full_initial_state(mocker):
+    import app as app_module
+    invoke = mocker.patch.object(app_module.langgraph_app, "invoke",
+                                 return_value={**build_initial_state("Hi"), "final_answer": "Hello!"})
+
+    response = app_module.app.test_client().post("/chat", json={"message": "Hi"})
+
+    assert response.get_json() == {"response": "Hello!"}
+    invoke.assert_called_once_with(build_initial_state("Hi"))
+
+
+def test_chat_stream_rejects_empty_message():
+    from app import app as flask_app
+
+    response = flask_app.test_client().post("/chat/stream", json={"message": "  "})
+    assert response.status_code == 400
@@ -0,0 +1,85 @@
+import time
+
+import pytest
+
+import utils
+from caching import TTLCache, SQLiteCache, LLMResponseCache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a") # "b" is now the LRU entry
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(max_entries=10, ttl_seconds=0.05)
+    cache.set("a", 1)
+    time.sleep(0.06)
+    assert cache.get("a") is None
+
+
+def test_sqlite_tier_is_shared_and_bounded(tmp_path):
+    path = str(tmp_path / "llm_cache.sqlite")
+    writer = SQLiteCache(path, max_entries=3)
+    reader = SQLiteCache(path, max_entries=3) # e.g. another gunicorn worker
+    for i in range(5):
+        writer.set(f"k{i}", {"n": i})
+    writer.purge()
+
+    assert reader.get("k4") == {"n": 4}
+    assert len(reader) == 3
+
+
+def test_sqlite_hits_do_not_write_but_still_count_for_eviction(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "c.sqlite"), max_entries=3)
+    for i in range(3):
+        cache.set(f"k{i}", i)
+    conn = cache._conn()
+    changes = conn.total_changes
+
+    assert cache.get("k0") == 0
+    assert conn.total_changes == changes and not conn.in_transaction # a hit is a plain read
+
+    cache.set("k3", 3)
+    cache.purge()
+    assert [cache.get(f"k{i}") for i in range(4)] == [0, None, 2, 3] # k0 was read last, k1 goes
+
+
+def test_llm_cache_promotes_disk_hits_to_memory(tmp_path):
+    disk = SQLiteCache(str(tmp_path / "c.sqlite"))
+    disk.set("key", "cached answer")
+    cache = LLMResponseCache(TTLCache(), disk)
+
+    assert cache.get("key") == (True, "cached answer")
+    assert cache.get("key") == (True, "cached answer")
+    assert cache.stats["disk_hits"] == 1 and cache.stats["memory_hits"] == 1
+
+
+@pytest.fixture
+def fresh_llm_cache(monkeypatch):
+    monkeypatch.setattr(utils, "_llm_cache", LLMResponseCache(TTLCache()))
+
+
+def test_get_llm_response_cache_hit_skips_api(fresh_llm_cache, mock_openai_client):
+    stats = {"hits": 0, "misses": 0}
+    first = utils.get_llm_response("Say hi", model="gpt-test", use_cache=True, cache_stats=stats)
+    second = utils.get_llm_response("Say hi", model="gpt-test", use_cache=True, cache_stats=stats)
+
+    assert first == second
+    assert mock_openai_client.chat.completions.create.call_count == 1
+    assert stats == {"hits": 1, "misses": 1}
+
+
+def test_get_llm_response_cache_key_includes_temperature(fresh_llm_cache, mock_openai_client):
+    utils.get_llm_response("Say hi", model="gpt-test", temperature=0.1, use_cache=True)
+    utils.get_llm_response("Say hi", model="gpt-test", temperature=0.7, use_cache=True)
+    utils.get_llm_response("Say hi", model="gpt-test", temperature=0.1) # not opted in
+
+    assert mock_openai_client.chat.completions.create.call_count == 3
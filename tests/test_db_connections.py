@@ -0,0 +1,57 @@
+import os
+import shutil
+import sqlite3
+import threading
+
+import pytest
+
+from db_connections import SQLiteConnectionManager
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "shop.db")
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("CREATE TABLE Orders (id INTEGER PRIMARY KEY, status TEXT)")
+        conn.execute("INSERT INTO Orders VALUES (1002, 'shipped')")
+    conn.close()
+    return path
+
+
+def test_connection_is_reused_per_thread_and_read_only(db_path):
+    manager = SQLiteConnectionManager(db_path)
+    with manager.connection() as conn:
+        assert dict(conn.execute("SELECT status FROM Orders WHERE id = 1002").fetchone()) == {"status": "shipped"}
+        assert conn.execute("PRAGMA query_only").fetchone()[0] == 1
+        assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2 # MEMORY
+    with manager.connection() as again:
+        assert again is conn
+        with pytest.raises(sqlite3.OperationalError):
+            again.execute("DELETE FROM Orders")
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(manager._checkout()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+    assert manager.stats["opened"] == 2
+
+
+def test_health_check_reopens_when_the_database_file_is_replaced(db_path, tmp_path):
+    manager = SQLiteConnectionManager(db_path, {"health_check_interval_seconds": 0})
+    with manager.connection() as conn:
+        conn.execute("SELECT 1")
+
+    rebuilt = str(tmp_path / "rebuilt.db")
+    shutil.copyfile(db_path, rebuilt)
+    target = sqlite3.connect(rebuilt)
+    with target:
+        target.execute("UPDATE Orders SET status = 'delivered'")
+    target.close()
+    os.replace(rebuilt, db_path)
+
+    with manager.connection() as fresh:
+        assert fresh is not conn
+        assert fresh.execute("SELECT status FROM Orders").fetchone()[0] == "delivered"
+    assert (manager.stats["failed_checks"], manager.stats["reopened"]) == (1, 1)
@@ -0,0 +1,77 @@
+import sqlite3
+
+from generate_dataset import generate_database, generate_documents
+
+TABLES = ("Customers", "Products", "Orders", "Returns")
+
+
+def _dump(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = {table: conn.execute(f"SELECT * FROM {table} ORDER BY rowid").fetchall() for table in TABLES}
+    conn.close()
+    return rows
+
+
+def _schema(db_path):
+    conn = sqlite3.connect(db_path)
+    schema = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table' ORDER BY name").fetchall()
+    conn.close()
+    return schema
+
+
+def test_same_seed_writes_the_same_rows_on_the_bundled_schema(tmp_path):
+    first = str(tmp_path / "first.db")
+    totals = generate_database(first, scale=0.05, seed=3, batch_size=700)
+    second = str(tmp_path / "second.db")
+    generate_database(second, scale=0.05, seed=3, batch_size=700)
+
+    assert _dump(first) == _dump(second)
+    generate_database(second, scale=0.05, seed=4, batch_size=700)
+    assert _dump(first)["Orders"] != _dump(second)["Orders"]
+    assert _schema(first) == _schema("data/ecommerce_support.db")
+    assert totals["Customers"] == 10 + 1000 and totals["Orders"] == 12 + 5000
+    bundled = _dump("data/ecommerce_support.db")
+    assert all(set(bundled[table]) <= set(_dump(first)[table]) for table in TABLES) # golden rows kept
+
+
+def test_generated_data_is_skewed_like_real_traffic(tmp_path):
+    db_path = str(tmp_path / "shop.db")
+    generate_database(db_path, scale=0.2, seed=1, end_date="2024-12-31", days=730)
+    conn = sqlite3.connect(db_path)
+
+    per_customer = [n for (n,) in conn.execute("SELECT COUNT(*) FROM Orders WHERE id > 12345 "
+                                               "GROUP BY customer_id ORDER BY 1 DESC")]
+    assert sum(per_customer[:400]) / sum(per_customer) > 0.4 # top 10% of 4000 customers
+    statuses = dict(conn.execute("SELECT status, COUNT(*) FROM Orders WHERE id > 12345 GROUP BY status"))
+    assert max(statuses, key=statuses.get) == "delivered" and statuses["returned"] > 0
+    assert conn.execute("SELECT COUNT(*) FROM Orders WHERE id > 12345 AND status IN ('pending', 'processing') "
+                        "AND order_date < '2024-12-20'").fetchone()[0] == 0 # old orders have left the warehouse
+    assert conn.execute("SELECT COUNT(*) FROM Orders o WHERE status = 'returned' AND NOT EXISTS "
+                        "(SELECT 1 FROM Returns r WHERE r.order_id = o.id)").fetchone()[0] == 0
+    months = dict(conn.execute("SELECT substr(order_date, 1, 7), COUNT(*) FROM Orders GROUP BY 1"))
+    assert months["2024-12"] > 1.5 * months["2024-06"] # growth plus the holiday peak
+    assert min(months) >= "2023-01"
+    mice = conn.execute("SELECT COUNT(*) FROM Products WHERE name LIKE '%Wireless Mouse%'").fetchone()[0]
+    printers = conn.execute("SELECT COUNT(*) FROM Products WHERE name LIKE '%Printer%'").fetchone()[0]
+    assert mice > 5 * printers
+    hot, rest = conn.execute("SELECT AVG(CASE WHEN id <= 14 THEN inventory_count END), " # first 1% of 400
+                             "AVG(CASE WHEN id > 14 THEN inventory_count END) FROM Products WHERE id > 10").fetchone()
+    assert hot < rest / 3 # bestsellers run low
+    conn.close()
+
+
+def test_documents_match_the_generated_catalogue(tmp_path):
+    db_path = str(tmp_path / "shop.db")
+    generate_database(db_path, scale=0.05, seed=2)
+
+    paths = generate_documents(str(tmp_path / "docs"), count=60, seed=2, db_path=db_path)
+    again = generate_documents(str(tmp_path / "again"), count=60, seed=2, db_path=db_path)
+
+    assert len(paths) == 60 and all(path.rsplit("/", 1)[1].startswith("synthetic_") for path in paths)
+    texts = [open(path, encoding="utf-8").read() for path in paths]
+    assert texts == [open(path, encoding="utf-8").read() for path in again]
+    assert any(text.startswith("Shipping to Egypt") for text in texts)
+    assert any(text.startswith("Returns: Wrong size") for text in texts)
+    bestseller = sqlite3.connect(db_path).execute("SELECT name FROM Products WHERE id = 11").fetchone()[0]
+    assert any(text.startswith(f"{bestseller}: Questions and Answers") for text in texts)
+    assert len(generate_documents(str(tmp_path / "base"), count=10, seed=2)) == 10
@@ -0,0 +1,87 @@
+import sqlite3
+
+import pytest
+
+from agents.sql_node import _execute_sql
+from index_advisor import advise, main
+from sql_workload import flush_recorders, load_workload, recorder_for
+
+RETURNS_SQL = "SELECT reason FROM Returns WHERE order_id = :order_id;"
+CUSTOMER_ORDERS_SQL = ("SELECT o.id, o.status FROM Orders o JOIN Customers c ON o.customer_id = c.id "
+                       "WHERE c.email = :email;")
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "shop.db")
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("CREATE TABLE Customers (id INTEGER PRIMARY KEY, email TEXT)")
+        conn.execute("CREATE TABLE Orders (id INTEGER PRIMARY KEY, customer_id INTEGER, status TEXT)")
+        conn.execute("CREATE TABLE Returns (order_id INTEGER, reason TEXT)")
+        conn.executemany("INSERT INTO Customers VALUES (?, ?)", [(i, f"user{i}@example.com") for i in range(1, 201)])
+        conn.executemany("INSERT INTO Orders VALUES (?, ?, ?)",
+                         [(i, i % 200 + 1, ("shipped", "delivered")[i % 2]) for i in range(1, 1001)])
+        conn.executemany("INSERT INTO Returns VALUES (?, ?)", [(i, "Wrong size") for i in range(1, 1001, 10)])
+    conn.close()
+    return path
+
+
+def _workload(db_path, tmp_path):
+    recorder = recorder_for({"enabled": True, "path": "workload.jsonl"})
+    conn = sqlite3.connect(db_path)
+    for i in range(1, 11):
+        for sql, params in ((RETURNS_SQL, {"order_id": i}), (CUSTOMER_ORDERS_SQL, {"email": f"user{i}@example.com"})):
+            recorder.record(conn, sql, params, 1.0, len(conn.execute(sql, params).fetchall()))
+    conn.close()
+    recorder.flush()
+    return str(tmp_path / "workload.jsonl")
+
+
+def test_executed_statements_are_recorded_once_each_with_their_plan(db_path, tmp_path):
+    config = {"db_path": db_path, "result_cache": {"enabled": True}, "workload": {"enabled": True, "path": "w.jsonl"}}
+    for _ in range(2):
+        results, error_msg, _ = _execute_sql(config, RETURNS_SQL, {"order_id": 11})
+        assert (results, error_msg) == ([{"reason": "Wrong size"}], None)
+
+    flush_recorders()
+    recorded = load_workload(str(tmp_path / "w.jsonl")) # the second run was a result cache hit
+    assert len(recorded) == 1
+    assert recorded[0]["params"] == {"order_id": 11} and recorded[0]["rows"] == 1
+    assert recorded[0]["plan"] == ["SCAN Returns"]
+
+
+def test_workload_file_is_written_off_the_request_path_and_rotated(db_path, tmp_path):
+    recorder = recorder_for({"enabled": True, "path": "rotating.jsonl", "max_statements": 4})
+    conn = sqlite3.connect(db_path)
+    for i in range(1, 11):
+        recorder.record(conn, RETURNS_SQL, {"order_id": i}, 1.0, 1)
+    conn.close()
+    flush_recorders()
+
+    path = str(tmp_path / "rotating.jsonl")
+    assert len(load_workload(path)) == 6 # 2 in the file, 4 in rotating.jsonl.1; the oldest 4 are gone
+    assert [entry["params"]["order_id"] for entry in load_workload(path)] == [5, 6, 7, 8, 9, 10]
+    assert recorder.stats["rotations"] == 2 and len(recorder.statements) == 4
+
+
+def test_advisor_finds_the_join_and_filter_indexes(db_path, tmp_path):
+    advised = advise(db_path, load_workload(_workload(db_path, tmp_path)))
+
+    assert {(candidate.table, candidate.column) for candidate in advised} == \
+        {("Returns", "order_id"), ("Orders", "customer_id"), ("Customers", "email")}
+    assert all(candidate.saved_rows > 0 for candidate in advised)
+
+
+def test_apply_creates_the_indexes_and_replays_the_workload(db_path, tmp_path):
+    report = main(["--workload", _workload(db_path, tmp_path), "--db-path", db_path, "--apply", "--repeat", "2"])
+
+    conn = sqlite3.connect(db_path)
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {CUSTOMER_ORDERS_SQL}", {"email": "x"})]
+    conn.close()
+    assert set(report["created"]) == indexes == {"idx_returns_order_id", "idx_orders_customer_id",
+                                                 "idx_customers_email"}
+    assert not any(detail.startswith("SCAN") for detail in plan)
+    assert set(report["before_ms"]) == set(report["after_ms"]) == {RETURNS_SQL, CUSTOMER_ORDERS_SQL,
+                                                                   "workload_total_ms"}
@@ -0,0 +1,37 @@
+from intent_templates import IntentTemplateCache, to_template
+
+
+def test_literals_become_placeholders():
+    assert to_template("Where is my order #1002?") == ("where is my order #{number}?", ["1002"])
+    assert to_template("Do you have Nike Air Max in stock?") == ("do you have {name} in stock?", ["Nike Air Max"])
+    assert to_template('Orders for bob@example.com or "Blue Hoodie"') == \
+        ("orders for {email} or {quoted}", ["bob@example.com", "Blue Hoodie"])
+
+
+def test_repeat_template_re_extracts_entities_from_new_literals():
+    cache = IntentTemplateCache()
+    assert cache.store("v1", "Where is my order #1002?", "ORDER_STATUS", {"order_id": "1002"})
+
+    match = cache.lookup("v1", "Where is my order #77?")
+
+    assert (match.intent, match.entities) == ("ORDER_STATUS", {"order_id": "77"})
+    assert cache.lookup("v2", "Where is my order #77?") is None # new intent_parser version, new keys
+    assert cache.stats == {"hits": 1, "misses": 1, "stored": 1, "uncacheable": 0}
+
+
+def test_entities_not_taken_from_the_query_are_not_cached():
+    cache = IntentTemplateCache()
+
+    assert not cache.store("v1", "Where is my latest order?", "ORDER_STATUS", {"order_id": "1002"})
+    assert cache.lookup("v1", "Where is my latest order?") is None
+
+
+def test_lru_eviction_and_ttl():
+    cache = IntentTemplateCache(max_entries=1, ttl_seconds=None)
+    cache.store("v1", "Where is my order #1?", "ORDER_STATUS", {"order_id": "1"})
+    cache.store("v1", "Do you have Nike in stock?", "PRODUCT_AVAILABILITY", {"product_name": "Nike"})
+    assert cache.lookup("v1", "Where is my order #2?") is None
+
+    expired = IntentTemplateCache(ttl_seconds=-1)
+    expired.store("v1", "Where is my order #1?", "ORDER_STATUS", {"order_id": "1"})
+    assert expired.lookup("v1", "Where is my order #2?") is None
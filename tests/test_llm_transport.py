@@ -0,0 +1,133 @@
+import asyncio
+import time
+
+import pytest
+
+import utils
+from fake_openai_server import start_in_thread
+from llm_transport import ResilientTransport, CircuitBreaker, CircuitOpenError, build_openai_clients
+
+FAST_RETRY = {"retry": {"max_attempts": 4, "base_delay_seconds": 0.01, "max_delay_seconds": 0.02,
+                        "total_deadline_seconds": 5},
+              "circuit_breaker": {"failure_threshold": 3, "reset_timeout_seconds": 0.2}}
+
+
+@pytest.fixture
+def stub_upstream(monkeypatch):
+    """Routes utils' OpenAI calls to a local fake server with a fast retry policy."""
+    server, base_url = start_in_thread()
+    sync_client, async_client = build_openai_clients("test-key", FAST_RETRY, base_url=base_url)
+    monkeypatch.setattr(utils, "client", sync_client)
+    monkeypatch.setattr(utils, "async_client", async_client)
+    monkeypatch.setattr(utils, "_transport", ResilientTransport(FAST_RETRY))
+    monkeypatch.setattr(utils, "_coalescing_enabled", lambda: False)
+    yield server
+    server.shutdown()
+
+
+def test_retries_transient_errors_until_success(stub_upstream):
+    stub_upstream.fail_next(503, 429, 500)
+
+    answer = utils.get_llm_response("Where is my order?", model="gpt-test")
+
+    assert answer == "This is a response from the local fake OpenAI server."
+    assert stub_upstream.stats["requests"] == 4
+    assert utils._transport.stats["retries"] == 3
+
+
+def test_client_errors_are_not_retried(stub_upstream):
+    stub_upstream.fail_next(400)
+
+    answer = utils.get_llm_response("Where is my order?", model="gpt-test")
+
+    assert answer.startswith("Error: OpenAI API call failed")
+    assert stub_upstream.stats["requests"] == 1
+
+
+def test_breaker_opens_and_fails_fast_during_brownout(stub_upstream):
+    stub_upstream.error_rate = 1.0
+
+    first = utils.get_llm_response("Where is my order?", model="gpt-test")
+    requests_after_first = stub_upstream.stats["requests"]
+    start = time.perf_counter()
+    second = utils.get_llm_response("Where is my order?", model="gpt-test")
+
+    assert first.startswith("Error:")
+    assert requests_after_first == 3 # threshold reached, later attempts short-circuit
+    assert "circuit open" in second
+    assert stub_upstream.stats["requests"] == requests_after_first
+    assert time.perf_counter() - start < 0.05
+
+    # After the reset timeout a single trial goes through and closes the circuit again
+    stub_upstream.error_rate = 0.0
+    time.sleep(0.25)
+    assert utils.get_llm_response("Where is my order?", model="gpt-test").startswith("This is a response")
+    assert utils._transport.breaker.state == "closed"
+
+
+def test_per_attempt_timeout_is_bounded_by_total_deadline():
+    transport = ResilientTransport({"retry": {"max_attempts": 10, "base_delay_seconds": 0.01,
+                                              "max_delay_seconds": 0.01, "total_deadline_seconds": 0.3}})
+    seen_timeouts = []
+
+    def slow_call(timeout):
+        seen_timeouts.append(timeout)
+        time.sleep(timeout)
+        raise utils.OpenAIError("unreachable") # non-retryable, ends the loop
+
+    with pytest.raises(utils.OpenAIError):
+        transport.call(slow_call, timeout=5)
+    assert seen_timeouts[0] <= 0.3
+
+
+def test_async_path_retries_against_stub(stub_upstream):
+    stub_upstream.fail_next(502)
+
+    answer = asyncio.run(utils.aget_llm_response("Where is my order?", model="gpt-test"))
+
+    assert answer == "This is a response from the local fake OpenAI server."
+    assert stub_upstream.stats["requests"] == 2
+
+
+def test_half_open_allows_a_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout_seconds=0)
+    breaker.record_failure()
+    breaker.before_call() # trial admitted
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_half_open_trial_rejected_with_429_reopens_the_circuit(stub_upstream):
+    stub_upstream.error_rate = 1.0
+    utils.get_llm_response("Where is my order?", model="gpt-test") # opens the circuit
+    stub_upstream.error_rate = 0.0
+    time.sleep(0.25)
+    stub_upstream.fail_next(429, 429, 429, 429) # the trial runs out of attempts on our own quota
+
+    assert utils.get_llm_response("Where is my order?", model="gpt-test").startswith("Error:")
+    assert utils._transport.breaker.state == "open"
+    time.sleep(0.25)
+    assert utils.get_llm_response("Where is my order?", model="gpt-test").startswith("This is a response")
+    assert utils._transport.breaker.state == "closed"
+
+
+def test_cancelled_half_open_trial_reopens_the_circuit():
+    transport = ResilientTransport(FAST_RETRY)
+    breaker = transport.breaker
+    for _ in range(3):
+        breaker.record_failure()
+
+    async def trial():
+        task = asyncio.ensure_future(transport.acall(lambda timeout: asyncio.sleep(10)))
+        await asyncio.sleep(0.05) # the trial is in flight
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    time.sleep(0.25) # past the reset timeout: the next call is the half-open trial
+    asyncio.run(trial())
+    assert breaker.state == "open"
+    time.sleep(0.25)
+    assert breaker.before_call() is True # a new trial is admitted instead of failing forever
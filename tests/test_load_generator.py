@@ -0,0 +1,43 @@
+import json
+import statistics
+
+import pytest
+
+from fake_openai_server import LatencyModel, default_chat_responder, fake_intent, fake_sql
+from load_generator import arrival_offsets, percentile, run_step
+
+
+def test_latency_distributions_are_seeded_and_shaped():
+    assert LatencyModel.parse("fixed:250").sample_ms() == 250.0
+    uniform = [LatencyModel.parse("uniform:100,200", seed=1).sample_ms() for _ in range(200)]
+    assert all(100 <= value <= 200 for value in uniform)
+
+    first = LatencyModel.parse("lognormal:300,0.5", seed=7)
+    second = LatencyModel.parse("lognormal:300,0.5", seed=7)
+    samples = [first.sample_ms() for _ in range(2000)]
+    assert samples[:5] == [second.sample_ms() for _ in range(5)]
+    assert statistics.median(samples) == pytest.approx(300, rel=0.1)
+    assert percentile(samples, 0.99) > 2 * statistics.median(samples) # long right tail
+    with pytest.raises(ValueError):
+        LatencyModel.parse("pareto:1")
+
+
+def test_answers_are_shaped_for_the_node_that_asked():
+    intent_prompt = 'classifying user intent ... ## User Query: "Do you have Nike Air Max in stock?"?'
+    assert json.loads(default_chat_responder([{"role": "system", "content": intent_prompt}])) == {
+        "intent": "PRODUCT_AVAILABILITY", "entities": {"product_name": "Nike Air Max"}}
+    assert fake_intent("How do I return a damaged item?")["intent"] == "RETURN_INFO"
+    assert fake_sql("What is the email of the customer who placed order #1003?") == \
+        "SELECT email FROM Customers WHERE id = (SELECT customer_id FROM Orders WHERE id = 1003);"
+    assert default_chat_responder([{"role": "user", "content": "Say hi"}]) == \
+        "This is a response from the local fake OpenAI server."
+
+
+def test_open_loop_step_reports_percentiles():
+    assert len(arrival_offsets(50, 2)) == 100
+    assert 60 < len(arrival_offsets(50, 2, poisson=True, seed=3)) < 140
+
+    step = run_step(lambda query: query != "bad", ["good", "good", "bad"], rps=60, duration=0.5, workers=4)
+
+    assert step["sent"] == 30 and step["errors"] == 10
+    assert 0 <= step["p50_s"] <= step["p95_s"] <= step["p99_s"]
@@ -0,0 +1,82 @@
+import io
+import json
+import logging
+import threading
+
+import pytest
+
+import utils
+from log_pipeline import configure_logging, reset_correlation_id, set_correlation_id, shutdown_logging
+
+
+@pytest.fixture
+def log_stream():
+    stream = io.StringIO()
+    yield stream
+    utils.configure_logging() # back to the registry's pipeline for the remaining tests
+
+
+def _json_lines(stream):
+    shutdown_logging() # stops the listener after it has drained the queue
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_json_records_carry_correlation_id_extras_and_truncated_payloads(log_stream):
+    configure_logging({"format": "json", "max_field_chars": 20}, stream=log_stream)
+    token = set_correlation_id("req-42")
+    try:
+        logging.getLogger("agents.test").info("rows: %s", list(range(100)), extra={"node": "sql_processor",
+                                                                                   "latency_s": 0.25})
+    finally:
+        reset_correlation_id(token)
+
+    (record,) = _json_lines(log_stream)
+    assert record["correlation_id"] == "req-42"
+    assert (record["node"], record["latency_s"]) == ("sql_processor", 0.25)
+    assert record["msg"].startswith("rows: [0, 1, 2, 3, 4") and "[truncated" in record["msg"]
+
+
+def test_sampling_drops_info_but_keeps_warnings(log_stream):
+    configure_logging({"format": "json", "sampling": {"noisy": 0.0}}, stream=log_stream)
+    noisy = logging.getLogger("noisy.child")
+    for _ in range(5):
+        noisy.info("dropped")
+    noisy.warning("kept")
+    logging.getLogger("quiet").info("kept too")
+
+    assert [record["msg"] for record in _json_lines(log_stream)] == ["kept", "kept too"]
+
+
+def test_messages_are_merged_on_the_listener_thread(log_stream):
+    class Spy:
+        def __str__(self):
+            threads.append(threading.current_thread())
+            return "spy"
+
+    threads = []
+    handler = configure_logging({"format": "text", "max_field_chars": 30}, stream=log_stream)
+    handler.prepare(logging.makeLogRecord({"msg": "via %s", "args": (Spy(),)}))
+    assert threads == [] # nothing is formatted on the calling thread
+
+    rows = [{"id": 1}]
+    logging.getLogger("agents.test").info("rows: %s", rows)
+    rows.append({"id": 2}) # changed after the call: the record keeps what was logged
+    logging.getLogger("agents.test").info("%s", "x" * 100)
+    shutdown_logging()
+
+    first, second = log_stream.getvalue().splitlines()
+    assert first.endswith("rows: [{'id': 1}]")
+    assert second.endswith("x" * 30 + "... [truncated 70 chars]")
+
+
+def test_registry_load_does_not_print(capsys):
+    utils.load_agent_registry(force_reload=True)
+    assert capsys.readouterr().out == ""
+
+
+def test_http_responses_echo_the_request_id():
+    from app import app as flask_app
+
+    response = flask_app.test_client().get("/", headers={"X-Request-ID": "abc123"})
+
+    assert response.headers["X-Request-ID"] == "abc123"
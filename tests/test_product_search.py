@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+
+from agents.sql_node import _execute_sql
+from db_connections import SQLiteConnectionManager
+from product_search import install_product_index, rewrite_like
+from sql_result_cache import install_change_tracking
+from sql_templates import VETTED_SQL_TEMPLATES
+
+STOCK = next(template for template in VETTED_SQL_TEMPLATES if template.name == "product_stock")
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "shop.db")
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("CREATE TABLE Products (id INTEGER PRIMARY KEY, name TEXT, price REAL, inventory_count INTEGER)")
+        conn.executemany("INSERT INTO Products VALUES (?, ?, ?, ?)", [
+            (1, "Nike Air Max", 129.99, 12), (2, "Wireless Mouse", 19.99, 100), (3, "Mouse Pad", 9.99, 40),
+            (4, "Mouse Mouse", 59.99, 7)])
+    conn.close()
+    return path
+
+
+def _write(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute(sql)
+    conn.close()
+
+
+def _rows(db_path, sql, params=None):
+    with SQLiteConnectionManager(db_path).connection() as conn:
+        return sorted(tuple(row) for row in conn.execute(sql, params or ()))
+
+
+def test_rewritten_like_returns_the_same_rows_and_follows_writes(db_path):
+    assert install_product_index(db_path) == 4
+    like = "SELECT p.id, p.name FROM Products p WHERE p.name LIKE '%mouse%' AND price < 50;"
+    rewritten, used = rewrite_like(like)
+
+    assert used and "p.id IN (SELECT rowid FROM Products_fts WHERE Products_fts MATCH '\"mouse\"')" in rewritten
+    assert _rows(db_path, rewritten) == _rows(db_path, like) == [(2, "Wireless Mouse"), (3, "Mouse Pad")]
+
+    _write(db_path, "INSERT INTO Products VALUES (5, 'Mouse Bungee', 14.99, 3)")
+    _write(db_path, "UPDATE Products SET name = 'Trackball' WHERE id = 2")
+    _write(db_path, "DELETE FROM Products WHERE id = 3")
+    assert _rows(db_path, rewritten) == _rows(db_path, like) == [(5, "Mouse Bungee")]
+
+
+def test_rewrite_keeps_like_the_index_cannot_answer():
+    for sql in ("SELECT * FROM Products WHERE name LIKE '%tv%'", # no trigram
+                "SELECT * FROM Products WHERE name LIKE '%a_b%'", # LIKE wildcard
+                "SELECT * FROM Customers WHERE name LIKE '%alice%'", # another table's name column
+                "SELECT c.name FROM Customers c JOIN Orders o ON o.customer_id = c.id JOIN Products p "
+                "ON p.id = o.product_id WHERE c.name LIKE '%alice%'",
+                "SELECT name FROM Customers, Products WHERE name LIKE '%alice%'"): # unqualified: could be either
+        assert rewrite_like(sql) == (sql, False)
+
+    join = "SELECT c.name FROM Customers c, Products p WHERE c.name LIKE '%alice%' AND p.name LIKE '%mouse%'"
+    rewritten, used = rewrite_like(join)
+    assert used and "c.name LIKE '%alice%' AND p.id IN (SELECT rowid FROM Products_fts" in rewritten
+
+    assert rewrite_like(STOCK.sql, {"product_name": "Ai"}) == (STOCK.sql, False)
+    rewritten, used = rewrite_like(STOCK.sql, {"product_name": "Air Max"})
+    assert used and """MATCH '"' || replace(:product_name, '"', '""') || '"'""" in rewritten
+
+
+def test_template_runs_ranked_through_the_index_with_the_result_cache(db_path):
+    install_product_index(db_path)
+    assert install_change_tracking(db_path) == ["Products"]
+    config = {"db_path": db_path, "result_cache": {"enabled": True}}
+    cache_stats = {"hits": 0, "misses": 0}
+
+    for _ in range(2):
+        results, error_msg, truncated = _execute_sql(config, STOCK.sql, {"product_name": "mouse"}, cache_stats,
+                                                     inspect_plan=False, fts_sql=STOCK.fts_sql)
+        # bm25: the name that repeats the term ranks first
+        assert (results, error_msg, truncated) == ([{"name": "Mouse Mouse", "inventory_count": 7},
+                                                    {"name": "Mouse Pad", "inventory_count": 40},
+                                                    {"name": "Wireless Mouse", "inventory_count": 100}], None, False)
+    assert cache_stats == {"hits": 1, "misses": 1}
+
+    _write(db_path, "UPDATE Products SET inventory_count = 0 WHERE id = 4")
+    results, _, _ = _execute_sql(config, STOCK.sql, {"product_name": "mouse"}, cache_stats, inspect_plan=False,
+                                 fts_sql=STOCK.fts_sql)
+    assert results[0] == {"name": "Mouse Mouse", "inventory_count": 0}
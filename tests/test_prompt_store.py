@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+import utils
+from prompt_store import PromptStore, PromptTemplate, render_placeholders
+
+
+@pytest.fixture
+def prompt_dir(tmp_path):
+    (tmp_path / "sql").mkdir()
+    path = tmp_path / "sql" / "v1.txt"
+    path.write_text("Schema: {db_schema}\nQuestion: {user_query}\nLiteral {{braces}}\n")
+    return tmp_path
+
+
+def test_format_matches_str_format(prompt_dir):
+    store = PromptStore(str(prompt_dir))
+    template = store.get(str(prompt_dir / "sql" / "v1.txt"))
+    values = {"db_schema": "Orders(id)", "user_query": "Where is order 7?"}
+
+    assert isinstance(template, str)
+    assert template.format(**values) == str.format(str(template), **values)
+    with pytest.raises(KeyError):
+        template.format(db_schema="x")
+
+
+def test_substitute_leaves_other_braces_alone():
+    template = PromptTemplate('Return JSON like {"intent": "X"} for "{user_query}" {unknown}')
+    assert template.substitute(user_query="hi") == 'Return JSON like {"intent": "X"} for "hi" {unknown}'
+    assert render_placeholders("plain {user_query}", user_query="hi") == "plain hi"
+
+
+def test_template_is_read_once_and_reloaded_on_change(prompt_dir):
+    store = PromptStore(str(prompt_dir), check_interval_seconds=0)
+    path = prompt_dir / "sql" / "v1.txt"
+    first = store.get(str(path))
+    assert store.get(str(path)) is first
+
+    path.write_text("Changed: {user_query}")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    reloaded = store.get(str(path))
+    assert reloaded.format(user_query="q") == "Changed: q"
+    assert store.metrics()["loads"] == 1 and store.metrics()["reloads"] == 1
+
+
+def test_render_metrics_and_preload(prompt_dir):
+    store = PromptStore(str(prompt_dir))
+    assert store.preload() == 1
+    template = store.get(str(prompt_dir / "sql" / "v1.txt"))
+    for _ in range(3):
+        template.format(db_schema="s", user_query="q")
+
+    metrics = store.metrics()["templates"][os.path.normpath(str(prompt_dir / "sql" / "v1.txt"))]
+    assert metrics["renders"] == 3 and metrics["mean_render_us"] > 0
+
+
+def test_load_prompt_from_path_uses_the_store(monkeypatch):
+    monkeypatch.setattr(utils, "_prompt_store", PromptStore("prompts"))
+
+    template = utils.load_prompt_from_path("prompts/response/v1_0_format.txt")
+
+    assert isinstance(template, PromptTemplate)
+    assert utils.load_prompt_from_path("prompts/response/v1_0_format.txt") is template
+    assert utils.load_prompt_from_path("prompts/does/not_exist.txt") == ""
@@ -0,0 +1,52 @@
+from agents.response_node import _plan_response
+from result_encoding import encode_rows
+
+ORDERS = [{"id": 1001, "status": "shipped", "customer": "Alice", "total": 20.0, "note": None},
+          {"id": 1002, "status": "shipped", "customer": "Alice", "total": 35.5, "note": "gift | wrap"},
+          {"id": 1003, "status": "shipped", "customer": "Bob", "total": 12.25, "note": None},
+          {"id": 1004, "status": "shipped", "customer": "Bob", "total": 8.0, "note": None},
+          {"id": 1005, "status": "shipped", "customer": "Carol", "total": 99.0, "note": None}]
+
+
+def test_rows_are_written_once_as_a_compact_table():
+    encoded = encode_rows(ORDERS)
+
+    assert encoded.text == "\n".join([
+        "5 rows",
+        "same in every row: status=shipped",
+        "id: min 1001, max 1005, avg 1003.0, sum 5015",
+        "total: min 8.0, max 99.0, avg 34.95, sum 174.75",
+        'columns: id | customer | total | note (" = same as the row above)',
+        "1001 | Alice | 20.0 | NULL",
+        '1002 | " | 35.5 | "gift | wrap"',
+        "1003 | Bob | 12.25 | NULL",
+        '1004 | " | 8.0 | "',
+        "1005 | Carol | 99.0 | \"",
+    ])
+    assert (encoded.rows_shown, encoded.rows_total) == (5, 5)
+    assert encode_rows([{"status": "shipped"}]).text == "1 row\ncolumns: status\nshipped"
+    assert encode_rows([]).text == "0 rows (no matching records)"
+
+
+def test_large_results_are_cut_to_the_token_budget_with_a_marker():
+    rows = [{"id": i, "email": f"user{i}@example.com", "inventory_count": i % 7} for i in range(10000)]
+
+    encoded = encode_rows(rows, {"max_tokens": 300}, more_at_source=True)
+
+    assert encoded.tokens <= 300 and 0 < encoded.rows_shown < 10000
+    assert encoded.text.splitlines()[0] == "10000 rows (the query matched more)"
+    assert encoded.text.splitlines()[-1] == f"... {10000 - encoded.rows_shown} more rows not shown"
+    assert "inventory_count: min 0, max 6, avg 3.0, sum 29994" in encoded.text # over every row, shown or not
+
+
+def test_response_prompt_carries_the_encoded_result(mock_initial_state):
+    config = {"prompt_path": "prompts/response/v1_0_format.txt", "llm_model": "gpt-4o"}
+    state = {**mock_initial_state, "intent": "SQL_QUERY_GENERAL", "sql_query_result": ORDERS[:2],
+             "sql_result_truncated": True}
+
+    _, prompt, context = _plan_response(state, config)
+    _, _, raw_context = _plan_response(state, {**config, "result_encoding": {"enabled": False}})
+
+    assert context.startswith("The database query for 'Test query' returned: \n2 rows (the query matched more)\n")
+    assert context in prompt and "'customer': 'Alice'" not in prompt
+    assert raw_context.endswith("(only the first 2 rows; the query matched more)")
@@ -0,0 +1,80 @@
+import shutil
+import sqlite3
+
+import pytest
+
+from agents.sql_node import _build_sql_prompt
+from product_search import install_product_index
+from schema_introspection import load_schema, prompt_schema, relevant_tables, render_schema
+from sql_backends import close_backends
+from sql_result_cache import install_change_tracking
+from utils import DB_SCHEMA_FOR_PROMPT
+
+STATUS_QUESTION = ("What is the status of order #1002?", "ORDER_STATUS", {"order_id": "1002"})
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "shop.db")
+    shutil.copyfile("data/ecommerce_support.db", path)
+    return path
+
+
+def _write(db_path, *statements):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        for sql in statements:
+            conn.execute(sql)
+    conn.close()
+
+
+def test_schema_is_read_from_the_database_and_refreshed_on_change(db_path):
+    install_product_index(db_path)
+    install_change_tracking(db_path)
+    conn = sqlite3.connect(db_path)
+
+    schema = load_schema(conn, db_path)
+    assert render_schema(schema) == DB_SCHEMA_FOR_PROMPT # internal tables left out, relationships inferred
+    assert load_schema(conn, db_path) is schema
+
+    _write(db_path, "ALTER TABLE Returns ADD COLUMN refund_amount REAL")
+    assert [column.name for column in load_schema(conn, db_path).tables["Returns"]][-1] == "refund_amount"
+    conn.close()
+
+
+def test_prompt_keeps_the_question_tables_as_the_schema_grows(db_path):
+    conn = sqlite3.connect(db_path)
+    schema = load_schema(conn, db_path)
+    assert relevant_tables(schema, "SQL_QUERY_GENERAL", {"order_id": "1003"}, "Email of whoever placed order 1003?") \
+        == ["Customers", "Orders"]
+    assert relevant_tables(schema, "SQL_QUERY_GENERAL", {}, "Which orders were returned and why?") == ["Orders", "Returns"]
+    assert relevant_tables(schema, None, None, "Hello there") == list(schema.tables)
+    before = prompt_schema(conn, db_path, STATUS_QUESTION[1], STATUS_QUESTION[2], STATUS_QUESTION[0])
+
+    _write(db_path, *(f"CREATE TABLE Warehouse{i} (id INTEGER PRIMARY KEY, {', '.join(f'c{j} TEXT' for j in range(20))})"
+                      for i in range(40)),
+           f"CREATE TABLE Shipments (id INTEGER PRIMARY KEY, order_id INTEGER, carrier TEXT, "
+           f"{', '.join(f'extra{j} TEXT' for j in range(20))})")
+
+    assert prompt_schema(conn, db_path, STATUS_QUESTION[1], STATUS_QUESTION[2], STATUS_QUESTION[0]) == before
+    shipments = prompt_schema(conn, db_path, "SQL_QUERY_GENERAL", {"order_id": "1002"}, "Which carrier has order 1002?")
+    assert "Shipments(id INTEGER PRIMARY KEY, order_id INTEGER, carrier TEXT)" in shipments # wide table: keys + mentioned
+    assert "- Shipments.order_id references Orders.id" in shipments and "Warehouse" not in shipments
+    conn.close()
+
+
+def test_sql_prompt_uses_the_pruned_live_schema(db_path):
+    config = {"db_path": db_path, "prompt_path": "prompts/sql/v1_2_schema.txt"}
+
+    prompt = _build_sql_prompt(config, STATUS_QUESTION[0], STATUS_QUESTION[1], STATUS_QUESTION[2])
+    static = _build_sql_prompt({**config, "schema": {"live": False}}, STATUS_QUESTION[0], STATUS_QUESTION[1],
+                               STATUS_QUESTION[2])
+
+    assert "1. Orders(id INTEGER PRIMARY KEY, customer_id INTEGER, order_date TEXT, status TEXT)" in prompt
+    assert "Customers(" not in prompt and "Customers(" in static
+    assert len(prompt) < len(static)
+
+    # Introspection reads SQLite pragmas: another backend's database gets the static schema
+    dbapi = {**config, "backend": {"name": "dbapi", "driver": "sqlite3", "connect_args": {"database": db_path}}}
+    assert _build_sql_prompt(dbapi, STATUS_QUESTION[0], STATUS_QUESTION[1], STATUS_QUESTION[2]) == static
+    close_backends()
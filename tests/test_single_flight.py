@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import utils
+from single_flight import SingleFlight
+
+
+def test_threads_with_same_key_share_one_call():
+    flight = SingleFlight()
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def upstream():
+        calls.append(1)
+        time.sleep(0.2)
+        return "policy text"
+
+    def caller(_):
+        barrier.wait()
+        return flight.do("return policy", upstream)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(caller, range(8)))
+
+    assert len(calls) == 1
+    assert {r[0] for r in results} == {"policy text"}
+    assert sum(coalesced for _, coalesced in results) == 7
+    assert flight.saved_calls() == 7
+
+
+def test_thread_waiters_receive_the_leaders_exception():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("upstream down")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(flight.do, "k", failing)
+        started.wait()
+        follower = pool.submit(flight.do, "k", failing)
+        with pytest.raises(RuntimeError):
+            leader.result()
+        with pytest.raises(RuntimeError):
+            follower.result()
+
+
+def test_async_callers_share_one_call_and_survive_caller_cancellation():
+    flight = SingleFlight()
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return [0.1, 0.2]
+
+    async def scenario():
+        first = asyncio.ensure_future(flight.ado("q", upstream))
+        await asyncio.sleep(0)
+        others = [flight.ado("q", upstream) for _ in range(4)]
+        first.cancel() # The leader's caller goes away; the shared request keeps running
+        return await asyncio.gather(*others)
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(r == ([0.1, 0.2], True) for r in results)
+
+
+def test_get_embeddings_coalesces_identical_concurrent_queries(mock_openai_client):
+    embedding_response = mock_openai_client.embeddings.create.return_value
+
+    def slow_create(**kwargs):
+        time.sleep(0.2)
+        return embedding_response
+    mock_openai_client.embeddings.create.side_effect = slow_create
+    saved_before = utils.get_coalescing_stats()["embeddings"]["coalesced"]
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        results = list(pool.map(lambda _: utils.get_embeddings(["what is your return policy"]), range(5)))
+
+    assert all(r == results[0] for r in results)
+    assert mock_openai_client.embeddings.create.call_count == 1
+    assert utils.get_coalescing_stats()["embeddings"]["coalesced"] - saved_before == 4
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+import pytest
+
+import speculation
+
+
+@pytest.fixture
+def branches(monkeypatch):
+    def slow_search(query):
+        time.sleep(0.05)
+        return [{"source": "returns.txt", "text": query}]
+
+    async def aslow_search(query):
+        await asyncio.sleep(0.05)
+        return [{"source": "returns.txt", "text": query}]
+
+    monkeypatch.setitem(speculation._branches, "retrieval_processor",
+                        speculation.SpeculativeBranch(slow_search, aslow_search, lambda q: 0.0001))
+    monkeypatch.setitem(speculation._branches, "sql_processor",
+                        speculation.SpeculativeBranch(lambda q: ("SELECT 1;", None, None), None, lambda q: 0.005))
+    return {"enabled": True, "branches": ["sql_processor", "retrieval_processor"], "max_cost_usd": 0.01}
+
+
+def test_routed_branch_keeps_its_work_and_the_rest_is_wasted(branches):
+    record = speculation.start(branches, "How long does a refund take?")
+    time.sleep(0.06) # the intent LLM call
+    state = speculation.settle(record, {"intent": "RETURN_INFO"})
+
+    assert (state["speculation"]["kept"], state["speculation"]["discarded"]) == ("retrieval_processor", ["sql_processor"])
+    assert state["speculation"]["wasted_cost_usd"] == 0.005
+    contexts, update = speculation.claim(state, "retrieval_processor")
+    assert contexts[0]["text"] == "How long does a refund take?"
+    assert update["speculation"]["saved_s"] >= 0.04
+    assert speculation.claim(state, "retrieval_processor") == (None, {}) # claimed once
+
+
+def test_budget_skips_expensive_branches(branches):
+    branches["max_cost_usd"] = 0.001
+
+    record = speculation.start(branches, "Do you have Nike Air Max in stock?")
+    state = speculation.settle(record, {"intent": "PRODUCT_AVAILABILITY"})
+
+    assert record["launched"] == ["retrieval_processor"]
+    assert state["speculation"]["kept"] is None
+    assert speculation.claim(state, "sql_processor") == (None, {})
+
+
+def test_async_work_is_cancelled_when_not_routed(branches):
+    async def run():
+        record = speculation.astart({**branches, "branches": ["retrieval_processor"]}, "Where is my order #7?")
+        return speculation.settle(record, {"intent": "ORDER_STATUS"})
+
+    state = asyncio.run(run())
+
+    assert state["speculation"]["discarded"] == ["retrieval_processor"]
+    assert speculation.start({"enabled": False}, "hi") is None
+
+
+def test_report_sums_saved_and_wasted_work():
+    from run_evaluation import speculation_report_lines
+
+    records = [{"launched": ["retrieval_processor", "sql_processor"], "kept": "retrieval_processor",
+                "saved_s": 0.3, "wasted_s": 0.25, "wasted_cost_usd": 0.004}, None]
+    report = "\n".join(speculation_report_lines([{"speculation": record} for record in records]))
+
+    assert "**Branch Work Kept:** 1/2" in report and "**Time Saved:** 0.3000s" in report
+    assert "**Cost Wasted (estimated):** $0.004000" in report
@@ -0,0 +1,119 @@
+import asyncio
+import shutil
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from agents.sql_node import _aexecute_sql, _execute_sql
+from chat_stream import HEARTBEAT, cancellable_events
+from sql_backends import (CancellationToken, QueryCancelled, SqlBackend, backend_for, cancellation_scope, close_backends,
+                          register_backend)
+from sql_templates import VETTED_SQL_TEMPLATES
+
+ENDLESS_SQL = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) SELECT count(*) FROM n"
+STOCK = next(template for template in VETTED_SQL_TEMPLATES if template.name == "product_stock")
+
+
+@pytest.fixture
+def config(tmp_path):
+    path = str(tmp_path / "shop.db")
+    shutil.copyfile("data/ecommerce_support.db", path)
+    yield {"db_path": path, "guard": {"time_limit_ms": 60000}, "backend": {"pool_size": 2}}
+    close_backends()
+
+
+def test_async_statements_run_on_the_backend_threads(config):
+    async def run():
+        loop_thread = threading.get_ident()
+        threads = set()
+
+        def work(conn):
+            threads.add(threading.get_ident())
+            time.sleep(0.05)
+            return conn.execute("SELECT status FROM Orders WHERE id = 1002").fetchone()[0]
+
+        backend = backend_for(config)
+        statuses = await asyncio.gather(*(backend.arun(work) for _ in range(4)))
+        results, error_msg, _ = await _aexecute_sql(config, "SELECT id FROM Orders WHERE id = :id", {"id": 1002})
+        return loop_thread, threads, statuses, results, error_msg
+
+    loop_thread, threads, statuses, results, error_msg = asyncio.run(run())
+
+    assert len(set(statuses)) == 1 and loop_thread not in threads
+    assert len(threads) == 2 # pool_size
+    assert (results, error_msg) == ([{"id": 1002}], None)
+
+
+def test_cancelled_requests_stop_their_statement(config):
+    async def cancel_task():
+        task = asyncio.ensure_future(_aexecute_sql(config, ENDLESS_SQL))
+        await asyncio.sleep(0.2)
+        started = time.perf_counter()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return time.perf_counter() - started
+
+    assert asyncio.run(cancel_task()) < 1.0
+
+    token = CancellationToken()
+    threading.Timer(0.2, token.cancel).start()
+    with cancellation_scope(token), pytest.raises(QueryCancelled):
+        _execute_sql(config, ENDLESS_SQL)
+    assert _execute_sql(config, "SELECT COUNT(*) AS n FROM Orders")[0][0]["n"] > 0 # the pooled connection still works
+
+    # /chat/stream: the client going away closes the relay, which cancels the SQL of the run
+    outcome = []
+
+    def events():
+        try:
+            _execute_sql(config, ENDLESS_SQL)
+        except QueryCancelled:
+            outcome.append("cancelled")
+        yield {"event": "done"}
+
+    stream = cancellable_events(events, heartbeat_seconds=0.05)
+    assert next(stream) == HEARTBEAT
+    stream.close()
+    deadline = time.monotonic() + 2
+    while not outcome and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert outcome == ["cancelled"]
+
+
+def test_dbapi_backend_pools_connections_and_binds_template_parameters(config):
+    conn = sqlite3.connect(config["db_path"])
+    with conn:
+        conn.executemany("INSERT INTO Products (name, inventory_count) VALUES (?, ?)",
+                         [(f"Mouse {i}", i) for i in range(5)])
+    conn.close()
+    dbapi = {**config, "backend": {"name": "dbapi", "driver": "sqlite3", "pool_size": 2,
+                                   "connect_args": {"database": config["db_path"], "check_same_thread": False}},
+             "guard": {"max_rows": 3}}
+
+    results, error_msg, truncated = _execute_sql(dbapi, STOCK.sql, {"product_name": "mouse"})
+    assert error_msg is None and truncated and len(results) == 3 # the row cap still applies
+    assert asyncio.run(_aexecute_sql(dbapi, STOCK.sql, {"product_name": "Mouse 4"}))[0] == [{"name": "Mouse 4", "inventory_count": 4}]
+    assert backend_for(dbapi).bind(STOCK.sql, {"product_name": "x"})[1] == ["x"] # sqlite3 is qmark style
+    assert backend_for(dbapi).stats["opened"] <= 2
+
+    assert _execute_sql(dbapi, "SELECT * FROM Nope")[1].startswith("Database error:")
+    missing = {**dbapi, "backend": {"name": "dbapi", "driver": "no_such_driver"}}
+    assert _execute_sql(missing, "SELECT 1")[1].startswith("Database unavailable:")
+
+
+def test_backend_without_cancel_fails_when_built(config):
+    class NoCancel(SqlBackend):
+        name = "no_cancel"
+
+        def __init__(self, settings, node_config):
+            super().__init__(settings)
+
+        def _connection(self):
+            return None
+
+    register_backend(NoCancel.name, NoCancel)
+    with pytest.raises(TypeError, match="_cancel"):
+        backend_for({**config, "backend": {"name": "no_cancel"}})
@@ -0,0 +1,44 @@
+import sqlite3
+
+import pytest
+
+from sql_guard import SqlGuardError, execute_guarded
+
+SETTINGS = {"max_rows": 5, "fetch_batch_size": 2, "large_table_rows": 100}
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("CREATE TABLE Orders (id INTEGER PRIMARY KEY, customer_id INTEGER, status TEXT)")
+    conn.execute("CREATE TABLE Customers (id INTEGER PRIMARY KEY, email TEXT)")
+    conn.executemany("INSERT INTO Orders VALUES (?, ?, 'shipped')", [(i, i % 50) for i in range(1, 1001)])
+    conn.executemany("INSERT INTO Customers VALUES (?, ?)", [(i, f"c{i}@example.com") for i in range(1, 1001)])
+    yield conn
+    conn.close()
+
+
+def test_full_scan_of_a_large_table_is_limited_and_truncated(conn):
+    result = execute_guarded(conn, "SELECT * FROM Orders;", settings=SETTINGS)
+
+    assert (len(result.rows), result.truncated, result.rewritten, result.full_scans) == (5, True, True, ["orders"])
+    for commented in ("SELECT * FROM Orders WHERE status LIKE '%ship%'; -- Note: every order", "SELECT * FROM Orders -- all"):
+        assert len(execute_guarded(conn, commented, settings=SETTINGS).rows) == 5 # the LIMIT wrapper survives comments
+    lookup = execute_guarded(conn, "SELECT status FROM Orders WHERE id = ?", (7,), settings=SETTINGS)
+    assert (lookup.rows, lookup.truncated, lookup.rewritten) == ([{"status": "shipped"}], False, False)
+
+
+def test_cartesian_join_and_reject_policy(conn):
+    with pytest.raises(SqlGuardError, match="joins large tables"):
+        execute_guarded(conn, "SELECT o.id FROM Orders o, Customers c", settings=SETTINGS)
+    with pytest.raises(SqlGuardError, match="scans the whole orders table"):
+        execute_guarded(conn, "SELECT * FROM Orders", settings={**SETTINGS, "on_full_scan": "reject"})
+
+
+def test_time_limit_interrupts_and_leaves_the_connection_usable(conn):
+    slow = "SELECT COUNT(*) AS n FROM Orders a, Orders b, Orders c"
+    with pytest.raises(SqlGuardError, match="ran longer than 50ms"):
+        execute_guarded(conn, slow, settings={**SETTINGS, "on_full_scan": "allow", "time_limit_ms": 50})
+
+    assert execute_guarded(conn, "SELECT 1 AS one", settings=SETTINGS).rows == [{"one": 1}]
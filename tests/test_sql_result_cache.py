@@ -0,0 +1,94 @@
+import sqlite3
+
+import pytest
+
+from db_connections import SQLiteConnectionManager
+from sql_result_cache import SqlResultCache, install_change_tracking, normalize_sql
+
+STATUS_SQL = "SELECT status FROM Orders WHERE id = :order_id;"
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "shop.db")
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("CREATE TABLE Orders (id INTEGER PRIMARY KEY, status TEXT)")
+        conn.execute("CREATE TABLE Returns (order_id INTEGER, reason TEXT)")
+        conn.execute("INSERT INTO Orders VALUES (1002, 'shipped')")
+    conn.close()
+    return path
+
+
+def _write(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute(sql)
+    conn.close()
+
+
+def _query(cache, conn, sql, params=None):
+    rows, pending = cache.lookup(conn, sql, params)
+    if rows is None:
+        rows = [dict(row) for row in conn.execute(sql, params or ()).fetchall()]
+        cache.store(pending, rows)
+    return rows
+
+
+def test_any_write_invalidates_without_change_tracking(db_path):
+    cache = SqlResultCache({"enabled": True})
+    with SQLiteConnectionManager(db_path).connection() as conn:
+        assert _query(cache, conn, STATUS_SQL, {"order_id": 1002}) == [{"status": "shipped"}]
+        assert _query(cache, conn, "select status  from Orders where id = :order_id", {"order_id": 1002}) == \
+            [{"status": "shipped"}]
+        assert cache.stats["hits"] == 1
+
+        _write(db_path, "INSERT INTO Returns VALUES (1002, 'Wrong size')")
+        _write(db_path, "UPDATE Orders SET status = 'delivered'")
+
+        assert _query(cache, conn, STATUS_SQL, {"order_id": 1002}) == [{"status": "delivered"}]
+    assert normalize_sql("SELECT  'A  b' FROM Orders;") == "select 'A  b' from orders"
+
+
+def test_change_counters_only_invalidate_the_tables_written(db_path):
+    install_change_tracking(db_path)
+    cache = SqlResultCache({"enabled": True})
+    with SQLiteConnectionManager(db_path).connection() as conn:
+        _query(cache, conn, STATUS_SQL, {"order_id": 1002})
+        _write(db_path, "INSERT INTO Returns VALUES (1002, 'Wrong size')")
+        _query(cache, conn, STATUS_SQL, {"order_id": 1002})
+        assert (cache.stats["hits"], cache.stats["stale"]) == (1, 0)
+
+        _write(db_path, "UPDATE Orders SET status = 'delivered'")
+
+        assert _query(cache, conn, STATUS_SQL, {"order_id": 1002}) == [{"status": "delivered"}]
+        assert cache.stats["stale"] == 1
+
+
+def test_size_limit_and_per_table_ttl(db_path):
+    cache = SqlResultCache({"enabled": True, "max_rows": 0, "table_ttl_seconds": {"Returns": 0}})
+    with SQLiteConnectionManager(db_path).connection() as conn:
+        _query(cache, conn, STATUS_SQL, {"order_id": 1002})
+        cache.settings["max_rows"] = 10
+        _query(cache, conn, "SELECT reason FROM Returns")
+        _query(cache, conn, "SELECT reason FROM Returns")
+    assert cache.stats["too_large"] == 1
+    assert (cache.stats["stored"], cache.stats["hits"], len(cache.entries)) == (0, 0, 0)
+
+
+def test_comma_joined_tables_are_tracked_too(db_path):
+    _write(db_path, "CREATE TABLE Customers (id INTEGER PRIMARY KEY, name TEXT)")
+    _write(db_path, "INSERT INTO Customers VALUES (1, 'Alice Smith')")
+    _write(db_path, "ALTER TABLE Orders ADD COLUMN customer_id INTEGER")
+    _write(db_path, "UPDATE Orders SET customer_id = 1")
+    install_change_tracking(db_path)
+    cache = SqlResultCache({"enabled": True})
+    sql = "SELECT c.name FROM Orders o, Customers c WHERE o.customer_id = c.id AND o.id = :order_id"
+    with SQLiteConnectionManager(db_path).connection() as conn:
+        assert _query(cache, conn, sql, {"order_id": 1002}) == [{"name": "Alice Smith"}]
+
+        _write(db_path, "UPDATE Customers SET name = 'CHANGED'")
+
+        assert _query(cache, conn, sql, {"order_id": 1002}) == [{"name": "CHANGED"}]
+        _query(cache, conn, "SELECT value FROM json_each('[1, 2]')")
+        assert cache.stats["untracked"] == 1 # not a table: never cached
@@ -0,0 +1,51 @@
+from sql_templates import SqlTemplateLibrary, parameterize
+
+QUERY = "What date was order #1002 placed on?"
+LLM_SQL = "SELECT order_date FROM Orders WHERE id = {};"
+
+
+def test_vetted_templates_bind_entities_as_parameters():
+    library = SqlTemplateLibrary()
+
+    stock = library.match("v1", "PRODUCT_AVAILABILITY", {"product_name": "Nike Air Max"}, "Any Nike Air Max left?")
+    email = library.match("v1", "SQL_QUERY_GENERAL", {"order_id": "1003"}, "Email of whoever placed order 1003?")
+
+    assert stock.params == {"product_name": "Nike Air Max"}
+    assert stock.rendered_sql == "SELECT name, inventory_count FROM Products WHERE name LIKE '%Nike Air Max%';"
+    assert (email.template.name, email.params) == ("customer_email_by_order", {"order_id": 1003})
+    assert library.match("v1", "ORDER_STATUS", {"order_id": "12; DROP TABLE Orders"}, "status?") is None
+    assert library.match("v1", "SQL_QUERY_GENERAL", {}, "Which orders were returned and why?") is None
+    assert library.stats["vetted_hits"] == 2 and library.stats["misses"] == 2
+
+
+def test_repeated_llm_sql_shape_is_learned():
+    library = SqlTemplateLibrary(min_occurrences=3)
+    for order_id in ("1002", "1002"):
+        assert library.observe("v1", "SQL_QUERY_GENERAL", {"order_id": order_id}, QUERY.replace("1002", order_id),
+                               LLM_SQL.format(order_id)) is None
+    assert library.match("v1", "SQL_QUERY_GENERAL", {"order_id": "1004"}, "What date was order #1004 placed on?") is None
+
+    learned = library.observe("v1", "SQL_QUERY_GENERAL", {"order_id": "1003"}, "What date was order #1003 placed on?",
+                              LLM_SQL.format(1003))
+
+    assert learned.sql == "SELECT order_date FROM Orders WHERE id = :order_id;"
+    match = library.match("v1", "SQL_QUERY_GENERAL", {"order_id": "1004"}, "What date was order #1004 placed on?")
+    assert (match.template.source, match.rendered_sql) == ("learned", LLM_SQL.format(1004))
+    assert library.match("v2", "SQL_QUERY_GENERAL", {"order_id": "1004"}, "What date was order #1004 placed on?") is None
+
+
+def test_question_shape_with_several_sql_shapes_is_not_learned():
+    library = SqlTemplateLibrary(min_occurrences=2)
+    library.observe("v1", "SQL_QUERY_GENERAL", {"order_id": "1"}, "Tell me about order 1", LLM_SQL.format(1))
+    library.observe("v1", "SQL_QUERY_GENERAL", {"order_id": "2"}, "Tell me about order 2",
+                    "SELECT status FROM Orders WHERE id = 2;")
+    library.observe("v1", "SQL_QUERY_GENERAL", {"order_id": "3"}, "Tell me about order 3", LLM_SQL.format(3))
+
+    assert library.stats["learned"] == 0
+    assert parameterize("SELECT * FROM Products WHERE name LIKE '%nike%';", {"product_name": "Nike Air Max"}) is None
+    # only compared literals are entity values; the LIMIT keeps its 1
+    assert parameterize("SELECT status FROM Orders WHERE id = 1 LIMIT 1;", {"order_id": 1}) == \
+        "SELECT status FROM Orders WHERE id = :order_id LIMIT 1;"
+    assert parameterize("SELECT * FROM Orders WHERE id IN (7, 1) ORDER BY 1", {"order_id": 1}) == \
+        "SELECT * FROM Orders WHERE id IN (7, :order_id) ORDER BY 1"
+    assert parameterize("SELECT * FROM Orders ORDER BY order_date DESC LIMIT 1", {"order_id": 1}) is None
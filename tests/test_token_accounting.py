@@ -0,0 +1,91 @@
+import pytest
+
+import utils
+from agents.response_node import response_synthesis_node
+from run_evaluation import aggregate_node_metrics, token_cost_report_lines
+from token_accounting import count_message_tokens, estimate_cost_usd, new_token_usage
+
+
+@pytest.fixture
+def api_usage(mock_openai_client):
+    usage = mock_openai_client.chat.completions.create.return_value.usage
+    usage.prompt_tokens = 120
+    usage.completion_tokens = 30
+    return usage
+
+
+def test_prompt_counting_grows_with_the_prompt():
+    short = count_message_tokens([{"role": "system", "content": "Where is my order?"}])
+    longer = count_message_tokens([{"role": "system", "content": "Where is my order? " * 50}])
+    assert 0 < short < longer
+
+
+def test_usage_is_estimated_when_the_api_reports_none():
+    token_usage = new_token_usage()
+
+    utils.get_llm_response("Where is my order?", model="gpt-4o", token_usage=token_usage)
+
+    assert token_usage["calls"] == 1
+    assert token_usage["estimated_prompt_tokens"] > 0
+    assert token_usage["cost_usd"] > 0
+
+
+def test_api_reported_counts_win_over_the_estimate(api_usage):
+    token_usage = new_token_usage()
+    utils.get_llm_response("Where is my order?", model="gpt-4o", token_usage=token_usage)
+
+    assert (token_usage["prompt_tokens"], token_usage["completion_tokens"]) == (120, 30)
+    assert token_usage["cost_usd"] == pytest.approx(estimate_cost_usd("gpt-4o", 120, 30))
+
+
+def test_node_output_budget_and_stop_sequences_reach_the_request(mock_openai_client):
+    options = utils.llm_options_for_node({"max_output_tokens": 200, "stop": ["\n\nQuery:"]})
+
+    utils.get_llm_response("Classify this", model="gpt-4o", **options)
+
+    kwargs = mock_openai_client.chat.completions.create.call_args.kwargs
+    assert kwargs["max_tokens"] == 200
+    assert kwargs["stop"] == ["\n\nQuery:"]
+
+
+def test_max_tokens_is_trimmed_to_the_context_window(mock_openai_client):
+    utils.get_llm_response("Hello", model="gpt-4o", max_tokens=500000)
+    assert mock_openai_client.chat.completions.create.call_args.kwargs["max_tokens"] < 128000
+
+
+def test_cache_hits_are_counted_but_not_billed(monkeypatch, api_usage):
+    monkeypatch.setattr(utils, "_llm_cache", None)
+    token_usage = new_token_usage()
+    for _ in range(2):
+        utils.get_llm_response("Say hi", model="gpt-4o", use_cache=True, token_usage=token_usage)
+
+    assert token_usage["calls"] == 2 and token_usage["cached_calls"] == 1
+    assert token_usage["prompt_tokens"] == 120
+
+
+def test_node_records_usage_in_state(mock_initial_state, api_usage):
+    mock_initial_state["intent"] = "ORDER_STATUS"
+    mock_initial_state["sql_query_result"] = [{"status": "shipped"}]
+
+    result = response_synthesis_node(mock_initial_state)
+
+    assert result["node_token_usage"]["response_synthesizer"]["total_tokens"] == 150
+
+
+def test_evaluation_report_aggregates_tokens_and_cost():
+    results = [
+        {"type": "SQL", "total_latency": 1.0, "node_latencies": {"intent_parser": 0.4, "sql_processor": 0.6},
+         "node_token_usage": {"intent_parser": {"calls": 1, "prompt_tokens": 100, "completion_tokens": 20,
+                                                "total_tokens": 120, "cost_usd": 0.00045}}},
+        {"type": "SQL", "total_latency": 2.0, "node_latencies": {"intent_parser": 0.5},
+         "node_token_usage": {"intent_parser": {"calls": 1, "prompt_tokens": 100, "completion_tokens": 20,
+                                                "total_tokens": 120, "cost_usd": 0.00045}}},
+    ]
+
+    per_node = aggregate_node_metrics(results)
+    assert per_node["intent_parser"]["total_tokens"] == 240
+    assert per_node["sql_processor"]["latencies"] == [0.6]
+
+    report = "\n".join(token_cost_report_lines(results))
+    assert "| intent_parser | 2 | 0.4500 |" in report
+    assert "**Total Tokens:** 240" in report
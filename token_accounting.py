@@ -0,0 +1,100 @@
+# token_accounting.py
+"""
+Token counting and per-node usage/cost bookkeeping for LLM calls.
+
+Prompts are counted with tiktoken before the call (same tokenizer build_document_index.py uses);
+completion tokens come from the API's `usage` block when present, else they are counted locally.
+If the tiktoken encoding files cannot be loaded (e.g. offline), a ~4 chars/token estimate is used.
+"""
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import tiktoken
+
+logger = logging.getLogger(__name__) # utils imports this module, so it cannot use utils.logger
+
+# USD per 1M tokens; override/extend with the `model_pricing` section of agent_registry.yaml
+DEFAULT_MODEL_PRICING = {
+    "gpt-4o": {"input": 2.50, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "output": 0.60},
+    "text-embedding-3-small": {"input": 0.02, "output": 0.0},
+}
+DEFAULT_CONTEXT_WINDOW = 128000
+# Per-message framing tokens of the chat format (role/separators) and the reply primer
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+
+@lru_cache(maxsize=None)
+def _encoding_for(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    except Exception as e:
+        logger.warning("tiktoken encoding for '%s' unavailable (%s); estimating token counts.", model, e)
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning("tiktoken fallback encoding unavailable (%s); estimating token counts.", e)
+        return None
+
+
+def count_text_tokens(text: str, model: str = "gpt-4o") -> int:
+    if not text:
+        return 0
+    encoding = _encoding_for(model or "gpt-4o")
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(messages: List[Dict[str, str]], model: str = "gpt-4o") -> int:
+    """Prompt tokens for a chat request, including the chat-format overhead."""
+    return sum(TOKENS_PER_MESSAGE + count_text_tokens(m.get("content") or "", model) for m in messages) + TOKENS_PER_REPLY
+
+
+def estimate_cost_usd(model: str, prompt_tokens: int, completion_tokens: int, pricing: Optional[dict] = None) -> float:
+    prices = {**DEFAULT_MODEL_PRICING, **(pricing or {})}.get(model)
+    if not prices:
+        return 0.0
+    return (prompt_tokens * prices.get("input", 0.0) + completion_tokens * prices.get("output", 0.0)) / 1_000_000
+
+
+def new_token_usage() -> Dict[str, float]:
+    """Per-node accumulator filled by get_llm_response(token_usage=...)."""
+    return {"calls": 0, "cached_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0,
+            "estimated_prompt_tokens": 0, "cost_usd": 0.0}
+
+
+def record_usage(token_usage: Optional[dict], model: str, estimated_prompt_tokens: int,
+                 prompt_tokens: Optional[int] = None, completion_tokens: int = 0, cached: bool = False,
+                 pricing: Optional[dict] = None, price_factor: float = 1.0):
+    """
+    Adds one LLM call to a node's usage. Cached or coalesced calls are counted but not billed.
+    prompt_tokens is the API-reported count; the pre-flight estimate is used when it is missing.
+    price_factor scales the cost, e.g. for discounted Batch API calls.
+    """
+    if token_usage is None:
+        return
+    token_usage["calls"] += 1
+    token_usage["estimated_prompt_tokens"] += estimated_prompt_tokens
+    if cached:
+        token_usage["cached_calls"] += 1
+        return
+    prompt_tokens = estimated_prompt_tokens if prompt_tokens is None else prompt_tokens
+    token_usage["prompt_tokens"] += prompt_tokens
+    token_usage["completion_tokens"] += completion_tokens
+    token_usage["total_tokens"] += prompt_tokens + completion_tokens
+    token_usage["cost_usd"] = round(token_usage["cost_usd"] + estimate_cost_usd(model, prompt_tokens, completion_tokens, pricing) * price_factor, 6)
+
+
+def api_usage_counts(usage) -> Optional[tuple]:
+    """(prompt_tokens, completion_tokens) from an OpenAI `usage` object, or None if it is absent/malformed."""
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if isinstance(prompt_tokens, int) and isinstance(completion_tokens, int):
+        return prompt_tokens, completion_tokens
+    return None
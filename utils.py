@@ -2,15 +2,25 @@
 import yaml
 import os
 from dotenv import load_dotenv
-from openai import OpenAI, OpenAIError
+from openai import OpenAIError
+from langgraph.config import get_config, get_stream_writer
 import importlib
+import time
+import threading
 import logging
 import json
 from typing import TypedDict, Optional, List, Dict, Any
 from graph_state import AgentState
+from caching import TTLCache, SQLiteCache, LLMResponseCache
+from single_flight import SingleFlight
+from llm_transport import ResilientTransport, CircuitOpenError, build_openai_clients
+from prompt_store import PromptStore
+from batch_runner import current_batch_session, BATCH_PRICE_FACTOR
+import log_pipeline
+from token_accounting import (count_message_tokens, count_text_tokens, record_usage, api_usage_counts,
+                              DEFAULT_CONTEXT_WINDOW)
 
-# Setup basic logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Logging is configured by configure_logging() below, once the registry is loaded
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -21,47 +31,36 @@ if not OPENAI_API_KEY:
     logger.critical("OPENAI_API_KEY not found in .env file. Application may not function.")
     # raise ValueError("OPENAI_API_KEY not found. Please set it in your .env file.")
 
-# Initialize OpenAI client
-# Use a try-except block for robustness, especially if key might be missing/invalid
-try:
-    client = OpenAI(api_key=OPENAI_API_KEY)
-except OpenAIError as e:
-    logger.critical(f"Failed to initialize OpenAI client: {e}")
-    client = None # Ensure client is None if initialization fails
-
-
 AGENT_REGISTRY_PATH = "agent_registry.yaml"
 _agent_registry_cache = None
 
 def load_agent_registry(force_reload=False):
     """Loads the agent registry YAML file with caching."""
     global _agent_registry_cache
-        # CI DEBUG
-    print(f"[DEBUG utils.py] load_agent_registry called. force_reload={force_reload}. Cache is None: {_agent_registry_cache is None}")
-    # Check if file exists
-    if os.path.exists(AGENT_REGISTRY_PATH):
-        print(f"[DEBUG utils.py] {AGENT_REGISTRY_PATH} exists. Content peek:")
-        try:
-            with open(AGENT_REGISTRY_PATH, 'r') as f_peek:
-                print(f_peek.read(200)) # Print first 200 chars
-        except Exception as e_peek:
-            print(f"[DEBUG utils.py] Error peeking content: {e_peek}")
-    else:
-        print(f"[DEBUG utils.py] {AGENT_REGISTRY_PATH} DOES NOT EXIST.")
-    # END CI DEBUG
     if _agent_registry_cache is None or force_reload:
         try:
             with open(AGENT_REGISTRY_PATH, 'r') as f:
                 _agent_registry_cache = yaml.safe_load(f)
             logger.info("Agent registry loaded successfully.")
         except FileNotFoundError:
-            logger.error(f"Agent registry file not found at {AGENT_REGISTRY_PATH}")
+            logger.error("Agent registry file not found at %s", AGENT_REGISTRY_PATH)
             _agent_registry_cache = {} # Return empty dict on error
         except yaml.YAMLError as e:
-            logger.error(f"Error parsing agent registry YAML: {e}")
+            logger.error("Error parsing agent registry YAML: %s", e)
             _agent_registry_cache = {}
     return _agent_registry_cache
 
+def configure_logging(settings: Optional[dict] = None):
+    """
+    The one place logging is set up: a queue handler on the root logger and a listener thread that
+    formats (text or JSON) and writes records; see log_pipeline.py and the registry's `logging` section.
+    """
+    if settings is None:
+        settings = (load_agent_registry() or {}).get("logging")
+    return log_pipeline.configure_logging(settings)
+
+configure_logging()
+
 def get_node_config(node_name: str, version: Optional[str] = None) -> dict:
     registry = load_agent_registry()
     if not registry:
@@ -70,40 +69,180 @@ def get_node_config(node_name: str, version: Optional[str] = None) -> dict:
 
     node_entry = registry.get("nodes", {}).get(node_name)
     if not node_entry:
-        logger.warning(f"Node '{node_name}' not found in registry")
+        logger.warning("Node '%s' not found in registry", node_name)
         return {}
 
     # If version is not provided, try to use the active version
     if version is None:
         version = registry.get("active_node_versions", {}).get(node_name)
         if not version:
-            logger.warning(f"No active version for node '{node_name}'")
+            logger.warning("No active version for node '%s'", node_name)
             return {}
 
-    if node_entry.get("version") != version:
-        logger.warning(f"Requested version '{version}' for node '{node_name}' does not match the configured version '{node_entry.get('version')}'")
+    if node_entry.get("version") == version:
+        return node_entry
+
+    # Alternative versions live under `versions:` and only list the keys they change
+    override = (node_entry.get("versions") or {}).get(version)
+    if override is None:
+        logger.warning("Requested version '%s' for node '%s' does not match the configured version '%s'",
+                       version, node_name, node_entry.get('version'))
         return {}
+    merged = {key: value for key, value in node_entry.items() if key != "versions"}
+    merged.update(override)
+    merged["version"] = version
+    return merged
+
+
+# Initialize OpenAI client
+# Use a try-except block for robustness, especially if key might be missing/invalid.
+# Both clients share the pool/timeout settings of the registry's `openai_transport` section;
+# retries are done by the transport below, not by the SDK.
+try:
+    client, async_client = build_openai_clients(OPENAI_API_KEY, (load_agent_registry() or {}).get("openai_transport"))
+except OpenAIError as e:
+    logger.critical("Failed to initialize OpenAI client: %s", e)
+    client = None # Ensure client is None if initialization fails
+    async_client = None
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def get_transport() -> ResilientTransport:
+    """Returns the process-wide retry/circuit-breaker policy wrapped around every OpenAI call."""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = ResilientTransport((load_agent_registry() or {}).get("openai_transport"))
+    return _transport
+
+
+_prompt_store = None
+_prompt_store_lock = threading.Lock()
 
-    # Optionally merge with global defaults if you had a defaults section
-    # For now, assume no global defaults
-    return node_entry
+def get_prompt_store() -> PromptStore:
+    """Returns the process-wide prompt store, configured by the registry's `prompt_store` section."""
+    global _prompt_store
+    if _prompt_store is None:
+        with _prompt_store_lock:
+            if _prompt_store is None:
+                settings = (load_agent_registry() or {}).get("prompt_store") or {}
+                store = PromptStore(settings.get("root", "prompts"), settings.get("check_interval_seconds", 1.0))
+                if settings.get("preload", False):
+                    logger.info("Preloaded %s prompt templates from %s", store.preload(), store.root)
+                _prompt_store = store
+    return _prompt_store
 
 
 def load_prompt_from_path(prompt_path: str) -> str:
-    """Loads a prompt from a .txt file."""
+    """
+    Loads a prompt from a .txt file.
+    Returns a PromptTemplate (a str) from the prompt store: read once, re-read when the file changes.
+    """
     try:
-        with open(prompt_path, 'r', encoding='utf-8') as f:
-            return f.read().strip()
+        return get_prompt_store().get(prompt_path)
     except FileNotFoundError:
-        logger.error(f"Prompt file not found: {prompt_path}")
+        logger.error("Prompt file not found: %s", prompt_path)
         return "" # Return an empty string or raise an error
 
-def get_llm_response(prompt: str, system_prompt: Optional[str] = None, model: str = "gpt-4o", temperature: float = 0.1, max_tokens: int = 5000, json_mode: bool = False) -> str:
-    """Gets a response from the specified LLM, supporting JSON mode."""
-    if not client:
-        logger.error("OpenAI client not initialized. Cannot make API call.")
-        return "Error: OpenAI client not initialized."
-    
+
+def get_prompt_metrics() -> Dict[str, Any]:
+    """Render counts/timings per prompt template and load/reload counters."""
+    return get_prompt_store().metrics()
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+def get_llm_cache() -> LLMResponseCache:
+    """Returns the process-wide LLM response cache, built from the registry's `llm_cache` section."""
+    global _llm_cache
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                settings = (load_agent_registry() or {}).get("llm_cache") or {}
+                memory = TTLCache(max_entries=settings.get("max_entries", 1024), ttl_seconds=settings.get("ttl_seconds"))
+                disk = None
+                if settings.get("sqlite_path"):
+                    disk = SQLiteCache(settings["sqlite_path"], max_entries=settings.get("sqlite_max_entries", 50000),
+                                       ttl_seconds=settings.get("ttl_seconds"))
+                _llm_cache = LLMResponseCache(memory, disk)
+    return _llm_cache
+
+
+# Identical in-flight chat/embedding requests share one upstream call
+_llm_flight = SingleFlight("chat_completions")
+_embedding_flight = SingleFlight("embeddings")
+
+def _coalescing_enabled() -> bool:
+    settings = (load_agent_registry() or {}).get("request_coalescing") or {}
+    return settings.get("enabled", True)
+
+
+def get_coalescing_stats() -> Dict[str, Dict[str, int]]:
+    """Upstream calls made vs. calls saved by request coalescing, since process start."""
+    return {"chat_completions": dict(_llm_flight.stats), "embeddings": dict(_embedding_flight.stats)}
+
+
+def _count_coalesced(cache_stats: Optional[Dict[str, int]], coalesced: bool):
+    if coalesced and cache_stats is not None:
+        cache_stats["coalesced"] = cache_stats.get("coalesced", 0) + 1
+
+
+def llm_options_for_node(config: dict, cache_stats: Optional[Dict[str, int]] = None,
+                         token_usage: Optional[Dict[str, Any]] = None) -> dict:
+    """Per-node keyword arguments for get_llm_response, taken from the node's registry entry."""
+    options = {"use_cache": bool(config.get("cache_llm_responses", False)), "cache_stats": cache_stats,
+               "timeout": config.get("request_timeout_seconds"), "stream_tokens": bool(config.get("stream_tokens", False)),
+               "token_usage": token_usage}
+    if config.get("max_output_tokens"):
+        options["max_tokens"] = config["max_output_tokens"]
+    if config.get("stop"):
+        options["stop"] = config["stop"]
+    return options
+
+
+def new_cache_stats(config: dict) -> Optional[Dict[str, int]]:
+    """Fresh hit/miss counters for a node run, or None if the node does not use the LLM cache."""
+    return {"hits": 0, "misses": 0} if config.get("cache_llm_responses") else None
+
+
+def begin_node_timing(state: AgentState, node_name: str):
+    """Starts the per-node timer and records the node in the execution order."""
+    node_start_time = time.perf_counter()
+    current_latencies = state.get("node_latencies", {})
+    current_order = state.get("node_execution_order", [])
+    if node_name not in current_order:
+        current_order.append(node_name)
+    return node_start_time, current_latencies, current_order
+
+
+def finish_node_timing(node_name: str, node_start_time: float, current_latencies: dict, current_order: list,
+                       state: Optional[AgentState] = None, cache_stats: Optional[Dict[str, int]] = None,
+                       token_usage: Optional[Dict[str, Any]] = None,
+                       result_cache_stats: Optional[Dict[str, int]] = None) -> dict:
+    """Stores the node latency and returns the benchmarking fields for the node's partial result."""
+    current_latencies[node_name] = round(time.perf_counter() - node_start_time, 4)
+    logger.info("%s finished in %.4fs", node_name, current_latencies[node_name],
+                extra={"node": node_name, "latency_s": current_latencies[node_name]})
+    partial_result = {"node_latencies": current_latencies, "node_execution_order": current_order}
+    if state is not None and cache_stats is not None:
+        current_cache_stats = state.get("llm_cache_stats") or {}
+        current_cache_stats[node_name] = dict(cache_stats)
+        partial_result["llm_cache_stats"] = current_cache_stats
+    if state is not None and result_cache_stats is not None:
+        current_result_cache_stats = state.get("result_cache_stats") or {}
+        current_result_cache_stats[node_name] = dict(result_cache_stats)
+        partial_result["result_cache_stats"] = current_result_cache_stats
+    if state is not None and token_usage is not None and token_usage["calls"]:
+        current_token_usage = state.get("node_token_usage") or {}
+        current_token_usage[node_name] = dict(token_usage)
+        partial_result["node_token_usage"] = current_token_usage
+    return partial_result
+
+
+def _build_chat_request(prompt: str, system_prompt: Optional[str], model: str, temperature: float, max_tokens: int, json_mode: bool,
+                        stop: Optional[List[str]] = None) -> dict:
     messages = []
     if system_prompt:
         messages.append({"role": "system", "content": system_prompt})
@@ -113,7 +252,7 @@ def get_llm_response(prompt: str, system_prompt: Optional[str] = None, model: st
     #     messages.extend(state["history"])
 
     messages.append({"role": "system", "content": prompt})
-    logger.info(f"messages: {messages}")
+    logger.debug("LLM request messages: %s", messages)
 
     request_params = {
         "model": model,
@@ -123,35 +262,266 @@ def get_llm_response(prompt: str, system_prompt: Optional[str] = None, model: st
     }
     if json_mode:
         request_params["response_format"] = {"type": "json_object"}
+    if stop:
+        request_params["stop"] = list(stop)
+    return request_params
+
+
+def _preflight_prompt_tokens(request_params: dict) -> int:
+    """Counts prompt tokens before the call and trims max_tokens so prompt + output fits the context window."""
+    prompt_tokens = count_message_tokens(request_params["messages"], request_params["model"])
+    context_window = (load_agent_registry() or {}).get("context_window_tokens", DEFAULT_CONTEXT_WINDOW)
+    if prompt_tokens + request_params["max_tokens"] > context_window:
+        trimmed = max(1, context_window - prompt_tokens)
+        logger.warning("Prompt of %s tokens leaves room for %s output tokens (requested %s) on %s",
+                       prompt_tokens, trimmed, request_params['max_tokens'], request_params['model'])
+        request_params["max_tokens"] = trimmed
+    return prompt_tokens
+
+
+def _record_chat_usage(token_usage: Optional[Dict[str, Any]], request_params: dict, prompt_tokens: int,
+                       content, api_counts, shared: bool = False, price_factor: float = 1.0):
+    """Adds one chat call to a node's token usage; shared (cached/coalesced) answers are not billed twice."""
+    if token_usage is None:
+        return
+    model = request_params["model"]
+    pricing = (load_agent_registry() or {}).get("model_pricing")
+    if shared:
+        record_usage(token_usage, model, prompt_tokens, cached=True)
+    elif api_counts:
+        record_usage(token_usage, model, prompt_tokens, *api_counts, pricing=pricing, price_factor=price_factor)
+    else:
+        completion_text = content if isinstance(content, str) else json.dumps(content or "")
+        record_usage(token_usage, model, prompt_tokens, None, count_text_tokens(completion_text, model), pricing=pricing,
+                     price_factor=price_factor)
+
+
+def _parse_llm_content(content, model: str, json_mode: bool):
+    # Lazy %-style args: the (possibly long) content is only formatted if DEBUG is enabled
+    logger.debug("LLM (%s) response: %s", model, content)
+
+    if json_mode:
+        # For json_mode, the content is already a JSON string
+        try:
+            if isinstance(content, dict):  # Already parsed (shouldn't happen with current API)
+                return content
+            elif isinstance(content, str):
+                return json.loads(content)
+            else:
+                raise ValueError(f"Unexpected response type: {type(content)}")
+        except (json.JSONDecodeError, ValueError) as e:
+            logger.error("JSON parse failed: %s", e)
+            return {"error": "Invalid JSON response", "details": str(e)}
+
+    return content
+
+
+def _request_key(request_params: dict, json_mode: bool) -> str:
+    extra = {"stop": request_params["stop"]} if request_params.get("stop") else {}
+    return LLMResponseCache.make_key(request_params["model"], request_params["messages"],
+                                     request_params["temperature"], json_mode, request_params["max_tokens"], **extra)
+
+
+def _create_chat_content(request_params: dict, timeout: Optional[float] = None):
+    """Returns (content, (prompt_tokens, completion_tokens) or None)."""
+    response = get_transport().call(lambda t: client.chat.completions.create(**request_params, timeout=t), timeout)
+    return response.choices[0].message.content, api_usage_counts(getattr(response, "usage", None))
+
+
+async def _acreate_chat_content(request_params: dict, timeout: Optional[float] = None):
+    async def create(t):
+        return await async_client.chat.completions.create(**request_params, timeout=t)
+    response = await get_transport().acall(create, timeout)
+    return response.choices[0].message.content, api_usage_counts(getattr(response, "usage", None))
+
+
+def get_token_writer():
+    """
+    Returns a callable that emits {"event": "token", ...} custom stream events, or None.
+    Tokens are only streamed when the graph runs with configurable `stream_tokens` (see chat_stream.py),
+    so plain app.invoke keeps using single non-streaming completions.
+    """
+    try:
+        config = get_config()
+    except RuntimeError: # Called outside a graph run
+        return None
+    if not (config.get("configurable") or {}).get("stream_tokens"):
+        return None
+    node_name = (config.get("metadata") or {}).get("langgraph_node")
+    writer = get_stream_writer()
+    return lambda text: writer({"event": "token", "node": node_name, "text": text})
+
+
+def _chunk_text(chunk) -> str:
+    if not chunk.choices:
+        return ""
+    return chunk.choices[0].delta.content or ""
+
+
+STREAM_OPTIONS = {"include_usage": True} # The last chunk then carries the usage block
+
+
+def _stream_chat_content(request_params: dict, timeout: Optional[float], token_writer):
+    """Streaming variant of _create_chat_content; same (content, usage counts) return value."""
+    # Retries cover opening the stream; a failure mid-stream surfaces as an error like any other
+    stream = get_transport().call(
+        lambda t: client.chat.completions.create(**request_params, stream=True, stream_options=STREAM_OPTIONS, timeout=t),
+        timeout)
+    parts, counts = [], None
+    for chunk in stream:
+        counts = api_usage_counts(getattr(chunk, "usage", None)) or counts
+        text = _chunk_text(chunk)
+        if text:
+            parts.append(text)
+            token_writer(text)
+    return "".join(parts), counts
+
+
+async def _astream_chat_content(request_params: dict, timeout: Optional[float], token_writer):
+    async def create(t):
+        return await async_client.chat.completions.create(**request_params, stream=True,
+                                                          stream_options=STREAM_OPTIONS, timeout=t)
+    stream = await get_transport().acall(create, timeout)
+    parts, counts = [], None
+    async for chunk in stream:
+        counts = api_usage_counts(getattr(chunk, "usage", None)) or counts
+        text = _chunk_text(chunk)
+        if text:
+            parts.append(text)
+            token_writer(text)
+    return "".join(parts), counts
+
+
+def _cache_lookup(use_cache: bool, request_params: dict, json_mode: bool, cache_stats: Optional[Dict[str, int]]):
+    """Returns (cache, cache_key, hit, content); cache is None when the caller did not opt in."""
+    if not use_cache:
+        return None, None, False, None
+    cache = get_llm_cache()
+    cache_key = _request_key(request_params, json_mode)
+    hit, content = cache.get(cache_key)
+    if cache_stats is not None:
+        cache_stats["hits" if hit else "misses"] += 1
+    if hit:
+        logger.info("LLM cache hit for model %s", request_params['model'])
+    return cache, cache_key, hit, content
+
+
+def _batch_response(batch, request_params: dict, json_mode: bool, prompt_tokens: int, cache, cache_key,
+                    token_usage: Optional[Dict[str, Any]]):
+    """Answers from the batch results, or queues the request and raises BatchPending (see batch_runner)."""
+    result = batch.resolve(_request_key(request_params, json_mode), request_params)
+    if result.error:
+        logger.error("OpenAI batch request failed: %s", result.error)
+        return f"Error: OpenAI batch request failed. Details: {result.error}"
+    _record_chat_usage(token_usage, request_params, prompt_tokens, result.content, result.usage,
+                       price_factor=BATCH_PRICE_FACTOR)
+    if cache is not None and result.content is not None:
+        cache.set(cache_key, result.content)
+    return _parse_llm_content(result.content, request_params["model"], json_mode)
+
+
+def get_llm_response(prompt: str, system_prompt: Optional[str] = None, model: str = "gpt-4o", temperature: float = 0.1, max_tokens: int = 5000, json_mode: bool = False,
+                     use_cache: bool = False, cache_stats: Optional[Dict[str, int]] = None, timeout: Optional[float] = None,
+                     stream_tokens: bool = False, stop: Optional[List[str]] = None,
+                     token_usage: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Gets a response from the specified LLM, supporting JSON mode and an optional response cache.
+    With stream_tokens, text is also emitted token by token when the graph is being streamed.
+    Prompt/completion tokens and cost are added to token_usage (see token_accounting.new_token_usage).
+    During a batch run the request is answered from, or queued for, the Batch API (see batch_runner).
+    """
+    request_params = _build_chat_request(prompt, system_prompt, model, temperature, max_tokens, json_mode, stop)
+    prompt_tokens = _preflight_prompt_tokens(request_params)
+    token_writer = get_token_writer() if stream_tokens and not json_mode else None
+    cache, cache_key, hit, cached_content = _cache_lookup(use_cache, request_params, json_mode, cache_stats)
+    if hit:
+        _record_chat_usage(token_usage, request_params, prompt_tokens, cached_content, None, shared=True)
+        if token_writer:
+            token_writer(cached_content)
+        return _parse_llm_content(cached_content, model, json_mode)
+
+    batch = current_batch_session()
+    if batch is not None:
+        return _batch_response(batch, request_params, json_mode, prompt_tokens, cache, cache_key, token_usage)
+
+    if not client:
+        logger.error("OpenAI client not initialized. Cannot make API call.")
+        return "Error: OpenAI client not initialized."
+
+    try:
+        logger.debug("Sending request to LLM (%s) with prompt: %.1000s...", model, prompt)
+        if token_writer:
+            # Streamed calls are not coalesced: followers would miss the tokens
+            (content, api_counts), coalesced = _stream_chat_content(request_params, timeout, token_writer), False
+        elif _coalescing_enabled():
+            flight_key = cache_key or _request_key(request_params, json_mode)
+            (content, api_counts), coalesced = _llm_flight.do(flight_key, lambda: _create_chat_content(request_params, timeout))
+            _count_coalesced(cache_stats, coalesced)
+        else:
+            (content, api_counts), coalesced = _create_chat_content(request_params, timeout), False
+        _record_chat_usage(token_usage, request_params, prompt_tokens, content, api_counts, shared=coalesced)
+        if cache is not None and content is not None:
+            cache.set(cache_key, content)
+        return _parse_llm_content(content, model, json_mode)
+
+    except CircuitOpenError as e:
+        logger.warning("OpenAI call short-circuited: %s", e)
+        return f"Error: LLM service temporarily unavailable (circuit open). Details: {e}"
+    except OpenAIError as e:
+        logger.error("OpenAI API error: %s", e)
+        return f"Error: OpenAI API call failed. Details: {e}"
+    except Exception as e:
+        logger.error("Unexpected error calling OpenAI API: %s", e)
+        return f"Error: Could not get response from LLM. Details: {e}"
+
+
+async def aget_llm_response(prompt: str, system_prompt: Optional[str] = None, model: str = "gpt-4o", temperature: float = 0.1, max_tokens: int = 5000, json_mode: bool = False,
+                            use_cache: bool = False, cache_stats: Optional[Dict[str, int]] = None, timeout: Optional[float] = None,
+                            stream_tokens: bool = False, stop: Optional[List[str]] = None,
+                            token_usage: Optional[Dict[str, Any]] = None) -> str:
+    """Async twin of get_llm_response, awaiting the AsyncOpenAI client instead of blocking a thread."""
+    request_params = _build_chat_request(prompt, system_prompt, model, temperature, max_tokens, json_mode, stop)
+    prompt_tokens = _preflight_prompt_tokens(request_params)
+    token_writer = get_token_writer() if stream_tokens and not json_mode else None
+    # Cache tiers are local (memory / SQLite file), so the lookup stays on the loop
+    cache, cache_key, hit, cached_content = _cache_lookup(use_cache, request_params, json_mode, cache_stats)
+    if hit:
+        _record_chat_usage(token_usage, request_params, prompt_tokens, cached_content, None, shared=True)
+        if token_writer:
+            token_writer(cached_content)
+        return _parse_llm_content(cached_content, model, json_mode)
+
+    batch = current_batch_session()
+    if batch is not None:
+        return _batch_response(batch, request_params, json_mode, prompt_tokens, cache, cache_key, token_usage)
+
+    if not async_client:
+        logger.error("Async OpenAI client not initialized. Cannot make API call.")
+        return "Error: OpenAI client not initialized."
 
     try:
-        logger.debug(f"Sending request to LLM ({model}) with prompt: {prompt[:1000]}...")
-        response = client.chat.completions.create(**request_params)
-        content = response.choices[0].message.content
-        # Log the response content, but truncate for readability
-        logger.info(f"LLM ({model}) response: {content[:1000]}...")
-
-        if json_mode:
-            # For json_mode, the content is already a JSON string
-            try:
-                if isinstance(content, dict):  # Already parsed (shouldn't happen with current API)
-                    return content
-                elif isinstance(content, str):
-                    return json.loads(content)
-                else:
-                    raise ValueError(f"Unexpected response type: {type(content)}")
-            except (json.JSONDecodeError, ValueError) as e:
-                logger.error(f"JSON parse failed: {str(e)}")
-                return {"error": "Invalid JSON response", "details": str(e)}
-        
-        logger.info(f"content: {content}")
-        return content
+        logger.debug("Sending async request to LLM (%s) with prompt: %.1000s...", model, prompt)
+        if token_writer:
+            (content, api_counts), coalesced = await _astream_chat_content(request_params, timeout, token_writer), False
+        elif _coalescing_enabled():
+            flight_key = cache_key or _request_key(request_params, json_mode)
+            (content, api_counts), coalesced = await _llm_flight.ado(flight_key, lambda: _acreate_chat_content(request_params, timeout))
+            _count_coalesced(cache_stats, coalesced)
+        else:
+            (content, api_counts), coalesced = await _acreate_chat_content(request_params, timeout), False
+        _record_chat_usage(token_usage, request_params, prompt_tokens, content, api_counts, shared=coalesced)
+        if cache is not None and content is not None:
+            cache.set(cache_key, content)
+        return _parse_llm_content(content, model, json_mode)
 
+    except CircuitOpenError as e:
+        logger.warning("OpenAI call short-circuited: %s", e)
+        return f"Error: LLM service temporarily unavailable (circuit open). Details: {e}"
     except OpenAIError as e:
-        logger.error(f"OpenAI API error: {e}")
+        logger.error("OpenAI API error: %s", e)
         return f"Error: OpenAI API call failed. Details: {e}"
     except Exception as e:
-        logger.error(f"Unexpected error calling OpenAI API: {e}")
+        logger.error("Unexpected error calling OpenAI API: %s", e)
         return f"Error: Could not get response from LLM. Details: {e}"
 
 
@@ -166,22 +536,59 @@ def get_embeddings(texts: List[str], model: str = "text-embedding-3-small") -> L
         # Ensure texts are non-empty strings, API might error otherwise
         processed_texts = [text if text.strip() else " " for text in texts]
 
-        response = client.embeddings.create(input=processed_texts, model=model)
-        return [item.embedding for item in response.data]
+        def create():
+            response = get_transport().call(lambda t: client.embeddings.create(input=processed_texts, model=model, timeout=t))
+            return [item.embedding for item in response.data]
+
+        if _coalescing_enabled():
+            embeddings, coalesced = _embedding_flight.do((model, tuple(processed_texts)), create)
+            if coalesced:
+                logger.info("Embedding request coalesced with an in-flight call (%s)", model)
+            return embeddings
+        return create()
+    except OpenAIError as e:
+        logger.error("OpenAI API error getting embeddings: %s", e)
+        return [[] for _ in texts]
+    except Exception as e:
+        logger.error("Unexpected error getting embeddings: %s", e)
+        return [[] for _ in texts]
+
+
+async def aget_embeddings(texts: List[str], model: str = "text-embedding-3-small") -> List[List[float]]:
+    """Async twin of get_embeddings."""
+    if not async_client:
+        logger.error("Async OpenAI client not initialized. Cannot get embeddings.")
+        return [[] for _ in texts]
+    if not texts:
+        return []
+    try:
+        processed_texts = [text if text.strip() else " " for text in texts]
+
+        async def create():
+            response = await get_transport().acall(
+                lambda t: async_client.embeddings.create(input=processed_texts, model=model, timeout=t))
+            return [item.embedding for item in response.data]
+
+        if _coalescing_enabled():
+            embeddings, coalesced = await _embedding_flight.ado((model, tuple(processed_texts)), create)
+            if coalesced:
+                logger.info("Embedding request coalesced with an in-flight call (%s)", model)
+            return embeddings
+        return await create()
     except OpenAIError as e:
-        logger.error(f"OpenAI API error getting embeddings: {e}")
+        logger.error("OpenAI API error getting embeddings: %s", e)
         return [[] for _ in texts]
     except Exception as e:
-        logger.error(f"Unexpected error getting embeddings: {e}")
+        logger.error("Unexpected error getting embeddings: %s", e)
         return [[] for _ in texts]
 
 DB_SCHEMA_FOR_PROMPT = """
 Database Schema:
 Tables:
-1. Customers(id INTEGER PRIMARY KEY, name TEXT, email TEXT)
-2. Products(id INTEGER PRIMARY KEY, name TEXT, price REAL, inventory_count INTEGER)
-3. Orders(id INTEGER PRIMARY KEY, customer_id INTEGER, order_date TEXT, status TEXT)
-4. Returns(id INTEGER PRIMARY KEY, order_id INTEGER, reason TEXT, approved_by TEXT, status TEXT)
+1. Customers(id INTEGER PRIMARY KEY, name TEXT, email TEXT, location TEXT)
+2. Orders(id INTEGER PRIMARY KEY, customer_id INTEGER, order_date TEXT, status TEXT)
+3. Products(id INTEGER PRIMARY KEY, name TEXT, price REAL, inventory_count INTEGER)
+4. Returns(order_id INTEGER, reason TEXT, approved_by TEXT)
 
 Relationships:
 - Orders.customer_id references Customers.id